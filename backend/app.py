@@ -3,31 +3,102 @@
 Application Flask - API REST pour la gestion de bibliothèque
 """
 
-from flask import Flask, jsonify, request
+import io
+import itertools
+import os
+import time
+from flask import Blueprint, Flask, Response, current_app, jsonify, request
 from flask_cors import CORS
-from config.database import test_connection
-from models import etudiant, livre, emprunt
-from services import stats_service
-from utils.validators import valider_email, valider_non_vide, valider_annee
-from utils.logger import log
-
-app = Flask(__name__)
-CORS(app)
+from config.database import (test_connection, get_pool_stats, get_replica_stats, begin_session, end_session,
+                             prechauffer)
+from config import requetes_lentes
+from models import etudiant, livre, emprunt, cache
+from services import stats_service, import_service
+from storage import get_stockage
+from config.settings import MAX_EMPRUNTS_PAR_ETUDIANT, FENETRES_CLASSEMENT, LIMITE_CLASSEMENT, MAX_OPERATIONS_LOT
+from utils.validators import valider_email, valider_non_vide, valider_annee, valider_date, valider_entier_positif
+from utils.pagination import lire_pagination, lire_booleen, paginer
+from utils.export import generer_ndjson, generer_csv
+from utils import metrics
+from utils.logger import log, debut_requete, fin_requete, request_id_courant, get_log_stats
+
+# Routes de l'API, enregistrées sur l'application par create_app()
+api = Blueprint('api', __name__)
+
+
+# Mesures par route (enregistrées en premier : elles englobent les autres hooks)
+@api.before_app_request
+def debut_mesures():
+    metrics.debut_requete()
+
+
+@api.after_app_request
+def fin_mesures(response):
+    route = request.url_rule.rule if request.url_rule is not None else 'non_trouvee'
+    metrics.fin_requete(route, request.method, response.status_code)
+    return response
+
+
+@api.teardown_app_request
+def abandonner_mesures(error):
+    """Requête terminée sans réponse : comptée en 500"""
+    route = request.url_rule.rule if request.url_rule is not None else 'non_trouvee'
+    metrics.fin_requete(route, request.method, 500)
+
+
+# Une transaction par requête HTTP
+@api.before_app_request
+def ouvrir_session_bdd():
+    """Ouvre la session BDD (la connexion n'est prise qu'au premier SQL) et identifie la requête"""
+    debut_requete(request.headers.get('X-Request-ID'), request.method, request.path)
+    begin_session()
+
+
+@api.after_app_request
+def valider_session_bdd(response):
+    """COMMIT si la réponse est un succès, ROLLBACK sinon"""
+    try:
+        end_session(commit=response.status_code < 400)
+    except Exception as e:
+        log(f"Erreur COMMIT {request.method} {request.path}: {e}", level="ERROR")
+        response = jsonify({'error': str(e)})
+        response.status_code = 500
+    request_id = request_id_courant()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
+    fin_requete(response.status_code)
+    return response
+
+
+@api.teardown_app_request
+def fermer_session_bdd(error):
+    """Annule la transaction si la requête s'est terminée sans réponse"""
+    try:
+        end_session(commit=False)
+    except Exception:
+        pass
+    fin_requete()
 
 
 # API Étudiants
-@app.route('/api/etudiants', methods=['GET'])
+@api.route('/api/etudiants', methods=['GET'])
 def get_etudiants():
-    """Récupère tous les étudiants"""
+    """Récupère les étudiants page par page (?all=1 pour la liste complète)"""
     try:
-        etudiants = etudiant.get_all()
-        return jsonify(etudiants), 200
+        if lire_booleen(request.args, 'all'):
+            return jsonify(etudiant.get_all()), 200
+
+        limite, apres = lire_pagination(request.args)
+        etudiants = etudiant.get_page(limite, apres)
+        return jsonify(paginer(etudiants, limite, ('nom', 'prenom', 'id'))), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         log(f"Erreur GET /api/etudiants: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/etudiants/<int:etudiant_id>', methods=['GET'])
+@api.route('/api/etudiants/<int:etudiant_id>', methods=['GET'])
 def get_etudiant(etudiant_id):
     """Récupère un étudiant par ID"""
     try:
@@ -40,7 +111,7 @@ def get_etudiant(etudiant_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/etudiants/search', methods=['GET'])
+@api.route('/api/etudiants/search', methods=['GET'])
 def search_etudiants():
     """Recherche des étudiants"""
     try:
@@ -52,7 +123,7 @@ def search_etudiants():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/etudiants', methods=['POST'])
+@api.route('/api/etudiants', methods=['POST'])
 def create_etudiant():
     """Crée un nouvel étudiant"""
     try:
@@ -73,7 +144,7 @@ def create_etudiant():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/etudiants/<int:etudiant_id>', methods=['PUT'])
+@api.route('/api/etudiants/<int:etudiant_id>', methods=['PUT'])
 def update_etudiant(etudiant_id):
     """Met à jour un étudiant"""
     try:
@@ -94,7 +165,7 @@ def update_etudiant(etudiant_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/etudiants/<int:etudiant_id>', methods=['DELETE'])
+@api.route('/api/etudiants/<int:etudiant_id>', methods=['DELETE'])
 def delete_etudiant(etudiant_id):
     """Supprime un étudiant"""
     try:
@@ -108,18 +179,24 @@ def delete_etudiant(etudiant_id):
 
 
 # API Livres
-@app.route('/api/livres', methods=['GET'])
+@api.route('/api/livres', methods=['GET'])
 def get_livres():
-    """Récupère tous les livres"""
+    """Récupère les livres page par page (?all=1 pour la liste complète)"""
     try:
-        livres = livre.get_all()
-        return jsonify(livres), 200
+        if lire_booleen(request.args, 'all'):
+            return jsonify(livre.get_all()), 200
+
+        limite, apres = lire_pagination(request.args)
+        livres = livre.get_page(limite, apres)
+        return jsonify(paginer(livres, limite, ('titre', 'isbn'))), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         log(f"Erreur GET /api/livres: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/livres/<string:isbn>', methods=['GET'])
+@api.route('/api/livres/<string:isbn>', methods=['GET'])
 def get_livre(isbn):
     """Récupère un livre par ISBN"""
     try:
@@ -132,7 +209,7 @@ def get_livre(isbn):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/livres/search', methods=['GET'])
+@api.route('/api/livres/search', methods=['GET'])
 def search_livres():
     """Recherche des livres"""
     try:
@@ -144,7 +221,7 @@ def search_livres():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/livres', methods=['POST'])
+@api.route('/api/livres', methods=['POST'])
 def create_livre():
     """Crée un nouveau livre"""
     try:
@@ -165,7 +242,38 @@ def create_livre():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/livres/<string:isbn>', methods=['PUT'])
+@api.route('/api/livres/import', methods=['POST'])
+def import_livres():
+    """
+    Importe un catalogue de livres en masse (format=csv|ndjson).
+    Le fichier est envoyé en multipart (champ 'fichier') ou directement dans le corps.
+    Retourne le rapport d'import avec les erreurs ligne par ligne.
+    """
+    try:
+        format_import = request.args.get('format')
+        if 'fichier' in request.files:
+            envoi = request.files['fichier']
+            flux = envoi.stream
+            if format_import is None and envoi.filename.lower().endswith(('.ndjson', '.jsonl')):
+                format_import = 'ndjson'
+        else:
+            flux = request.stream
+            if format_import is None and 'ndjson' in (request.mimetype or ''):
+                format_import = 'ndjson'
+
+        fichier = io.TextIOWrapper(flux, encoding='utf-8-sig', newline='')
+        rapport = import_service.importer_livres(fichier, format_import or 'csv')
+        return jsonify(rapport), 200
+    except UnicodeDecodeError:
+        return jsonify({'error': "Le fichier doit être encodé en UTF-8"}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log(f"Erreur POST /api/livres/import: {e}", level="ERROR")
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/livres/<string:isbn>', methods=['PUT'])
 def update_livre(isbn):
     """Met à jour un livre"""
     try:
@@ -188,7 +296,7 @@ def update_livre(isbn):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/livres/<string:isbn>', methods=['DELETE'])
+@api.route('/api/livres/<string:isbn>', methods=['DELETE'])
 def delete_livre(isbn):
     """Supprime un livre"""
     try:
@@ -202,52 +310,92 @@ def delete_livre(isbn):
 
 
 # API Emprunts
-@app.route('/api/emprunts', methods=['GET'])
+@api.route('/api/emprunts', methods=['GET'])
 def get_emprunts():
-    """Récupère tous les emprunts"""
+    """
+    Récupère les emprunts page par page (?all=1 pour la liste complète).
+    Filtres : etudiant_id, isbn, depuis, jusqu_au, statut (en_cours|retourne), ordre (asc|desc)
+    """
     try:
-        emprunts = emprunt.get_all()
-        # Ajouter calculs jours retard et amende pour tous
-        for emp in emprunts:
-            emp['jours_retard'] = emprunt.calculer_jours_retard(emp)
-            emp['amende'] = emprunt.calculer_amende(emp)
-        return jsonify(emprunts), 200
+        args = request.args
+        tout = lire_booleen(args, 'all')
+        if tout:
+            emprunts = emprunt.get_all()
+        else:
+            limite, apres = lire_pagination(args)
+            emprunts = emprunt.get_page(
+                limite, apres,
+                etudiant_id=valider_entier_positif(args['etudiant_id'], 'etudiant_id') if args.get('etudiant_id') else None,
+                isbn=args.get('isbn') or None,
+                depuis=valider_date(args['depuis'], 'depuis') if args.get('depuis') else None,
+                jusqu_au=valider_date(args['jusqu_au'], 'jusqu_au') if args.get('jusqu_au') else None,
+                statut=args.get('statut') or None,
+                croissant=args.get('ordre', 'desc') == 'asc'
+            )
+
+        if tout:
+            return jsonify(emprunts), 200
+        return jsonify(paginer(emprunts, limite, ('date_emprunt', 'id'))), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         log(f"Erreur GET /api/emprunts: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/emprunts/en-cours', methods=['GET'])
+@api.route('/api/emprunts/en-cours', methods=['GET'])
 def get_emprunts_en_cours():
     """Récupère les emprunts en cours"""
     try:
         emprunts = emprunt.get_en_cours()
-        # Ajouter calculs jours retard et amende
-        for emp in emprunts:
-            emp['jours_retard'] = emprunt.calculer_jours_retard(emp)
-            emp['amende'] = emprunt.calculer_amende(emp)
         return jsonify(emprunts), 200
     except Exception as e:
         log(f"Erreur GET /api/emprunts/en-cours: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/emprunts/en-retard', methods=['GET'])
+@api.route('/api/emprunts/en-retard', methods=['GET'])
 def get_emprunts_en_retard():
     """Récupère les emprunts en retard"""
     try:
         emprunts = emprunt.get_en_retard()
-        # Ajouter calculs
-        for emp in emprunts:
-            emp['jours_retard'] = emprunt.calculer_jours_retard(emp)
-            emp['amende'] = emprunt.calculer_amende(emp)
         return jsonify(emprunts), 200
     except Exception as e:
         log(f"Erreur GET /api/emprunts/en-retard: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/emprunts', methods=['POST'])
+@api.route('/api/emprunts/export', methods=['GET'])
+def export_emprunts():
+    """
+    Exporte tout l'historique des emprunts en flux (format=ndjson|csv).
+    Filtres optionnels : depuis, jusqu_au
+    """
+    try:
+        args = request.args
+        format_export = args.get('format', 'ndjson')
+        if format_export not in ('ndjson', 'csv'):
+            return jsonify({'error': "'format' doit être 'ndjson' ou 'csv'"}), 400
+
+        lots = emprunt.export(
+            depuis=valider_date(args['depuis'], 'depuis') if args.get('depuis') else None,
+            jusqu_au=valider_date(args['jusqu_au'], 'jusqu_au') if args.get('jusqu_au') else None
+        )
+        # Lire le premier lot ici pour qu'une erreur BDD donne encore une réponse 500
+        lots = itertools.chain([next(lots, [])], lots)
+
+        if format_export == 'csv':
+            return Response(generer_csv(lots, emprunt.COLONNES_EXPORT), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=emprunts.csv'})
+        return Response(generer_ndjson(lots), mimetype='application/x-ndjson')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log(f"Erreur GET /api/emprunts/export: {e}", level="ERROR")
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/emprunts', methods=['POST'])
 def create_emprunt():
     """Crée un nouvel emprunt"""
     try:
@@ -255,21 +403,21 @@ def create_emprunt():
         etudiant_id = int(data.get('etudiant_id'))
         isbn_val = data.get('livre_id')  # Frontend envoie 'livre_id' mais c'est un ISBN
 
-        # Vérifications
-        if not etudiant.exists(etudiant_id):
+        # Vérifications, verrous et création en un seul appel
+        statut, emprunt_id = emprunt.emprunter(etudiant_id, isbn_val)
+
+        if statut == emprunt.StatutEmprunt.ETUDIANT_INCONNU:
             return jsonify({'error': 'Étudiant non trouvé'}), 404
 
-        if not livre.exists(isbn_val):
+        if statut == emprunt.StatutEmprunt.LIVRE_INCONNU:
             return jsonify({'error': 'Livre non trouvé'}), 404
 
-        if not livre.est_disponible(isbn_val):
+        if statut == emprunt.StatutEmprunt.INDISPONIBLE:
             return jsonify({'error': 'Livre non disponible'}), 400
 
-        nb_emprunts = etudiant.count_emprunts_actifs(etudiant_id)
-        if nb_emprunts >= 5:
-            return jsonify({'error': 'Limite de 5 emprunts atteinte'}), 400
+        if statut == emprunt.StatutEmprunt.LIMITE_ATTEINTE:
+            return jsonify({'error': f'Limite de {MAX_EMPRUNTS_PAR_ETUDIANT} emprunts atteinte'}), 400
 
-        emprunt_id = emprunt.create(etudiant_id, isbn_val)
         return jsonify({'id': emprunt_id, 'message': 'Emprunt créé'}), 201
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -278,22 +426,18 @@ def create_emprunt():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/emprunts/<int:emprunt_id>/retourner', methods=['POST'])
+@api.route('/api/emprunts/<int:emprunt_id>/retourner', methods=['POST'])
 def retourner_emprunt(emprunt_id):
     """Retourne un livre (marque l'emprunt comme terminé)"""
     try:
-        emp = emprunt.get_by_id(emprunt_id)
-        if not emp:
+        statut, jours_retard, amende_calc = emprunt.retourner(emprunt_id)
+
+        if statut == emprunt.StatutRetour.INCONNU:
             return jsonify({'error': 'Emprunt non trouvé'}), 404
 
-        if emp['date_retour']:
+        if statut == emprunt.StatutRetour.DEJA_RETOURNE:
             return jsonify({'error': 'Livre déjà retourné'}), 400
 
-        jours_retard = emprunt.calculer_jours_retard(emp)
-        amende_calc = emprunt.calculer_amende(emp)
-
-        emprunt.retourner(emprunt_id)
-
         return jsonify({
             'message': 'Livre retourné',
             'jours_retard': jours_retard,
@@ -304,7 +448,71 @@ def retourner_emprunt(emprunt_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/emprunts/<int:emprunt_id>', methods=['DELETE'])
+def lire_lot(data, cle: str) -> list:
+    """Lit la liste d'opérations d'un lot (non vide, au plus MAX_OPERATIONS_LOT éléments)"""
+    elements = (data or {}).get(cle)
+    if not isinstance(elements, list) or not elements:
+        raise ValueError(f"'{cle}' doit être une liste non vide")
+    if len(elements) > MAX_OPERATIONS_LOT:
+        raise ValueError(f"Au plus {MAX_OPERATIONS_LOT} opérations par lot")
+    return elements
+
+
+def resumer_lot(resultats: list) -> dict:
+    """Nombre de résultats par statut"""
+    resume = {}
+    for resultat in resultats:
+        resume[resultat['statut']] = resume.get(resultat['statut'], 0) + 1
+    return resume
+
+
+@api.route('/api/emprunts/lot', methods=['POST'])
+def create_emprunts_lot():
+    """
+    Crée un lot d'emprunts en une transaction.
+    Corps : {"operations": [{"etudiant_id": 1, "livre_id": "978..."}, ...], "savepoints": false}
+    Retourne un résultat par opération (ok, etudiant_inconnu, livre_inconnu, indisponible, limite_atteinte).
+    """
+    try:
+        data = request.json
+        operations = []
+        for op in lire_lot(data, 'operations'):
+            if not isinstance(op, dict):
+                raise ValueError("Chaque opération doit être un objet")
+            etudiant_id = valider_entier_positif(str(op.get('etudiant_id')), 'etudiant_id')
+            isbn_val = valider_non_vide(str(op.get('livre_id') or ''), 'livre_id')
+            operations.append((etudiant_id, isbn_val))
+
+        resultats = emprunt.emprunter_lot(operations, bool(data.get('savepoints')))
+        return jsonify({'resultats': resultats, 'resume': resumer_lot(resultats)}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log(f"Erreur POST /api/emprunts/lot: {e}", level="ERROR")
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/emprunts/lot/retourner', methods=['POST'])
+def retourner_emprunts_lot():
+    """
+    Retourne un lot d'emprunts en une transaction.
+    Corps : {"ids": [12, 15, ...], "savepoints": false}
+    Retourne un résultat par emprunt (ok avec jours de retard et amende, inconnu, deja_retourne).
+    """
+    try:
+        data = request.json
+        emprunt_ids = [valider_entier_positif(str(emprunt_id), 'ids') for emprunt_id in lire_lot(data, 'ids')]
+
+        resultats = emprunt.retourner_lot(emprunt_ids, bool(data.get('savepoints')))
+        return jsonify({'resultats': resultats, 'resume': resumer_lot(resultats)}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log(f"Erreur POST /api/emprunts/lot/retourner: {e}", level="ERROR")
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/emprunts/<int:emprunt_id>', methods=['DELETE'])
 def delete_emprunt(emprunt_id):
     """Supprime un emprunt"""
     try:
@@ -316,68 +524,171 @@ def delete_emprunt(emprunt_id):
 
 
 # API Statistiques
-@app.route('/api/stats/overview', methods=['GET'])
+@api.route('/api/stats/overview', methods=['GET'])
 def get_stats_overview():
     """Récupère vue d'ensemble des stats"""
     try:
-        totaux = stats_service.get_totaux()
-        stats_emp = stats_service.get_stats_emprunts()
-        livres_dispo = stats_service.get_livres_disponibles()
-        taux = stats_service.get_taux_emprunt()
-
-        return jsonify({
-            'totaux': totaux,
-            'emprunts': stats_emp,
-            'livres_disponibles': livres_dispo,
-            'taux_emprunt': round(taux, 1)
-        }), 200
+        return jsonify(stats_service.get_overview()), 200
     except Exception as e:
         log(f"Erreur GET /api/stats/overview: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/stats/top-etudiants', methods=['GET'])
+def lire_classement(args) -> tuple:
+    """Lit les paramètres limit (défaut 5) et window (7, 30, 365 ou all) d'un classement"""
+    limite = valider_entier_positif(args.get('limit', '5'), 'limit')
+    if limite > LIMITE_CLASSEMENT:
+        raise ValueError(f"'limit' ne peut pas dépasser {LIMITE_CLASSEMENT}")
+
+    fenetre = args.get('window', 'all')
+    if fenetre == 'all':
+        return limite, None
+    if not fenetre.isdigit() or int(fenetre) not in FENETRES_CLASSEMENT:
+        raise ValueError(f"'window' doit valoir all ou {', '.join(str(f) for f in FENETRES_CLASSEMENT)}")
+    return limite, int(fenetre)
+
+
+@api.route('/api/stats/top-etudiants', methods=['GET'])
 def get_top_etudiants():
-    """Top 5 étudiants"""
+    """Top N étudiants (?limit=5&window=7|30|365|all)"""
     try:
-        top = stats_service.get_top_etudiants(5)
+        limite, fenetre = lire_classement(request.args)
+        top = stats_service.get_top_etudiants(limite, fenetre)
         return jsonify(top), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         log(f"Erreur GET /api/stats/top-etudiants: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/stats/top-livres', methods=['GET'])
+@api.route('/api/stats/top-livres', methods=['GET'])
 def get_top_livres():
-    """Top 5 livres"""
+    """Top N livres (?limit=5&window=7|30|365|all)"""
     try:
-        top = stats_service.get_top_livres(5)
+        limite, fenetre = lire_classement(request.args)
+        top = stats_service.get_top_livres(limite, fenetre)
         return jsonify(top), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         log(f"Erreur GET /api/stats/top-livres: {e}", level="ERROR")
         return jsonify({'error': str(e)}), 500
 
 
+@api.route('/api/stats/pool', methods=['GET'])
+def get_stats_pool():
+    """État du pool de connexions BDD (et des réplicas en lecture s'il y en a)"""
+    stats = get_pool_stats()
+    replicas = get_replica_stats()
+    if replicas is not None:
+        stats['replicas'] = replicas
+    return jsonify(stats), 200
+
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Métriques de tous les workers au format texte Prometheus"""
+    try:
+        texte = metrics.format_prometheus(metrics.agreger())
+        return Response(texte, mimetype='text/plain; version=0.0.4; charset=utf-8'), 200
+    except Exception as e:
+        log(f"Erreur get_metrics: {e}", level="ERROR")
+        return jsonify({'error': str(e)}), 500
+
+
+@api.route('/api/debug/requetes-lentes', methods=['GET'])
+def get_requetes_lentes():
+    """Requêtes SQL les plus coûteuses de tous les workers, avec leur dernier plan capturé"""
+    try:
+        limite = valider_entier_positif(request.args.get('limite', '20'), 'limite')
+        tri = request.args.get('tri', 'total')
+        return jsonify(requetes_lentes.rapport(limite, tri)), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        log(f"Erreur get_requetes_lentes: {e}", level="ERROR")
+        return jsonify({'error': str(e)}), 500
+
+
 # Gestion d'erreurs
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Route non trouvée'}), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'error': 'Erreur serveur'}), 500
 
 
+# Santé du processus (sans requête SQL) : sonde de vie pour le répartiteur de charge
+@api.route('/api/sante', methods=['GET'])
+def get_sante():
+    """PID du worker, durée de fonctionnement, temps de démarrage mesurés, file du journal et cache d'entités"""
+    demarrage = current_app.config['DEMARRAGE']
+    return jsonify({
+        'statut': 'ok',
+        'pid': os.getpid(),
+        'en_service_s': round(time.monotonic() - demarrage['depuis'], 1),
+        'demarrage': {cle: valeur for cle, valeur in demarrage.items() if cle != 'depuis'},
+        'journal': get_log_stats(),
+        'cache_entites': cache.get_stats(),
+    }), 200
+
+
+def create_app() -> Flask:
+    """
+    Construit l'application Flask (CORS, session BDD par requête, routes).
+    Aucune connexion ici : la base est contactée au premier SQL, ou par
+    prechauffer_app() dans chaque worker du serveur de production.
+    METRICS_DIR n'est pas vidé ici (partagé par les workers) : voir on_starting
+    dans gunicorn.conf.py.
+    """
+    debut = time.perf_counter()
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    app.config['DEMARRAGE'] = {
+        'depuis': time.monotonic(),
+        'creation_app_ms': round((time.perf_counter() - debut) * 1000, 1),
+    }
+    return app
+
+
+def prechauffer_app(app: Flask) -> dict:
+    """
+    Prépare un worker avant sa première requête : pool ouvert (connexions
+    minimales testées), réplicas mesurés, cache des statistiques rempli.
+    Lève une exception si la base est injoignable (le worker ne démarre pas).
+    """
+    debut = time.perf_counter()
+    mesures = prechauffer() if get_stockage().nom == 'postgres' else {}
+    try:
+        stats_service.get_overview()
+    except Exception as e:
+        # Un cache vide n'empêche pas de servir
+        log(f"Préchauffage du cache des statistiques échoué: {e}", level="ERROR")
+    mesures['prechauffage_ms'] = round((time.perf_counter() - debut) * 1000, 1)
+    app.config['DEMARRAGE'].update(mesures)
+    return mesures
+
+
 if __name__ == '__main__':
+    # Serveur de développement (un seul processus) ; en production : python manage.py serve
     log("Démarrage serveur Flask")
-
-    # Test connexion BDD
-    if not test_connection():
+    metrics.reinitialiser()
+    requetes_lentes.reinitialiser()
+    app = create_app()
+
+    # Test connexion BDD (aucune base avec le moteur mémoire)
+    if get_stockage().nom == 'memoire':
+        print("Stockage en mémoire : données non persistantes")
+    elif not test_connection():
         print("ERREUR: Impossible de se connecter à la base de données")
         print("Vérifiez votre fichier .env et que PostgreSQL est démarré")
         exit(1)
-
-    print("Connexion BDD OK")
+    else:
+        print("Connexion BDD OK")
     print("Serveur démarré sur http://localhost:5001")
     app.run(debug=True, host='0.0.0.0', port=5001)
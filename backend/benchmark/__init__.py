@@ -0,0 +1 @@
+# Module des bancs d'essai
@@ -0,0 +1,320 @@
+"""
+Jeu de données déterministe pour les bancs d'essai.
+
+Même échelle et même graine => mêmes étudiants, livres, exemplaires et emprunts
+(dates relatives au jour de génération). L'échelle 1 correspond à 50 000
+étudiants, 500 000 titres et 5 000 000 d'emprunts sur trois ans ; la popularité
+des livres et l'activité des étudiants suivent une loi de Zipf.
+
+Chargement :
+- PostgreSQL : COPY par lots dans les tables vides (ou vidées avec vider=True) ;
+  compteurs et classements sont tenus à jour par les triggers ;
+- moteur mémoire : par les dépôts de StockageMemoire (petites échelles, <= 0,05).
+"""
+
+import csv
+import io
+import itertools
+import random
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from typing import Callable, Dict, Iterator, List, Optional
+
+from config.database import copy_query, execute_query, transaction
+from config.settings import AMENDE_PAR_JOUR, DUREE_EMPRUNT_DEFAUT, MAX_EMPRUNTS_PAR_ETUDIANT
+from services import stats_service
+
+TAILLES_ECHELLE_1 = {'etudiants': 50_000, 'livres': 500_000, 'emprunts': 5_000_000}
+HISTORIQUE_JOURS = 3 * 365
+TAILLE_LOT_COPY = 100_000
+
+PRENOMS = ['Jean', 'Marie', 'Pierre', 'Sophie', 'Lucas', 'Emma', 'Hugo', 'Léa', 'Louis', 'Chloé',
+           'Gabriel', 'Inès', 'Raphaël', 'Jade', 'Arthur', 'Zoé', 'Jules', 'Camille', 'Adam', 'Manon',
+           'Théo', 'Anaïs', 'Noé', 'Louise', 'Élodie', 'Maël', 'Clémence', 'Hélène', 'Jérôme', 'Loïc',
+           'Amélie', 'Benoît', 'Céline', 'Cédric', 'Gaëlle', 'François', 'Mathéo', 'Océane', 'Rémi', 'Sébastien']
+NOMS = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Richard', 'Petit', 'Durand', 'Leroy', 'Moreau',
+        'Simon', 'Laurent', 'Lefèbvre', 'Michel', 'Garcia', 'David', 'Bertrand', 'Roux', 'Vincent', 'Fournier',
+        'Morel', 'Girard', 'André', 'Lefèvre', 'Mercier', 'Dupont', 'Lambert', 'Bonnet', 'François', 'Martinez',
+        'Légaré', 'Bélanger', 'Côté', 'Gagné', 'Pelletier', 'Béland', 'Ménard', 'Chénier', 'Hébert', 'Gérard']
+OUVRAGES = ['Introduction à', 'Histoire de', 'Principes de', 'Traité de', 'Éléments de', 'Fondements de',
+            'Méthodes de', 'Théorie de', 'Manuel de', 'Leçons de', 'Essai sur', 'Dictionnaire de',
+            'Précis de', 'Atlas de', 'Exercices de', 'Cours de', 'Abrégé de', 'Regards sur']
+SUJETS = ['la physique quantique', "l'économie politique", 'la chimie organique', "l'algorithmique",
+          'la mécanique des fluides', 'la sociologie urbaine', "l'histoire médiévale", 'la biologie cellulaire',
+          'la géographie humaine', 'la philosophie morale', 'la linguistique', 'la statistique',
+          "l'analyse numérique", 'la thermodynamique', 'la littérature française', 'la psychologie cognitive',
+          'la théorie des graphes', 'la génétique', "l'astronomie", 'la géologie', 'la comptabilité',
+          'la programmation', 'les bases de données', 'la cryptographie', "l'électronique", "l'optique",
+          'la topologie', "l'algèbre linéaire", 'la musicologie', "l'archéologie"]
+COMPLEMENTS = ['', '', '', ' moderne', ' appliquée', ' avancée', ' pour débutants', ' illustrée',
+               ' : une approche pratique', ' : concepts et méthodes', ' au XXe siècle', ' en 100 questions']
+EDITEURS = ['Dunod', 'Gallimard', 'Hachette', 'Flammarion', 'Eyrolles', 'Armand Colin', 'PUF', 'Seuil',
+            'Ellipses', 'De Boeck', 'Vuibert', 'Belin', 'La Découverte', 'Odile Jacob', 'EDP Sciences',
+            'Presses de Sciences Po', 'Pearson', 'Masson', 'Nathan', 'Larousse']
+
+
+def _isbn13(numero: int) -> str:
+    """ISBN-13 valide (préfixe 978, clé de contrôle calculée)"""
+    corps = f"978{numero:09d}"
+    somme = sum(int(c) * (1 if i % 2 == 0 else 3) for i, c in enumerate(corps))
+    return corps + str((10 - somme % 10) % 10)
+
+
+def _ascii(texte: str) -> str:
+    return unicodedata.normalize('NFKD', texte).encode('ascii', 'ignore').decode('ascii')
+
+
+def _poids_zipf(n: int, exposant: float) -> List[float]:
+    """Poids cumulés de la loi de Zipf : le rang 0 est le plus fréquent"""
+    return list(accumulate(1.0 / (rang + 1) ** exposant for rang in range(n)))
+
+
+class Jeu:
+    """Données générées pour une échelle et une graine"""
+
+    def __init__(self, echelle: float = 0.01, graine: int = 42, aujourd_hui: Optional[date] = None):
+        if echelle <= 0:
+            raise ValueError("L'échelle doit être positive")
+        self.echelle = echelle
+        self.graine = graine
+        self.nb_etudiants = max(10, round(TAILLES_ECHELLE_1['etudiants'] * echelle))
+        self.nb_livres = max(10, round(TAILLES_ECHELLE_1['livres'] * echelle))
+        self.nb_emprunts = max(10, round(TAILLES_ECHELLE_1['emprunts'] * echelle))
+        self.aujourd_hui = aujourd_hui or date.today()
+        self.debut = self.aujourd_hui - timedelta(days=HISTORIQUE_JOURS)
+
+        # Exemplaires : 1 à 5 par titre, numérotés à la suite (les identifiants SERIAL du chargement)
+        rng = random.Random(graine)
+        self.nb_exemplaires_livre = [rng.choices((1, 2, 3, 4, 5), (40, 30, 15, 10, 5))[0]
+                                     for _ in range(self.nb_livres)]
+        self.premier_exemplaire = [1] + list(accumulate(self.nb_exemplaires_livre))[:-1]
+        self.nb_exemplaires = sum(self.nb_exemplaires_livre)
+
+        self.cumul_etudiants = _poids_zipf(self.nb_etudiants, 0.6)
+        self.cumul_livres = _poids_zipf(self.nb_livres, 1.0)
+
+    def _rng(self, domaine: int, i: int) -> random.Random:
+        # Un générateur par ligne : livre(i) ne dépend pas des lignes précédentes
+        return random.Random((self.graine * 1_000_003 + domaine) * 100_000_007 + i)
+
+    # --- Lignes, adressables par index ---
+
+    def etudiant(self, etudiant_id: int) -> Dict:
+        rng = self._rng(1, etudiant_id)
+        prenom, nom = rng.choice(PRENOMS), rng.choice(NOMS)
+        return {
+            'id': etudiant_id,
+            'nom': nom,
+            'prenom': prenom,
+            'email': f"{_ascii(prenom)}.{_ascii(nom)}.{etudiant_id}@etu.univ.fr".lower().replace(' ', ''),
+            'date_inscription': self.debut - timedelta(days=rng.randrange(365)),
+        }
+
+    def livre(self, index: int) -> Dict:
+        rng = self._rng(2, index)
+        titre = f"{rng.choice(OUVRAGES)} {rng.choice(SUJETS)}{rng.choice(COMPLEMENTS)}"
+        if rng.random() < 0.2:
+            titre += f", tome {rng.randint(1, 4)}"
+        return {
+            'isbn': _isbn13(index + 1),
+            'titre': titre,
+            'editeur': rng.choice(EDITEURS),
+            'annee': rng.randint(1960, self.aujourd_hui.year),
+            'exemplaires': self.nb_exemplaires_livre[index],
+        }
+
+    def etudiants(self) -> Iterator[Dict]:
+        return (self.etudiant(i) for i in range(1, self.nb_etudiants + 1))
+
+    def livres(self) -> Iterator[Dict]:
+        return (self.livre(i) for i in range(self.nb_livres))
+
+    def exemplaires(self) -> Iterator[Dict]:
+        for index in range(self.nb_livres):
+            isbn = _isbn13(index + 1)
+            premier = self.premier_exemplaire[index]
+            for id_exemplaire in range(premier, premier + self.nb_exemplaires_livre[index]):
+                yield {'id': id_exemplaire, 'isbn': isbn}
+
+    # --- Tirages selon la popularité ---
+
+    def tirer_etudiant(self, rng: random.Random) -> int:
+        return min(self.nb_etudiants, bisect_left(self.cumul_etudiants, rng.random() * self.cumul_etudiants[-1]) + 1)
+
+    def tirer_livre(self, rng: random.Random) -> int:
+        return min(self.nb_livres - 1, bisect_left(self.cumul_livres, rng.random() * self.cumul_livres[-1]))
+
+    def emprunts(self) -> Iterator[Dict]:
+        """
+        Emprunts par date croissante (identifiants 1..N). Un emprunt non rendu à la
+        date du jour reste en cours s'il respecte les règles (exemplaire libre,
+        MAX_EMPRUNTS_PAR_ETUDIANT) ; sinon il est rendu aujourd'hui.
+        """
+        rng = random.Random(self.graine * 7 + 3)
+        jours = [self.debut + timedelta(days=j) for j in range(HISTORIQUE_JOURS + 1)]
+        poids = [0.3 if jour.weekday() >= 5 else 1.0 for jour in jours]
+        cumul = list(accumulate(poids))
+        en_cours = Counter()
+        occupes = set()
+        emprunt_id = 0
+        deja = 0
+
+        for numero, jour in enumerate(jours):
+            # Répartition exacte de nb_emprunts selon le poids des jours
+            jusqu_ici = round(self.nb_emprunts * cumul[numero] / cumul[-1])
+            for _ in range(jusqu_ici - deja):
+                emprunt_id += 1
+                etudiant_id = self.tirer_etudiant(rng)
+                index = self.tirer_livre(rng)
+                nb, premier = self.nb_exemplaires_livre[index], self.premier_exemplaire[index]
+                id_exemplaire = premier + rng.randrange(nb)
+                tirage = rng.random()
+                duree = rng.randint(3, 14) if tirage < 0.7 else rng.randint(15, 30) if tirage < 0.95 \
+                    else rng.randint(31, 90)
+                retour = jour + timedelta(days=duree)
+
+                if retour >= self.aujourd_hui:
+                    retour = self.aujourd_hui
+                    if en_cours[etudiant_id] < MAX_EMPRUNTS_PAR_ETUDIANT:
+                        libres = [premier + k for k in range(nb) if premier + k not in occupes]
+                        if libres:
+                            id_exemplaire = rng.choice(libres)
+                            occupes.add(id_exemplaire)
+                            en_cours[etudiant_id] += 1
+                            retour = None
+
+                jours_retard = max(0, (retour - jour).days - DUREE_EMPRUNT_DEFAUT) if retour else 0
+                yield {
+                    'id': emprunt_id,
+                    'etudiant_id': etudiant_id,
+                    'isbn': _isbn13(index + 1),
+                    'id_exemplaire': id_exemplaire,
+                    'date_emprunt': jour,
+                    'date_retour': retour,
+                    'amende': (Decimal(str(AMENDE_PAR_JOUR)) * jours_retard).quantize(Decimal('0.01')),
+                }
+            deja = jusqu_ici
+
+
+# --- Chargement PostgreSQL ---
+
+TABLES = ('etudiant', 'livre', 'exemplaire', 'emprunt')
+
+COPIES = {
+    'etudiant': "COPY etudiant (id_etud, nom, prenom, email, date_inscription, solde_amende) FROM STDIN WITH (FORMAT csv)",
+    'livre': "COPY livre (isbn, titre, editeur, annee) FROM STDIN WITH (FORMAT csv)",
+    'exemplaire': "COPY exemplaire (id_exemplaire, isbn, disponible) FROM STDIN WITH (FORMAT csv)",
+    'emprunt': "COPY emprunt (id_emprunt, id_etud, isbn, date_emprunt, date_retour, amende, id_exemplaire) "
+               "FROM STDIN WITH (FORMAT csv)",
+}
+
+
+def _copier(table: str, lignes: Iterator[tuple], taille_lot: int, progression: Callable[[str], None]) -> int:
+    """COPY par lots, un lot par transaction ; retourne le nombre de lignes"""
+    total = 0
+    while True:
+        lot = list(itertools.islice(lignes, taille_lot))
+        if not lot:
+            return total
+        tampon = io.StringIO()
+        csv.writer(tampon).writerows(lot)
+        tampon.seek(0)
+        with transaction():
+            copy_query(COPIES[table], tampon)
+        total += len(lot)
+        progression(f"{table}: {total} lignes")
+
+
+def charger_postgres(jeu: Jeu, vider: bool = False, taille_lot: int = TAILLE_LOT_COPY,
+                     progression: Callable[[str], None] = lambda message: None) -> Dict:
+    """
+    Charge le jeu par COPY. Les tables doivent être vides, sauf avec vider=True
+    (TRUNCATE de toutes les données). Retourne les nombres de lignes et la durée.
+    """
+    debut = time.monotonic()
+    with transaction():
+        if vider:
+            execute_query("TRUNCATE emprunt, exemplaire, livre, etudiant RESTART IDENTITY CASCADE")
+        else:
+            for table in TABLES:
+                if execute_query(f"SELECT EXISTS (SELECT 1 FROM {table}) as existe", fetch_one=True, primary=True)['existe']:
+                    raise ValueError(f"La table {table} n'est pas vide (vider=True pour la remplacer)")
+
+        # Partitions mensuelles de tout l'historique (et des mois à venir)
+        execute_query(
+            "SELECT creer_partitions_emprunt(%s, %s) as nb",
+            (jeu.debut.replace(day=1), (jeu.aujourd_hui.replace(day=1) + timedelta(days=62)).replace(day=1)),
+            fetch_one=True
+        )
+
+    rapport = {
+        'etudiants': _copier('etudiant', ((e['id'], e['nom'], e['prenom'], e['email'], e['date_inscription'], 0)
+                                          for e in jeu.etudiants()), taille_lot, progression),
+        'livres': _copier('livre', ((livre['isbn'], livre['titre'], livre['editeur'], livre['annee'])
+                                    for livre in jeu.livres()), taille_lot, progression),
+        'exemplaires': _copier('exemplaire', ((x['id'], x['isbn'], 't') for x in jeu.exemplaires()),
+                               taille_lot, progression),
+        'emprunts': _copier('emprunt', ((e['id'], e['etudiant_id'], e['isbn'], e['date_emprunt'], e['date_retour'],
+                                         e['amende'], e['id_exemplaire']) for e in jeu.emprunts()),
+                            taille_lot, progression),
+    }
+
+    with transaction():
+        # Exemplaires prêtés et soldes d'amendes (les triggers ajustent les compteurs)
+        execute_query("""
+            UPDATE exemplaire SET disponible = FALSE
+            WHERE id_exemplaire IN (SELECT id_exemplaire FROM emprunt WHERE date_retour IS NULL)
+        """)
+        execute_query("""
+            UPDATE etudiant et SET solde_amende = a.total
+            FROM (SELECT id_etud, SUM(amende) as total FROM emprunt GROUP BY id_etud HAVING SUM(amende) > 0) a
+            WHERE et.id_etud = a.id_etud
+        """)
+        for table, colonne in (('etudiant', 'id_etud'), ('exemplaire', 'id_exemplaire'), ('emprunt', 'id_emprunt')):
+            execute_query(
+                f"SELECT setval(pg_get_serial_sequence('{table}', '{colonne}'), "
+                f"(SELECT COALESCE(MAX({colonne}), 0) + 1 FROM {table}), false)",
+                fetch_one=True
+            )
+    progression("repli des classements")
+    stats_service.replier_classements()
+    progression("ANALYZE")
+    execute_query("ANALYZE etudiant, livre, exemplaire, emprunt")
+
+    stats_service.invalider_cache()
+    rapport['duree_s'] = round(time.monotonic() - debut, 1)
+    return rapport
+
+
+# --- Chargement du moteur mémoire ---
+
+def charger_memoire(stockage, jeu: Jeu) -> Dict:
+    """Charge le jeu dans un StockageMemoire vide (mêmes identifiants qu'en base)"""
+    if stockage.etudiant or stockage.livre:
+        raise ValueError("Le stockage mémoire n'est pas vide")
+    debut = time.monotonic()
+    with stockage.verrou:
+        for e in jeu.etudiants():
+            stockage.etudiants.create(e['nom'], e['prenom'], e['email'])
+            stockage.etudiant[e['id']]['date_inscription'] = e['date_inscription']
+        for livre in jeu.livres():
+            stockage.livres.create(livre['titre'], livre['editeur'], livre['isbn'], livre['annee'],
+                                   livre['exemplaires'])
+        nb_emprunts = 0
+        for e in jeu.emprunts():
+            if e['date_retour'] is None:
+                stockage.occuper_exemplaire(e['id_exemplaire'])
+            stockage.inserer_emprunt(e['etudiant_id'], e['isbn'], e['date_emprunt'], e['date_retour'],
+                                     e['amende'], e['id_exemplaire'])
+            if e['amende']:
+                stockage.crediter_amende(e['etudiant_id'], e['amende'])
+            nb_emprunts += 1
+
+    stats_service.invalider_cache()
+    return {'etudiants': jeu.nb_etudiants, 'livres': jeu.nb_livres, 'exemplaires': jeu.nb_exemplaires,
+            'emprunts': nb_emprunts, 'duree_s': round(time.monotonic() - debut, 1)}
@@ -0,0 +1,203 @@
+"""
+Exécution d'un banc d'essai et rapport JSON comparable d'un commit à l'autre.
+
+N threads (usagers) enchaînent des scénarios tirés selon le mix pendant la durée
+demandée, après une phase d'échauffement non mesurée. Les requêtes SQL par requête
+HTTP sont lues dans /api/metrics (différence avant / après la période mesurée).
+"""
+
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from random import Random
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmark.donnees import Jeu
+from benchmark.scenarios import SCENARIOS, Usager, lire_mix
+
+FORMAT_RAPPORT = 1
+_LIGNE_METRIQUE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+_ETIQUETTE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _percentile(valeurs: List[float], rang: float) -> float:
+    """Percentile au rang le plus proche d'une liste triée"""
+    if not valeurs:
+        return 0.0
+    return valeurs[min(len(valeurs) - 1, max(0, round(rang * len(valeurs)) - 1))]
+
+
+def _resumer(mesures: List[Tuple[float, int]], duree_s: float) -> Dict:
+    durees = sorted(d * 1000 for d, _ in mesures)
+    return {
+        'nombre': len(mesures),
+        'erreurs': sum(1 for _, statut in mesures if statut >= 500),
+        'refus': sum(1 for _, statut in mesures if 400 <= statut < 500),
+        'debit_rps': round(len(mesures) / duree_s, 2),
+        'moyenne_ms': round(sum(durees) / len(durees), 3) if durees else 0.0,
+        'p50_ms': round(_percentile(durees, 0.50), 3),
+        'p90_ms': round(_percentile(durees, 0.90), 3),
+        'p95_ms': round(_percentile(durees, 0.95), 3),
+        'p99_ms': round(_percentile(durees, 0.99), 3),
+        'max_ms': round(durees[-1], 3) if durees else 0.0,
+    }
+
+
+def lire_metriques(client) -> Dict[str, Dict[str, float]]:
+    """Par route : requêtes HTTP, requêtes SQL et temps SQL cumulés (texte de /api/metrics)"""
+    statut, texte = client.requete('GET', '/api/metrics')
+    routes: Dict[str, Dict[str, float]] = defaultdict(lambda: {'http': 0, 'sql': 0, 'sql_s': 0.0})
+    if statut != 200 or not isinstance(texte, str):
+        return {}
+    for ligne in texte.splitlines():
+        correspondance = _LIGNE_METRIQUE.match(ligne)
+        if not correspondance:
+            continue
+        nom, etiquettes, valeur = correspondance.groups()
+        route = dict(_ETIQUETTE.findall(etiquettes)).get('route')
+        if route is None:
+            continue
+        if nom == 'http_request_duration_seconds_count':
+            routes[route]['http'] += float(valeur)
+        elif nom == 'db_queries_per_request_sum':
+            routes[route]['sql'] += float(valeur)
+        elif nom == 'db_query_seconds_total':
+            routes[route]['sql_s'] += float(valeur)
+    return dict(routes)
+
+
+def _sql_par_route(avant: Dict, apres: Dict) -> Dict:
+    resultat = {}
+    for route, valeurs in sorted(apres.items()):
+        precedent = avant.get(route, {'http': 0, 'sql': 0, 'sql_s': 0.0})
+        nb_http = valeurs['http'] - precedent['http']
+        if route == '/api/metrics' or nb_http <= 0:
+            continue
+        resultat[route] = {
+            'requetes_http': int(nb_http),
+            'sql_par_requete': round((valeurs['sql'] - precedent['sql']) / nb_http, 2),
+            'sql_ms_par_requete': round((valeurs['sql_s'] - precedent['sql_s']) * 1000 / nb_http, 3),
+        }
+    return resultat
+
+
+def version_code() -> Optional[str]:
+    """Commit courant (suffixe -dirty si l'arbre de travail est modifié)"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              timeout=5, check=True).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def lancer(fabrique_client: Callable[[], object], jeu: Jeu, duree_s: float = 30, concurrence: int = 4,
+           mix: Optional[Dict[str, int]] = None, graine: int = 1, echauffement_s: float = 5,
+           cible: str = '') -> Dict:
+    """
+    Rejoue le mix de scénarios avec `concurrence` usagers et retourne le rapport.
+    fabrique_client() crée le client d'un usager (ClientFlask ou ClientHttp).
+    """
+    if duree_s <= 0 or concurrence <= 0:
+        raise ValueError("La durée et la concurrence doivent être positives")
+    mix = mix or lire_mix(None)
+    noms = [nom for nom, poids in mix.items() if poids > 0]
+    poids = [mix[nom] for nom in noms]
+
+    debut_mesure = time.monotonic() + echauffement_s
+    fin = debut_mesure + duree_s
+    usagers: List[Usager] = []
+    scenarios: List[Dict[str, List[Tuple[float, int]]]] = []
+
+    def boucle(numero: int):
+        usager = Usager(fabrique_client(), jeu, Random(graine * 1000 + numero))
+        par_scenario = defaultdict(list)
+        usagers.append(usager)
+        scenarios.append(par_scenario)
+        while time.monotonic() < fin:
+            if time.monotonic() >= debut_mesure and usager.debut_mesure is None:
+                usager.commencer_mesure()
+            nom = usager.rng.choices(noms, poids)[0]
+            debut = time.perf_counter()
+            SCENARIOS[nom](usager)
+            if usager.debut_mesure is not None:
+                par_scenario[nom].append((time.perf_counter() - debut, 200))
+
+    threads = [threading.Thread(target=boucle, args=(n,), name=f"usager-{n}") for n in range(concurrence)]
+    for thread in threads:
+        thread.start()
+
+    client_metriques = fabrique_client()
+    time.sleep(max(0.0, debut_mesure - time.monotonic()))
+    metriques_avant = lire_metriques(client_metriques)
+    for thread in threads:
+        thread.join()
+    duree_reelle = time.monotonic() - debut_mesure
+    # Les workers recopient leurs métriques chaque seconde
+    time.sleep(1.5)
+    metriques_apres = lire_metriques(client_metriques)
+
+    par_requete: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    for usager in usagers:
+        for libelle, mesures in usager.mesures.items():
+            par_requete[libelle].extend(mesures)
+    par_scenario: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+    for mesures_usager in scenarios:
+        for nom, mesures in mesures_usager.items():
+            par_scenario[nom].extend(mesures)
+    toutes = [mesure for mesures in par_requete.values() for mesure in mesures]
+    global_ = _resumer(toutes, duree_reelle)
+
+    return {
+        'format': FORMAT_RAPPORT,
+        'version': version_code(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'parametres': {
+            'cible': cible, 'echelle': jeu.echelle, 'graine': graine, 'graine_donnees': jeu.graine,
+            'duree_s': duree_s, 'echauffement_s': echauffement_s, 'concurrence': concurrence, 'mix': mix,
+        },
+        'duree_s': round(duree_reelle, 2),
+        'requetes': global_['nombre'],
+        'debit_rps': global_['debit_rps'],
+        'erreurs': global_['erreurs'],
+        'exceptions': sum(usager.exceptions for usager in usagers),
+        'latence': {cle: valeur for cle, valeur in global_.items() if cle.endswith('_ms')},
+        'par_requete': {libelle: _resumer(mesures, duree_reelle) for libelle, mesures in sorted(par_requete.items())},
+        'par_scenario': {nom: _resumer(mesures, duree_reelle) for nom, mesures in sorted(par_scenario.items())},
+        'sql_par_route': _sql_par_route(metriques_avant, metriques_apres),
+    }
+
+
+def comparer(ancien: Dict, nouveau: Dict, tolerance: float = 0.10) -> List[Dict]:
+    """
+    Compare deux rapports requête par requête : p95, débit et requêtes SQL par requête.
+    Une ligne est une régression si le p95 ou le nombre de requêtes SQL augmente, ou
+    si le débit baisse, de plus de `tolerance` (fraction).
+    """
+    def variation(avant: float, apres: float) -> Optional[float]:
+        return round((apres - avant) / avant, 4) if avant else None
+
+    lignes = []
+    for libelle in sorted(set(ancien['par_requete']) | set(nouveau['par_requete'])):
+        a, n = ancien['par_requete'].get(libelle), nouveau['par_requete'].get(libelle)
+        if a is None or n is None:
+            lignes.append({'libelle': libelle, 'ancien': a, 'nouveau': n, 'regression': False})
+            continue
+        p95, debit = variation(a['p95_ms'], n['p95_ms']), variation(a['debit_rps'], n['debit_rps'])
+        lignes.append({
+            'libelle': libelle,
+            'p95_ms': (a['p95_ms'], n['p95_ms']), 'variation_p95': p95,
+            'debit_rps': (a['debit_rps'], n['debit_rps']), 'variation_debit': debit,
+            'regression': (p95 is not None and p95 > tolerance) or (debit is not None and debit < -tolerance),
+        })
+
+    for route in sorted(set(ancien.get('sql_par_route', {})) & set(nouveau.get('sql_par_route', {}))):
+        a, n = ancien['sql_par_route'][route]['sql_par_requete'], nouveau['sql_par_route'][route]['sql_par_requete']
+        sql = variation(a, n)
+        lignes.append({
+            'libelle': f"SQL {route}", 'sql_par_requete': (a, n), 'variation_sql': sql,
+            'regression': (sql is not None and sql > tolerance) or (not a and n > 0),
+        })
+    return lignes
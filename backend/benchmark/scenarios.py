@@ -0,0 +1,197 @@
+"""
+Scénarios de trafic rejoués contre l'API (un scénario = une action d'un usager).
+
+- recherche : saisie au fil de la frappe (une requête de recherche par caractère ou deux)
+- emprunts : passages au comptoir (détail de l'étudiant, emprunts, retours) et
+  rafales des postes de scan (lots d'emprunts puis de retours)
+- tableau_de_bord : rafraîchissement périodique des statistiques et des retards
+- listes : pages des listes (pagination par curseur), détails et historique
+
+Chaque appel est chronométré sous un libellé stable (ex. 'GET /api/livres/search'),
+qui sert de clé au rapport.
+"""
+
+import http.client
+import json
+import re
+import time
+from collections import defaultdict, deque
+from random import Random
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from benchmark.donnees import Jeu
+
+# Part de chaque scénario dans le trafic (comptoir de bibliothèque universitaire)
+MIX_DEFAUT = {'recherche': 40, 'listes': 25, 'emprunts': 20, 'tableau_de_bord': 15}
+
+_ARTICLE = re.compile(r"^(?:la |le |les |l')")
+
+
+class ClientFlask:
+    """Requêtes dans le processus (app.test_client()), sans réseau"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def requete(self, methode: str, chemin: str, corps: Optional[Dict] = None) -> Tuple[int, object]:
+        reponse = self.client.open(chemin, method=methode, json=corps)
+        return reponse.status_code, reponse.get_json(silent=True) if reponse.is_json else reponse.get_data(as_text=True)
+
+
+class ClientHttp:
+    """Requêtes HTTP vers un serveur lancé à part, sur une connexion persistante"""
+
+    def __init__(self, url: str, delai: float = 30.0):
+        adresse = urlsplit(url)
+        self.hote, self.port = adresse.hostname, adresse.port or 80
+        self.prefixe = adresse.path.rstrip('/')
+        self.delai = delai
+        self.connexion = None
+
+    def requete(self, methode: str, chemin: str, corps: Optional[Dict] = None) -> Tuple[int, object]:
+        donnees = json.dumps(corps).encode('utf-8') if corps is not None else None
+        entetes = {'Content-Type': 'application/json'} if corps is not None else {}
+        for tentative in (1, 2):
+            if self.connexion is None:
+                self.connexion = http.client.HTTPConnection(self.hote, self.port, timeout=self.delai)
+            try:
+                self.connexion.request(methode, self.prefixe + chemin, donnees, entetes)
+                reponse = self.connexion.getresponse()
+                texte = reponse.read().decode('utf-8')
+                break
+            except (ConnectionError, http.client.HTTPException):
+                # Connexion fermée par le serveur (keep-alive expiré, worker recyclé) : une seconde chance
+                self.connexion.close()
+                self.connexion = None
+                if tentative == 2:
+                    raise
+        if reponse.getheader('Content-Type', '').startswith('application/json'):
+            return reponse.status, json.loads(texte)
+        return reponse.status, texte
+
+
+class Usager:
+    """Client d'un thread : appels chronométrés et emprunts à rendre plus tard"""
+
+    def __init__(self, client, jeu: Jeu, rng: Random):
+        self.client = client
+        self.jeu = jeu
+        self.rng = rng
+        self.mesures: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+        self.exceptions = 0
+        self.a_rendre = deque()
+        self.debut_mesure: Optional[float] = None
+
+    def commencer_mesure(self):
+        """Fin de l'échauffement : les appels déjà chronométrés sont oubliés"""
+        self.mesures.clear()
+        self.exceptions = 0
+        self.debut_mesure = time.perf_counter()
+
+    def appel(self, libelle: str, methode: str, chemin: str, corps: Optional[Dict] = None) -> Tuple[int, object]:
+        debut = time.perf_counter()
+        try:
+            statut, resultat = self.client.requete(methode, chemin, corps)
+        except Exception:
+            self.exceptions += 1
+            statut, resultat = 599, None
+        self.mesures[libelle].append((time.perf_counter() - debut, statut))
+        return statut, resultat
+
+
+def recherche(u: Usager):
+    if u.rng.random() < 0.8:
+        # Le sujet du titre (ex. "physique quantique"), tapé au fil de l'eau
+        mots = u.jeu.livre(u.jeu.tirer_livre(u.rng))['titre'].split()
+        texte = _ARTICLE.sub('', ' '.join(mots[2:4]))
+        route, libelle = '/api/livres/search', 'GET /api/livres/search'
+    else:
+        texte = u.jeu.etudiant(u.jeu.tirer_etudiant(u.rng))['nom']
+        route, libelle = '/api/etudiants/search', 'GET /api/etudiants/search'
+    n = min(3, len(texte))
+    while n <= len(texte):
+        u.appel(libelle, 'GET', f"{route}?q={quote(texte[:n])}")
+        n += u.rng.choice((1, 1, 2))
+
+
+def emprunts(u: Usager):
+    etudiant_id = u.jeu.tirer_etudiant(u.rng)
+    if u.rng.random() < 0.8:
+        # Comptoir : fiche de l'étudiant, un à trois emprunts, retours d'emprunts antérieurs
+        u.appel('GET /api/etudiants/<id>', 'GET', f"/api/etudiants/{etudiant_id}")
+        for _ in range(u.rng.randint(1, 3)):
+            isbn = u.jeu.livre(u.jeu.tirer_livre(u.rng))['isbn']
+            statut, resultat = u.appel('POST /api/emprunts', 'POST', '/api/emprunts',
+                                       {'etudiant_id': etudiant_id, 'livre_id': isbn})
+            if statut == 201:
+                u.a_rendre.append(resultat['id'])
+        for _ in range(min(len(u.a_rendre), u.rng.randint(1, 3))):
+            u.appel('POST /api/emprunts/<id>/retourner', 'POST', f"/api/emprunts/{u.a_rendre.popleft()}/retourner")
+    else:
+        # Poste de scan : un lot d'emprunts puis le lot de retours des emprunts en attente
+        operations = [{'etudiant_id': u.jeu.tirer_etudiant(u.rng),
+                       'livre_id': u.jeu.livre(u.jeu.tirer_livre(u.rng))['isbn']}
+                      for _ in range(u.rng.randint(5, 20))]
+        statut, resultat = u.appel('POST /api/emprunts/lot', 'POST', '/api/emprunts/lot', {'operations': operations})
+        if statut == 200:
+            u.a_rendre.extend(r['id'] for r in resultat['resultats'] if r['statut'] == 'ok')
+        if u.a_rendre:
+            ids = [u.a_rendre.popleft() for _ in range(min(len(u.a_rendre), 20))]
+            u.appel('POST /api/emprunts/lot/retourner', 'POST', '/api/emprunts/lot/retourner', {'ids': ids})
+
+
+def tableau_de_bord(u: Usager):
+    u.appel('GET /api/stats/overview', 'GET', '/api/stats/overview')
+    fenetre = u.rng.choice(('all', '7', '30', '365'))
+    u.appel('GET /api/stats/top-etudiants', 'GET', f"/api/stats/top-etudiants?window={fenetre}")
+    u.appel('GET /api/stats/top-livres', 'GET', f"/api/stats/top-livres?window={fenetre}")
+    if u.rng.random() < 0.3:
+        u.appel('GET /api/emprunts/en-retard', 'GET', '/api/emprunts/en-retard')
+
+
+def listes(u: Usager):
+    choix = u.rng.random()
+    if choix < 0.5:
+        route = u.rng.choice(('/api/etudiants', '/api/livres', '/api/emprunts'))
+        suivant = None
+        for _ in range(u.rng.randint(1, 4)):
+            chemin = f"{route}?limit=50" + (f"&after={suivant}" if suivant else '')
+            statut, page = u.appel(f"GET {route}", 'GET', chemin)
+            suivant = page.get('next') if statut == 200 and isinstance(page, dict) else None
+            if not suivant:
+                break
+    elif choix < 0.8:
+        isbn = u.jeu.livre(u.jeu.tirer_livre(u.rng))['isbn']
+        u.appel('GET /api/livres/<isbn>', 'GET', f"/api/livres/{isbn}")
+        u.appel('GET /api/emprunts?isbn', 'GET', f"/api/emprunts?isbn={isbn}&limit=20")
+    else:
+        etudiant_id = u.jeu.tirer_etudiant(u.rng)
+        u.appel('GET /api/etudiants/<id>', 'GET', f"/api/etudiants/{etudiant_id}")
+        u.appel('GET /api/emprunts?etudiant_id', 'GET', f"/api/emprunts?etudiant_id={etudiant_id}&limit=20")
+
+
+SCENARIOS: Dict[str, Callable[[Usager], None]] = {
+    'recherche': recherche,
+    'emprunts': emprunts,
+    'tableau_de_bord': tableau_de_bord,
+    'listes': listes,
+}
+
+
+def lire_mix(texte: Optional[str]) -> Dict[str, int]:
+    """'recherche=40,emprunts=20' -> {'recherche': 40, 'emprunts': 20} (défaut : MIX_DEFAUT)"""
+    if not texte:
+        return dict(MIX_DEFAUT)
+    mix = {}
+    for element in texte.split(','):
+        nom, _, poids = element.partition('=')
+        nom = nom.strip()
+        if nom not in SCENARIOS:
+            raise ValueError(f"Scénario inconnu : '{nom}' (attendu : {', '.join(SCENARIOS)})")
+        if not poids.strip().isdigit():
+            raise ValueError(f"Poids invalide pour '{nom}' : '{poids}'")
+        mix[nom] = int(poids)
+    if not any(mix.values()):
+        raise ValueError("Le mix doit contenir au moins un scénario de poids positif")
+    return mix
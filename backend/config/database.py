@@ -1,45 +1,385 @@
 import os
-import sys
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from psycopg2.pool import PoolError
+from config import requetes_lentes
+from config.pool import ConnectionPool
+from config.replicas import Replica, ReplicaSet
+from utils import metrics
 from utils.logger import log
 
-load_dotenv()
-
-# Configuration BDD depuis variables d'environnement
-# Vérification que toutes les variables requises sont définies
-required_env_vars = ["DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASSWORD"]
-missing_vars = [var for var in required_env_vars if not os.getenv(var)]
-if missing_vars:
-    error_msg = (
-        f"\nERREUR DE CONFIGURATION\n"
-        f"Variables d'environnement manquantes: {', '.join(missing_vars)}\n"
-        f"Vérifiez que votre fichier .env existe et contient toutes les variables requises.\n"
-    )
-    log(error_msg, level="ERROR")
-    print(error_msg, file=sys.stderr)
-    sys.exit(1)
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": int(os.getenv("DB_PORT")),
-    "database": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD")
-}
+# Variables obligatoires ; les autres ont une valeur par défaut
+VARIABLES_REQUISES = ["DB_HOST", "DB_PORT", "DB_NAME", "DB_USER", "DB_PASSWORD"]
+
+
+class ConfigurationError(RuntimeError):
+    """Configuration BDD absente ou invalide (.env manquant, variable non définie...)"""
+
+
+def _lire_config() -> Dict:
+    load_dotenv()
+
+    missing_vars = [var for var in VARIABLES_REQUISES if not os.getenv(var)]
+    if missing_vars:
+        error_msg = (
+            f"Variables d'environnement manquantes: {', '.join(missing_vars)}\n"
+            f"Vérifiez que votre fichier .env existe et contient toutes les variables requises."
+        )
+        log(error_msg, level="ERROR")
+        raise ConfigurationError(error_msg)
+
+    try:
+        return {
+            # Configuration BDD depuis variables d'environnement
+            "db": {
+                "host": os.getenv("DB_HOST"),
+                "port": int(os.getenv("DB_PORT")),
+                "database": os.getenv("DB_NAME"),
+                "user": os.getenv("DB_USER"),
+                "password": os.getenv("DB_PASSWORD")
+            },
+            # Dimensionnement du pool de connexions (optionnel)
+            "pool": {
+                "minconn": int(os.getenv("DB_POOL_MIN", "1")),
+                "maxconn": int(os.getenv("DB_POOL_MAX", "10")),
+                "timeout": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                "validate_after": float(os.getenv("DB_POOL_VALIDATE_AFTER", "30")),
+            },
+            # Réplicas en lecture (optionnel) : DSN séparés par des virgules
+            "replicas": {
+                "dsns": [dsn.strip() for dsn in os.getenv("DB_REPLICAS", "").split(",") if dsn.strip()],
+                "retard_max": float(os.getenv("DB_REPLICA_MAX_LAG", "5")),
+                "intervalle": float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "2")),
+                "connect_timeout": int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2")),
+            },
+            # Profil des requêtes (config/requetes_lentes.py)
+            "requetes_lentes": {
+                "seuil_ms": float(os.getenv("SLOW_QUERY_MS", "200")),
+                "taux_explain": float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1")),
+                "intervalle_explain": float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300")),
+            },
+        }
+    except ValueError as e:
+        log(f"Configuration BDD invalide : {e}", level="ERROR")
+        raise ConfigurationError(f"Configuration BDD invalide : {e}")
+
+
+def get_config() -> Dict:
+    """
+    Configuration BDD (clés db, pool, replicas), lue au premier appel et non à
+    l'import : importer l'application ne touche ni au .env ni à la base.
+    Lève ConfigurationError si une variable requise manque.
+    """
+    global _config
+    if _config is None:
+        with _pool_lock:
+            if _config is None:
+                _config = _lire_config()
+    return _config
+
+
+_config = None
+_pool = None
+_pool_lock = threading.RLock()
+_replicas = None
+# Pools hérités d'un processus parent (voir reinitialiser_apres_fork)
+_herites = []
+
+# Requêtes qui peuvent aller sur un réplica : SELECT / WITH sans écriture ni verrou.
+# Les fonctions SQL qui écrivent (emprunter_livre...) sont appelées avec primary=True.
+_DEBUT_LECTURE = re.compile(r'^\s*(?:--[^\n]*\n\s*)*\(?\s*(select|with)\b', re.IGNORECASE)
+_ECRITURE = re.compile(
+    r'\b(insert|update|delete|merge|truncate|copy|lock|nextval|setval|pg_advisory\w*)\b'
+    r'|\bfor\s+(update|share|no\s+key\s+update|key\s+share)\b',
+    re.IGNORECASE
+)
+
+
+class Session:
+    """
+    Unité de travail : une connexion et une transaction partagées par toutes
+    les requêtes SQL exécutées pendant la session (typiquement une requête HTTP).
+    La connexion n'est empruntée au pool qu'à la première requête SQL.
+    """
+
+    def __init__(self):
+        self.conn = None
+        self.apres_commit: List[Callable[[], None]] = []
+        # Passe à True à la première écriture (ou dans transaction()) : les lectures
+        # suivantes vont aussi sur le primaire pour voir les écritures de la session
+        self.primaire = False
+
+    def connection(self):
+        if self.conn is None:
+            self.conn = get_pool().getconn()
+        return self.conn
+
+    def close(self, commit: bool):
+        """Valide (ou annule) la transaction puis rend la connexion au pool"""
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        broken = False
+        try:
+            if commit:
+                conn.commit()
+            else:
+                conn.rollback()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            get_pool().putconn(conn, close=broken)
+
+        if commit:
+            for callback in self.apres_commit:
+                callback()
+
+
+_session: ContextVar[Optional[Session]] = ContextVar("db_session", default=None)
 
 
 def get_connection():
     """Retourne une connexion à la base PostgreSQL"""
     try:
-        return psycopg2.connect(**DB_CONFIG)
+        return psycopg2.connect(**get_config()["db"])
     except psycopg2.Error as e:
         log(f"Erreur connexion BDD: {e}", level="ERROR")
         raise
 
 
-def execute_query(query: str, params: tuple = None, fetch: bool = False, fetch_one: bool = False):
+def get_pool() -> ConnectionPool:
+    """Retourne le pool de connexions, créé au premier appel"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = get_config()
+                try:
+                    _pool = ConnectionPool(**config["pool"], **config["db"])
+                    _pool.observer_attente = metrics.observer_attente_pool
+                except psycopg2.Error as e:
+                    log(f"Erreur connexion BDD: {e}", level="ERROR")
+                    raise
+    return _pool
+
+
+def get_replicas() -> Optional[ReplicaSet]:
+    """Retourne les réplicas en lecture (None si DB_REPLICAS n'est pas défini)"""
+    global _replicas
+    config = get_config()
+    if _replicas is None and config['replicas']['dsns']:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = ReplicaSet(
+                    config['replicas']['dsns'],
+                    config['replicas']['retard_max'],
+                    config['replicas']['intervalle'],
+                    maxconn=config['pool']['maxconn'],
+                    timeout=config['pool']['timeout'],
+                    validate_after=config['pool']['validate_after'],
+                    connect_timeout=config['replicas']['connect_timeout'],
+                )
+    return _replicas
+
+
+def get_replica_stats() -> Optional[Dict]:
+    """Retourne l'état des réplicas (retard, disponibilité, lectures servies) ou None"""
+    replicas = get_replicas()
+    return replicas.stats() if replicas else None
+
+
+def est_lecture(query: str) -> bool:
+    """Vrai si la requête ne fait que lire (peut être servie par un réplica)"""
+    return bool(_DEBUT_LECTURE.match(query)) and not _ECRITURE.search(query)
+
+
+def _choisir_replica(query: str, fetch: bool, primary: bool) -> Optional[Replica]:
+    """Réplica qui servira la requête, ou None pour le primaire"""
+    if primary or not fetch or not est_lecture(query):
+        return None
+    session = _session.get()
+    if session is not None and session.primaire:
+        return None
+    replicas = get_replicas()
+    return replicas.choisir() if replicas else None
+
+
+def get_pool_stats() -> Dict:
+    """Retourne les statistiques du pool (connexions utilisées, inactives, attente)"""
+    if _pool is None:
+        pool = get_config()['pool']
+        return {'min': pool['minconn'], 'max': pool['maxconn'], 'ouvertes': 0, 'utilisees': 0, 'inactives': 0}
+    return _pool.stats()
+
+
+def prechauffer() -> Dict:
+    """
+    Ouvre le pool du processus courant et vérifie la base (SELECT 1), puis mesure
+    les réplicas : la première requête HTTP ne paie ni connexion ni mesure.
+    Retourne les durées en ms ; lève l'erreur si la base est injoignable.
+    """
+    debut = time.perf_counter()
+    with get_pool().connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+    mesures = {'pool_ms': round((time.perf_counter() - debut) * 1000, 1)}
+
+    replicas = get_replicas()
+    if replicas is not None:
+        debut = time.perf_counter()
+        utilisables = sum(1 for replica in replicas.replicas if replica.utilisable())
+        mesures['replicas_ms'] = round((time.perf_counter() - debut) * 1000, 1)
+        mesures['replicas_utilisables'] = utilisables
+    return mesures
+
+
+def reinitialiser_apres_fork():
+    """
+    Appelée dans le processus fils après un fork (workers du serveur de production) :
+    le fils ouvrira son propre pool au premier besoin. Les connexions héritées
+    partagent leur socket avec le parent ; elles sont abandonnées sans être fermées
+    (la fermeture terminerait aussi la session du parent côté serveur).
+    """
+    global _pool, _replicas, _pool_lock
+    if _pool is not None or _replicas is not None:
+        _herites.append((_pool, _replicas))
+    _pool = None
+    _replicas = None
+    _pool_lock = threading.RLock()
+    _session.set(None)
+
+
+def fermer_pool():
+    """Ferme les connexions du processus courant (arrêt d'un worker)"""
+    global _pool, _replicas
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        if _replicas is not None:
+            _replicas.closeall()
+        _pool = None
+        _replicas = None
+
+
+os.register_at_fork(after_in_child=reinitialiser_apres_fork)
+
+
+def begin_session():
+    """Ouvre une session pour le contexte courant (connexion empruntée à la demande)"""
+    if _session.get() is None:
+        _session.set(Session())
+
+
+def end_session(commit: bool = True):
+    """Termine la session courante : COMMIT si commit=True, ROLLBACK sinon"""
+    session = _session.get()
+    if session is None:
+        return
+    _session.set(None)
+    try:
+        session.close(commit)
+    except psycopg2.Error as e:
+        log(f"Erreur fin de transaction: {e}", level="ERROR")
+        raise
+
+
+@contextmanager
+def transaction():
+    """
+    Exécute un bloc dans une seule transaction, sur le primaire.
+    Réutilise la session en cours si elle existe déjà.
+    """
+    session = _session.get()
+    if session is not None:
+        session.primaire = True
+        yield
+        return
+
+    begin_session()
+    _session.get().primaire = True
+    try:
+        yield
+    except BaseException:
+        end_session(commit=False)
+        raise
+    end_session(commit=True)
+
+
+@contextmanager
+def savepoint():
+    """
+    Sous-transaction dans la session en cours : si le bloc lève une exception,
+    seules ses écritures sont annulées (ROLLBACK TO SAVEPOINT) et la
+    transaction de la session reste utilisable.
+    """
+    if _session.get() is None:
+        raise RuntimeError("savepoint() doit être appelé dans une session ou une transaction")
+
+    nom = f"sp_{uuid.uuid4().hex}"
+    execute_query(f"SAVEPOINT {nom}")
+    try:
+        yield
+    except BaseException:
+        execute_query(f"ROLLBACK TO SAVEPOINT {nom}")
+        raise
+    execute_query(f"RELEASE SAVEPOINT {nom}")
+
+
+def session_a_ecrit() -> bool:
+    """Vrai si la session en cours a écrit : ses lectures peuvent voir des écritures non validées"""
+    session = _session.get()
+    return session is not None and session.primaire
+
+
+def on_commit(callback: Callable[[], None]):
+    """
+    Exécute callback une fois les écritures visibles : après le COMMIT de la
+    session en cours, ou immédiatement hors session (requêtes en autocommit).
+    """
+    session = _session.get()
+    if session is None:
+        callback()
+    elif callback not in session.apres_commit:
+        session.apres_commit.append(callback)
+
+
+_ECHEC_REPLICA = object()
+
+
+def _lire_sur_replica(replica: Replica, query: str, params, fetch_one: bool):
+    """Exécute une lecture sur un réplica ; None si le réplica a échoué (repli sur le primaire)"""
+    try:
+        with replica.pool.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+                result = cur.fetchone() if fetch_one else cur.fetchall()
+            conn.rollback()
+        replica.lectures += 1
+        return result
+    except psycopg2.errors.ReadOnlySqlTransaction as e:
+        # Écriture non détectée (fonction SQL appelée sans primary=True)
+        log(f"Écriture envoyée au réplica, relancée sur le primaire: {e}", level="ERROR")
+        return _ECHEC_REPLICA
+    except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError,
+            psycopg2.errors.SerializationFailure) as e:
+        # Réplica en panne ou requête annulée par le rejeu (conflit de recovery)
+        log(f"Lecture sur réplica {replica.nom} échouée, repli sur le primaire: {e}", level="ERROR")
+        replica.signaler_echec(e)
+        return _ECHEC_REPLICA
+
+
+def execute_query(query: str, params: tuple = None, fetch: bool = False, fetch_one: bool = False,
+                  primary: bool = False):
     """
     Exécute une requête SQL de manière sécurisée.
 
@@ -48,35 +388,157 @@ def execute_query(query: str, params: tuple = None, fetch: bool = False, fetch_o
         params: Paramètres de la requête
         fetch: True pour récupérer tous les résultats
         fetch_one: True pour récupérer un seul résultat
+        primary: True pour forcer le primaire (fonction SQL qui écrit, lecture
+                 qui doit voir la dernière écriture)
 
     Returns:
         Liste de dict, un dict, ou True si succès
+
+    Les lectures (SELECT sans écriture ni verrou) vont sur un réplica à jour si
+    DB_REPLICAS est défini, tant que la session n'a pas écrit ; sinon, et pour
+    toute écriture, sur le primaire.
+    Si une session est ouverte (voir begin_session), la requête s'exécute dans
+    sa transaction et le COMMIT est laissé à end_session.
+    Chaque requête est chronométrée (métriques de la requête HTTP, voir
+    utils/metrics.py ; profil des requêtes lentes, voir config/requetes_lentes.py).
     """
+    debut = time.perf_counter()
     try:
-        with get_connection() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        return _executer(query, params, fetch, fetch_one, primary)
+    finally:
+        duree = time.perf_counter() - debut
+        metrics.compter_requete_sql(duree)
+        requetes_lentes.enregistrer(query, params, duree, get_config()["requetes_lentes"])
+
+
+def _executer(query: str, params, fetch: bool, fetch_one: bool, primary: bool):
+    replica = _choisir_replica(query, fetch or fetch_one, primary)
+    if replica is not None:
+        result = _lire_sur_replica(replica, query, params, fetch_one)
+        if result is not _ECHEC_REPLICA:
+            return result
+
+    session = _session.get()
+    try:
+        if session is not None:
+            if primary or not est_lecture(query):
+                session.primaire = True
+            with session.connection().cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute(query, params)
 
                 if fetch_one:
                     return cur.fetchone()
                 elif fetch:
                     return cur.fetchall()
+                return True
+
+        # En cas d'erreur, le pool annule la transaction au retour de la connexion
+        with get_pool().connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params)
+
+                if fetch_one:
+                    result = cur.fetchone()
+                elif fetch:
+                    result = cur.fetchall()
                 else:
-                    conn.commit()
-                    return True
+                    result = True
+            conn.commit()
+            return result
 
     except psycopg2.Error as e:
         log(f"Erreur SQL: {e}", level="ERROR")
         raise
 
 
+def copy_query(query: str, fichier) -> int:
+    """
+    Exécute un COPY ... FROM STDIN en lisant les données depuis fichier
+    (objet fichier texte). Retourne le nombre de lignes copiées.
+
+    Comme execute_query : dans la transaction de la session si elle est ouverte,
+    sinon sur une connexion du pool avec COMMIT.
+    """
+    session = _session.get()
+    try:
+        if session is not None:
+            session.primaire = True
+            with session.connection().cursor() as cur:
+                cur.copy_expert(query, fichier)
+                return cur.rowcount
+
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.copy_expert(query, fichier)
+                lignes = cur.rowcount
+            conn.commit()
+            return lignes
+
+    except psycopg2.Error as e:
+        log(f"Erreur SQL (COPY): {e}", level="ERROR")
+        raise
+
+
 def test_connection() -> bool:
     """Teste la connexion à la base de données"""
     try:
-        with get_connection() as conn:
+        with get_pool().connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
-                return True
+            conn.rollback()
+            return True
     except Exception as e:
         log(f"Test connexion échoué: {e}", level="ERROR")
         return False
+
+
+def stream_query(query: str, params: tuple = None, batch_size: int = 2000, primary: bool = False) -> Iterator[List[Dict]]:
+    """
+    Exécute une requête avec un curseur côté serveur (curseur nommé) et produit
+    les lignes par lots de batch_size : la mémoire reste constante quelle que
+    soit la taille du résultat.
+
+    Utilise sa propre connexion du pool (hors session) car le générateur est
+    consommé après la fin de la requête HTTP ; la connexion est rendue quand
+    le générateur est épuisé ou fermé. Servi par un réplica à jour s'il y en a
+    un (repli sur le primaire si le réplica échoue avant le premier lot).
+    """
+    replica = _choisir_replica(query, True, primary)
+    if replica is not None:
+        produit = False
+        try:
+            with replica.pool.connection() as conn:
+                with conn.cursor(name=f"flux_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+                    cur.itersize = batch_size
+                    cur.execute(query, params)
+                    while True:
+                        lot = cur.fetchmany(batch_size)
+                        if not lot:
+                            break
+                        produit = True
+                        yield lot
+                conn.rollback()
+            replica.lectures += 1
+            return
+        except (psycopg2.OperationalError, psycopg2.InterfaceError, PoolError,
+                psycopg2.errors.SerializationFailure) as e:
+            replica.signaler_echec(e)
+            if produit:
+                log(f"Erreur SQL (flux, réplica {replica.nom}): {e}", level="ERROR")
+                raise
+            log(f"Flux sur réplica {replica.nom} échoué, repli sur le primaire: {e}", level="ERROR")
+
+    try:
+        with get_pool().connection() as conn:
+            with conn.cursor(name=f"flux_{uuid.uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+                cur.itersize = batch_size
+                cur.execute(query, params)
+                while True:
+                    lot = cur.fetchmany(batch_size)
+                    if not lot:
+                        break
+                    yield lot
+            conn.rollback()
+    except psycopg2.Error as e:
+        log(f"Erreur SQL (flux): {e}", level="ERROR")
+        raise
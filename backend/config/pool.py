@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(PoolError):
+    """Aucune connexion libre avant l'expiration du délai d'attente"""
+
+
+class ConnectionPool:
+    """
+    Pool de connexions PostgreSQL borné et thread-safe.
+
+    - au plus `maxconn` connexions ouvertes en même temps
+    - attente bloquante (au plus `timeout` secondes) quand le pool est plein
+    - les connexions restées inactives plus de `validate_after` secondes
+      sont testées (SELECT 1) avant d'être rendues à l'appelant
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, validate_after: float, **conn_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Taille de pool invalide (min={minconn}, max={maxconn})")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self._conn_kwargs = conn_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connexion, instant du dernier retour)
+        self._total = 0
+        self._in_use = 0
+        self._closed = False
+
+        # Compteurs exposés par stats()
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._created = 0
+        self._discarded = 0
+        # Appelé avec l'attente (secondes) de chaque emprunt réussi (métriques)
+        self.observer_attente: Optional[Callable[[float], None]] = None
+
+        for _ in range(minconn):
+            conn = self._connect()
+            with self._cond:
+                self._total += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._conn_kwargs)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _is_alive(self, conn) -> bool:
+        """Vérifie qu'une connexion inactive répond encore"""
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._total -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def getconn(self):
+        """Emprunte une connexion au pool (bloque au plus `timeout` secondes)"""
+        debut = time.monotonic()
+        echeance = debut + self.timeout
+        a_attendu = False
+
+        while True:
+            conn = None
+            last_used = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolError("Pool de connexions fermé")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._total < self.maxconn:
+                        self._total += 1
+                        break
+                    restant = echeance - time.monotonic()
+                    if restant <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"Aucune connexion disponible après {self.timeout}s "
+                            f"({self._in_use}/{self.maxconn} utilisées)"
+                        )
+                    a_attendu = True
+                    self._cond.wait(restant)
+                self._in_use += 1
+
+            # Ouverture ou validation hors du verrou
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._cond:
+                        self._total -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+            elif conn.closed or (time.monotonic() - last_used > self.validate_after and not self._is_alive(conn)):
+                with self._cond:
+                    self._in_use -= 1
+                self._discard(conn)
+                continue
+
+            attente = time.monotonic() - debut
+            with self._cond:
+                self._checkouts += 1
+                if a_attendu:
+                    self._waits += 1
+                self._wait_total += attente
+                self._wait_max = max(self._wait_max, attente)
+            if self.observer_attente is not None:
+                self.observer_attente(attente)
+            return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Rend une connexion au pool (la ferme si elle est inutilisable)"""
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._cond:
+            self._in_use -= 1
+
+        if close or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager : emprunte une connexion puis la rend au pool"""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, close=broken)
+
+    def closeall(self):
+        """Ferme toutes les connexions inactives et refuse les nouveaux emprunts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict:
+        """Retourne l'état du pool et les temps d'attente cumulés"""
+        with self._cond:
+            return {
+                'min': self.minconn,
+                'max': self.maxconn,
+                'ouvertes': self._total,
+                'utilisees': self._in_use,
+                'inactives': len(self._idle),
+                'emprunts': self._checkouts,
+                'attentes': self._waits,
+                'expirations': self._timeouts,
+                'attente_totale_ms': round(self._wait_total * 1000, 3),
+                'attente_max_ms': round(self._wait_max * 1000, 3),
+                'attente_moyenne_ms': round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                'creees': self._created,
+                'fermees': self._discarded,
+            }
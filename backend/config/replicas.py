@@ -0,0 +1,124 @@
+import itertools
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+from config.pool import ConnectionPool
+from utils.logger import log
+
+# Retard de réplication en secondes (0 si le réplica a rejoué tout ce qu'il a reçu)
+REQUETE_RETARD = """
+    SELECT CASE
+               WHEN NOT pg_is_in_recovery() THEN 0
+               WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+               ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+"""
+
+
+def _masquer_dsn(dsn: str) -> str:
+    """Nom affichable d'un réplica : DSN sans mot de passe"""
+    dsn = re.sub(r'(password\s*=\s*)\S+', r'\1***', dsn)
+    return re.sub(r'(://[^:/@]+):[^@]*@', r'\1:***@', dsn)
+
+
+class Replica:
+    """
+    Réplica en lecture seule : son propre pool de connexions et son retard de
+    réplication, mesuré au plus toutes les `intervalle` secondes.
+    Un réplica en panne ou trop en retard n'est plus choisi jusqu'à la mesure suivante.
+    """
+
+    def __init__(self, dsn: str, retard_max: float, intervalle: float, **pool_kwargs):
+        self.nom = _masquer_dsn(dsn)
+        self.retard_max = retard_max
+        self.intervalle = intervalle
+        self.pool = ConnectionPool(minconn=0, dsn=dsn, **pool_kwargs)
+
+        self._lock = threading.Lock()
+        self._verifie_le = float('-inf')
+        self.disponible = False
+        self.retard: Optional[float] = None
+        self.erreur: Optional[str] = None
+        self.lectures = 0
+        self.echecs = 0
+
+    def _verifier(self):
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(REQUETE_RETARD)
+                    retard = float(cur.fetchone()[0])
+                conn.rollback()
+            self.retard = retard
+            self.disponible = True
+            self.erreur = None
+        except (psycopg2.Error, PoolError) as e:
+            if self.disponible or self.erreur is None:
+                log(f"Réplica {self.nom} indisponible : {e}", level="ERROR")
+            self.disponible = False
+            self.erreur = str(e).strip()
+        self._verifie_le = time.monotonic()
+
+    def utilisable(self) -> bool:
+        """Disponible et assez à jour (remesure le retard si la dernière mesure est trop ancienne)"""
+        if time.monotonic() - self._verifie_le >= self.intervalle and self._lock.acquire(blocking=False):
+            try:
+                self._verifier()
+            finally:
+                self._lock.release()
+        return self.disponible and self.retard is not None and self.retard <= self.retard_max
+
+    def signaler_echec(self, erreur: Exception):
+        """Écarte le réplica jusqu'à la prochaine mesure (connexion perdue, requête annulée...)"""
+        self.echecs += 1
+        self.disponible = False
+        self.erreur = str(erreur).strip()
+        self._verifie_le = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {
+            'nom': self.nom,
+            'disponible': self.disponible,
+            'retard_s': round(self.retard, 3) if self.retard is not None else None,
+            'retard_max_s': self.retard_max,
+            'lectures': self.lectures,
+            'echecs': self.echecs,
+            'erreur': self.erreur,
+            'pool': self.pool.stats(),
+        }
+
+
+class ReplicaSet:
+    """Ensemble des réplicas : choisit à tour de rôle un réplica utilisable"""
+
+    def __init__(self, dsns: List[str], retard_max: float, intervalle: float, **pool_kwargs):
+        self.replicas = [Replica(dsn, retard_max, intervalle, **pool_kwargs) for dsn in dsns]
+        self._tour = itertools.cycle(range(len(self.replicas)))
+        self._tour_lock = threading.Lock()
+        self.replis_primaire = 0
+
+    def choisir(self) -> Optional[Replica]:
+        """Retourne un réplica utilisable, ou None (la lecture ira sur le primaire)"""
+        with self._tour_lock:
+            depart = next(self._tour)
+        for decalage in range(len(self.replicas)):
+            replica = self.replicas[(depart + decalage) % len(self.replicas)]
+            if replica.utilisable():
+                return replica
+        self.replis_primaire += 1
+        return None
+
+    def closeall(self):
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+    def stats(self) -> Dict:
+        return {
+            'replicas': [replica.stats() for replica in self.replicas],
+            'replis_primaire': self.replis_primaire,
+        }
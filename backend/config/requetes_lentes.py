@@ -0,0 +1,306 @@
+"""
+Profil des requêtes SQL exécutées par execute_query.
+
+Chaque requête est chronométrée et rangée sous son texte normalisé (littéraux et
+paramètres remplacés par ?, listes IN réduites) : nombre, temps total, maximum et
+histogramme logarithmique des durées (p50/p95 à 20 % près, fusionnables entre
+workers). Au plus MAX_REQUETES textes sont suivis ; au-delà, celui qui a coûté le
+moins de temps est oublié.
+
+Une requête plus lente que SLOW_QUERY_MS est tirée au sort (SLOW_QUERY_EXPLAIN_RATE)
+pour une capture de plan, au plus une fois par texte et par
+SLOW_QUERY_EXPLAIN_INTERVAL secondes. Le plan est calculé par un thread, sur une
+autre connexion : EXPLAIN (ANALYZE, BUFFERS) dans une transaction en lecture seule
+annulée pour une lecture, EXPLAIN seul (sans exécution) pour une écriture.
+
+Chaque processus recopie son profil toutes les 5 secondes dans
+METRICS_DIR/requetes/<pid>.json ; rapport() fusionne ceux de tous les workers
+(GET /api/debug/requetes-lentes, python manage.py requetes-lentes).
+"""
+
+import json
+import math
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Optional
+
+import psycopg2
+from psycopg2.pool import PoolError
+
+from utils import metrics
+from utils.logger import log
+
+MAX_REQUETES = 500
+INTERVALLE_ECRITURE = 5.0
+TAILLE_FILE_EXPLAIN = 10
+DELAI_EXPLAIN = "30s"
+
+# Seaux des durées : le seau i contient les durées <= BASE_MS * FACTEUR ** i
+BASE_MS = 0.01
+FACTEUR = 1.2
+NB_SEAUX = 100
+
+TRIS = ('total', 'p95', 'max', 'nombre')
+
+_COMMENTAIRE = re.compile(r'--[^\n]*')
+_CHAINE = re.compile(r"'(?:[^']|'')*'")
+_NOMBRE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMETRE = re.compile(r'%\(\w+\)s|%s')
+_LISTE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ESPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=2048)
+def normaliser(query: str) -> str:
+    """Texte de la requête sans valeurs : les exécutions d'une même requête sont regroupées"""
+    texte = _COMMENTAIRE.sub(' ', query)
+    texte = _CHAINE.sub('?', texte)
+    texte = _PARAMETRE.sub('?', texte)
+    texte = _NOMBRE.sub('?', texte)
+    texte = _LISTE.sub('(...)', texte)
+    return _ESPACES.sub(' ', texte).strip()
+
+
+def _seau(duree_ms: float) -> int:
+    if duree_ms <= BASE_MS:
+        return 0
+    return min(NB_SEAUX - 1, math.ceil(math.log(duree_ms / BASE_MS) / math.log(FACTEUR)))
+
+
+def _percentile(seaux: Dict[int, int], nombre: int, rang: float, maximum: float) -> float:
+    """Borne supérieure du seau qui contient le percentile (au plus le maximum observé)"""
+    seuil = rang * nombre
+    cumul = 0
+    for i in sorted(seaux):
+        cumul += seaux[i]
+        if cumul >= seuil:
+            return round(min(BASE_MS * FACTEUR ** i, maximum), 3)
+    return round(maximum, 3)
+
+
+class Profil:
+    """Statistiques par texte normalisé d'un processus"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requetes: Dict[str, Dict] = {}
+        self.version = 0
+        self.explains: queue.Queue = queue.Queue(maxsize=TAILLE_FILE_EXPLAIN)
+        self.explain_le: Dict[str, float] = {}
+
+    def enregistrer(self, texte: str, duree_ms: float, lente: bool) -> bool:
+        """Ajoute une exécution ; vrai si un plan peut être capturé pour ce texte"""
+        with self.lock:
+            stats = self.requetes.get(texte)
+            if stats is None:
+                if len(self.requetes) >= MAX_REQUETES:
+                    oubliee = min(self.requetes, key=lambda t: self.requetes[t]['total_ms'])
+                    del self.requetes[oubliee]
+                stats = self.requetes[texte] = {'nombre': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'lentes': 0,
+                                                'seaux': {}, 'plan': None}
+            stats['nombre'] += 1
+            stats['total_ms'] += duree_ms
+            if duree_ms > stats['max_ms']:
+                stats['max_ms'] = duree_ms
+            i = _seau(duree_ms)
+            stats['seaux'][i] = stats['seaux'].get(i, 0) + 1
+            self.version += 1
+            if not lente:
+                return False
+            stats['lentes'] += 1
+            return True
+
+    def exporter(self) -> Dict:
+        with self.lock:
+            return {'pid': os.getpid(), 'requetes': {
+                texte: dict(stats, seaux={str(i): n for i, n in stats['seaux'].items()})
+                for texte, stats in self.requetes.items()
+            }}
+
+
+_profil = Profil()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+
+def _reinitialiser_apres_fork():
+    global _profil, _thread, _thread_lock
+    _profil = Profil()
+    _thread = None
+    _thread_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reinitialiser_apres_fork)
+
+
+def _demarrer_thread():
+    global _thread
+    if _thread is None:
+        with _thread_lock:
+            if _thread is None:
+                _thread = threading.Thread(target=_boucle, args=(_profil,), name="requetes-lentes", daemon=True)
+                _thread.start()
+
+
+def enregistrer(query: str, params, duree: float, config: Dict):
+    """Appelée par execute_query après chaque requête (duree en secondes)"""
+    _demarrer_thread()
+    duree_ms = duree * 1000
+    texte = normaliser(query)
+    profil = _profil
+    if not profil.enregistrer(texte, duree_ms, duree_ms >= config['seuil_ms']):
+        return
+
+    maintenant = time.monotonic()
+    if random.random() >= config['taux_explain'] \
+            or maintenant - profil.explain_le.get(texte, float('-inf')) < config['intervalle_explain']:
+        return
+    if len(profil.explain_le) >= MAX_REQUETES:
+        profil.explain_le.clear()
+    profil.explain_le[texte] = maintenant
+    try:
+        profil.explains.put_nowait((texte, query, params, round(duree_ms, 3)))
+    except queue.Full:
+        pass
+
+
+def _capturer_plan(query: str, params) -> str:
+    """Plan de la requête sur une connexion du pool primaire, transaction toujours annulée"""
+    from config.database import get_pool, est_lecture
+
+    with get_pool().connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                lecture = est_lecture(query)
+                if lecture:
+                    cur.execute("SET TRANSACTION READ ONLY")
+                cur.execute(f"SET LOCAL statement_timeout = '{DELAI_EXPLAIN}'")
+                if lecture:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+                else:
+                    cur.execute("EXPLAIN " + query, params)
+                return "\n".join(ligne[0] for ligne in cur.fetchall())
+        finally:
+            conn.rollback()
+
+
+def _boucle(profil: Profil):
+    ecrit_version = -1
+    prochaine_ecriture = time.monotonic() + INTERVALLE_ECRITURE
+    while True:
+        try:
+            texte, query, params, duree_ms = profil.explains.get(
+                timeout=max(0.0, prochaine_ecriture - time.monotonic()))
+            try:
+                plan = _capturer_plan(query, params)
+            except (psycopg2.Error, PoolError) as e:
+                plan = f"(plan indisponible : {e})"
+            with profil.lock:
+                stats = profil.requetes.get(texte)
+                if stats is not None:
+                    stats['plan'] = {'plan': plan, 'duree_ms': duree_ms,
+                                     'capture_le': datetime.now().isoformat(timespec='seconds')}
+                    profil.version += 1
+        except queue.Empty:
+            pass
+        if time.monotonic() >= prochaine_ecriture:
+            prochaine_ecriture = time.monotonic() + INTERVALLE_ECRITURE
+            if profil.version != ecrit_version:
+                ecrit_version = profil.version
+                ecrire(profil)
+
+
+def _repertoire() -> str:
+    return os.path.join(metrics.repertoire(), 'requetes')
+
+
+def ecrire(profil: Optional[Profil] = None):
+    """Recopie le profil du processus dans METRICS_DIR/requetes/<pid>.json"""
+    profil = profil or _profil
+    repertoire = _repertoire()
+    try:
+        os.makedirs(repertoire, exist_ok=True)
+        temporaire = os.path.join(repertoire, f".{os.getpid()}.tmp")
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(profil.exporter(), f)
+        os.replace(temporaire, os.path.join(repertoire, f"{os.getpid()}.json"))
+    except OSError as e:
+        log(f"Écriture du profil SQL impossible: {e}", level="ERROR")
+
+
+def reinitialiser():
+    """Efface les profils écrits (démarrage de l'application)"""
+    try:
+        noms = os.listdir(_repertoire())
+    except FileNotFoundError:
+        return
+    for nom in noms:
+        if nom.endswith('.json'):
+            try:
+                os.remove(os.path.join(_repertoire(), nom))
+            except FileNotFoundError:
+                pass
+
+
+def rapport(limite: int = 20, tri: str = 'total') -> Dict:
+    """
+    Les `limite` requêtes les plus coûteuses de tous les workers (tri : temps total,
+    p95, maximum ou nombre d'exécutions), avec leur dernier plan capturé.
+    """
+    if tri not in TRIS:
+        raise ValueError(f"Tri invalide (attendu : {', '.join(TRIS)})")
+    if _profil.version:
+        ecrire()
+
+    fusion: Dict[str, Dict] = {}
+    processus = 0
+    try:
+        noms = os.listdir(_repertoire())
+    except FileNotFoundError:
+        noms = []
+    for nom in noms:
+        if not nom.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(_repertoire(), nom), encoding='utf-8') as f:
+                donnees = json.load(f)
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError) as e:
+            log(f"Profil SQL illisible {nom}: {e}", level="ERROR")
+            continue
+        processus += 1
+        for texte, stats in donnees['requetes'].items():
+            total = fusion.setdefault(texte, {'nombre': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'lentes': 0,
+                                              'seaux': {}, 'plan': None})
+            total['nombre'] += stats['nombre']
+            total['total_ms'] += stats['total_ms']
+            total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+            total['lentes'] += stats['lentes']
+            for i, n in stats['seaux'].items():
+                total['seaux'][int(i)] = total['seaux'].get(int(i), 0) + n
+            if stats['plan'] and (total['plan'] is None or stats['plan']['capture_le'] > total['plan']['capture_le']):
+                total['plan'] = stats['plan']
+
+    requetes = []
+    for texte, stats in fusion.items():
+        requetes.append({
+            'requete': texte,
+            'nombre': stats['nombre'],
+            'total_ms': round(stats['total_ms'], 3),
+            'moyenne_ms': round(stats['total_ms'] / stats['nombre'], 3),
+            'p50_ms': _percentile(stats['seaux'], stats['nombre'], 0.50, stats['max_ms']),
+            'p95_ms': _percentile(stats['seaux'], stats['nombre'], 0.95, stats['max_ms']),
+            'max_ms': round(stats['max_ms'], 3),
+            'lentes': stats['lentes'],
+            'plan': stats['plan'],
+        })
+    cle = {'total': 'total_ms', 'p95': 'p95_ms', 'max': 'max_ms', 'nombre': 'nombre'}[tri]
+    requetes.sort(key=lambda r: r[cle], reverse=True)
+    return {'processus': processus, 'requetes_suivies': len(requetes), 'requetes': requetes[:limite]}
@@ -9,6 +9,37 @@ AMENDE_PAR_JOUR = 0.50
 # Nombre maximum d'emprunts simultanés par étudiant
 MAX_EMPRUNTS_PAR_ETUDIANT = 5
 
+# Nombre maximum de résultats retournés par une recherche
+LIMITE_RECHERCHE = 50
+
+# Durée de validité du cache de la vue d'ensemble des statistiques (en secondes)
+DUREE_CACHE_STATS = 30
+
+# Cache des livres et étudiants lus par clé (models/cache.py) : lignes par entité et
+# durée de validité en secondes, retard maximal sur les écritures des autres workers
+TAILLE_CACHE_ENTITES = 10000
+DUREE_CACHE_ENTITES = 10
+
+# Fenêtres (en jours) acceptées par les classements, en plus de 'all'
+FENETRES_CLASSEMENT = (7, 30, 365)
+
+# Nombre maximum de lignes d'un classement
+LIMITE_CLASSEMENT = 100
+
+# Délai (en secondes) de regroupement des emprunts avant leur report dans les classements
+INTERVALLE_REPLI_CLASSEMENTS = 5
+
+# Import du catalogue : lignes validées puis copiées par lot, nombre maximum d'erreurs détaillées
+TAILLE_LOT_IMPORT = 5000
+LIMITE_ERREURS_IMPORT = 1000
+
+# Nombre maximum d'opérations par lot d'emprunts ou de retours (postes de scan)
+MAX_OPERATIONS_LOT = 1000
+
+# Partitions mensuelles de emprunt : mois créés à l'avance, mois conservés avant archivage
+PARTITIONS_MOIS_AVANCE = 3
+ARCHIVE_MOIS_CONSERVES = 24
+
 # Format de date pour l'affichage
 FORMAT_DATE = "%d/%m/%Y"
 
@@ -0,0 +1,68 @@
+"""
+Configuration gunicorn du serveur de production (lue par python manage.py serve).
+
+Le maître charge l'application une seule fois (preload_app) puis crée les workers
+par fork : ils démarrent sans réimporter le code. Chaque worker ouvre son propre
+pool de connexions après le fork et le préchauffe avant d'accepter des requêtes.
+
+kill -HUP <pid du maître> relit cette configuration et remplace les workers sans
+coupure (anciens arrêtés après leurs requêtes en cours), mais les nouveaux sont
+forkés du maître : ils gardent le code chargé à son démarrage. Déployer un nouveau
+code sans coupure : kill -USR2 <pid> (nouveau maître lancé avec le nouveau code à
+côté de l'ancien), kill -WINCH <ancien pid> (arrêt progressif de ses workers) puis
+kill -QUIT <ancien pid> ; ou redémarrer le serveur.
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:5001")
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("WEB_THREADS", "1"))
+timeout = int(os.getenv("WEB_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# Recyclage des workers (fuites mémoire) ; jitter pour ne pas tous les recycler ensemble
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+errorlog = "-"
+proc_name = "bibliotheque"
+
+
+def on_starting(server):
+    """
+    Maître, une fois au lancement : métriques et profils des exécutions précédentes
+    (METRICS_DIR) effacés. Ni un HUP ni un worker recréé ne passent ici : les
+    fichiers des workers en service sont conservés.
+    """
+    from config import requetes_lentes
+    from utils import metrics
+    metrics.reinitialiser()
+    requetes_lentes.reinitialiser()
+
+
+def post_fork(server, worker):
+    """Le worker ne réutilise aucune connexion ouverte par le maître"""
+    from config.database import reinitialiser_apres_fork
+    reinitialiser_apres_fork()
+
+
+def post_worker_init(worker):
+    """Préchauffage (pool, réplicas, cache) avant la première requête"""
+    from app import prechauffer_app
+    mesures = prechauffer_app(worker.app.wsgi())
+    worker.log.info("Worker %s prêt : %s", worker.pid, mesures)
+
+
+def worker_exit(server, worker):
+    from config.database import fermer_pool
+    from utils import metrics
+    fermer_pool()
+    metrics.fermer()
+
+
+def when_ready(server):
+    from wsgi import app
+    server.log.info("Application chargée : %s", app.config['DEMARRAGE'])
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Commandes d'administration du backend
+
+Usage:
+    python manage.py compteurs verifier
+    python manage.py compteurs reconstruire
+    python manage.py classements reconstruire
+    python manage.py classements replier
+    python manage.py amendes accumuler [--date AAAA-MM-JJ] [--taille-lot N]
+    python manage.py livres importer FICHIER [--format csv|ndjson] [--taille-lot N]
+    python manage.py partitions lister
+    python manage.py partitions creer [--mois-avance N]
+    python manage.py partitions archiver [--mois-conserves N]
+    python manage.py migrations statut
+    python manage.py migrations appliquer [--jusqu-a NNNN]
+    python manage.py serve [--workers N] [--bind HOTE:PORT]
+    python manage.py requetes-lentes [--limite N] [--tri total|p95|max|nombre] [--json]
+    python manage.py bench generer [--echelle X] [--graine N] [--vider] [--taille-lot N]
+    python manage.py bench lancer [--url URL | --memoire] [--echelle X] [--graine N] [--duree S]
+                                  [--echauffement S] [--concurrence N] [--mix recherche=40,...] [--sortie FICHIER]
+    python manage.py bench comparer ANCIEN.json NOUVEAU.json [--tolerance 0.10]
+"""
+
+import argparse
+import json
+import os
+import sys
+from benchmark import donnees, execution, scenarios
+from config import requetes_lentes
+from config.database import ConfigurationError, get_config
+from services import stats_service, amende_service, import_service, partition_service, migration_service
+from config.settings import PARTITIONS_MOIS_AVANCE, ARCHIVE_MOIS_CONSERVES
+from utils.validators import valider_date
+
+
+def cmd_compteurs(args) -> int:
+    """Vérifie ou reconstruit la table stats_compteur"""
+    if args.action == 'reconstruire':
+        lignes = stats_service.reconstruire_compteurs()
+        print("Compteurs reconstruits")
+    else:
+        lignes = stats_service.verifier_compteurs()
+
+    derive = False
+    print(f"{'compteur':<20}{'table':>14}{'réel':>14}{'écart':>12}")
+    for ligne in lignes:
+        derive = derive or ligne['ecart'] != 0
+        print(f"{ligne['cle']:<20}{ligne['compteur']:>14}{ligne['reel']:>14}{ligne['ecart']:>12}")
+
+    if derive and args.action == 'verifier':
+        print("Écart détecté : lancez 'python manage.py compteurs reconstruire'")
+        return 1
+    return 0
+
+
+def cmd_classements(args) -> int:
+    """Reconstruit les tables de classement (top étudiants / top livres) ou y replie les emprunts en attente"""
+    if args.action == 'replier':
+        print(f"{stats_service.replier_classements()} emprunt(s) repliés dans les classements")
+        return 0
+    stats_service.reconstruire_classements()
+    print("Classements reconstruits")
+    return 0
+
+
+def cmd_amendes(args) -> int:
+    """Accumule les amendes des emprunts en retard dans les soldes étudiants"""
+    jour = valider_date(args.date, 'date') if args.date else None
+    rapport = amende_service.accumuler_amendes(jour, args.taille_lot)
+    print(json.dumps(rapport, ensure_ascii=False))
+    return 0
+
+
+def cmd_livres(args) -> int:
+    """Importe un catalogue de livres (CSV ou NDJSON)"""
+    format_import = args.format
+    if format_import is None:
+        format_import = 'ndjson' if args.fichier.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+    with open(args.fichier, encoding='utf-8-sig', newline='') as fichier:
+        rapport = import_service.importer_livres(fichier, format_import, args.taille_lot)
+    print(json.dumps(rapport, ensure_ascii=False))
+    return 1 if rapport['nb_erreurs'] else 0
+
+
+def cmd_partitions(args) -> int:
+    """Liste, crée ou archive les partitions mensuelles de la table emprunt"""
+    if args.action == 'creer':
+        nb = partition_service.creer_partitions(args.mois_avance)
+        print(f"{nb} partition(s) créée(s)")
+    elif args.action == 'archiver':
+        archivees = partition_service.archiver_partitions(args.mois_conserves)
+        for partition in archivees:
+            print(f"{partition['nom_partition']:<30}{partition['nb_lignes']:>12} lignes")
+        print(f"{len(archivees)} partition(s) archivée(s)")
+    else:
+        print(f"{'partition':<24}{'début':>12}{'fin':>12}{'lignes (est.)':>16}")
+        for partition in partition_service.lister_partitions():
+            debut = partition['debut'].isoformat() if partition['debut'] else 'défaut'
+            fin = partition['fin'].isoformat() if partition['fin'] else ''
+            print(f"{partition['nom']:<24}{debut:>12}{fin:>12}{partition['lignes_estimees']:>16}")
+    return 0
+
+
+def cmd_migrations(args) -> int:
+    """Affiche l'état des migrations ou applique celles en attente"""
+    if args.action == 'appliquer':
+        faites = migration_service.migrer(args.jusqu_a)
+        for migration in faites:
+            print(f"{migration['nom']:<50}{migration['duree_ms']:>10} ms")
+        print(f"{len(faites)} migration(s) appliquée(s)")
+        return 0
+
+    etat = migration_service.statut()
+    en_attente = 0
+    for migration in etat['migrations']:
+        if migration['modifiee']:
+            etat_migration = "MODIFIÉE depuis son application"
+        elif migration['appliquee']:
+            etat_migration = f"appliquée le {migration['appliquee_le']:%Y-%m-%d %H:%M}"
+        else:
+            etat_migration = "en attente"
+            en_attente += 1
+        print(f"{migration['nom']:<50}{etat_migration}")
+    for index in etat['index_invalides']:
+        print(f"Index invalide (construction interrompue) : {index}")
+    return 1 if en_attente or etat['index_invalides'] else 0
+
+
+def cmd_requetes_lentes(args) -> int:
+    """Affiche les requêtes SQL les plus coûteuses du serveur en cours (profils de METRICS_DIR)"""
+    rapport = requetes_lentes.rapport(args.limite, args.tri)
+    if args.json:
+        print(json.dumps(rapport, ensure_ascii=False, indent=2))
+        return 0
+    if not rapport['requetes']:
+        print("Aucune requête profilée (serveur arrêté, ou METRICS_DIR différent de celui du serveur)")
+        return 0
+
+    print(f"{rapport['requetes_suivies']} requête(s) suivie(s) par {rapport['processus']} processus\n")
+    print(f"{'nombre':>8}{'total ms':>12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'lentes':>8}  requête")
+    for requete in rapport['requetes']:
+        print(f"{requete['nombre']:>8}{requete['total_ms']:>12.1f}{requete['p50_ms']:>10.2f}"
+              f"{requete['p95_ms']:>10.2f}{requete['max_ms']:>10.2f}{requete['lentes']:>8}  {requete['requete'][:100]}")
+    for requete in rapport['requetes']:
+        if requete['plan']:
+            plan = requete['plan']
+            print(f"\n--- {requete['requete']}\n--- exécution de {plan['duree_ms']} ms, plan du {plan['capture_le']}")
+            print(plan['plan'])
+    return 0
+
+
+def cmd_bench(args) -> int:
+    """Bancs d'essai : génération du jeu de données, trafic simulé, comparaison de rapports"""
+    if args.action == 'comparer':
+        if len(args.fichiers) != 2:
+            print("bench comparer attend deux rapports : ANCIEN.json NOUVEAU.json", file=sys.stderr)
+            return 2
+        rapports = []
+        for chemin in args.fichiers:
+            with open(chemin, encoding='utf-8') as f:
+                rapports.append(json.load(f))
+        lignes = execution.comparer(rapports[0], rapports[1], args.tolerance)
+        print(f"{'':<42}{'ancien':>12}{'nouveau':>12}{'écart':>10}")
+        for ligne in lignes:
+            if 'p95_ms' in ligne:
+                cle, variation = 'p95_ms', ligne['variation_p95']
+            elif 'sql_par_requete' in ligne:
+                cle, variation = 'sql_par_requete', ligne['variation_sql']
+            else:
+                print(f"{ligne['libelle'][:42]:<42}{'absente' if ligne['ancien'] is None else '':>12}"
+                      f"{'absente' if ligne['nouveau'] is None else '':>12}")
+                continue
+            ecart = f"{variation:+.1%}" if variation is not None else ''
+            marque = '  RÉGRESSION' if ligne['regression'] else ''
+            print(f"{ligne['libelle'][:42]:<42}{ligne[cle][0]:>12}{ligne[cle][1]:>12}{ecart:>10}{marque}")
+        regressions = sum(1 for ligne in lignes if ligne['regression'])
+        print(f"\nDébit : {rapports[0]['debit_rps']} -> {rapports[1]['debit_rps']} req/s ; "
+              f"{regressions} régression(s) au-delà de {args.tolerance:.0%}")
+        return 1 if regressions else 0
+
+    jeu = donnees.Jeu(args.echelle, args.graine)
+    if args.action == 'generer':
+        rapport = donnees.charger_postgres(jeu, args.vider, args.taille_lot, progression=print)
+        print(json.dumps(rapport, ensure_ascii=False))
+        return 0
+
+    if args.url:
+        if args.memoire:
+            print("--memoire et --url sont incompatibles", file=sys.stderr)
+            return 2
+        cible = args.url
+        def fabrique_client():
+            return scenarios.ClientHttp(args.url)
+    else:
+        from app import create_app
+        if args.memoire:
+            from storage import set_stockage
+            from storage.memoire import StockageMemoire
+            stockage = StockageMemoire()
+            donnees.charger_memoire(stockage, jeu)
+            set_stockage(stockage)
+        cible = 'memoire' if args.memoire else 'processus'
+        application = create_app()
+        def fabrique_client():
+            return scenarios.ClientFlask(application)
+
+    rapport = execution.lancer(fabrique_client, jeu, args.duree, args.concurrence, scenarios.lire_mix(args.mix),
+                               args.graine_trafic, args.echauffement, cible)
+    if args.sortie:
+        with open(args.sortie, 'w', encoding='utf-8') as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2)
+
+    print(f"{rapport['requetes']} requêtes en {rapport['duree_s']} s : {rapport['debit_rps']} req/s, "
+          f"{rapport['erreurs']} erreur(s), {rapport['exceptions']} exception(s)\n")
+    print(f"{'requête':<42}{'nombre':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'4xx':>6}{'5xx':>6}")
+    for libelle, stats in rapport['par_requete'].items():
+        print(f"{libelle[:42]:<42}{stats['nombre']:>8}{stats['debit_rps']:>9}{stats['p50_ms']:>9.2f}"
+              f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['refus']:>6}{stats['erreurs']:>6}")
+    if rapport['sql_par_route']:
+        print(f"\n{'route':<42}{'requêtes':>10}{'SQL/req':>9}{'ms SQL/req':>12}")
+        for route, stats in rapport['sql_par_route'].items():
+            print(f"{route[:42]:<42}{stats['requetes_http']:>10}{stats['sql_par_requete']:>9}"
+                  f"{stats['sql_ms_par_requete']:>12}")
+    return 1 if rapport['erreurs'] or rapport['exceptions'] else 0
+
+
+def cmd_serve(args) -> int:
+    """Lance le serveur de production : gunicorn, workers pré-forkés (voir gunicorn.conf.py)"""
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        print("gunicorn n'est pas installé (pip install -r requirements.txt, Linux/macOS uniquement) ; "
+              "en développement : python app.py", file=sys.stderr)
+        return 1
+
+    # Erreur de configuration signalée avant de démarrer le moindre worker
+    get_config()
+
+    dossier = os.path.dirname(os.path.abspath(__file__))
+    sys.argv = ['gunicorn', '--chdir', dossier, '-c', os.path.join(dossier, 'gunicorn.conf.py')]
+    if args.workers:
+        sys.argv += ['--workers', str(args.workers)]
+    if args.bind:
+        sys.argv += ['--bind', args.bind]
+    sys.argv.append('wsgi:app')
+    return run()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Administration de la bibliothèque")
+    commandes = parser.add_subparsers(dest='commande', required=True)
+
+    compteurs = commandes.add_parser('compteurs', help="Compteurs statistiques")
+    compteurs.add_argument('action', choices=['verifier', 'reconstruire'])
+    compteurs.set_defaults(func=cmd_compteurs)
+
+    classements = commandes.add_parser('classements', help="Classements des emprunts")
+    classements.add_argument('action', choices=['reconstruire', 'replier'])
+    classements.set_defaults(func=cmd_classements)
+
+    amendes = commandes.add_parser('amendes', help="Traitement de nuit des amendes")
+    amendes.add_argument('action', choices=['accumuler'])
+    amendes.add_argument('--date', help="Date de référence AAAA-MM-JJ (défaut : aujourd'hui)")
+    amendes.add_argument('--taille-lot', type=int, default=amende_service.TAILLE_LOT_DEFAUT)
+    amendes.set_defaults(func=cmd_amendes)
+
+    livres = commandes.add_parser('livres', help="Catalogue des livres")
+    livres.add_argument('action', choices=['importer'])
+    livres.add_argument('fichier', help="Fichier CSV (avec en-tête) ou NDJSON")
+    livres.add_argument('--format', choices=import_service.FORMATS_IMPORT)
+    livres.add_argument('--taille-lot', type=int, default=import_service.TAILLE_LOT_IMPORT)
+    livres.set_defaults(func=cmd_livres)
+
+    partitions = commandes.add_parser('partitions', help="Partitions mensuelles des emprunts")
+    partitions.add_argument('action', choices=['lister', 'creer', 'archiver'])
+    partitions.add_argument('--mois-avance', type=int, default=PARTITIONS_MOIS_AVANCE)
+    partitions.add_argument('--mois-conserves', type=int, default=ARCHIVE_MOIS_CONSERVES)
+    partitions.set_defaults(func=cmd_partitions)
+
+    migrations = commandes.add_parser('migrations', help="Migrations du schéma (sql/migrations)")
+    migrations.add_argument('action', choices=['statut', 'appliquer'])
+    migrations.add_argument('--jusqu-a', type=int, help="Dernière version à appliquer")
+    migrations.set_defaults(func=cmd_migrations)
+
+    lentes = commandes.add_parser('requetes-lentes', help="Requêtes SQL les plus coûteuses et leurs plans")
+    lentes.add_argument('--limite', type=int, default=20)
+    lentes.add_argument('--tri', choices=requetes_lentes.TRIS, default='total')
+    lentes.add_argument('--json', action='store_true', help="Rapport complet en JSON")
+    lentes.set_defaults(func=cmd_requetes_lentes)
+
+    bench = commandes.add_parser('bench', help="Bancs d'essai reproductibles (voir benchmark/)")
+    bench.add_argument('action', choices=['generer', 'lancer', 'comparer'])
+    bench.add_argument('fichiers', nargs='*', help="comparer : rapports ANCIEN.json NOUVEAU.json")
+    bench.add_argument('--echelle', type=float, default=0.01,
+                       help="Fraction de 50k étudiants / 500k livres / 5M emprunts (défaut : 0.01)")
+    bench.add_argument('--graine', type=int, default=42, help="Graine du jeu de données")
+    bench.add_argument('--vider', action='store_true', help="generer : vide les tables avant le chargement")
+    bench.add_argument('--taille-lot', type=int, default=donnees.TAILLE_LOT_COPY, help="generer : lignes par COPY")
+    bench.add_argument('--url', help="lancer : serveur à solliciter (défaut : application dans le processus)")
+    bench.add_argument('--memoire', action='store_true', help="lancer : moteur de stockage en mémoire")
+    bench.add_argument('--duree', type=float, default=30, help="lancer : secondes mesurées")
+    bench.add_argument('--echauffement', type=float, default=5, help="lancer : secondes non mesurées")
+    bench.add_argument('--concurrence', type=int, default=4, help="lancer : usagers simultanés")
+    bench.add_argument('--mix', help="lancer : poids des scénarios, ex. " +
+                       ','.join(f"{nom}={poids}" for nom, poids in scenarios.MIX_DEFAUT.items()))
+    bench.add_argument('--graine-trafic', type=int, default=1, help="lancer : graine des usagers")
+    bench.add_argument('--sortie', help="lancer : fichier du rapport JSON")
+    bench.add_argument('--tolerance', type=float, default=0.10, help="comparer : écart toléré (fraction)")
+    bench.set_defaults(func=cmd_bench)
+
+    serve = commandes.add_parser('serve', help="Serveur HTTP de production (gunicorn)")
+    serve.add_argument('--workers', type=int, help="Nombre de workers (défaut : WEB_WORKERS ou 2 x CPU + 1)")
+    serve.add_argument('--bind', help="Adresse d'écoute (défaut : WEB_BIND ou 0.0.0.0:5001)")
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args()
+    try:
+        return args.func(args)
+    except ConfigurationError as e:
+        print(f"ERREUR DE CONFIGURATION\n{e}", file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(f"ERREUR : {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Cache des lignes d'entités lues par clé primaire (livres par ISBN, étudiants par ID).
+
+LRU borné (TAILLE_CACHE_ENTITES lignes par entité) et durée de vie de
+DUREE_CACHE_ENTITES secondes, propre au processus : les lectures répétées d'une
+même fiche (détails, exists, est_disponible) ne vont plus en base.
+
+Les écritures du processus invalident explicitement les lignes concernées, tout de
+suite puis après le COMMIT (comme le cache des statistiques) ; une lecture commencée
+avant une invalidation n'est pas mise en cache. Les écritures des autres workers ne
+sont vues qu'à l'expiration : DUREE_CACHE_ENTITES borne le retard. Les absences
+(None) ne sont pas mises en cache, ni les lectures d'une session qui a déjà écrit
+(elles peuvent voir des écritures non validées).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, Hashable, Iterable, Optional
+from config.database import on_commit, session_a_ecrit
+from config.settings import DUREE_CACHE_ENTITES, TAILLE_CACHE_ENTITES
+from utils import metrics
+
+
+class CacheEntites:
+    """LRU à durée de vie : clé primaire -> (expiration, ligne)"""
+
+    def __init__(self, nom: str, taille: int = TAILLE_CACHE_ENTITES, duree: float = DUREE_CACHE_ENTITES):
+        self.nom = nom
+        self.taille = taille
+        self.duree = duree
+        self.lock = threading.Lock()
+        self.lignes: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.generation = 0
+        self.compteurs = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _compter(self, evenement: str, nombre: int = 1):
+        # Appelée sous self.lock
+        self.compteurs[evenement] += nombre
+        metrics.compter_cache(self.nom, evenement, nombre)
+
+    def lire(self, cle: Hashable, charger: Callable[[], Optional[Dict]]) -> Optional[Dict]:
+        """Ligne en cache si elle n'a pas expiré, sinon charger() (mise en cache si trouvée)"""
+        if self.taille <= 0 or self.duree <= 0:
+            return charger()
+
+        with self.lock:
+            entree = self.lignes.get(cle)
+            if entree is not None:
+                if entree[0] > time.monotonic():
+                    self.lignes.move_to_end(cle)
+                    self._compter('hits')
+                    return dict(entree[1])
+                del self.lignes[cle]
+                self._compter('expirations')
+            self._compter('misses')
+            generation = self.generation
+
+        ligne = charger()
+        if ligne is None or session_a_ecrit():
+            return ligne
+
+        with self.lock:
+            if generation == self.generation:
+                self.lignes[cle] = (time.monotonic() + self.duree, dict(ligne))
+                self.lignes.move_to_end(cle)
+                if len(self.lignes) > self.taille:
+                    self._compter('evictions', len(self.lignes) - self.taille)
+                    while len(self.lignes) > self.taille:
+                        self.lignes.popitem(last=False)
+        return ligne
+
+    def _retirer(self, cles: Optional[Iterable[Hashable]]):
+        with self.lock:
+            self.generation += 1
+            if cles is None:
+                nombre = len(self.lignes)
+                self.lignes.clear()
+            else:
+                nombre = sum(1 for cle in cles if self.lignes.pop(cle, None) is not None)
+            if nombre:
+                self._compter('invalidations', nombre)
+
+    def invalider(self, *cles: Hashable):
+        """À appeler après une écriture des lignes `cles` : retirées tout de suite et après le COMMIT"""
+        cles = tuple(cle for cle in cles if cle is not None)
+        if not cles:
+            return
+        self._retirer(cles)
+        on_commit(partial(self._retirer, cles))
+
+    def vider(self):
+        """Invalide toutes les lignes (écriture dont les clés ne sont pas connues)"""
+        self._retirer(None)
+        on_commit(partial(self._retirer, None))
+
+    def stats(self) -> Dict:
+        with self.lock:
+            lectures = self.compteurs['hits'] + self.compteurs['misses']
+            return dict(self.compteurs, lignes=len(self.lignes), taille=self.taille, duree_s=self.duree,
+                        taux_hits=round(self.compteurs['hits'] / lectures, 3) if lectures else None)
+
+
+livres = CacheEntites('livres')
+etudiants = CacheEntites('etudiants')
+
+
+def _reinitialiser_apres_fork():
+    # Verrous éventuellement pris par un autre thread au moment du fork
+    global livres, etudiants
+    livres = CacheEntites('livres', livres.taille, livres.duree)
+    etudiants = CacheEntites('etudiants', etudiants.taille, etudiants.duree)
+
+
+os.register_at_fork(after_in_child=_reinitialiser_apres_fork)
+
+
+def get_stats() -> Dict:
+    """Compteurs du processus : hits, misses, évictions, expirations, invalidations par entité"""
+    return {'livres': livres.stats(), 'etudiants': etudiants.stats()}
+
+
+def vider():
+    """Vide les deux caches"""
+    livres.vider()
+    etudiants.vider()
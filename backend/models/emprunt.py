@@ -1,151 +1,193 @@
-from typing import Optional, List, Dict
-from datetime import date, timedelta
-from config.database import execute_query
+from enum import Enum
+from typing import Optional, List, Dict, Tuple, Iterator
+from datetime import date
 from config.settings import DUREE_EMPRUNT_DEFAUT, AMENDE_PAR_JOUR
+from models import cache
+from services import stats_service
+from storage import get_stockage
+from utils.pagination import cle_curseur
 
 
-def create(etudiant_id: int, isbn: str) -> Optional[int]:
-    """Crée un emprunt et retourne son ID"""
-    date_emprunt = date.today()
+class StatutEmprunt(str, Enum):
+    """Résultat d'une tentative d'emprunt (voir la fonction SQL emprunter_livre)"""
+    OK = 'ok'
+    ETUDIANT_INCONNU = 'etudiant_inconnu'
+    LIVRE_INCONNU = 'livre_inconnu'
+    INDISPONIBLE = 'indisponible'
+    LIMITE_ATTEINTE = 'limite_atteinte'
+
+
+class StatutRetour(str, Enum):
+    """Résultat d'un retour (voir la fonction SQL retourner_emprunt)"""
+    OK = 'ok'
+    INCONNU = 'inconnu'
+    DEJA_RETOURNE = 'deja_retourne'
+
 
-    query = """
-        INSERT INTO emprunt (id_etud, isbn, date_emprunt, amende)
-        VALUES (%s, %s, %s, 0)
-        RETURNING id_emprunt
+def emprunter(etudiant_id: int, isbn: str) -> Tuple[StatutEmprunt, Optional[int]]:
     """
-    result = execute_query(query, (etudiant_id, isbn, date_emprunt), fetch_one=True)
+    Emprunte un livre en un seul aller-retour BDD.
+    Vérifie l'étudiant, le livre, la disponibilité et la limite d'emprunts,
+    puis réserve un exemplaire libre (SKIP LOCKED : les emprunts simultanés d'un
+    même titre ne s'attendent pas) et crée l'emprunt de manière atomique.
+    Retourne (statut, id de l'emprunt ou None).
+    """
+    resultat, emprunt_id = get_stockage().emprunts.emprunter(etudiant_id, isbn)
+    statut = StatutEmprunt(resultat)
+    if statut == StatutEmprunt.OK:
+        # Exemplaires disponibles du livre ; la fiche de l'étudiant ne change pas
+        cache.livres.invalider(isbn)
+        stats_service.invalider_cache()
+        stats_service.planifier_repli_classements()
+    return statut, emprunt_id
+
+
+def create(etudiant_id: int, isbn: str) -> Optional[int]:
+    """Crée un emprunt et retourne son ID (None si l'emprunt est refusé)"""
+    statut, emprunt_id = emprunter(etudiant_id, isbn)
+    return emprunt_id if statut == StatutEmprunt.OK else None
 
-    # Décrémenter exemplaires_dispo
-    if result:
-        execute_query("UPDATE livre SET exemplaires_dispo = exemplaires_dispo - 1 WHERE isbn = %s", (isbn,))
 
-    return result['id_emprunt'] if result else None
+def emprunter_lot(operations: List[Tuple[int, str]], savepoints: bool = False) -> List[Dict]:
+    """
+    Emprunte un lot de livres (poste de prêt) dans une seule transaction.
+    operations = [(etudiant_id, isbn), ...] ; retourne un résultat par opération, dans l'ordre.
+
+    Par défaut une seule instruction appelle emprunter_livre pour chaque opération
+    (un aller-retour BDD pour tout le lot) : une erreur inattendue annule le lot entier.
+    Avec savepoints=True, chaque opération a son propre point de sauvegarde et une
+    erreur n'annule que l'opération concernée (statut 'erreur').
+    """
+    resultats = get_stockage().emprunts.emprunter_lot(operations, savepoints)
+    if any(r['statut'] == StatutEmprunt.OK for r in resultats):
+        cache.livres.invalider(*{r['isbn'] for r in resultats if r['statut'] == StatutEmprunt.OK})
+        stats_service.invalider_cache()
+        stats_service.planifier_repli_classements()
+    return resultats
 
 
 def get_all() -> List[Dict]:
     """Retourne tous les emprunts avec détails étudiant et livre"""
-    query = """
-        SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour, e.amende,
-               et.id_etud as etudiant_id, et.nom, et.prenom,
-               l.isbn as livre_id, l.titre, l.editeur as auteur
-        FROM emprunt e
-        JOIN etudiant et ON e.id_etud = et.id_etud
-        JOIN livre l ON e.isbn = l.isbn
-        ORDER BY e.date_emprunt DESC
+    return get_stockage().emprunts.get_all()
+
+
+def get_page(limite: int, apres: Optional[List] = None, etudiant_id: Optional[int] = None,
+             isbn: Optional[str] = None, depuis: Optional[date] = None, jusqu_au: Optional[date] = None,
+             statut: Optional[str] = None, croissant: bool = False) -> List[Dict]:
+    """
+    Retourne une page d'emprunts triés par date d'emprunt (pagination par clé).
+    apres = (date_emprunt, id) de la dernière ligne de la page précédente.
+    Filtres : étudiant, ISBN, intervalle de dates, statut 'en_cours' ou 'retourne'.
+    Lit limite + 1 lignes pour savoir s'il existe une page suivante.
+    L'échéance, les jours de retard et l'amende en cours (0 si le livre est rendu)
+    sont calculés avec DUREE_EMPRUNT_DEFAUT et AMENDE_PAR_JOUR.
+    """
+    if statut not in (None, 'en_cours', 'retourne'):
+        raise ValueError("'statut' doit être 'en_cours' ou 'retourne'")
+
+    return get_stockage().emprunts.get_page(limite + 1, cle_curseur(apres, 2), etudiant_id=etudiant_id,
+                                            isbn=isbn, depuis=depuis, jusqu_au=jusqu_au,
+                                            statut=statut, croissant=croissant)
+
+
+COLONNES_EXPORT = (
+    'id', 'date_emprunt', 'date_retour', 'amende',
+    'etudiant_id', 'nom', 'prenom', 'email',
+    'livre_id', 'titre', 'editeur'
+)
+
+
+def export(depuis: Optional[date] = None, jusqu_au: Optional[date] = None,
+           taille_lot: int = 2000) -> Iterator[List[Dict]]:
     """
-    return execute_query(query, fetch=True) or []
+    Historique complet des emprunts (avec étudiant et livre), lu par lots
+    via un curseur côté serveur. Voir COLONNES_EXPORT.
+    """
+    return get_stockage().emprunts.export(depuis, jusqu_au, taille_lot)
 
 
 def get_by_id(emprunt_id: int) -> Optional[Dict]:
     """Retourne un emprunt par son ID avec détails"""
-    query = """
-        SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour, e.amende,
-               et.id_etud as etudiant_id, et.nom, et.prenom,
-               l.isbn as livre_id, l.titre, l.editeur as auteur
-        FROM emprunt e
-        JOIN etudiant et ON e.id_etud = et.id_etud
-        JOIN livre l ON e.isbn = l.isbn
-        WHERE e.id_emprunt = %s
-    """
-    return execute_query(query, (emprunt_id,), fetch_one=True)
+    return get_stockage().emprunts.get_by_id(emprunt_id)
 
 
 def get_by_etudiant(etudiant_id: int) -> List[Dict]:
     """Retourne tous les emprunts d'un étudiant"""
-    query = """
-        SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour, e.amende,
-               et.id_etud as etudiant_id, et.nom, et.prenom,
-               l.isbn as livre_id, l.titre, l.editeur as auteur
-        FROM emprunt e
-        JOIN etudiant et ON e.id_etud = et.id_etud
-        JOIN livre l ON e.isbn = l.isbn
-        WHERE e.id_etud = %s
-        ORDER BY e.date_emprunt DESC
-    """
-    return execute_query(query, (etudiant_id,), fetch=True) or []
+    return get_stockage().emprunts.get_by_etudiant(etudiant_id)
 
 
 def get_en_cours() -> List[Dict]:
     """Retourne tous les emprunts en cours à l'heure (non retournés et non en retard)"""
-    date_limite = date.today() - timedelta(days=DUREE_EMPRUNT_DEFAUT)
-
-    query = """
-        SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour, e.amende,
-               et.id_etud as etudiant_id, et.nom, et.prenom,
-               l.isbn as livre_id, l.titre, l.editeur as auteur
-        FROM emprunt e
-        JOIN etudiant et ON e.id_etud = et.id_etud
-        JOIN livre l ON e.isbn = l.isbn
-        WHERE e.date_retour IS NULL
-        AND e.date_emprunt >= %s
-        ORDER BY e.date_emprunt
-    """
-    return execute_query(query, (date_limite,), fetch=True) or []
+    return get_stockage().emprunts.get_en_cours()
 
 
 def get_en_retard() -> List[Dict]:
-    """Retourne tous les emprunts en retard"""
-    date_limite = date.today() - timedelta(days=DUREE_EMPRUNT_DEFAUT)
-
-    query = """
-        SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour, e.amende,
-               et.id_etud as etudiant_id, et.nom, et.prenom,
-               l.isbn as livre_id, l.titre, l.editeur as auteur
-        FROM emprunt e
-        JOIN etudiant et ON e.id_etud = et.id_etud
-        JOIN livre l ON e.isbn = l.isbn
-        WHERE e.date_retour IS NULL
-        AND e.date_emprunt < %s
-        ORDER BY e.date_emprunt
     """
-    return execute_query(query, (date_limite,), fetch=True) or []
-
-
-def retourner(emprunt_id: int) -> bool:
-    """Marque un emprunt comme retourné avec la date du jour"""
-    # Récupérer l'emprunt pour calculer l'amende
-    emp = get_by_id(emprunt_id)
-    if not emp:
-        return False
+    Retourne tous les emprunts en retard.
+    Servi par l'index partiel idx_emprunt_en_cours_date : ne lit que les emprunts
+    non rendus antérieurs à l'échéance.
+    """
+    return get_stockage().emprunts.get_en_retard()
 
-    jours_retard = calculer_jours_retard(emp)
-    amende_calc = jours_retard * AMENDE_PAR_JOUR
 
-    # Mettre à jour l'emprunt
-    query = """
-        UPDATE emprunt
-        SET date_retour = %s, amende = %s
-        WHERE id_emprunt = %s AND date_retour IS NULL
+def retourner(emprunt_id: int) -> Tuple[StatutRetour, int, float]:
+    """
+    Marque un emprunt comme retourné avec la date du jour, en un seul aller-retour BDD.
+    L'amende est calculée en SQL puis ajoutée au solde de l'étudiant, et l'exemplaire
+    redevient disponible, uniquement si l'emprunt était encore en cours.
+    Retourne (statut, jours de retard, amende).
     """
-    result = execute_query(query, (date.today(), amende_calc, emprunt_id))
+    resultat, jours_retard, amende, etudiant_id, isbn = get_stockage().emprunts.retourner(emprunt_id)
+    statut = StatutRetour(resultat)
+    if statut == StatutRetour.OK:
+        # Exemplaires disponibles du livre et solde d'amendes de l'étudiant
+        cache.livres.invalider(isbn)
+        cache.etudiants.invalider(etudiant_id)
+        stats_service.invalider_cache()
+    return statut, jours_retard, amende
 
-    # Incrémenter exemplaires_dispo
-    if result and emp:
-        execute_query("UPDATE livre SET exemplaires_dispo = exemplaires_dispo + 1 WHERE isbn = %s", (emp['livre_id'],))
-        # Ajouter l'amende au solde de l'étudiant
-        if amende_calc > 0:
-            execute_query("UPDATE etudiant SET solde_amende = solde_amende + %s WHERE id_etud = %s", (amende_calc, emp['etudiant_id']))
 
-    return result
+def retourner_lot(emprunt_ids: List[int], savepoints: bool = False) -> List[Dict]:
+    """
+    Retourne un lot d'emprunts (poste de retour) dans une seule transaction.
+    Retourne un résultat par identifiant, dans l'ordre : statut, jours de retard, amende,
+    étudiant et ISBN de l'emprunt rendu.
+
+    Par défaut une seule instruction ensembliste (fonction SQL retourner_emprunts)
+    traite tout le lot : une erreur inattendue annule le lot entier.
+    Avec savepoints=True, chaque retour a son propre point de sauvegarde et une
+    erreur n'annule que le retour concerné (statut 'erreur').
+    """
+    resultats = get_stockage().emprunts.retourner_lot(emprunt_ids, savepoints)
+    rendus = [r for r in resultats if r['statut'] == StatutRetour.OK]
+    if rendus:
+        cache.livres.invalider(*{r['isbn'] for r in rendus})
+        cache.etudiants.invalider(*{r['etudiant_id'] for r in rendus})
+        stats_service.invalider_cache()
+    return resultats
 
 
 def delete(emprunt_id: int) -> bool:
-    """Supprime un emprunt"""
-    return execute_query("DELETE FROM emprunt WHERE id_emprunt = %s", (emprunt_id,))
+    """Supprime un emprunt (l'exemplaire d'un emprunt en cours redevient disponible)"""
+    result = get_stockage().emprunts.delete(emprunt_id)
+    # Le livre de l'emprunt n'est pas connu ici : suppression rare, tout le cache des livres est vidé
+    cache.livres.vider()
+    stats_service.invalider_cache()
+    return result
 
 
-def calculer_jours_retard(emprunt: Dict) -> int:
-    """Calcule le nombre de jours de retard pour un emprunt"""
+def calculer_jours_retard(emprunt: Dict, date_ref: Optional[date] = None) -> int:
+    """Calcule le nombre de jours de retard pour un emprunt (à date_ref, aujourd'hui par défaut)"""
     if emprunt['date_retour'] is not None:
         return 0
 
     date_emprunt = emprunt['date_emprunt']
-    jours_ecoules = (date.today() - date_emprunt).days
+    jours_ecoules = ((date_ref or date.today()) - date_emprunt).days
 
     return max(0, jours_ecoules - DUREE_EMPRUNT_DEFAUT)
 
 
-def calculer_amende(emprunt: Dict) -> float:
-    """Calcule l'amende pour un emprunt en retard"""
-    jours_retard = calculer_jours_retard(emprunt)
+def calculer_amende(emprunt: Dict, date_ref: Optional[date] = None) -> float:
+    """Calcule l'amende pour un emprunt en retard (à date_ref, aujourd'hui par défaut)"""
+    jours_retard = calculer_jours_retard(emprunt, date_ref)
     return jours_retard * AMENDE_PAR_JOUR
@@ -1,50 +1,50 @@
 from typing import Optional, List, Dict
-from config.database import execute_query
+from config.settings import LIMITE_RECHERCHE
+from models import cache
+from services import stats_service
+from storage import get_stockage
+from utils.pagination import cle_curseur
 
 
 def create(nom: str, prenom: str, email: str) -> Optional[int]:
     """Crée un étudiant et retourne son ID"""
-    query = """
-        INSERT INTO etudiant (nom, prenom, email, date_inscription, solde_amende)
-        VALUES (%s, %s, %s, CURRENT_DATE, 0)
-        RETURNING id_etud
-    """
-    result = execute_query(query, (nom, prenom, email), fetch_one=True)
-    return result['id_etud'] if result else None
+    etudiant_id = get_stockage().etudiants.create(nom, prenom, email)
+    stats_service.invalider_cache()
+    return etudiant_id
 
 
 def get_all() -> List[Dict]:
     """Retourne tous les étudiants triés par nom"""
-    query = "SELECT id_etud as id, nom, prenom, email, date_inscription, solde_amende FROM etudiant ORDER BY nom, prenom"
-    return execute_query(query, fetch=True) or []
+    return get_stockage().etudiants.get_all()
+
+
+def get_page(limite: int, apres: Optional[List] = None) -> List[Dict]:
+    """
+    Retourne une page d'étudiants triés par nom (pagination par clé).
+    apres = (nom, prénom, id) de la dernière ligne de la page précédente.
+    Lit limite + 1 lignes pour savoir s'il existe une page suivante.
+    """
+    return get_stockage().etudiants.get_page(limite + 1, cle_curseur(apres, 3))
 
 
 def get_by_id(etudiant_id: int) -> Optional[Dict]:
-    """Retourne un étudiant par son ID"""
-    query = "SELECT id_etud as id, nom, prenom, email, date_inscription, solde_amende FROM etudiant WHERE id_etud = %s"
-    return execute_query(query, (etudiant_id,), fetch_one=True)
-
-
-def search(terme: str) -> List[Dict]:
-    """Recherche un étudiant par nom, prénom ou email"""
-    query = """
-        SELECT id_etud as id, nom, prenom, email, date_inscription, solde_amende
-        FROM etudiant
-        WHERE nom ILIKE %s OR prenom ILIKE %s OR email ILIKE %s
-        ORDER BY nom, prenom
+    """Retourne un étudiant par son ID (cache d'entités, voir models/cache.py)"""
+    return cache.etudiants.lire(etudiant_id, lambda: get_stockage().etudiants.get_by_id(etudiant_id))
+
+
+def search(terme: str, limite: int = LIMITE_RECHERCHE) -> List[Dict]:
+    """
+    Recherche un étudiant par nom, prénom ou email, sans tenir compte des accents.
+    Sous-chaîne et similarité (fautes de frappe) par trigrammes ; résultats triés par pertinence.
     """
-    pattern = f"%{terme}%"
-    return execute_query(query, (pattern, pattern, pattern), fetch=True) or []
+    return get_stockage().etudiants.search(terme, limite)
 
 
 def update(etudiant_id: int, nom: str, prenom: str, email: str) -> bool:
     """Met à jour les infos d'un étudiant"""
-    query = """
-        UPDATE etudiant
-        SET nom = %s, prenom = %s, email = %s
-        WHERE id_etud = %s
-    """
-    return execute_query(query, (nom, prenom, email, etudiant_id))
+    result = get_stockage().etudiants.update(etudiant_id, nom, prenom, email)
+    cache.etudiants.invalider(etudiant_id)
+    return result
 
 
 def delete(etudiant_id: int) -> bool:
@@ -52,34 +52,24 @@ def delete(etudiant_id: int) -> bool:
     Supprime un étudiant.
     Lève une erreur si des emprunts sont liés.
     """
-    # Vérifier les emprunts liés
-    check = execute_query(
-        "SELECT COUNT(*) as count FROM emprunt WHERE id_etud = %s",
-        (etudiant_id,),
-        fetch_one=True
-    )
+    etudiants = get_stockage().etudiants
 
-    if check and check['count'] > 0:
-        raise ValueError(f"Impossible: {check['count']} emprunt(s) lié(s)")
+    # Vérifier les emprunts liés
+    nb_emprunts = etudiants.count_emprunts(etudiant_id)
+    if nb_emprunts > 0:
+        raise ValueError(f"Impossible: {nb_emprunts} emprunt(s) lié(s)")
 
-    return execute_query("DELETE FROM etudiant WHERE id_etud = %s", (etudiant_id,))
+    result = etudiants.delete(etudiant_id)
+    cache.etudiants.invalider(etudiant_id)
+    stats_service.invalider_cache()
+    return result
 
 
 def exists(etudiant_id: int) -> bool:
-    """Vérifie si un étudiant existe"""
-    result = execute_query(
-        "SELECT 1 FROM etudiant WHERE id_etud = %s",
-        (etudiant_id,),
-        fetch_one=True
-    )
-    return result is not None
+    """Vérifie si un étudiant existe (lu dans le cache d'entités)"""
+    return get_by_id(etudiant_id) is not None
 
 
 def count_emprunts_actifs(etudiant_id: int) -> int:
     """Compte le nombre d'emprunts en cours pour un étudiant"""
-    result = execute_query(
-        "SELECT COUNT(*) as count FROM emprunt WHERE id_etud = %s AND date_retour IS NULL",
-        (etudiant_id,),
-        fetch_one=True
-    )
-    return result['count'] if result else 0
+    return get_stockage().etudiants.count_emprunts_actifs(etudiant_id)
@@ -1,58 +1,60 @@
 from typing import Optional, List, Dict
-from config.database import execute_query
+from config.settings import LIMITE_RECHERCHE
+from models import cache
+from services import stats_service
+from storage import get_stockage
+from utils.pagination import cle_curseur
 
 
 def create(titre: str, editeur: str, isbn: str, annee: Optional[int] = None, exemplaires: int = 1) -> Optional[str]:
-    """Crée un livre et retourne son ISBN"""
-    query = """
-        INSERT INTO livre (isbn, titre, editeur, annee, exemplaires_dispo)
-        VALUES (%s, %s, %s, %s, %s)
-        RETURNING isbn
-    """
-    result = execute_query(query, (isbn, titre, editeur, annee, exemplaires), fetch_one=True)
-    return result['isbn'] if result else None
+    """Crée un livre avec ses exemplaires et retourne son ISBN"""
+    result = get_stockage().livres.create(titre, editeur, isbn, annee, exemplaires)
+    stats_service.invalider_cache()
+    return result
 
 
 def get_all() -> List[Dict]:
     """Retourne tous les livres triés par titre"""
-    query = "SELECT isbn, titre, editeur, annee as annee_publication, exemplaires_dispo FROM livre ORDER BY titre"
-    return execute_query(query, fetch=True) or []
+    return get_stockage().livres.get_all()
+
+
+def get_page(limite: int, apres: Optional[List] = None) -> List[Dict]:
+    """
+    Retourne une page de livres triés par titre (pagination par clé).
+    apres = (titre, isbn) de la dernière ligne de la page précédente.
+    Lit limite + 1 lignes pour savoir s'il existe une page suivante.
+    """
+    return get_stockage().livres.get_page(limite + 1, cle_curseur(apres, 2))
 
 
 def get_by_id(isbn: str) -> Optional[Dict]:
-    """Retourne un livre par son ISBN"""
-    query = "SELECT isbn, titre, editeur, annee as annee_publication, exemplaires_dispo FROM livre WHERE isbn = %s"
-    return execute_query(query, (isbn,), fetch_one=True)
-
-
-def search(terme: str) -> List[Dict]:
-    """Recherche un livre par titre ou editeur"""
-    query = """
-        SELECT isbn, titre, editeur, annee as annee_publication, exemplaires_dispo
-        FROM livre
-        WHERE titre ILIKE %s OR editeur ILIKE %s
-        ORDER BY titre
+    """Retourne un livre par son ISBN (cache d'entités, voir models/cache.py)"""
+    return cache.livres.lire(isbn, lambda: get_stockage().livres.get_by_id(isbn))
+
+
+def search(terme: str, limite: int = LIMITE_RECHERCHE) -> List[Dict]:
     """
-    pattern = f"%{terme}%"
-    return execute_query(query, (pattern, pattern), fetch=True) or []
+    Recherche un livre par titre ou editeur, sans tenir compte des accents.
+    Combine plein texte français sur le titre, sous-chaîne et similarité
+    (fautes de frappe) par trigrammes ; résultats triés par pertinence.
+    """
+    return get_stockage().livres.search(terme, limite)
 
 
 def update(isbn: str, titre: str, editeur: str, annee: Optional[int] = None, exemplaires: Optional[int] = None) -> bool:
-    """Met à jour les infos d'un livre"""
+    """
+    Met à jour les infos d'un livre.
+    exemplaires fixe le nombre d'exemplaires disponibles : des exemplaires sont
+    ajoutés, ou des exemplaires libres retirés (voir la fonction SQL ajuster_exemplaires).
+    """
+    if exemplaires is not None and exemplaires < 0:
+        raise ValueError("Le nombre d'exemplaires ne peut pas être négatif")
+
+    result = get_stockage().livres.update(isbn, titre, editeur, annee, exemplaires)
+    cache.livres.invalider(isbn)
     if exemplaires is not None:
-        query = """
-            UPDATE livre
-            SET titre = %s, editeur = %s, annee = %s, exemplaires_dispo = %s
-            WHERE isbn = %s
-        """
-        return execute_query(query, (titre, editeur, annee, exemplaires, isbn))
-    else:
-        query = """
-            UPDATE livre
-            SET titre = %s, editeur = %s, annee = %s
-            WHERE isbn = %s
-        """
-        return execute_query(query, (titre, editeur, annee, isbn))
+        stats_service.invalider_cache()
+    return result
 
 
 def delete(isbn: str) -> bool:
@@ -60,34 +62,25 @@ def delete(isbn: str) -> bool:
     Supprime un livre.
     Lève une erreur si des emprunts sont liés.
     """
-    # Vérifier les emprunts liés
-    check = execute_query(
-        "SELECT COUNT(*) as count FROM emprunt WHERE isbn = %s",
-        (isbn,),
-        fetch_one=True
-    )
+    livres = get_stockage().livres
 
-    if check and check['count'] > 0:
-        raise ValueError(f"Impossible: {check['count']} emprunt(s) lié(s)")
+    # Vérifier les emprunts liés
+    nb_emprunts = livres.count_emprunts(isbn)
+    if nb_emprunts > 0:
+        raise ValueError(f"Impossible: {nb_emprunts} emprunt(s) lié(s)")
 
-    return execute_query("DELETE FROM livre WHERE isbn = %s", (isbn,))
+    result = livres.delete(isbn)
+    cache.livres.invalider(isbn)
+    stats_service.invalider_cache()
+    return result
 
 
 def exists(isbn: str) -> bool:
-    """Vérifie si un livre existe"""
-    result = execute_query(
-        "SELECT 1 FROM livre WHERE isbn = %s",
-        (isbn,),
-        fetch_one=True
-    )
-    return result is not None
+    """Vérifie si un livre existe (lu dans le cache d'entités)"""
+    return get_by_id(isbn) is not None
 
 
 def est_disponible(isbn: str) -> bool:
-    """Vérifie si un livre est actuellement disponible"""
-    result = execute_query(
-        "SELECT exemplaires_dispo FROM livre WHERE isbn = %s",
-        (isbn,),
-        fetch_one=True
-    )
-    return result is not None and result['exemplaires_dispo'] > 0
+    """Vérifie si un livre est actuellement disponible (lu dans le cache d'entités)"""
+    liv = get_by_id(isbn)
+    return liv is not None and liv['exemplaires_dispo'] > 0
@@ -0,0 +1,131 @@
+"""
+Traitement de nuit des amendes (python manage.py amendes accumuler).
+
+Chaque nuit, l'amende due à la date du jour est portée dans emprunt.amende pour
+chaque emprunt en retard non rendu, et l'écart reporté dans etudiant.solde_amende :
+les soldes sont à jour sans attendre le retour du livre. Au retour,
+retourner_emprunt n'ajoute au solde que le complément.
+
+Le traitement avance par lots ; le point de reprise de chaque date de référence
+(table amende_lot) est mis à jour dans la transaction du lot.
+"""
+
+import time
+from datetime import date
+from typing import Dict, Optional
+from config.database import execute_query, transaction
+from config.settings import DUREE_EMPRUNT_DEFAUT, AMENDE_PAR_JOUR
+from models import cache
+from services import stats_service
+
+TAILLE_LOT_DEFAUT = 10000
+
+# Un lot : lit les emprunts en retard suivant le point de reprise (parcours de
+# l'index partiel idx_emprunt_en_cours_date), porte emprunt.amende à l'amende due
+# à la date de référence, reporte les écarts dans les soldes et avance le point
+# de reprise, le tout en une instruction et une transaction.
+# L'amende n'est jamais diminuée : relancer le traitement pour un jour déjà
+# traité ne change rien (idempotent).
+REQUETE_LOT = """
+    WITH lot AS (
+        SELECT e.id_emprunt, e.id_etud, e.date_emprunt, e.amende,
+               (GREATEST(0, %(jour)s::date - e.date_emprunt - %(duree)s) * %(amende_jour)s)::DECIMAL(10,2) as amende_due
+        FROM emprunt e
+        WHERE e.date_retour IS NULL
+          AND e.date_emprunt < %(jour)s::date - %(duree)s
+          AND (%(apres_date)s::date IS NULL OR (e.date_emprunt, e.id_emprunt) > (%(apres_date)s::date, %(apres_id)s))
+        ORDER BY e.date_emprunt, e.id_emprunt
+        LIMIT %(taille)s
+        FOR UPDATE OF e
+    ),
+    maj AS (
+        UPDATE emprunt e SET amende = lot.amende_due
+        FROM lot
+        WHERE e.id_emprunt = lot.id_emprunt AND e.date_emprunt = lot.date_emprunt
+          -- Bornes du lot (constantes) : seules ses partitions sont parcourues
+          AND e.date_emprunt < %(jour)s::date - %(duree)s
+          AND e.date_emprunt >= COALESCE(%(apres_date)s::date, '-infinity')
+          AND lot.amende_due > lot.amende
+        RETURNING lot.id_etud, lot.amende_due - lot.amende as delta
+    ),
+    soldes AS (
+        UPDATE etudiant et SET solde_amende = et.solde_amende + d.delta
+        FROM (SELECT id_etud, SUM(delta) as delta FROM maj GROUP BY id_etud) d
+        WHERE et.id_etud = d.id_etud
+        RETURNING d.delta
+    ),
+    dernier AS (
+        SELECT date_emprunt, id_emprunt FROM lot ORDER BY date_emprunt DESC, id_emprunt DESC LIMIT 1
+    ),
+    point AS (
+        UPDATE amende_lot SET
+            dernier_date = COALESCE((SELECT date_emprunt FROM dernier), dernier_date),
+            dernier_id = COALESCE((SELECT id_emprunt FROM dernier), dernier_id),
+            lignes = lignes + (SELECT COUNT(*) FROM maj),
+            montant = montant + COALESCE((SELECT SUM(delta) FROM soldes), 0),
+            termine = (SELECT COUNT(*) FROM lot) < %(taille)s,
+            fin = CASE WHEN (SELECT COUNT(*) FROM lot) < %(taille)s THEN now() END
+        WHERE jour = %(jour)s
+        RETURNING termine
+    )
+    SELECT (SELECT COUNT(*) FROM lot) as lues,
+           (SELECT COUNT(*) FROM maj) as modifiees,
+           COALESCE((SELECT SUM(delta) FROM maj), 0) as montant,
+           (SELECT termine FROM point) as termine
+"""
+
+
+def accumuler_amendes(jour: Optional[date] = None, taille_lot: int = TAILLE_LOT_DEFAUT) -> Dict:
+    """
+    Reporte dans etudiant.solde_amende les amendes de tous les emprunts en retard
+    non rendus, calculées au `jour` donné (aujourd'hui par défaut).
+
+    Traitement par lots ensemblistes, chaque lot dans sa propre transaction avec
+    son point de reprise (table amende_lot) : un traitement interrompu reprend
+    là où il s'était arrêté, un jour déjà terminé n'est pas retraité.
+    Les montants sont ceux de emprunt.calculer_amende(emp, jour).
+    """
+    jour = jour or date.today()
+    debut = time.monotonic()
+    rapport = {'jour': jour.isoformat(), 'lots': 0, 'lues': 0, 'modifiees': 0, 'montant': 0.0,
+               'reprise': False, 'deja_termine': False}
+
+    with transaction():
+        execute_query("INSERT INTO amende_lot (jour) VALUES (%s) ON CONFLICT (jour) DO NOTHING", (jour,))
+
+    while True:
+        with transaction():
+            # Le verrou sur le point de reprise sérialise deux traitements concurrents du même jour
+            point = execute_query(
+                "SELECT dernier_date, dernier_id, termine FROM amende_lot WHERE jour = %s FOR UPDATE",
+                (jour,),
+                fetch_one=True
+            )
+            if point['termine']:
+                rapport['deja_termine'] = rapport['lots'] == 0
+                break
+            if rapport['lots'] == 0 and point['dernier_id'] is not None:
+                rapport['reprise'] = True
+
+            lot = execute_query(REQUETE_LOT, {
+                'jour': jour,
+                'duree': DUREE_EMPRUNT_DEFAUT,
+                'amende_jour': AMENDE_PAR_JOUR,
+                'apres_date': point['dernier_date'],
+                'apres_id': point['dernier_id'],
+                'taille': taille_lot
+            }, fetch_one=True)
+
+        rapport['lots'] += 1
+        rapport['lues'] += lot['lues']
+        rapport['modifiees'] += lot['modifiees']
+        rapport['montant'] += float(lot['montant'])
+        if lot['termine']:
+            break
+
+    if rapport['modifiees']:
+        # Soldes d'amendes modifiés : fiches étudiants du cache périmées
+        cache.etudiants.vider()
+        stats_service.invalider_cache()
+    rapport['duree_s'] = round(time.monotonic() - debut, 3)
+    return rapport
@@ -0,0 +1,140 @@
+import csv
+import itertools
+import json
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from config.settings import TAILLE_LOT_IMPORT, LIMITE_ERREURS_IMPORT
+from models import cache
+from services import stats_service
+from storage import get_stockage
+from utils.validators import valider_non_vide, valider_annee, valider_isbn, valider_entier_positif
+
+FORMATS_IMPORT = ('csv', 'ndjson')
+
+# Noms de colonnes acceptés (ceux de l'API sont acceptés en alias)
+ALIAS_COLONNES = {
+    'annee_publication': 'annee',
+    'exemplaires_dispo': 'exemplaires',
+}
+
+# Tailles des colonnes de la table livre
+LONGUEUR_TITRE = 255
+LONGUEUR_EDITEUR = 200
+
+
+def _lire_csv(fichier) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Produit (numéro de ligne, champs, erreur de lecture) pour un fichier CSV avec en-tête"""
+    reader = csv.DictReader(fichier)
+    colonnes = {ALIAS_COLONNES.get(c.strip(), c.strip()) for c in reader.fieldnames or []}
+    manquantes = {'isbn', 'titre', 'editeur'} - colonnes
+    if manquantes:
+        raise ValueError(f"Colonnes manquantes dans l'en-tête CSV : {', '.join(sorted(manquantes))}")
+
+    for champs in reader:
+        yield reader.line_num, champs, None
+
+
+def _lire_ndjson(fichier) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Produit (numéro de ligne, champs, erreur de lecture) pour un fichier NDJSON"""
+    for numero, texte in enumerate(fichier, start=1):
+        if not texte.strip():
+            continue
+        try:
+            champs = json.loads(texte)
+        except ValueError:
+            yield numero, None, "JSON invalide"
+            continue
+        if not isinstance(champs, dict):
+            yield numero, None, "Objet JSON attendu"
+            continue
+        yield numero, champs, None
+
+
+def _valider_ligne(champs: Dict) -> Tuple:
+    """Applique les règles de création d'un livre, retourne (isbn, titre, editeur, annee, exemplaires)"""
+    champs = {ALIAS_COLONNES.get(str(c).strip(), str(c).strip()): v for c, v in champs.items()}
+
+    def texte(nom):
+        valeur = champs.get(nom)
+        return '' if valeur is None else str(valeur)
+
+    isbn = valider_isbn(valider_non_vide(texte('isbn'), 'ISBN'))
+    titre = valider_non_vide(texte('titre'), 'titre')
+    editeur = valider_non_vide(texte('editeur'), 'éditeur')
+    if len(titre) > LONGUEUR_TITRE:
+        raise ValueError(f"Le titre dépasse {LONGUEUR_TITRE} caractères")
+    if len(editeur) > LONGUEUR_EDITEUR:
+        raise ValueError(f"L'éditeur dépasse {LONGUEUR_EDITEUR} caractères")
+
+    annee = None
+    if texte('annee').strip():
+        annee = valider_annee(texte('annee').strip())
+    exemplaires = None
+    if texte('exemplaires').strip():
+        exemplaires = valider_entier_positif(texte('exemplaires').strip(), "exemplaires")
+
+    return isbn, titre, editeur, annee, exemplaires
+
+
+def importer_livres(fichier, format: str = 'csv', taille_lot: int = TAILLE_LOT_IMPORT) -> Dict:
+    """
+    Importe un catalogue de livres (CSV avec en-tête ou NDJSON) depuis un fichier texte.
+
+    Les lignes sont validées par lots (mêmes règles que POST /api/livres, plus la
+    clé de contrôle de l'ISBN) ; les lots de lignes valides sont fusionnés dans
+    le catalogue par le moteur de stockage, en une transaction (PostgreSQL : COPY
+    dans une table temporaire puis une seule instruction de fusion).
+    Une ligne invalide est signalée dans le rapport sans interrompre l'import.
+    Si un ISBN apparaît plusieurs fois, seule sa première occurrence est importée.
+    """
+    if format not in FORMATS_IMPORT:
+        raise ValueError(f"Format d'import inconnu : '{format}' (attendu : {', '.join(FORMATS_IMPORT)})")
+
+    debut = time.monotonic()
+    lignes = _lire_csv(fichier) if format == 'csv' else _lire_ndjson(fichier)
+    rapport = {'lignes': 0, 'valides': 0, 'inseres': 0, 'modifies': 0, 'inchanges': 0,
+               'nb_erreurs': 0, 'erreurs': [], 'erreurs_tronquees': False}
+    premieres = {}  # ISBN -> numéro de sa première ligne
+
+    def erreur(numero, isbn, message):
+        rapport['nb_erreurs'] += 1
+        if len(rapport['erreurs']) < LIMITE_ERREURS_IMPORT:
+            rapport['erreurs'].append({'ligne': numero, 'isbn': isbn, 'erreur': message})
+        else:
+            rapport['erreurs_tronquees'] = True
+
+    def lots_valides() -> Iterator[List[Tuple]]:
+        while True:
+            lot = list(itertools.islice(lignes, taille_lot))
+            if not lot:
+                return
+
+            valides = []
+            for numero, champs, lecture in lot:
+                rapport['lignes'] += 1
+                if lecture:
+                    erreur(numero, None, lecture)
+                    continue
+                try:
+                    valeurs = _valider_ligne(champs)
+                except ValueError as e:
+                    erreur(numero, champs.get('isbn'), str(e))
+                    continue
+                if valeurs[0] in premieres:
+                    erreur(numero, valeurs[0], f"ISBN en double (déjà présent ligne {premieres[valeurs[0]]})")
+                    continue
+                premieres[valeurs[0]] = numero
+                valides.append(valeurs)
+                rapport['valides'] += 1
+            if valides:
+                yield valides
+
+    rapport['inseres'], rapport['modifies'] = get_stockage().livres.importer(lots_valides())
+    rapport['inchanges'] = rapport['valides'] - rapport['inseres'] - rapport['modifies']
+
+    if rapport['modifies']:
+        cache.livres.vider()
+    if rapport['inseres']:
+        stats_service.invalider_cache()
+    rapport['duree_s'] = round(time.monotonic() - debut, 3)
+    return rapport
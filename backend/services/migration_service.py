@@ -0,0 +1,289 @@
+import hashlib
+import importlib.util
+import os
+import re
+import time
+from typing import Dict, List, Optional
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import RealDictCursor
+from config.database import get_connection
+from utils.logger import log
+
+# Migrations numérotées : sql/migrations/NNNN_description.sql ou .py
+DOSSIER_MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'migrations')
+MOTIF_MIGRATION = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+
+# Une migration .sql dont une ligne est exactement ce marqueur est exécutée hors
+# transaction, instruction par instruction (CREATE INDEX CONCURRENTLY...) ;
+# une migration .py l'est si elle définit TRANSACTION = False.
+MARQUEUR_SANS_TRANSACTION = '-- migration: sans-transaction'
+
+# Verrou consultatif : deux migrations ne s'exécutent jamais en même temps
+CLE_VERROU_MIGRATION = 727300
+
+CREATION_TABLE_SUIVI = """
+    CREATE TABLE IF NOT EXISTS schema_migration (
+        version INTEGER PRIMARY KEY,
+        nom VARCHAR(200) NOT NULL,
+        somme_controle CHAR(64) NOT NULL,
+        appliquee_le TIMESTAMP NOT NULL DEFAULT now(),
+        duree_ms INTEGER NOT NULL
+    )
+"""
+
+
+def lister_migrations() -> List[Dict]:
+    """Retourne les migrations présentes dans DOSSIER_MIGRATIONS, par numéro croissant"""
+    migrations = []
+    for fichier in sorted(os.listdir(DOSSIER_MIGRATIONS)):
+        correspondance = MOTIF_MIGRATION.match(fichier)
+        if not correspondance:
+            continue
+        chemin = os.path.join(DOSSIER_MIGRATIONS, fichier)
+        with open(chemin, 'rb') as f:
+            contenu = f.read()
+        migrations.append({
+            'version': int(correspondance.group(1)),
+            'nom': fichier,
+            'chemin': chemin,
+            'type': correspondance.group(3),
+            'somme_controle': hashlib.sha256(contenu).hexdigest(),
+        })
+
+    versions = [m['version'] for m in migrations]
+    doublons = sorted({v for v in versions if versions.count(v) > 1})
+    if doublons:
+        raise ValueError(f"Numéros de migration en double : {', '.join(map(str, doublons))}")
+    return migrations
+
+
+def decouper_instructions(texte: str) -> List[str]:
+    """
+    Découpe un script SQL en instructions sur les ';' hors chaînes, identifiants
+    entre guillemets, commentaires et blocs $$...$$.
+    """
+    instructions = []
+    debut = 0
+    i = 0
+    n = len(texte)
+    while i < n:
+        c = texte[i]
+        if texte.startswith('--', i):
+            fin = texte.find('\n', i)
+            i = n if fin < 0 else fin + 1
+        elif texte.startswith('/*', i):
+            fin = texte.find('*/', i + 2)
+            i = n if fin < 0 else fin + 2
+        elif c in ("'", '"'):
+            fin = texte.find(c, i + 1)
+            while fin >= 0 and texte.startswith(c * 2, fin):
+                fin = texte.find(c, fin + 2)
+            i = n if fin < 0 else fin + 1
+        elif c == '$':
+            balise = re.match(r'\$(\w*)\$', texte[i:])
+            if balise:
+                fin = texte.find(balise.group(0), i + len(balise.group(0)))
+                i = n if fin < 0 else fin + len(balise.group(0))
+            else:
+                i += 1
+        elif c == ';':
+            instructions.append(texte[debut:i])
+            debut = i = i + 1
+        else:
+            i += 1
+    instructions.append(texte[debut:])
+
+    # Ignore les morceaux vides ou ne contenant que des commentaires
+    resultat = []
+    for instruction in instructions:
+        sans_commentaires = re.sub(r'--[^\n]*', '', instruction).strip()
+        if sans_commentaires:
+            resultat.append(instruction.strip())
+    return resultat
+
+
+def creer_index_concurrent(cur, nom: str, table: str, definition: str):
+    """
+    Crée l'index `nom` sur `table` sans bloquer les écritures (connexion en autocommit).
+    definition = partie qui suit le nom de la table, ex. "(id_etud) WHERE date_retour IS NULL".
+
+    CREATE INDEX CONCURRENTLY n'existe pas pour une table partitionnée : l'index
+    parent est alors créé sur la seule table mère (ON ONLY, invalide), chaque
+    partition est indexée en CONCURRENTLY puis rattachée ; l'index parent devient
+    valide une fois toutes les partitions rattachées.
+    Idempotent : peut être relancé après une interruption (les index restés
+    invalides après un échec sont supprimés puis recréés).
+    """
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    ligne = cur.fetchone()
+    if ligne is None:
+        raise ValueError(f"Table inconnue : {table}")
+
+    if ligne['relkind'] != 'p':
+        _index_concurrent_simple(cur, nom, table, definition)
+        return
+
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON ONLY {} ").format(
+        sql.Identifier(nom), sql.Identifier(table)) + sql.SQL(definition))
+
+    cur.execute("""
+        SELECT c.relname as partition
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%(table)s)
+          AND NOT EXISTS (
+              SELECT 1
+              FROM pg_inherits ii
+              JOIN pg_index x ON x.indexrelid = ii.inhrelid
+              WHERE ii.inhparent = to_regclass(%(nom)s) AND x.indrelid = c.oid
+          )
+        ORDER BY c.relname
+    """, {'table': table, 'nom': nom})
+    for ligne in cur.fetchall():
+        partition = ligne['partition']
+        index_partition = f"{partition}_{nom[4:] if nom.startswith('idx_') else nom}"[:63]
+        _index_concurrent_simple(cur, index_partition, partition, definition)
+        cur.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {}").format(
+            sql.Identifier(nom), sql.Identifier(index_partition)))
+
+
+def _index_concurrent_simple(cur, nom: str, table: str, definition: str):
+    """CREATE INDEX CONCURRENTLY sur une table non partitionnée (recrée l'index s'il est invalide)"""
+    cur.execute("""
+        SELECT x.indisvalid
+        FROM pg_index x
+        WHERE x.indexrelid = to_regclass(%s)
+    """, (nom,))
+    existant = cur.fetchone()
+    if existant and existant['indisvalid']:
+        return
+    if existant:
+        log(f"Index invalide {nom} (construction interrompue) : suppression puis recréation", level="INFO")
+        cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(nom)))
+
+    cur.execute(sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ").format(
+        sql.Identifier(nom), sql.Identifier(table)) + sql.SQL(definition))
+
+
+def _charger_module(migration: Dict):
+    spec = importlib.util.spec_from_file_location(f"migration_{migration['version']:04d}", migration['chemin'])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _executer(conn, migration: Dict):
+    """Exécute une migration ; retourne True si elle a été faite hors transaction"""
+    module = None
+    if migration['type'] == 'py':
+        module = _charger_module(migration)
+        transactionnelle = getattr(module, 'TRANSACTION', True)
+    else:
+        with open(migration['chemin'], encoding='utf-8') as f:
+            texte = f.read()
+        transactionnelle = MARQUEUR_SANS_TRANSACTION not in texte.splitlines()
+
+    conn.autocommit = not transactionnelle
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        if module is not None:
+            module.migrer(cur)
+        elif transactionnelle:
+            cur.execute(texte)
+        else:
+            for instruction in decouper_instructions(texte):
+                cur.execute(instruction)
+    return not transactionnelle
+
+
+def _appliquees(cur) -> Dict[int, Dict]:
+    cur.execute("SELECT version, nom, somme_controle, appliquee_le, duree_ms FROM schema_migration")
+    return {ligne['version']: ligne for ligne in cur.fetchall()}
+
+
+def statut() -> Dict:
+    """
+    État des migrations : appliquées (avec date et durée), en attente,
+    modifiées depuis leur application, et index invalides restés en base.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(CREATION_TABLE_SUIVI)
+            appliquees = _appliquees(cur)
+            cur.execute("""
+                SELECT indexrelid::regclass::TEXT as nom
+                FROM pg_index
+                WHERE NOT indisvalid
+                ORDER BY 1
+            """)
+            invalides = [ligne['nom'] for ligne in cur.fetchall()]
+        conn.commit()
+    finally:
+        conn.close()
+
+    migrations = []
+    for migration in lister_migrations():
+        faite = appliquees.get(migration['version'])
+        migrations.append({
+            'version': migration['version'],
+            'nom': migration['nom'],
+            'appliquee': faite is not None,
+            'appliquee_le': faite['appliquee_le'] if faite else None,
+            'duree_ms': faite['duree_ms'] if faite else None,
+            'modifiee': faite is not None and faite['somme_controle'] != migration['somme_controle'],
+        })
+    return {'migrations': migrations, 'index_invalides': invalides}
+
+
+def migrer(cible: Optional[int] = None) -> List[Dict]:
+    """
+    Applique dans l'ordre les migrations en attente (jusqu'à la version `cible` incluse).
+    Une migration transactionnelle et son enregistrement sont validés ensemble ;
+    une migration hors transaction est enregistrée après son succès et doit donc
+    être idempotente (IF NOT EXISTS) pour pouvoir être relancée après un échec.
+    S'arrête à la première erreur. Retourne les migrations appliquées.
+    """
+    conn = get_connection()
+    faites = []
+    try:
+        conn.autocommit = True
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (CLE_VERROU_MIGRATION,))
+            cur.execute(CREATION_TABLE_SUIVI)
+            appliquees = _appliquees(cur)
+
+        for migration in lister_migrations():
+            if migration['version'] in appliquees:
+                continue
+            if cible is not None and migration['version'] > cible:
+                break
+
+            debut = time.monotonic()
+            try:
+                _executer(conn, migration)
+                duree_ms = int((time.monotonic() - debut) * 1000)
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "INSERT INTO schema_migration (version, nom, somme_controle, duree_ms) VALUES (%s, %s, %s, %s)",
+                        (migration['version'], migration['nom'], migration['somme_controle'], duree_ms)
+                    )
+                if not conn.autocommit:
+                    conn.commit()
+            except Exception as e:
+                if not conn.autocommit:
+                    conn.rollback()
+                log(f"Migration {migration['nom']} échouée : {e}", level="ERROR")
+                raise
+
+            log(f"Migration {migration['nom']} appliquée en {duree_ms} ms")
+            faites.append({'version': migration['version'], 'nom': migration['nom'], 'duree_ms': duree_ms})
+    finally:
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (CLE_VERROU_MIGRATION,))
+        except psycopg2.Error:
+            pass
+        conn.close()
+    return faites
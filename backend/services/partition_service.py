@@ -0,0 +1,54 @@
+from datetime import date
+from typing import Dict, List
+from config.database import execute_query, transaction
+from config.settings import PARTITIONS_MOIS_AVANCE, ARCHIVE_MOIS_CONSERVES
+
+
+def _decaler_mois(jour: date, mois: int) -> date:
+    """Premier jour du mois situé `mois` mois après (ou avant) celui de `jour`"""
+    index = jour.year * 12 + jour.month - 1 + mois
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def lister_partitions() -> List[Dict]:
+    """Retourne les partitions de emprunt avec leurs bornes et leur taille estimée"""
+    query = """
+        SELECT nom, debut, fin, lignes_estimees
+        FROM emprunt_partition
+        ORDER BY debut NULLS LAST
+    """
+    return execute_query(query, fetch=True) or []
+
+
+def creer_partitions(mois_avance: int = PARTITIONS_MOIS_AVANCE) -> int:
+    """
+    Crée les partitions mensuelles de emprunt du mois courant jusqu'à
+    `mois_avance` mois à l'avance. Retourne le nombre de partitions créées.
+    À lancer régulièrement (cron) pour que les nouveaux emprunts ne tombent
+    jamais dans la partition par défaut.
+    """
+    debut = _decaler_mois(date.today(), 0)
+    fin = _decaler_mois(date.today(), mois_avance + 1)
+    with transaction():
+        result = execute_query(
+            "SELECT creer_partitions_emprunt(%s, %s) as nb",
+            (debut, fin),
+            fetch_one=True
+        )
+    return result['nb']
+
+
+def archiver_partitions(mois_conserves: int = ARCHIVE_MOIS_CONSERVES) -> List[Dict]:
+    """
+    Détache les partitions antérieures aux `mois_conserves` derniers mois dont
+    tous les emprunts sont rendus, et les déplace dans le schéma archive.
+    Les partitions contenant encore un emprunt en cours sont conservées.
+    Retourne les partitions archivées avec leur nombre de lignes.
+    """
+    avant = _decaler_mois(date.today(), -mois_conserves)
+    with transaction():
+        return execute_query(
+            "SELECT nom_partition, nb_lignes FROM archiver_partitions_emprunt(%s)",
+            (avant,),
+            fetch=True
+        ) or []
@@ -1,94 +1,185 @@
-from typing import Dict, List
-from config.database import execute_query
-
-
-def get_totaux() -> Dict:
-    """Retourne le nombre total d'étudiants, livres et emprunts"""
-    query_etudiants = "SELECT COUNT(*) as total FROM etudiant"
-    query_livres = "SELECT COUNT(*) as total FROM livre"
-    query_emprunts = "SELECT COUNT(*) as total FROM emprunt"
-    query_exemplaires = "SELECT SUM(exemplaires_dispo) as total FROM livre"
-
-    total_etudiants = execute_query(query_etudiants, fetch_one=True)
-    total_livres = execute_query(query_livres, fetch_one=True)
-    total_emprunts = execute_query(query_emprunts, fetch_one=True)
-    total_exemplaires = execute_query(query_exemplaires, fetch_one=True)
-
-    return {
-        'etudiants': total_etudiants['total'] if total_etudiants else 0,
-        'livres': total_livres['total'] if total_livres else 0,
-        'emprunts': total_emprunts['total'] if total_emprunts else 0,
-        'exemplaires': total_exemplaires['total'] if total_exemplaires and total_exemplaires['total'] else 0
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from config.database import execute_query, on_commit, transaction
+from config.settings import DUREE_CACHE_STATS, INTERVALLE_REPLI_CLASSEMENTS
+from storage import get_stockage
+from utils.logger import log
+
+# Cache en mémoire de la vue d'ensemble. La génération est incrémentée à chaque
+# invalidation : un calcul commencé avant une écriture n'est pas mis en cache.
+_cache_lock = threading.Lock()
+_cache_overview = None
+_cache_expire = 0.0
+_cache_generation = 0
+
+
+def get_overview() -> Dict:
+    """
+    Vue d'ensemble du tableau de bord, lue dans la table stats_compteur
+    (maintenue par triggers : lecture en O(1), un seul instantané)
+    et mise en cache DUREE_CACHE_STATS secondes.
+    """
+    global _cache_overview, _cache_expire
+
+    with _cache_lock:
+        if _cache_overview is not None and time.monotonic() < _cache_expire:
+            return _cache_overview
+        generation = _cache_generation
+
+    compteurs = get_compteurs()
+    exemplaires = int(compteurs.get('exemplaires_dispo', 0))
+    emprunts = int(compteurs.get('emprunts', 0))
+    en_cours = int(compteurs.get('emprunts_en_cours', 0))
+    overview = {
+        'totaux': {
+            'etudiants': int(compteurs.get('etudiants', 0)),
+            'livres': int(compteurs.get('livres', 0)),
+            'emprunts': emprunts,
+            'exemplaires': exemplaires,
+            'amendes': float(compteurs.get('amendes', 0))
+        },
+        'emprunts': {
+            'en_cours': en_cours,
+            'termines': emprunts - en_cours
+        },
+        'livres_disponibles': exemplaires,
+        'taux_emprunt': round((en_cours / exemplaires) * 100, 1) if exemplaires > 0 else 0.0
     }
 
+    with _cache_lock:
+        if generation == _cache_generation:
+            _cache_overview = overview
+            _cache_expire = time.monotonic() + DUREE_CACHE_STATS
+    return overview
 
-def get_top_etudiants(limit: int = 5) -> List[Dict]:
-    """Retourne les étudiants ayant le plus d'emprunts"""
-    query = """
-        SELECT et.id_etud as id, et.nom, et.prenom, COUNT(e.id_emprunt) as nombre_emprunts
-        FROM etudiant et
-        LEFT JOIN emprunt e ON et.id_etud = e.id_etud
-        GROUP BY et.id_etud, et.nom, et.prenom
-        HAVING COUNT(e.id_emprunt) > 0
-        ORDER BY nombre_emprunts DESC
-        LIMIT %s
-    """
-    return execute_query(query, (limit,), fetch=True) or []
 
+def get_compteurs() -> Dict:
+    """Retourne les compteurs statistiques (somme des shards de chaque clé)"""
+    return get_stockage().stats.get_compteurs()
 
-def get_top_livres(limit: int = 5) -> List[Dict]:
-    """Retourne les livres les plus empruntés"""
+
+def verifier_compteurs() -> List[Dict]:
+    """Compare chaque compteur à la valeur recalculée depuis les tables de base"""
     query = """
-        SELECT l.isbn, l.titre, l.editeur as auteur, COUNT(e.id_emprunt) as nombre_emprunts
-        FROM livre l
-        LEFT JOIN emprunt e ON l.isbn = e.isbn
-        GROUP BY l.isbn, l.titre, l.editeur
-        HAVING COUNT(e.id_emprunt) > 0
-        ORDER BY nombre_emprunts DESC
-        LIMIT %s
+        SELECT r.cle, COALESCE(c.valeur, 0) as compteur, r.valeur as reel,
+               r.valeur - COALESCE(c.valeur, 0) as ecart
+        FROM stats_compteur_reel r
+        LEFT JOIN (SELECT cle, SUM(valeur) as valeur FROM stats_compteur GROUP BY cle) c ON c.cle = r.cle
+        ORDER BY r.cle
     """
-    return execute_query(query, (limit,), fetch=True) or []
-
-
-def get_stats_emprunts() -> Dict:
-    """Retourne des statistiques sur les emprunts"""
-    query_en_cours = "SELECT COUNT(*) as total FROM emprunt WHERE date_retour IS NULL"
-    query_termines = "SELECT COUNT(*) as total FROM emprunt WHERE date_retour IS NOT NULL"
+    return execute_query(query, fetch=True) or []
 
-    en_cours = execute_query(query_en_cours, fetch_one=True)
-    termines = execute_query(query_termines, fetch_one=True)
 
-    return {
-        'en_cours': en_cours['total'] if en_cours else 0,
-        'termines': termines['total'] if termines else 0
-    }
+def reconstruire_compteurs() -> List[Dict]:
+    """
+    Recalcule tous les compteurs depuis les tables de base.
+    Les écritures sont bloquées pendant le recalcul (LOCK ... IN SHARE MODE).
+    Retourne l'écart constaté avant reconstruction.
+    """
+    with transaction():
+        execute_query("LOCK TABLE etudiant, livre, exemplaire, emprunt IN SHARE MODE")
+        ecarts = verifier_compteurs()
+        execute_query("DELETE FROM stats_compteur")
+        execute_query("INSERT INTO stats_compteur (cle, shard, valeur) SELECT cle, 0, valeur FROM stats_compteur_reel")
+    invalider_cache()
+    return ecarts
 
 
-def get_livres_disponibles() -> int:
-    """Retourne le nombre total d'exemplaires disponibles"""
-    query = "SELECT SUM(exemplaires_dispo) as total FROM livre"
-    result = execute_query(query, fetch_one=True)
-    return result['total'] if result and result['total'] else 0
+def _vider_cache():
+    global _cache_overview, _cache_generation
+    with _cache_lock:
+        _cache_overview = None
+        _cache_generation += 1
 
 
-def get_taux_emprunt() -> float:
-    """Calcule le taux d'emprunts actifs par rapport au total d'exemplaires"""
-    # Total exemplaires
-    total_exemplaires = execute_query(
-        "SELECT SUM(exemplaires_dispo) as total FROM livre",
-        fetch_one=True
-    )
+def invalider_cache():
+    """À appeler après une écriture : le cache est vidé une fois la transaction validée"""
+    _vider_cache()
+    on_commit(_vider_cache)
 
-    # Emprunts actifs
-    emprunts_actifs = execute_query(
-        "SELECT COUNT(*) as total FROM emprunt WHERE date_retour IS NULL",
-        fetch_one=True
-    )
 
-    if not total_exemplaires or total_exemplaires['total'] == 0:
-        return 0.0
+def get_top_etudiants(limit: int = 5, fenetre: Optional[int] = None) -> List[Dict]:
+    """
+    Retourne les étudiants ayant le plus d'emprunts, au total (fenetre=None)
+    ou sur les `fenetre` derniers jours. Lit les compteurs maintenus par trigger.
+    """
+    return get_stockage().stats.get_top_etudiants(limit, fenetre)
 
-    total = total_exemplaires['total']
-    actifs = emprunts_actifs['total'] if emprunts_actifs else 0
 
-    return (actifs / total) * 100 if total > 0 else 0.0
+def get_top_livres(limit: int = 5, fenetre: Optional[int] = None) -> List[Dict]:
+    """
+    Retourne les livres les plus empruntés, au total (fenetre=None)
+    ou sur les `fenetre` derniers jours. Lit les compteurs maintenus par trigger.
+    """
+    return get_stockage().stats.get_top_livres(limit, fenetre)
+
+
+def replier_classements() -> int:
+    """Reporte les emprunts en attente (table classement_delta) dans les classements"""
+    return get_stockage().stats.replier_classements()
+
+
+# Repli asynchrone : planifier_repli_classements() réveille, après le COMMIT, un
+# thread qui replie au plus une fois toutes les INTERVALLE_REPLI_CLASSEMENTS secondes
+_repli_demande = threading.Event()
+_repli_thread: Optional[threading.Thread] = None
+_repli_lock = threading.Lock()
+
+
+def _boucle_repli(demande: threading.Event):
+    while True:
+        demande.wait()
+        time.sleep(INTERVALLE_REPLI_CLASSEMENTS)
+        demande.clear()
+        try:
+            replier_classements()
+        except Exception as e:
+            log(f"Erreur repli des classements: {e}", level="ERROR")
+
+
+def planifier_repli_classements():
+    """À appeler après des emprunts : les classements sont repliés peu après le COMMIT"""
+    global _repli_thread
+    if _repli_thread is None:
+        with _repli_lock:
+            if _repli_thread is None:
+                _repli_thread = threading.Thread(target=_boucle_repli, args=(_repli_demande,),
+                                                 name="repli-classements", daemon=True)
+                _repli_thread.start()
+    on_commit(_repli_demande.set)
+
+
+def _reinitialiser_apres_fork():
+    global _repli_demande, _repli_thread, _repli_lock
+    _repli_demande = threading.Event()
+    _repli_thread = None
+    _repli_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reinitialiser_apres_fork)
+
+
+def reconstruire_classements():
+    """Recalcule les tables de classement depuis la table emprunt"""
+    with transaction():
+        execute_query("LOCK TABLE emprunt IN SHARE MODE")
+        execute_query("TRUNCATE classement_etudiant, classement_livre, classement_jour_etudiant, classement_jour_livre, "
+                      "classement_delta")
+        execute_query("""
+            INSERT INTO classement_etudiant (id_etud, nb_emprunts)
+            SELECT id_etud, COUNT(*) FROM emprunt GROUP BY id_etud
+        """)
+        execute_query("""
+            INSERT INTO classement_livre (isbn, nb_emprunts)
+            SELECT isbn, COUNT(*) FROM emprunt GROUP BY isbn
+        """)
+        execute_query("""
+            INSERT INTO classement_jour_etudiant (jour, id_etud, nb_emprunts)
+            SELECT date_emprunt, id_etud, COUNT(*) FROM emprunt GROUP BY date_emprunt, id_etud
+        """)
+        execute_query("""
+            INSERT INTO classement_jour_livre (jour, isbn, nb_emprunts)
+            SELECT date_emprunt, isbn, COUNT(*) FROM emprunt GROUP BY date_emprunt, isbn
+        """)
@@ -1,10 +1,38 @@
 -- Script de création des tables pour la bibliothèque universitaire
 -- Base de données: bibliothequeuniv
+-- Schéma complet d'une nouvelle base. Une base existante évolue par les
+-- migrations de sql/migrations (python manage.py migrations appliquer).
 
 -- Suppression des tables existantes (dans l'ordre des dépendances)
 DROP TABLE IF EXISTS emprunt CASCADE;
+DROP TABLE IF EXISTS emprunt_cle CASCADE;
+DROP TABLE IF EXISTS exemplaire CASCADE;
 DROP TABLE IF EXISTS livre CASCADE;
 DROP TABLE IF EXISTS etudiant CASCADE;
+DROP TABLE IF EXISTS stats_compteur CASCADE;
+DROP TABLE IF EXISTS amende_lot CASCADE;
+DROP TABLE IF EXISTS schema_migration CASCADE;
+DROP TABLE IF EXISTS classement_jour_etudiant CASCADE;
+DROP TABLE IF EXISTS classement_jour_livre CASCADE;
+DROP TABLE IF EXISTS classement_etudiant CASCADE;
+DROP TABLE IF EXISTS classement_livre CASCADE;
+DROP TABLE IF EXISTS classement_delta CASCADE;
+
+-- Extensions pour la recherche (trigrammes + suppression des accents)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() n'est pas IMMUTABLE : enveloppe utilisable dans les index
+CREATE OR REPLACE FUNCTION f_unaccent(TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+$$;
+
+-- Configuration plein texte française insensible aux accents (« Misérables » = « miserables »)
+DROP TEXT SEARCH CONFIGURATION IF EXISTS fr_unaccent;
+CREATE TEXT SEARCH CONFIGURATION fr_unaccent (COPY = french);
+ALTER TEXT SEARCH CONFIGURATION fr_unaccent
+    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem;
 
 -- Table etudiant
 CREATE TABLE etudiant (
@@ -22,39 +50,691 @@ CREATE TABLE livre (
     titre VARCHAR(255) NOT NULL,
     editeur VARCHAR(200) NOT NULL,
     annee INTEGER,
-    exemplaires_dispo INTEGER DEFAULT 1,
     CHECK (annee IS NULL OR (annee >= 1000 AND annee <= EXTRACT(YEAR FROM CURRENT_DATE)))
 );
 
--- Table emprunt
+-- Table exemplaire : un exemplaire physique par ligne
+-- Le nombre d'exemplaires disponibles d'un livre est dérivé (COUNT ... WHERE disponible)
+CREATE TABLE exemplaire (
+    id_exemplaire SERIAL PRIMARY KEY,
+    isbn VARCHAR(20) NOT NULL REFERENCES livre(isbn) ON DELETE CASCADE,
+    disponible BOOLEAN NOT NULL DEFAULT TRUE
+);
+
+-- Table emprunt, partitionnée par mois sur date_emprunt (partitions emprunt_AAAA_MM)
+-- La clé primaire doit contenir la clé de partitionnement ; id_emprunt reste
+-- unique car il vient d'une seule séquence.
 CREATE TABLE emprunt (
-    id_emprunt SERIAL PRIMARY KEY,
+    id_emprunt SERIAL,
     id_etud INTEGER NOT NULL REFERENCES etudiant(id_etud) ON DELETE RESTRICT,
     isbn VARCHAR(20) NOT NULL REFERENCES livre(isbn) ON DELETE RESTRICT,
     date_emprunt DATE NOT NULL DEFAULT CURRENT_DATE,
     date_retour DATE,
     amende DECIMAL(10,2) DEFAULT 0,
+    id_exemplaire INTEGER REFERENCES exemplaire(id_exemplaire) ON DELETE SET NULL,
+    PRIMARY KEY (id_emprunt, date_emprunt),
     CHECK (date_retour IS NULL OR date_retour >= date_emprunt)
+) PARTITION BY RANGE (date_emprunt);
+
+-- Reçoit les emprunts hors des partitions mensuelles (doit rester vide : une
+-- partition ne peut pas être créée pour un mois dont des lignes sont ici)
+CREATE TABLE emprunt_defaut PARTITION OF emprunt DEFAULT;
+
+-- Date d'emprunt de chaque emprunt, par identifiant : une recherche par id_emprunt
+-- seul (API, retours) lit d'abord sa date, puis une seule partition de emprunt
+-- au lieu de sonder l'index de chacune. Tenue à jour par trigger.
+CREATE TABLE emprunt_cle (
+    id_emprunt INTEGER PRIMARY KEY,
+    date_emprunt DATE NOT NULL
 );
 
+CREATE OR REPLACE FUNCTION trg_cles_emprunt() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO emprunt_cle (id_emprunt, date_emprunt) SELECT id_emprunt, date_emprunt FROM nouveaux;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM emprunt_cle c USING anciens a WHERE c.id_emprunt = a.id_emprunt;
+    ELSE
+        TRUNCATE emprunt_cle;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER cles_emprunt_ins AFTER INSERT ON emprunt
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_cles_emprunt();
+CREATE TRIGGER cles_emprunt_del AFTER DELETE ON emprunt
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_cles_emprunt();
+CREATE TRIGGER cles_emprunt_tru AFTER TRUNCATE ON emprunt
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_cles_emprunt();
+
+-- Partitions mensuelles de emprunt couvrant [p_debut, p_fin[ (les existantes sont ignorées)
+CREATE OR REPLACE FUNCTION creer_partitions_emprunt(p_debut DATE, p_fin DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_mois DATE := date_trunc('month', p_debut)::DATE;
+    v_nom TEXT;
+    v_nb INTEGER := 0;
+BEGIN
+    WHILE v_mois < p_fin LOOP
+        v_nom := 'emprunt_' || to_char(v_mois, 'YYYY_MM');
+        IF to_regclass(v_nom) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF emprunt FOR VALUES FROM (%L) TO (%L)',
+                           v_nom, v_mois, (v_mois + INTERVAL '1 month')::DATE);
+            v_nb := v_nb + 1;
+        END IF;
+        v_mois := (v_mois + INTERVAL '1 month')::DATE;
+    END LOOP;
+    RETURN v_nb;
+END;
+$$;
+
+SELECT creer_partitions_emprunt((CURRENT_DATE - INTERVAL '12 months')::DATE, (CURRENT_DATE + INTERVAL '3 months')::DATE);
+
+-- Partitions de emprunt avec leurs bornes (NULL pour la partition par défaut)
+CREATE OR REPLACE VIEW emprunt_partition AS
+    SELECT c.relname::TEXT AS nom,
+           (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\)'))[1]::DATE AS debut,
+           (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::DATE AS fin,
+           GREATEST(c.reltuples, 0)::BIGINT AS lignes_estimees
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'emprunt'::regclass;
+
+-- Archivage : détache les partitions entièrement antérieures à p_avant dont tous
+-- les emprunts sont rendus et les déplace dans le schéma archive (toujours
+-- interrogeables, mais plus parcourues par les requêtes sur emprunt).
+-- Les triggers ne voient pas un DETACH : le compteur 'emprunts' et emprunt_cle
+-- sont ajustés ici.
+CREATE SCHEMA IF NOT EXISTS archive;
+
+CREATE OR REPLACE FUNCTION archiver_partitions_emprunt(p_avant DATE)
+RETURNS TABLE (nom_partition TEXT, nb_lignes BIGINT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_part RECORD;
+    v_ouvert BOOLEAN;
+    v_nb BIGINT;
+BEGIN
+    FOR v_part IN
+        SELECT p.nom FROM emprunt_partition p WHERE p.fin <= p_avant ORDER BY p.debut
+    LOOP
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE date_retour IS NULL)', v_part.nom) INTO v_ouvert;
+        CONTINUE WHEN v_ouvert;
+
+        EXECUTE format('SELECT COUNT(*) FROM %I', v_part.nom) INTO v_nb;
+        EXECUTE format('DELETE FROM emprunt_cle c USING %I p WHERE c.id_emprunt = p.id_emprunt', v_part.nom);
+        EXECUTE format('ALTER TABLE emprunt DETACH PARTITION %I', v_part.nom);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', v_part.nom);
+        PERFORM ajuster_compteur('emprunts', -v_nb);
+
+        nom_partition := 'archive.' || v_part.nom;
+        nb_lignes := v_nb;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
 -- Index pour améliorer les performances des recherches
-CREATE INDEX idx_etudiant_nom ON etudiant(nom);
+-- Les index de tri couvrent la clé de pagination complète (parcours d'intervalle d'index)
+CREATE INDEX idx_etudiant_nom ON etudiant(nom, prenom, id_etud);
 CREATE INDEX idx_etudiant_email ON etudiant(email);
-CREATE INDEX idx_livre_titre ON livre(titre);
+CREATE INDEX idx_livre_titre ON livre(titre, isbn);
 CREATE INDEX idx_livre_editeur ON livre(editeur);
-CREATE INDEX idx_emprunt_etudiant ON emprunt(id_etud);
-CREATE INDEX idx_emprunt_livre ON emprunt(isbn);
-CREATE INDEX idx_emprunt_date_retour ON emprunt(date_retour);
+-- Recherche : trigrammes (sous-chaînes, fautes de frappe) et plein texte (titres)
+CREATE INDEX idx_etudiant_nom_trgm ON etudiant USING GIN (f_unaccent(nom) gin_trgm_ops);
+CREATE INDEX idx_etudiant_prenom_trgm ON etudiant USING GIN (f_unaccent(prenom) gin_trgm_ops);
+CREATE INDEX idx_etudiant_email_trgm ON etudiant USING GIN (email gin_trgm_ops);
+CREATE INDEX idx_livre_titre_trgm ON livre USING GIN (f_unaccent(titre) gin_trgm_ops);
+CREATE INDEX idx_livre_editeur_trgm ON livre USING GIN (f_unaccent(editeur) gin_trgm_ops);
+CREATE INDEX idx_livre_titre_fts ON livre USING GIN (to_tsvector('fr_unaccent', titre));
+CREATE INDEX idx_emprunt_date ON emprunt(date_emprunt, id_emprunt);
+CREATE INDEX idx_emprunt_etudiant ON emprunt(id_etud, date_emprunt, id_emprunt);
+CREATE INDEX idx_emprunt_livre ON emprunt(isbn, date_emprunt, id_emprunt);
+-- Emprunts en cours : index partiels, presque vides sur les partitions anciennes
+CREATE INDEX idx_emprunt_en_cours_date ON emprunt(date_emprunt, id_emprunt) WHERE date_retour IS NULL;
+CREATE INDEX idx_emprunt_en_cours_etudiant ON emprunt(id_etud) WHERE date_retour IS NULL;
+-- Exemplaires libres d'un titre (allocation et comptage par parcours d'index)
+CREATE INDEX idx_exemplaire_libre ON exemplaire(isbn, id_exemplaire) WHERE disponible;
+-- Clés étrangères vers exemplaire (retrait d'un exemplaire, suppression d'un livre)
+CREATE INDEX idx_emprunt_exemplaire ON emprunt(id_exemplaire);
+CREATE INDEX idx_exemplaire_livre ON exemplaire(isbn);
+-- Un exemplaire n'est prêté qu'une fois à la fois : garanti par exemplaire.disponible,
+-- modifié sous verrou de ligne (un index unique sur une table partitionnée devrait
+-- contenir date_emprunt et ne le garantirait pas)
+
+-- Emprunt atomique : vérifications, verrous, attribution d'un exemplaire et INSERT en un seul appel
+-- Résultats possibles : ok, etudiant_inconnu, livre_inconnu, indisponible, limite_atteinte
+CREATE OR REPLACE FUNCTION emprunter_livre(p_id_etud INTEGER, p_isbn VARCHAR, p_max_emprunts INTEGER)
+RETURNS TABLE (resultat TEXT, emprunt_id INTEGER)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_nb INTEGER;
+    v_exemplaire INTEGER;
+    v_id INTEGER;
+BEGIN
+    -- Le verrou sur l'étudiant sérialise ses emprunts concurrents (limite fiable)
+    PERFORM 1 FROM etudiant WHERE id_etud = p_id_etud FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'etudiant_inconnu'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM livre WHERE isbn = p_isbn;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'livre_inconnu'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM exemplaire WHERE isbn = p_isbn AND disponible) THEN
+        RETURN QUERY SELECT 'indisponible'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    SELECT COUNT(*) INTO v_nb FROM emprunt WHERE id_etud = p_id_etud AND date_retour IS NULL;
+    IF v_nb >= p_max_emprunts THEN
+        RETURN QUERY SELECT 'limite_atteinte'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    -- Attribution d'un exemplaire libre : ceux déjà verrouillés par un emprunt
+    -- concurrent sont sautés au lieu d'être attendus, les emprunts simultanés
+    -- d'un même titre ne se bloquent pas (pas de ligne chaude sur livre)
+    SELECT id_exemplaire INTO v_exemplaire
+    FROM exemplaire
+    WHERE isbn = p_isbn AND disponible
+    ORDER BY id_exemplaire
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'indisponible'::TEXT, NULL::INTEGER;
+        RETURN;
+    END IF;
+
+    UPDATE exemplaire SET disponible = FALSE WHERE id_exemplaire = v_exemplaire;
+
+    INSERT INTO emprunt (id_etud, isbn, date_emprunt, amende, id_exemplaire)
+    VALUES (p_id_etud, p_isbn, CURRENT_DATE, 0, v_exemplaire)
+    RETURNING id_emprunt INTO v_id;
+
+    RETURN QUERY SELECT 'ok'::TEXT, v_id;
+END;
+$$;
+
+-- Retour atomique : calcul de l'amende, mise à jour de l'emprunt, de l'exemplaire et du solde
+-- Résultats possibles : ok, inconnu, deja_retourne. L'étudiant et le livre de
+-- l'emprunt rendu sont retournés (invalidation du cache d'entités)
+DROP FUNCTION IF EXISTS retourner_emprunt(INTEGER, INTEGER, NUMERIC);
+CREATE FUNCTION retourner_emprunt(p_id_emprunt INTEGER, p_duree INTEGER, p_amende_jour NUMERIC)
+RETURNS TABLE (resultat TEXT, jours_retard INTEGER, amende_due NUMERIC, etudiant_id INTEGER, isbn VARCHAR)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_date DATE;
+    v_id_etud INTEGER;
+    v_isbn VARCHAR;
+    v_exemplaire INTEGER;
+    v_deja NUMERIC;
+    v_jours INTEGER;
+    v_amende NUMERIC;
+BEGIN
+    -- Date de l'emprunt d'abord : les requêtes suivantes ne lisent que sa partition
+    SELECT c.date_emprunt INTO v_date FROM emprunt_cle c WHERE c.id_emprunt = p_id_emprunt;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'inconnu'::TEXT, 0, 0::NUMERIC, NULL::INTEGER, NULL::VARCHAR;
+        RETURN;
+    END IF;
+
+    -- La condition date_retour IS NULL est réévaluée après le verrou de ligne :
+    -- deux retours simultanés du même emprunt ne réincrémentent pas le stock deux fois
+    SELECT e.id_etud, e.isbn, e.id_exemplaire, e.amende INTO v_id_etud, v_isbn, v_exemplaire, v_deja
+    FROM emprunt e
+    WHERE e.id_emprunt = p_id_emprunt AND e.date_emprunt = v_date AND e.date_retour IS NULL
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'deja_retourne'::TEXT, 0, 0::NUMERIC, NULL::INTEGER, NULL::VARCHAR;
+        RETURN;
+    END IF;
+
+    -- L'amende déjà accumulée par le traitement de nuit (emprunt.amende) est
+    -- déjà dans le solde : seul le complément y est ajouté
+    UPDATE emprunt e
+    SET date_retour = CURRENT_DATE,
+        amende = GREATEST(v_deja, GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree) * p_amende_jour)
+    WHERE e.id_emprunt = p_id_emprunt AND e.date_emprunt = v_date
+    RETURNING GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree), e.amende
+    INTO v_jours, v_amende;
+
+    UPDATE exemplaire SET disponible = TRUE WHERE id_exemplaire = v_exemplaire;
+
+    IF v_amende > v_deja THEN
+        UPDATE etudiant SET solde_amende = solde_amende + (v_amende - v_deja) WHERE id_etud = v_id_etud;
+    END IF;
+
+    RETURN QUERY SELECT 'ok'::TEXT, v_jours, v_amende, v_id_etud, v_isbn;
+END;
+$$;
+
+-- Retour d'un lot d'emprunts (poste de retour) : mêmes règles que retourner_emprunt,
+-- en une instruction ensembliste. Un résultat par élément de p_ids, dans l'ordre
+-- (rang) ; un identifiant répété n'est retourné qu'une fois (deja_retourne ensuite).
+-- Les dates des emprunts (emprunt_cle) bornent les partitions lues.
+DROP FUNCTION IF EXISTS retourner_emprunts(INTEGER[], INTEGER, NUMERIC);
+CREATE FUNCTION retourner_emprunts(p_ids INTEGER[], p_duree INTEGER, p_amende_jour NUMERIC)
+RETURNS TABLE (rang BIGINT, emprunt_id INTEGER, resultat TEXT, jours_retard INTEGER, amende_due NUMERIC,
+               etudiant_id INTEGER, isbn VARCHAR)
+LANGUAGE sql AS $$
+    WITH demande AS (
+        SELECT d.id, d.rang, d.rang = MIN(d.rang) OVER (PARTITION BY d.id) as premier, c.date_emprunt
+        FROM unnest(p_ids) WITH ORDINALITY AS d(id, rang)
+        LEFT JOIN emprunt_cle c ON c.id_emprunt = d.id
+    ),
+    -- Verrous pris dans l'ordre des identifiants : pas d'interblocage entre deux lots.
+    -- Les bornes (sous-requêtes évaluées une fois) élaguent les partitions à l'exécution.
+    cibles AS (
+        SELECT e.id_emprunt, e.date_emprunt, e.id_etud, e.id_exemplaire, e.amende as deja,
+               GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree) as jours
+        FROM emprunt e
+        WHERE (e.id_emprunt, e.date_emprunt) IN (SELECT id, date_emprunt FROM demande)
+          AND e.date_emprunt BETWEEN (SELECT MIN(date_emprunt) FROM demande) AND (SELECT MAX(date_emprunt) FROM demande)
+          AND e.date_retour IS NULL
+        ORDER BY e.id_emprunt
+        FOR UPDATE OF e
+    ),
+    maj AS (
+        UPDATE emprunt e
+        SET date_retour = CURRENT_DATE,
+            amende = GREATEST(c.deja, c.jours * p_amende_jour)
+        FROM cibles c
+        WHERE e.id_emprunt = c.id_emprunt AND e.date_emprunt = c.date_emprunt
+          AND e.date_emprunt BETWEEN (SELECT MIN(date_emprunt) FROM demande) AND (SELECT MAX(date_emprunt) FROM demande)
+        RETURNING e.id_emprunt, e.id_etud, e.isbn, e.id_exemplaire, c.deja, e.amende, c.jours
+    ),
+    stock AS (
+        UPDATE exemplaire x SET disponible = TRUE
+        FROM maj
+        WHERE x.id_exemplaire = maj.id_exemplaire
+    ),
+    soldes AS (
+        UPDATE etudiant et SET solde_amende = et.solde_amende + s.delta
+        FROM (SELECT id_etud, SUM(amende - deja) as delta FROM maj GROUP BY id_etud) s
+        WHERE et.id_etud = s.id_etud AND s.delta > 0
+    )
+    SELECT d.rang, d.id,
+           CASE WHEN m.id_emprunt IS NOT NULL AND d.premier THEN 'ok'
+                WHEN d.date_emprunt IS NOT NULL THEN 'deja_retourne'
+                ELSE 'inconnu' END,
+           CASE WHEN d.premier THEN COALESCE(m.jours, 0) ELSE 0 END,
+           CASE WHEN d.premier THEN COALESCE(m.amende, 0) ELSE 0 END,
+           CASE WHEN d.premier THEN m.id_etud END,
+           CASE WHEN d.premier THEN m.isbn END
+    FROM demande d
+    LEFT JOIN maj m ON m.id_emprunt = d.id
+    ORDER BY d.rang
+$$;
+
+-- Fixe le nombre d'exemplaires disponibles d'un livre : ajoute des exemplaires
+-- ou retire des exemplaires libres (les exemplaires prêtés ne sont pas touchés)
+CREATE OR REPLACE FUNCTION ajuster_exemplaires(p_isbn VARCHAR, p_dispo INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_dispo INTEGER;
+    v_retires INTEGER;
+BEGIN
+    IF p_dispo < 0 THEN
+        RAISE EXCEPTION 'Nombre d''exemplaires négatif : %', p_dispo USING ERRCODE = 'check_violation';
+    END IF;
+
+    -- Sérialise les ajustements d'un même livre (sans bloquer les emprunts)
+    PERFORM 1 FROM livre WHERE isbn = p_isbn FOR NO KEY UPDATE;
+    SELECT COUNT(*) INTO v_dispo FROM exemplaire WHERE isbn = p_isbn AND disponible;
+
+    IF p_dispo > v_dispo THEN
+        INSERT INTO exemplaire (isbn) SELECT p_isbn FROM generate_series(1, p_dispo - v_dispo);
+        RETURN;
+    END IF;
+
+    -- Les exemplaires verrouillés par un emprunt en cours sont sautés : si trop peu
+    -- ont été retirés, on recompte après une courte attente (l'emprunt validé, son
+    -- exemplaire n'est plus libre ; annulé, il redevient retirable), puis on échoue
+    FOR v_tentative IN 1..3 LOOP
+        EXIT WHEN v_dispo <= p_dispo;
+        DELETE FROM exemplaire WHERE id_exemplaire IN (
+            SELECT id_exemplaire FROM exemplaire
+            WHERE isbn = p_isbn AND disponible
+            ORDER BY id_exemplaire DESC
+            LIMIT v_dispo - p_dispo
+            FOR UPDATE SKIP LOCKED
+        );
+        GET DIAGNOSTICS v_retires = ROW_COUNT;
+        v_dispo := v_dispo - v_retires;
+        EXIT WHEN v_dispo <= p_dispo;
+        PERFORM pg_sleep(0.01 * v_tentative);
+        SELECT COUNT(*) INTO v_dispo FROM exemplaire WHERE isbn = p_isbn AND disponible;
+    END LOOP;
+
+    IF v_dispo > p_dispo THEN
+        RAISE EXCEPTION 'Exemplaires de % en cours d''emprunt : % exemplaire(s) libre(s) au lieu de %, réessayez',
+            p_isbn, v_dispo, p_dispo
+            USING ERRCODE = 'lock_not_available';
+    END IF;
+END;
+$$;
+
+-- Points de reprise du traitement de nuit des amendes (un par date de référence)
+-- Le traitement parcourt les emprunts en retard par (date_emprunt, id_emprunt)
+CREATE TABLE amende_lot (
+    jour DATE PRIMARY KEY,
+    dernier_date DATE,
+    dernier_id INTEGER,
+    lignes INTEGER NOT NULL DEFAULT 0,
+    montant DECIMAL(12,2) NOT NULL DEFAULT 0,
+    termine BOOLEAN NOT NULL DEFAULT FALSE,
+    debut TIMESTAMP NOT NULL DEFAULT now(),
+    fin TIMESTAMP
+);
+
+-- Compteurs statistiques maintenus par triggers (vue d'ensemble en O(1))
+-- Chaque compteur est réparti sur 8 lignes (shard = pid du backend modulo 8)
+-- pour que les transactions concurrentes ne se bloquent pas sur la même ligne.
+CREATE TABLE stats_compteur (
+    cle VARCHAR(30) NOT NULL,
+    shard SMALLINT NOT NULL,
+    valeur NUMERIC(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (cle, shard)
+);
+
+-- Valeurs recalculées depuis les tables de base (reconstruction / vérification)
+CREATE VIEW stats_compteur_reel AS
+    SELECT 'etudiants'::VARCHAR AS cle, COUNT(*)::NUMERIC AS valeur FROM etudiant
+    UNION ALL SELECT 'amendes', COALESCE(SUM(solde_amende), 0) FROM etudiant
+    UNION ALL SELECT 'livres', COUNT(*) FROM livre
+    UNION ALL SELECT 'exemplaires_dispo', COUNT(*) FROM exemplaire WHERE disponible
+    UNION ALL SELECT 'emprunts', COUNT(*) FROM emprunt
+    UNION ALL SELECT 'emprunts_en_cours', COUNT(*) FROM emprunt WHERE date_retour IS NULL;
+
+CREATE OR REPLACE FUNCTION ajuster_compteur(p_cle VARCHAR, p_delta NUMERIC)
+RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    IF p_delta IS NULL OR p_delta = 0 THEN
+        RETURN;
+    END IF;
+    INSERT INTO stats_compteur (cle, shard, valeur)
+    VALUES (p_cle, pg_backend_pid() % 8, p_delta)
+    ON CONFLICT (cle, shard) DO UPDATE SET valeur = stats_compteur.valeur + EXCLUDED.valeur;
+END;
+$$;
+
+-- Triggers par instruction avec tables de transition : une mise à jour de compteur
+-- par instruction SQL, même pour un chargement en masse
+CREATE OR REPLACE FUNCTION trg_compteurs_etudiant() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM ajuster_compteur('etudiants', (SELECT COUNT(*) FROM nouveaux));
+        PERFORM ajuster_compteur('amendes', (SELECT SUM(solde_amende) FROM nouveaux));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM ajuster_compteur('etudiants', -(SELECT COUNT(*) FROM anciens));
+        PERFORM ajuster_compteur('amendes', -(SELECT SUM(solde_amende) FROM anciens));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM ajuster_compteur('amendes',
+            (SELECT COALESCE(SUM(solde_amende), 0) FROM nouveaux) - (SELECT COALESCE(SUM(solde_amende), 0) FROM anciens));
+    ELSE
+        DELETE FROM stats_compteur WHERE cle IN ('etudiants', 'amendes');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trg_compteurs_livre() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM ajuster_compteur('livres', (SELECT COUNT(*) FROM nouveaux));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM ajuster_compteur('livres', -(SELECT COUNT(*) FROM anciens));
+    ELSE
+        DELETE FROM stats_compteur WHERE cle = 'livres';
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trg_compteurs_exemplaire() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM ajuster_compteur('exemplaires_dispo', (SELECT COUNT(*) FROM nouveaux WHERE disponible));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM ajuster_compteur('exemplaires_dispo', -(SELECT COUNT(*) FROM anciens WHERE disponible));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM ajuster_compteur('exemplaires_dispo',
+            (SELECT COUNT(*) FROM nouveaux WHERE disponible) - (SELECT COUNT(*) FROM anciens WHERE disponible));
+    ELSE
+        DELETE FROM stats_compteur WHERE cle = 'exemplaires_dispo';
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trg_compteurs_emprunt() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM ajuster_compteur('emprunts', (SELECT COUNT(*) FROM nouveaux));
+        PERFORM ajuster_compteur('emprunts_en_cours', (SELECT COUNT(*) FROM nouveaux WHERE date_retour IS NULL));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM ajuster_compteur('emprunts', -(SELECT COUNT(*) FROM anciens));
+        PERFORM ajuster_compteur('emprunts_en_cours', -(SELECT COUNT(*) FROM anciens WHERE date_retour IS NULL));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM ajuster_compteur('emprunts_en_cours',
+            (SELECT COUNT(*) FROM nouveaux WHERE date_retour IS NULL) - (SELECT COUNT(*) FROM anciens WHERE date_retour IS NULL));
+    ELSE
+        DELETE FROM stats_compteur WHERE cle IN ('emprunts', 'emprunts_en_cours');
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER compteurs_etudiant_ins AFTER INSERT ON etudiant
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_etudiant();
+CREATE TRIGGER compteurs_etudiant_del AFTER DELETE ON etudiant
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_etudiant();
+CREATE TRIGGER compteurs_etudiant_upd AFTER UPDATE ON etudiant
+    REFERENCING OLD TABLE AS anciens NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_etudiant();
+CREATE TRIGGER compteurs_etudiant_tru AFTER TRUNCATE ON etudiant
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_etudiant();
+
+CREATE TRIGGER compteurs_livre_ins AFTER INSERT ON livre
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_livre();
+CREATE TRIGGER compteurs_livre_del AFTER DELETE ON livre
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_livre();
+CREATE TRIGGER compteurs_livre_tru AFTER TRUNCATE ON livre
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_livre();
+
+CREATE TRIGGER compteurs_exemplaire_ins AFTER INSERT ON exemplaire
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_exemplaire();
+CREATE TRIGGER compteurs_exemplaire_del AFTER DELETE ON exemplaire
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_exemplaire();
+CREATE TRIGGER compteurs_exemplaire_upd AFTER UPDATE ON exemplaire
+    REFERENCING OLD TABLE AS anciens NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_exemplaire();
+CREATE TRIGGER compteurs_exemplaire_tru AFTER TRUNCATE ON exemplaire
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_exemplaire();
+
+CREATE TRIGGER compteurs_emprunt_ins AFTER INSERT ON emprunt
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_emprunt();
+CREATE TRIGGER compteurs_emprunt_del AFTER DELETE ON emprunt
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_emprunt();
+CREATE TRIGGER compteurs_emprunt_upd AFTER UPDATE ON emprunt
+    REFERENCING OLD TABLE AS anciens NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_emprunt();
+CREATE TRIGGER compteurs_emprunt_tru AFTER TRUNCATE ON emprunt
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_compteurs_emprunt();
+
+-- Classements (top N) : nombre d'emprunts par étudiant et par livre, au total et
+-- par jour (pour les fenêtres glissantes 7/30/365 jours), reportés depuis
+-- classement_delta par replier_classements()
+CREATE TABLE classement_etudiant (
+    id_etud INTEGER PRIMARY KEY REFERENCES etudiant(id_etud) ON DELETE CASCADE,
+    nb_emprunts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE classement_livre (
+    isbn VARCHAR(20) PRIMARY KEY REFERENCES livre(isbn) ON DELETE CASCADE,
+    nb_emprunts INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE classement_jour_etudiant (
+    jour DATE NOT NULL,
+    id_etud INTEGER NOT NULL REFERENCES etudiant(id_etud) ON DELETE CASCADE,
+    nb_emprunts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (jour, id_etud)
+);
+
+CREATE TABLE classement_jour_livre (
+    jour DATE NOT NULL,
+    isbn VARCHAR(20) NOT NULL REFERENCES livre(isbn) ON DELETE CASCADE,
+    nb_emprunts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (jour, isbn)
+);
+
+-- Top N all-time : simple parcours d'index
+CREATE INDEX idx_classement_etudiant_nb ON classement_etudiant(nb_emprunts DESC, id_etud);
+CREATE INDEX idx_classement_livre_nb ON classement_livre(nb_emprunts DESC, isbn);
+
+-- Emprunts pas encore reportés dans les classements. Un emprunt n'y ajoute qu'une
+-- ligne (aucun conflit) : les emprunts simultanés d'un même titre ne se disputent
+-- pas la ligne de classement_livre. replier_classements() les reporte par lots.
+CREATE TABLE classement_delta (
+    id_emprunt INTEGER NOT NULL,
+    jour DATE NOT NULL,
+    id_etud INTEGER NOT NULL,
+    isbn VARCHAR(20) NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION trg_classements_emprunt() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_retires INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO classement_delta (id_emprunt, jour, id_etud, isbn)
+            SELECT id_emprunt, date_emprunt, id_etud, isbn FROM nouveaux;
+    ELSIF TG_OP = 'DELETE' THEN
+        -- Emprunts pas encore repliés : retirés de classement_delta ; les autres sont
+        -- décomptés (une ligne absente est créée en négatif, rare : suppression manuelle)
+        WITH retires AS (
+            DELETE FROM classement_delta d USING anciens a
+            WHERE d.id_emprunt = a.id_emprunt
+            RETURNING d.id_emprunt
+        )
+        SELECT array_agg(id_emprunt) INTO v_retires FROM retires;
+
+        INSERT INTO classement_etudiant (id_etud, nb_emprunts)
+            SELECT id_etud, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY id_etud
+            ON CONFLICT (id_etud) DO UPDATE SET nb_emprunts = classement_etudiant.nb_emprunts + EXCLUDED.nb_emprunts;
+        INSERT INTO classement_livre (isbn, nb_emprunts)
+            SELECT isbn, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY isbn
+            ON CONFLICT (isbn) DO UPDATE SET nb_emprunts = classement_livre.nb_emprunts + EXCLUDED.nb_emprunts;
+        INSERT INTO classement_jour_etudiant (jour, id_etud, nb_emprunts)
+            SELECT date_emprunt, id_etud, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY date_emprunt, id_etud
+            ON CONFLICT (jour, id_etud) DO UPDATE SET nb_emprunts = classement_jour_etudiant.nb_emprunts + EXCLUDED.nb_emprunts;
+        INSERT INTO classement_jour_livre (jour, isbn, nb_emprunts)
+            SELECT date_emprunt, isbn, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY date_emprunt, isbn
+            ON CONFLICT (jour, isbn) DO UPDATE SET nb_emprunts = classement_jour_livre.nb_emprunts + EXCLUDED.nb_emprunts;
+    ELSE
+        TRUNCATE classement_etudiant, classement_livre, classement_jour_etudiant, classement_jour_livre,
+                 classement_delta;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Reporte classement_delta dans les tables de classement, en une instruction.
+-- Un seul repli à la fois (les appels concurrents rendent la main aussitôt) ;
+-- retourne le nombre d'emprunts reportés.
+CREATE OR REPLACE FUNCTION replier_classements() RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_nb INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('replier_classements')) THEN
+        RETURN 0;
+    END IF;
+
+    WITH repli AS (
+        DELETE FROM classement_delta RETURNING jour, id_etud, isbn
+    ),
+    etudiants AS (
+        INSERT INTO classement_etudiant (id_etud, nb_emprunts)
+            SELECT id_etud, COUNT(*) FROM repli GROUP BY id_etud
+            ON CONFLICT (id_etud) DO UPDATE SET nb_emprunts = classement_etudiant.nb_emprunts + EXCLUDED.nb_emprunts
+    ),
+    livres AS (
+        INSERT INTO classement_livre (isbn, nb_emprunts)
+            SELECT isbn, COUNT(*) FROM repli GROUP BY isbn
+            ON CONFLICT (isbn) DO UPDATE SET nb_emprunts = classement_livre.nb_emprunts + EXCLUDED.nb_emprunts
+    ),
+    jours_etudiants AS (
+        INSERT INTO classement_jour_etudiant (jour, id_etud, nb_emprunts)
+            SELECT jour, id_etud, COUNT(*) FROM repli GROUP BY jour, id_etud
+            ON CONFLICT (jour, id_etud) DO UPDATE SET nb_emprunts = classement_jour_etudiant.nb_emprunts + EXCLUDED.nb_emprunts
+    ),
+    jours_livres AS (
+        INSERT INTO classement_jour_livre (jour, isbn, nb_emprunts)
+            SELECT jour, isbn, COUNT(*) FROM repli GROUP BY jour, isbn
+            ON CONFLICT (jour, isbn) DO UPDATE SET nb_emprunts = classement_jour_livre.nb_emprunts + EXCLUDED.nb_emprunts
+    )
+    SELECT COUNT(*) INTO v_nb FROM repli;
+    RETURN v_nb;
+END;
+$$;
+
+CREATE TRIGGER classements_emprunt_ins AFTER INSERT ON emprunt
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_classements_emprunt();
+CREATE TRIGGER classements_emprunt_del AFTER DELETE ON emprunt
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_classements_emprunt();
+CREATE TRIGGER classements_emprunt_tru AFTER TRUNCATE ON emprunt
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_classements_emprunt();
+
+-- Suivi des migrations (services/migration_service.py). Ce script crée déjà tout ce
+-- qu'apportent les migrations de sql/migrations : elles sont enregistrées comme
+-- appliquées, avec la somme SHA-256 de leur fichier. Une nouvelle migration est
+-- reportée ici avec ses objets et sa ligne (vérifié par tests/test_migrations.py).
+CREATE TABLE schema_migration (
+    version INTEGER PRIMARY KEY,
+    nom VARCHAR(200) NOT NULL,
+    somme_controle CHAR(64) NOT NULL,
+    appliquee_le TIMESTAMP NOT NULL DEFAULT now(),
+    duree_ms INTEGER NOT NULL
+);
+
+INSERT INTO schema_migration (version, nom, somme_controle, duree_ms) VALUES
+    (1, '0001_index_emprunts_en_cours.py', '57ae42fb528e96885403fd74dd69d89b916af3436ec6aecff017d09c3034bc45', 0),
+    (2, '0002_index_exemplaires_libres.sql', '18f20df219b9f6feafa83e1fb3b06b47ec087f16d734057e93fef759c6798079', 0),
+    (3, '0003_index_cles_etrangeres_exemplaire.py', '9f5e23191ecaaa2be8c8c175a9167bb295d134a2215c5005bd9c925aae12ea95', 0),
+    (4, '0004_retours_cles_entites.sql', '89cd80a3db290dfff6c69da313a2367084e000334920d1fe8b1598a532c9e9b4', 0),
+    (5, '0005_classements_delta.sql', 'deb9c6f771a4c5bcd770e678bfec338432be15a51bb415d77c81fbb147f9187e', 0),
+    (6, '0006_ajuster_exemplaires_verifie.sql', 'de55f1fb761f64704f3305deab395638d0afbf373441058d25803002a4dd0386', 0),
+    (7, '0007_emprunt_cle.sql', '4134646b1bfbe0171df1e6eb257f117118c574ad25f883fc02aca0913b07816a', 0);
 
 -- Commentaires sur les tables
 COMMENT ON TABLE etudiant IS 'Table des étudiants inscrits à la bibliothèque';
 COMMENT ON TABLE livre IS 'Catalogue des livres disponibles';
 COMMENT ON TABLE emprunt IS 'Historique des emprunts de livres';
+COMMENT ON TABLE exemplaire IS 'Exemplaires physiques des livres (un par ligne)';
+COMMENT ON TABLE stats_compteur IS 'Compteurs statistiques (somme des shards), maintenus par triggers';
 
 -- Commentaires sur les colonnes importantes
 COMMENT ON COLUMN emprunt.date_retour IS 'NULL si le livre n''est pas encore retourné';
 COMMENT ON COLUMN etudiant.solde_amende IS 'Total des amendes dues par l''étudiant';
-COMMENT ON COLUMN livre.exemplaires_dispo IS 'Nombre d''exemplaires disponibles';
+COMMENT ON COLUMN emprunt.amende IS 'Amende de l''emprunt déjà reportée dans etudiant.solde_amende';
+COMMENT ON COLUMN exemplaire.disponible IS 'FALSE pendant un emprunt (voir emprunt.id_exemplaire)';
 
 -- Afficher un message de confirmation
 SELECT 'Tables créées avec succès!' AS message;
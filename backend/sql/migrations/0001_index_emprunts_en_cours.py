@@ -0,0 +1,14 @@
+"""
+Index partiels des emprunts en cours : retards et traitement des amendes
+(par date), limite d'emprunts simultanés par étudiant (par id_etud).
+"""
+from services.migration_service import creer_index_concurrent
+
+TRANSACTION = False
+
+
+def migrer(cur):
+    creer_index_concurrent(cur, 'idx_emprunt_en_cours_date', 'emprunt',
+                           "(date_emprunt, id_emprunt) WHERE date_retour IS NULL")
+    creer_index_concurrent(cur, 'idx_emprunt_en_cours_etudiant', 'emprunt',
+                           "(id_etud) WHERE date_retour IS NULL")
@@ -0,0 +1,3 @@
+-- migration: sans-transaction
+-- Exemplaires libres d'un titre : attribution (SKIP LOCKED) et nombre d'exemplaires disponibles
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_exemplaire_libre ON exemplaire (isbn, id_exemplaire) WHERE disponible;
@@ -0,0 +1,13 @@
+"""
+Index des clés étrangères vers exemplaire : sans eux, retirer un exemplaire
+(ajuster_exemplaires, ON DELETE SET NULL) parcourt toutes les partitions de
+emprunt, et supprimer un livre (ON DELETE CASCADE) toute la table exemplaire.
+"""
+from services.migration_service import creer_index_concurrent
+
+TRANSACTION = False
+
+
+def migrer(cur):
+    creer_index_concurrent(cur, 'idx_emprunt_exemplaire', 'emprunt', "(id_exemplaire)")
+    creer_index_concurrent(cur, 'idx_exemplaire_livre', 'exemplaire', "(isbn)")
@@ -0,0 +1,99 @@
+-- Fonctions de retour : l'étudiant et le livre de chaque emprunt rendu sont retournés,
+-- pour invalider les lignes correspondantes du cache d'entités (models/cache.py).
+-- Le type de retour change : les fonctions sont supprimées puis recréées.
+
+DROP FUNCTION IF EXISTS retourner_emprunt(INTEGER, INTEGER, NUMERIC);
+CREATE FUNCTION retourner_emprunt(p_id_emprunt INTEGER, p_duree INTEGER, p_amende_jour NUMERIC)
+RETURNS TABLE (resultat TEXT, jours_retard INTEGER, amende_due NUMERIC, etudiant_id INTEGER, isbn VARCHAR)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_id_etud INTEGER;
+    v_isbn VARCHAR;
+    v_exemplaire INTEGER;
+    v_deja NUMERIC;
+    v_jours INTEGER;
+    v_amende NUMERIC;
+BEGIN
+    -- La condition date_retour IS NULL est réévaluée après le verrou de ligne :
+    -- deux retours simultanés du même emprunt ne réincrémentent pas le stock deux fois
+    SELECT e.id_etud, e.isbn, e.id_exemplaire, e.amende INTO v_id_etud, v_isbn, v_exemplaire, v_deja
+    FROM emprunt e
+    WHERE e.id_emprunt = p_id_emprunt AND e.date_retour IS NULL
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM emprunt e WHERE e.id_emprunt = p_id_emprunt) THEN
+            RETURN QUERY SELECT 'deja_retourne'::TEXT, 0, 0::NUMERIC, NULL::INTEGER, NULL::VARCHAR;
+        ELSE
+            RETURN QUERY SELECT 'inconnu'::TEXT, 0, 0::NUMERIC, NULL::INTEGER, NULL::VARCHAR;
+        END IF;
+        RETURN;
+    END IF;
+
+    -- L'amende déjà accumulée par le traitement de nuit (emprunt.amende) est
+    -- déjà dans le solde : seul le complément y est ajouté
+    UPDATE emprunt e
+    SET date_retour = CURRENT_DATE,
+        amende = GREATEST(v_deja, GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree) * p_amende_jour)
+    WHERE e.id_emprunt = p_id_emprunt
+    RETURNING GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree), e.amende
+    INTO v_jours, v_amende;
+
+    UPDATE exemplaire SET disponible = TRUE WHERE id_exemplaire = v_exemplaire;
+
+    IF v_amende > v_deja THEN
+        UPDATE etudiant SET solde_amende = solde_amende + (v_amende - v_deja) WHERE id_etud = v_id_etud;
+    END IF;
+
+    RETURN QUERY SELECT 'ok'::TEXT, v_jours, v_amende, v_id_etud, v_isbn;
+END;
+$$;
+
+DROP FUNCTION IF EXISTS retourner_emprunts(INTEGER[], INTEGER, NUMERIC);
+CREATE FUNCTION retourner_emprunts(p_ids INTEGER[], p_duree INTEGER, p_amende_jour NUMERIC)
+RETURNS TABLE (rang BIGINT, emprunt_id INTEGER, resultat TEXT, jours_retard INTEGER, amende_due NUMERIC,
+               etudiant_id INTEGER, isbn VARCHAR)
+LANGUAGE sql AS $$
+    WITH demande AS (
+        SELECT d.id, d.rang, d.rang = MIN(d.rang) OVER (PARTITION BY d.id) as premier
+        FROM unnest(p_ids) WITH ORDINALITY AS d(id, rang)
+    ),
+    -- Verrous pris dans l'ordre des identifiants : pas d'interblocage entre deux lots
+    cibles AS (
+        SELECT e.id_emprunt, e.id_etud, e.id_exemplaire, e.amende as deja,
+               GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree) as jours
+        FROM emprunt e
+        WHERE e.id_emprunt IN (SELECT id FROM demande) AND e.date_retour IS NULL
+        ORDER BY e.id_emprunt
+        FOR UPDATE OF e
+    ),
+    maj AS (
+        UPDATE emprunt e
+        SET date_retour = CURRENT_DATE,
+            amende = GREATEST(c.deja, c.jours * p_amende_jour)
+        FROM cibles c
+        WHERE e.id_emprunt = c.id_emprunt
+        RETURNING e.id_emprunt, e.id_etud, e.isbn, e.id_exemplaire, c.deja, e.amende, c.jours
+    ),
+    stock AS (
+        UPDATE exemplaire x SET disponible = TRUE
+        FROM maj
+        WHERE x.id_exemplaire = maj.id_exemplaire
+    ),
+    soldes AS (
+        UPDATE etudiant et SET solde_amende = et.solde_amende + s.delta
+        FROM (SELECT id_etud, SUM(amende - deja) as delta FROM maj GROUP BY id_etud) s
+        WHERE et.id_etud = s.id_etud AND s.delta > 0
+    )
+    SELECT d.rang, d.id,
+           CASE WHEN m.id_emprunt IS NOT NULL AND d.premier THEN 'ok'
+                WHEN EXISTS (SELECT 1 FROM emprunt e WHERE e.id_emprunt = d.id) THEN 'deja_retourne'
+                ELSE 'inconnu' END,
+           CASE WHEN d.premier THEN COALESCE(m.jours, 0) ELSE 0 END,
+           CASE WHEN d.premier THEN COALESCE(m.amende, 0) ELSE 0 END,
+           CASE WHEN d.premier THEN m.id_etud END,
+           CASE WHEN d.premier THEN m.isbn END
+    FROM demande d
+    LEFT JOIN maj m ON m.id_emprunt = d.id
+    ORDER BY d.rang
+$$;
@@ -0,0 +1,96 @@
+-- Classements : un emprunt n'ajoute plus qu'une ligne à classement_delta au lieu de
+-- mettre à jour les lignes de classement_livre / classement_jour_livre du titre
+-- (contention des emprunts simultanés d'un même titre). replier_classements()
+-- reporte les emprunts en attente ; les classements existants sont conservés.
+
+-- Emprunts pas encore reportés dans les classements. Un emprunt n'y ajoute qu'une
+-- ligne (aucun conflit) : les emprunts simultanés d'un même titre ne se disputent
+-- pas la ligne de classement_livre. replier_classements() les reporte par lots.
+CREATE TABLE classement_delta (
+    id_emprunt INTEGER NOT NULL,
+    jour DATE NOT NULL,
+    id_etud INTEGER NOT NULL,
+    isbn VARCHAR(20) NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION trg_classements_emprunt() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_retires INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO classement_delta (id_emprunt, jour, id_etud, isbn)
+            SELECT id_emprunt, date_emprunt, id_etud, isbn FROM nouveaux;
+    ELSIF TG_OP = 'DELETE' THEN
+        -- Emprunts pas encore repliés : retirés de classement_delta ; les autres sont
+        -- décomptés (une ligne absente est créée en négatif, rare : suppression manuelle)
+        WITH retires AS (
+            DELETE FROM classement_delta d USING anciens a
+            WHERE d.id_emprunt = a.id_emprunt
+            RETURNING d.id_emprunt
+        )
+        SELECT array_agg(id_emprunt) INTO v_retires FROM retires;
+
+        INSERT INTO classement_etudiant (id_etud, nb_emprunts)
+            SELECT id_etud, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY id_etud
+            ON CONFLICT (id_etud) DO UPDATE SET nb_emprunts = classement_etudiant.nb_emprunts + EXCLUDED.nb_emprunts;
+        INSERT INTO classement_livre (isbn, nb_emprunts)
+            SELECT isbn, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY isbn
+            ON CONFLICT (isbn) DO UPDATE SET nb_emprunts = classement_livre.nb_emprunts + EXCLUDED.nb_emprunts;
+        INSERT INTO classement_jour_etudiant (jour, id_etud, nb_emprunts)
+            SELECT date_emprunt, id_etud, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY date_emprunt, id_etud
+            ON CONFLICT (jour, id_etud) DO UPDATE SET nb_emprunts = classement_jour_etudiant.nb_emprunts + EXCLUDED.nb_emprunts;
+        INSERT INTO classement_jour_livre (jour, isbn, nb_emprunts)
+            SELECT date_emprunt, isbn, -COUNT(*) FROM anciens
+            WHERE id_emprunt <> ALL(COALESCE(v_retires, '{}')) GROUP BY date_emprunt, isbn
+            ON CONFLICT (jour, isbn) DO UPDATE SET nb_emprunts = classement_jour_livre.nb_emprunts + EXCLUDED.nb_emprunts;
+    ELSE
+        TRUNCATE classement_etudiant, classement_livre, classement_jour_etudiant, classement_jour_livre,
+                 classement_delta;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Reporte classement_delta dans les tables de classement, en une instruction.
+-- Un seul repli à la fois (les appels concurrents rendent la main aussitôt) ;
+-- retourne le nombre d'emprunts reportés.
+CREATE OR REPLACE FUNCTION replier_classements() RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_nb INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('replier_classements')) THEN
+        RETURN 0;
+    END IF;
+
+    WITH repli AS (
+        DELETE FROM classement_delta RETURNING jour, id_etud, isbn
+    ),
+    etudiants AS (
+        INSERT INTO classement_etudiant (id_etud, nb_emprunts)
+            SELECT id_etud, COUNT(*) FROM repli GROUP BY id_etud
+            ON CONFLICT (id_etud) DO UPDATE SET nb_emprunts = classement_etudiant.nb_emprunts + EXCLUDED.nb_emprunts
+    ),
+    livres AS (
+        INSERT INTO classement_livre (isbn, nb_emprunts)
+            SELECT isbn, COUNT(*) FROM repli GROUP BY isbn
+            ON CONFLICT (isbn) DO UPDATE SET nb_emprunts = classement_livre.nb_emprunts + EXCLUDED.nb_emprunts
+    ),
+    jours_etudiants AS (
+        INSERT INTO classement_jour_etudiant (jour, id_etud, nb_emprunts)
+            SELECT jour, id_etud, COUNT(*) FROM repli GROUP BY jour, id_etud
+            ON CONFLICT (jour, id_etud) DO UPDATE SET nb_emprunts = classement_jour_etudiant.nb_emprunts + EXCLUDED.nb_emprunts
+    ),
+    jours_livres AS (
+        INSERT INTO classement_jour_livre (jour, isbn, nb_emprunts)
+            SELECT jour, isbn, COUNT(*) FROM repli GROUP BY jour, isbn
+            ON CONFLICT (jour, isbn) DO UPDATE SET nb_emprunts = classement_jour_livre.nb_emprunts + EXCLUDED.nb_emprunts
+    )
+    SELECT COUNT(*) INTO v_nb FROM repli;
+    RETURN v_nb;
+END;
+$$;
@@ -0,0 +1,52 @@
+-- ajuster_exemplaires : les exemplaires libres verrouillés par un emprunt en cours
+-- (SKIP LOCKED) pouvaient laisser plus d'exemplaires libres que demandé sans erreur.
+-- Le nombre retiré est désormais vérifié : nouvelles tentatives, puis erreur.
+
+-- Fixe le nombre d'exemplaires disponibles d'un livre : ajoute des exemplaires
+-- ou retire des exemplaires libres (les exemplaires prêtés ne sont pas touchés)
+CREATE OR REPLACE FUNCTION ajuster_exemplaires(p_isbn VARCHAR, p_dispo INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_dispo INTEGER;
+    v_retires INTEGER;
+BEGIN
+    IF p_dispo < 0 THEN
+        RAISE EXCEPTION 'Nombre d''exemplaires négatif : %', p_dispo USING ERRCODE = 'check_violation';
+    END IF;
+
+    -- Sérialise les ajustements d'un même livre (sans bloquer les emprunts)
+    PERFORM 1 FROM livre WHERE isbn = p_isbn FOR NO KEY UPDATE;
+    SELECT COUNT(*) INTO v_dispo FROM exemplaire WHERE isbn = p_isbn AND disponible;
+
+    IF p_dispo > v_dispo THEN
+        INSERT INTO exemplaire (isbn) SELECT p_isbn FROM generate_series(1, p_dispo - v_dispo);
+        RETURN;
+    END IF;
+
+    -- Les exemplaires verrouillés par un emprunt en cours sont sautés : si trop peu
+    -- ont été retirés, on recompte après une courte attente (l'emprunt validé, son
+    -- exemplaire n'est plus libre ; annulé, il redevient retirable), puis on échoue
+    FOR v_tentative IN 1..3 LOOP
+        EXIT WHEN v_dispo <= p_dispo;
+        DELETE FROM exemplaire WHERE id_exemplaire IN (
+            SELECT id_exemplaire FROM exemplaire
+            WHERE isbn = p_isbn AND disponible
+            ORDER BY id_exemplaire DESC
+            LIMIT v_dispo - p_dispo
+            FOR UPDATE SKIP LOCKED
+        );
+        GET DIAGNOSTICS v_retires = ROW_COUNT;
+        v_dispo := v_dispo - v_retires;
+        EXIT WHEN v_dispo <= p_dispo;
+        PERFORM pg_sleep(0.01 * v_tentative);
+        SELECT COUNT(*) INTO v_dispo FROM exemplaire WHERE isbn = p_isbn AND disponible;
+    END LOOP;
+
+    IF v_dispo > p_dispo THEN
+        RAISE EXCEPTION 'Exemplaires de % en cours d''emprunt : % exemplaire(s) libre(s) au lieu de %, réessayez',
+            p_isbn, v_dispo, p_dispo
+            USING ERRCODE = 'lock_not_available';
+    END IF;
+END;
+$$;
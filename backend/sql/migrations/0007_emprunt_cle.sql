@@ -0,0 +1,172 @@
+-- Recherche d'un emprunt par identifiant seul : emprunt_cle donne sa date, une seule
+-- partition de emprunt est lue (retours, détail, suppression) au lieu de sonder
+-- l'index de chaque partition. Les emprunts existants y sont recopiés ; les
+-- triggers, créés d'abord, bloquent les écritures sur emprunt jusqu'au COMMIT.
+
+CREATE TABLE emprunt_cle (
+    id_emprunt INTEGER PRIMARY KEY,
+    date_emprunt DATE NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION trg_cles_emprunt() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO emprunt_cle (id_emprunt, date_emprunt) SELECT id_emprunt, date_emprunt FROM nouveaux;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM emprunt_cle c USING anciens a WHERE c.id_emprunt = a.id_emprunt;
+    ELSE
+        TRUNCATE emprunt_cle;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER cles_emprunt_ins AFTER INSERT ON emprunt
+    REFERENCING NEW TABLE AS nouveaux FOR EACH STATEMENT EXECUTE FUNCTION trg_cles_emprunt();
+CREATE TRIGGER cles_emprunt_del AFTER DELETE ON emprunt
+    REFERENCING OLD TABLE AS anciens FOR EACH STATEMENT EXECUTE FUNCTION trg_cles_emprunt();
+CREATE TRIGGER cles_emprunt_tru AFTER TRUNCATE ON emprunt
+    FOR EACH STATEMENT EXECUTE FUNCTION trg_cles_emprunt();
+
+INSERT INTO emprunt_cle (id_emprunt, date_emprunt) SELECT id_emprunt, date_emprunt FROM emprunt;
+
+-- Archivage : retire aussi les emprunts de la partition détachée de emprunt_cle
+CREATE OR REPLACE FUNCTION archiver_partitions_emprunt(p_avant DATE)
+RETURNS TABLE (nom_partition TEXT, nb_lignes BIGINT)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_part RECORD;
+    v_ouvert BOOLEAN;
+    v_nb BIGINT;
+BEGIN
+    FOR v_part IN
+        SELECT p.nom FROM emprunt_partition p WHERE p.fin <= p_avant ORDER BY p.debut
+    LOOP
+        EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE date_retour IS NULL)', v_part.nom) INTO v_ouvert;
+        CONTINUE WHEN v_ouvert;
+
+        EXECUTE format('SELECT COUNT(*) FROM %I', v_part.nom) INTO v_nb;
+        EXECUTE format('DELETE FROM emprunt_cle c USING %I p WHERE c.id_emprunt = p.id_emprunt', v_part.nom);
+        EXECUTE format('ALTER TABLE emprunt DETACH PARTITION %I', v_part.nom);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', v_part.nom);
+        PERFORM ajuster_compteur('emprunts', -v_nb);
+
+        nom_partition := 'archive.' || v_part.nom;
+        nb_lignes := v_nb;
+        RETURN NEXT;
+    END LOOP;
+END;
+$$;
+
+-- Retour atomique : calcul de l'amende, mise à jour de l'emprunt, de l'exemplaire et du solde
+-- Résultats possibles : ok, inconnu, deja_retourne. L'étudiant et le livre de
+-- l'emprunt rendu sont retournés (invalidation du cache d'entités)
+DROP FUNCTION IF EXISTS retourner_emprunt(INTEGER, INTEGER, NUMERIC);
+CREATE FUNCTION retourner_emprunt(p_id_emprunt INTEGER, p_duree INTEGER, p_amende_jour NUMERIC)
+RETURNS TABLE (resultat TEXT, jours_retard INTEGER, amende_due NUMERIC, etudiant_id INTEGER, isbn VARCHAR)
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_date DATE;
+    v_id_etud INTEGER;
+    v_isbn VARCHAR;
+    v_exemplaire INTEGER;
+    v_deja NUMERIC;
+    v_jours INTEGER;
+    v_amende NUMERIC;
+BEGIN
+    -- Date de l'emprunt d'abord : les requêtes suivantes ne lisent que sa partition
+    SELECT c.date_emprunt INTO v_date FROM emprunt_cle c WHERE c.id_emprunt = p_id_emprunt;
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'inconnu'::TEXT, 0, 0::NUMERIC, NULL::INTEGER, NULL::VARCHAR;
+        RETURN;
+    END IF;
+
+    -- La condition date_retour IS NULL est réévaluée après le verrou de ligne :
+    -- deux retours simultanés du même emprunt ne réincrémentent pas le stock deux fois
+    SELECT e.id_etud, e.isbn, e.id_exemplaire, e.amende INTO v_id_etud, v_isbn, v_exemplaire, v_deja
+    FROM emprunt e
+    WHERE e.id_emprunt = p_id_emprunt AND e.date_emprunt = v_date AND e.date_retour IS NULL
+    FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT 'deja_retourne'::TEXT, 0, 0::NUMERIC, NULL::INTEGER, NULL::VARCHAR;
+        RETURN;
+    END IF;
+
+    -- L'amende déjà accumulée par le traitement de nuit (emprunt.amende) est
+    -- déjà dans le solde : seul le complément y est ajouté
+    UPDATE emprunt e
+    SET date_retour = CURRENT_DATE,
+        amende = GREATEST(v_deja, GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree) * p_amende_jour)
+    WHERE e.id_emprunt = p_id_emprunt AND e.date_emprunt = v_date
+    RETURNING GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree), e.amende
+    INTO v_jours, v_amende;
+
+    UPDATE exemplaire SET disponible = TRUE WHERE id_exemplaire = v_exemplaire;
+
+    IF v_amende > v_deja THEN
+        UPDATE etudiant SET solde_amende = solde_amende + (v_amende - v_deja) WHERE id_etud = v_id_etud;
+    END IF;
+
+    RETURN QUERY SELECT 'ok'::TEXT, v_jours, v_amende, v_id_etud, v_isbn;
+END;
+$$;
+
+-- Retour d'un lot d'emprunts (poste de retour) : mêmes règles que retourner_emprunt,
+-- en une instruction ensembliste. Un résultat par élément de p_ids, dans l'ordre
+-- (rang) ; un identifiant répété n'est retourné qu'une fois (deja_retourne ensuite).
+-- Les dates des emprunts (emprunt_cle) bornent les partitions lues.
+DROP FUNCTION IF EXISTS retourner_emprunts(INTEGER[], INTEGER, NUMERIC);
+CREATE FUNCTION retourner_emprunts(p_ids INTEGER[], p_duree INTEGER, p_amende_jour NUMERIC)
+RETURNS TABLE (rang BIGINT, emprunt_id INTEGER, resultat TEXT, jours_retard INTEGER, amende_due NUMERIC,
+               etudiant_id INTEGER, isbn VARCHAR)
+LANGUAGE sql AS $$
+    WITH demande AS (
+        SELECT d.id, d.rang, d.rang = MIN(d.rang) OVER (PARTITION BY d.id) as premier, c.date_emprunt
+        FROM unnest(p_ids) WITH ORDINALITY AS d(id, rang)
+        LEFT JOIN emprunt_cle c ON c.id_emprunt = d.id
+    ),
+    -- Verrous pris dans l'ordre des identifiants : pas d'interblocage entre deux lots.
+    -- Les bornes (sous-requêtes évaluées une fois) élaguent les partitions à l'exécution.
+    cibles AS (
+        SELECT e.id_emprunt, e.date_emprunt, e.id_etud, e.id_exemplaire, e.amende as deja,
+               GREATEST(0, CURRENT_DATE - e.date_emprunt - p_duree) as jours
+        FROM emprunt e
+        WHERE (e.id_emprunt, e.date_emprunt) IN (SELECT id, date_emprunt FROM demande)
+          AND e.date_emprunt BETWEEN (SELECT MIN(date_emprunt) FROM demande) AND (SELECT MAX(date_emprunt) FROM demande)
+          AND e.date_retour IS NULL
+        ORDER BY e.id_emprunt
+        FOR UPDATE OF e
+    ),
+    maj AS (
+        UPDATE emprunt e
+        SET date_retour = CURRENT_DATE,
+            amende = GREATEST(c.deja, c.jours * p_amende_jour)
+        FROM cibles c
+        WHERE e.id_emprunt = c.id_emprunt AND e.date_emprunt = c.date_emprunt
+          AND e.date_emprunt BETWEEN (SELECT MIN(date_emprunt) FROM demande) AND (SELECT MAX(date_emprunt) FROM demande)
+        RETURNING e.id_emprunt, e.id_etud, e.isbn, e.id_exemplaire, c.deja, e.amende, c.jours
+    ),
+    stock AS (
+        UPDATE exemplaire x SET disponible = TRUE
+        FROM maj
+        WHERE x.id_exemplaire = maj.id_exemplaire
+    ),
+    soldes AS (
+        UPDATE etudiant et SET solde_amende = et.solde_amende + s.delta
+        FROM (SELECT id_etud, SUM(amende - deja) as delta FROM maj GROUP BY id_etud) s
+        WHERE et.id_etud = s.id_etud AND s.delta > 0
+    )
+    SELECT d.rang, d.id,
+           CASE WHEN m.id_emprunt IS NOT NULL AND d.premier THEN 'ok'
+                WHEN d.date_emprunt IS NOT NULL THEN 'deja_retourne'
+                ELSE 'inconnu' END,
+           CASE WHEN d.premier THEN COALESCE(m.jours, 0) ELSE 0 END,
+           CASE WHEN d.premier THEN COALESCE(m.amende, 0) ELSE 0 END,
+           CASE WHEN d.premier THEN m.id_etud END,
+           CASE WHEN d.premier THEN m.isbn END
+    FROM demande d
+    LEFT JOIN maj m ON m.id_emprunt = d.id
+    ORDER BY d.rang
+$$;
@@ -19,8 +19,9 @@ INSERT INTO etudiant (nom, prenom, email) VALUES
     ('Laurent', 'Lucas', 'lucas.laurent@supdevinci.fr'),
     ('Michel', 'Chloé', 'chloe.michel@supdevinci.fr');
 
--- Insertion de livres (avec ISBN)
-INSERT INTO livre (isbn, titre, editeur, annee, exemplaires_dispo) VALUES
+-- Insertion de livres (avec ISBN et nombre d'exemplaires)
+CREATE TEMP TABLE livre_seed (isbn VARCHAR(20), titre VARCHAR(255), editeur VARCHAR(200), annee INTEGER, exemplaires INTEGER);
+INSERT INTO livre_seed (isbn, titre, editeur, annee, exemplaires) VALUES
     -- Classiques français
     ('978-2-07-040850-4', 'Le Petit Prince', 'Gallimard', 1943, 3),
     ('978-2-07-040999-0', 'Les Misérables', 'Gallimard', 1862, 2),
@@ -56,6 +57,14 @@ INSERT INTO livre (isbn, titre, editeur, annee, exemplaires_dispo) VALUES
     ('978-0-201-63361-0', 'Design Patterns', 'Addison-Wesley', 1994, 2),
     ('978-0-98826-259-1', 'The Phoenix Project', 'IT Revolution', 2013, 1);
 
+INSERT INTO livre (isbn, titre, editeur, annee)
+SELECT isbn, titre, editeur, annee FROM livre_seed;
+
+INSERT INTO exemplaire (isbn)
+SELECT isbn FROM livre_seed, generate_series(1, exemplaires);
+
+DROP TABLE livre_seed;
+
 -- Insertion d'emprunts (quelques exemples)
 -- Emprunts en cours
 INSERT INTO emprunt (id_etud, isbn, date_emprunt, date_retour, amende) VALUES
@@ -84,16 +93,26 @@ INSERT INTO emprunt (id_etud, isbn, date_emprunt, date_retour, amende) VALUES
     (9, '978-2-253-00434-4', CURRENT_DATE - INTERVAL '15 days', CURRENT_DATE - INTERVAL '3 days', 0),
     (10, '978-2-07-041239-7', CURRENT_DATE - INTERVAL '28 days', CURRENT_DATE - INTERVAL '15 days', 0);
 
--- Mettre à jour les exemplaires disponibles pour les emprunts en cours
-UPDATE livre SET exemplaires_dispo = exemplaires_dispo - 1 WHERE isbn IN (
-    '978-2-07-040850-4', '978-2-07-036822-0', '978-2-07-054602-2',
-    '978-0-13-235088-4', '978-2-07-046540-8', '978-2-07-036024-8',
-    '978-2-267-02700-0', '978-2-253-11587-3'
-);
+-- Attribuer un exemplaire à chaque emprunt en cours
+WITH attribution AS (
+    SELECT e.id_emprunt, x.id_exemplaire
+    FROM (SELECT id_emprunt, isbn, ROW_NUMBER() OVER (PARTITION BY isbn ORDER BY id_emprunt) AS n
+          FROM emprunt WHERE date_retour IS NULL) e
+    JOIN (SELECT id_exemplaire, isbn, ROW_NUMBER() OVER (PARTITION BY isbn ORDER BY id_exemplaire) AS n
+          FROM exemplaire) x ON x.isbn = e.isbn AND x.n = e.n
+),
+prets AS (
+    UPDATE emprunt e SET id_exemplaire = a.id_exemplaire
+    FROM attribution a
+    WHERE e.id_emprunt = a.id_emprunt
+    RETURNING e.id_exemplaire
+)
+UPDATE exemplaire SET disponible = FALSE WHERE id_exemplaire IN (SELECT id_exemplaire FROM prets);
 
 -- Afficher un résumé
 SELECT 'Données insérées avec succès!' AS message;
 SELECT COUNT(*) AS nb_etudiants FROM etudiant;
 SELECT COUNT(*) AS nb_livres FROM livre;
+SELECT COUNT(*) AS nb_exemplaires_dispo FROM exemplaire WHERE disponible;
 SELECT COUNT(*) AS nb_emprunts_total FROM emprunt;
 SELECT COUNT(*) AS nb_emprunts_en_cours FROM emprunt WHERE date_retour IS NULL;
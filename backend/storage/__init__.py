@@ -0,0 +1,58 @@
+"""
+Moteurs de stockage des modèles.
+
+- postgres (défaut) : la base PostgreSQL, voir config/database.py
+- memoire : tables et index en mémoire, pour les tests et les bancs d'essai
+  sans serveur PostgreSQL (données non persistantes, propres au processus)
+
+Le moteur est choisi par la variable STORAGE_BACKEND, ou remplacé par set_stockage().
+"""
+
+import os
+import threading
+from typing import Optional
+from dotenv import load_dotenv
+from config.database import ConfigurationError
+from storage.base import Stockage
+from utils.logger import log
+
+MOTEURS = ('postgres', 'memoire')
+
+_stockage: Optional[Stockage] = None
+_lock = threading.Lock()
+
+
+def creer_stockage(nom: str) -> Stockage:
+    """Crée un moteur de stockage vide (memoire) ou branché sur la base (postgres)"""
+    if nom == 'postgres':
+        from storage.postgres import StockagePostgres
+        return StockagePostgres()
+    if nom == 'memoire':
+        from storage.memoire import StockageMemoire
+        return StockageMemoire()
+    raise ConfigurationError(f"STORAGE_BACKEND inconnu : '{nom}' (attendu : {', '.join(MOTEURS)})")
+
+
+def get_stockage() -> Stockage:
+    """Retourne le moteur de stockage courant, créé au premier appel"""
+    global _stockage
+    if _stockage is None:
+        with _lock:
+            if _stockage is None:
+                load_dotenv()
+                nom = os.getenv("STORAGE_BACKEND", "postgres").strip().lower()
+                _stockage = creer_stockage(nom)
+                if nom != 'postgres':
+                    log(f"Stockage '{nom}' : données non persistantes, propres à ce processus")
+    return _stockage
+
+
+def set_stockage(stockage: Optional[Stockage]) -> Optional[Stockage]:
+    """
+    Remplace le moteur courant (tests, bancs d'essai) et retourne l'ancien.
+    None revient au moteur choisi par STORAGE_BACKEND au prochain appel.
+    """
+    global _stockage
+    with _lock:
+        ancien, _stockage = _stockage, stockage
+    return ancien
@@ -0,0 +1,197 @@
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Interface des moteurs de stockage. Les modèles (models/*.py) gardent les règles
+# métier (vérifications, invalidation du cache des statistiques) et délèguent
+# la lecture et l'écriture des données au moteur retourné par storage.get_stockage().
+#
+# Les lignes retournées ont les mêmes clés et les mêmes types Python quel que soit
+# le moteur (date, Decimal pour les montants NUMERIC, float pour les amendes calculées).
+
+
+class StockageEtudiants(ABC):
+
+    @abstractmethod
+    def create(self, nom: str, prenom: str, email: str) -> Optional[int]:
+        """Crée un étudiant (inscrit aujourd'hui, solde nul) et retourne son ID"""
+
+    @abstractmethod
+    def get_all(self) -> List[Dict]:
+        """Tous les étudiants triés par nom, prénom"""
+
+    @abstractmethod
+    def get_page(self, limite: int, apres: Optional[List] = None) -> List[Dict]:
+        """Au plus `limite` étudiants après la clé (nom, prénom, id), triés par cette clé"""
+
+    @abstractmethod
+    def get_by_id(self, etudiant_id: int) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def search(self, terme: str, limite: int) -> List[Dict]:
+        """Recherche sans accents par nom, prénom ou email, par pertinence"""
+
+    @abstractmethod
+    def update(self, etudiant_id: int, nom: str, prenom: str, email: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete(self, etudiant_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    def exists(self, etudiant_id: int) -> bool:
+        pass
+
+    @abstractmethod
+    def count_emprunts(self, etudiant_id: int) -> int:
+        """Nombre d'emprunts (en cours ou rendus) de l'étudiant"""
+
+    @abstractmethod
+    def count_emprunts_actifs(self, etudiant_id: int) -> int:
+        """Nombre d'emprunts en cours de l'étudiant"""
+
+
+class StockageLivres(ABC):
+
+    @abstractmethod
+    def create(self, titre: str, editeur: str, isbn: str, annee: Optional[int], exemplaires: int) -> Optional[str]:
+        """Crée un livre avec `exemplaires` exemplaires disponibles et retourne son ISBN"""
+
+    @abstractmethod
+    def get_all(self) -> List[Dict]:
+        """Tous les livres triés par titre"""
+
+    @abstractmethod
+    def get_page(self, limite: int, apres: Optional[List] = None) -> List[Dict]:
+        """Au plus `limite` livres après la clé (titre, isbn), triés par cette clé"""
+
+    @abstractmethod
+    def get_by_id(self, isbn: str) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def search(self, terme: str, limite: int) -> List[Dict]:
+        """Recherche sans accents par titre ou éditeur, par pertinence"""
+
+    @abstractmethod
+    def update(self, isbn: str, titre: str, editeur: str, annee: Optional[int],
+               exemplaires: Optional[int] = None) -> bool:
+        """Met à jour le livre ; exemplaires fixe le nombre d'exemplaires disponibles"""
+
+    @abstractmethod
+    def delete(self, isbn: str) -> bool:
+        """Supprime le livre et ses exemplaires"""
+
+    @abstractmethod
+    def exists(self, isbn: str) -> bool:
+        pass
+
+    @abstractmethod
+    def count_emprunts(self, isbn: str) -> int:
+        """Nombre d'emprunts (en cours ou rendus) du livre"""
+
+    @abstractmethod
+    def est_disponible(self, isbn: str) -> bool:
+        """Au moins un exemplaire libre"""
+
+    @abstractmethod
+    def importer(self, lots: Iterable[List[Tuple]]) -> Tuple[int, int]:
+        """
+        Fusionne des lots de livres validés (isbn, titre, editeur, annee, exemplaires)
+        en une transaction : un nouveau livre est créé avec ses exemplaires (1 par
+        défaut), un livre existant est mis à jour sans toucher à ses exemplaires.
+        Retourne (nombre de livres insérés, nombre de livres modifiés).
+        """
+
+
+class StockageEmprunts(ABC):
+
+    @abstractmethod
+    def emprunter(self, etudiant_id: int, isbn: str) -> Tuple[str, Optional[int]]:
+        """
+        Emprunt atomique (voir la fonction SQL emprunter_livre) : retourne
+        (résultat, id de l'emprunt ou None) ; résultat = valeur de StatutEmprunt.
+        """
+
+    @abstractmethod
+    def emprunter_lot(self, operations: List[Tuple[int, str]], savepoints: bool = False) -> List[Dict]:
+        """Un résultat {etudiant_id, isbn, statut, id} par opération, dans l'ordre du lot"""
+
+    @abstractmethod
+    def retourner(self, emprunt_id: int) -> Tuple[str, int, float, Optional[int], Optional[str]]:
+        """
+        Retour atomique : (résultat, jours de retard, amende, étudiant, ISBN) ;
+        résultat = valeur de StatutRetour, étudiant et ISBN None si le retour n'a pas eu lieu.
+        """
+
+    @abstractmethod
+    def retourner_lot(self, emprunt_ids: List[int], savepoints: bool = False) -> List[Dict]:
+        """Un résultat {id, statut, jours_retard, amende, etudiant_id, isbn} par identifiant, dans l'ordre"""
+
+    @abstractmethod
+    def get_all(self) -> List[Dict]:
+        """Tous les emprunts détaillés, du plus récent au plus ancien"""
+
+    @abstractmethod
+    def get_page(self, limite: int, apres: Optional[List] = None, etudiant_id: Optional[int] = None,
+                 isbn: Optional[str] = None, depuis: Optional[date] = None, jusqu_au: Optional[date] = None,
+                 statut: Optional[str] = None, croissant: bool = False) -> List[Dict]:
+        """Au plus `limite` emprunts après la clé (date_emprunt, id), filtrés"""
+
+    @abstractmethod
+    def export(self, depuis: Optional[date], jusqu_au: Optional[date], taille_lot: int) -> Iterator[List[Dict]]:
+        """Historique par lots, trié par id (colonnes models.emprunt.COLONNES_EXPORT)"""
+
+    @abstractmethod
+    def get_by_id(self, emprunt_id: int) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def get_by_etudiant(self, etudiant_id: int) -> List[Dict]:
+        pass
+
+    @abstractmethod
+    def get_en_cours(self) -> List[Dict]:
+        """Emprunts non rendus dont l'échéance n'est pas dépassée, par date d'emprunt"""
+
+    @abstractmethod
+    def get_en_retard(self) -> List[Dict]:
+        """Emprunts non rendus dont l'échéance est dépassée, par date d'emprunt"""
+
+    @abstractmethod
+    def delete(self, emprunt_id: int) -> bool:
+        """Supprime l'emprunt (l'exemplaire d'un emprunt en cours redevient disponible)"""
+
+
+class StockageStats(ABC):
+
+    @abstractmethod
+    def get_compteurs(self) -> Dict:
+        """Compteurs de la vue d'ensemble (clés de la vue SQL stats_compteur_reel)"""
+
+    @abstractmethod
+    def get_top_etudiants(self, limit: int, fenetre: Optional[int] = None) -> List[Dict]:
+        pass
+
+    @abstractmethod
+    def get_top_livres(self, limit: int, fenetre: Optional[int] = None) -> List[Dict]:
+        pass
+
+    @abstractmethod
+    def replier_classements(self) -> int:
+        """Reporte les emprunts en attente dans les classements ; retourne leur nombre"""
+
+
+class Stockage:
+    """Moteur de stockage : un dépôt par entité"""
+
+    nom = ''
+
+    def __init__(self, etudiants: StockageEtudiants, livres: StockageLivres,
+                 emprunts: StockageEmprunts, stats: StockageStats):
+        self.etudiants = etudiants
+        self.livres = livres
+        self.emprunts = emprunts
+        self.stats = stats
@@ -0,0 +1,713 @@
+import heapq
+import itertools
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from psycopg2 import errors
+from config.settings import DUREE_EMPRUNT_DEFAUT, AMENDE_PAR_JOUR, MAX_EMPRUNTS_PAR_ETUDIANT
+from storage.base import Stockage, StockageEtudiants, StockageLivres, StockageEmprunts, StockageStats
+
+# Moteur en mémoire : mêmes règles et mêmes résultats que le schéma sql/init.sql
+# (fonctions emprunter_livre, retourner_emprunt(s), ajuster_exemplaires, triggers
+# de compteurs et de classements), mêmes clés et types dans les lignes retournées.
+#
+# Index maintenus à chaque écriture (équivalents des index SQL) :
+#   - hachage : étudiant par id et par email, livre par ISBN, emprunts par
+#     étudiant, par livre et par exemplaire, exemplaires libres par livre
+#   - listes triées (bisect) : étudiants (nom, prénom, id), livres (titre, isbn),
+#     emprunts (date_emprunt, id), emprunts en cours (date_emprunt, id) qui
+#     donne aussi l'ordre des échéances
+#
+# Différences assumées avec PostgreSQL :
+#   - les textes sont triés par point de code (collation "C"), pas selon la
+#     collation de la base
+#   - la recherche reproduit f_unaccent, ILIKE et word_similarity (pg_trgm) ;
+#     le plein texte français (ts_rank) est approché (mots vides, pluriels)
+#   - pas de transactions : chaque opération (un lot entier pour les lots) est
+#     atomique sous un verrou, mais rien n'est annulé si la requête HTTP échoue ensuite
+
+CENTIME = Decimal('0.01')
+SEUIL_WORD_SIMILARITY = 0.6  # pg_trgm.word_similarity_threshold par défaut
+
+MOTS_VIDES = {
+    'a', 'au', 'aux', 'ce', 'ces', 'd', 'dans', 'de', 'des', 'du', 'en', 'et', 'l', 'la',
+    'le', 'les', 'leur', 'mon', 'ou', 'par', 'pour', 'sa', 'se', 'son', 'sur', 'un', 'une',
+}
+
+
+def _montant(valeur) -> Decimal:
+    """Arrondi d'une colonne DECIMAL(10,2)"""
+    return Decimal(valeur).quantize(CENTIME, rounding=ROUND_HALF_UP)
+
+
+def _sans_accents(texte: str) -> str:
+    """Équivalent de lower(f_unaccent(texte))"""
+    decompose = unicodedata.normalize('NFKD', texte)
+    return ''.join(c for c in decompose if not unicodedata.combining(c)).lower()
+
+
+def _mots(texte: str) -> List[str]:
+    return re.findall(r'[^\W_]+', texte.lower())
+
+
+def _trigrammes(texte: str) -> List[str]:
+    """Trigrammes de chaque mot dans l'ordre, comme pg_trgm (mot préfixé de deux espaces, suffixé d'un)"""
+    trigrammes = []
+    for mot in _mots(texte):
+        mot = f"  {mot} "
+        trigrammes.extend(mot[i:i + 3] for i in range(len(mot) - 2))
+    return trigrammes
+
+
+def _word_similarity(terme: str, texte: str) -> float:
+    """
+    word_similarity(terme, texte) de pg_trgm : meilleure similarité entre les
+    trigrammes de terme et une étendue continue des trigrammes ordonnés de texte.
+    """
+    cherches = set(_trigrammes(terme))
+    if not cherches:
+        return 0.0
+    suite = _trigrammes(texte)
+    positions = [i for i, t in enumerate(suite) if t in cherches]
+    meilleure = 0.0
+    # Une étendue optimale commence et finit sur un trigramme commun
+    for a, debut in enumerate(positions):
+        communs = set()
+        for fin in positions[a:]:
+            communs.add(suite[fin])
+            etendue = fin - debut + 1
+            score = len(communs) / (len(cherches) + etendue - len(communs))
+            meilleure = max(meilleure, score)
+    return meilleure
+
+
+def _racines(texte: str) -> List[str]:
+    """Lexèmes approchés de to_tsvector('fr_unaccent', ...) : sans accents, sans mots vides ni pluriels"""
+    racines = []
+    for mot in _mots(_sans_accents(texte)):
+        if mot in MOTS_VIDES:
+            continue
+        if len(mot) > 3 and mot[-1] in 'sx':
+            mot = mot[:-1]
+        racines.append(mot)
+    return racines
+
+
+def _retirer(liste: List, cle):
+    """Retire cle d'une liste triée"""
+    i = bisect_left(liste, cle)
+    if i < len(liste) and liste[i] == cle:
+        del liste[i]
+
+
+def _cle_apres(apres: List, conversions) -> Tuple:
+    """Clé de pagination décodée, convertie comme le ferait PostgreSQL (sinon curseur invalide)"""
+    try:
+        return tuple(conversion(valeur) for conversion, valeur in zip(conversions, apres))
+    except (TypeError, ValueError):
+        raise ValueError("Curseur de pagination invalide")
+
+
+class StockageMemoire(Stockage):
+    """Tables et index en mémoire, protégés par un seul verrou"""
+
+    nom = 'memoire'
+
+    def __init__(self):
+        self.verrou = threading.RLock()
+        self.sequence_etudiant = itertools.count(1)
+        self.sequence_exemplaire = itertools.count(1)
+        self.sequence_emprunt = itertools.count(1)
+
+        self.etudiant: Dict[int, Dict] = {}
+        self.etudiant_par_email: Dict[str, int] = {}
+        self.etudiants_tries: List[Tuple[str, str, int]] = []
+
+        self.livre: Dict[str, Dict] = {}
+        self.livres_tries: List[Tuple[str, str]] = []
+
+        self.exemplaire: Dict[int, Dict] = {}
+        self.exemplaires_par_livre: Dict[str, Set[int]] = defaultdict(set)
+        self.exemplaires_libres: Dict[str, List[int]] = defaultdict(list)
+
+        self.emprunt: Dict[int, Dict] = {}
+        self.emprunts_tries: List[Tuple[date, int]] = []
+        self.emprunts_en_cours: List[Tuple[date, int]] = []
+        self.emprunts_par_etudiant: Dict[int, Set[int]] = defaultdict(set)
+        self.emprunts_par_livre: Dict[str, Set[int]] = defaultdict(set)
+        self.emprunts_par_exemplaire: Dict[int, Set[int]] = defaultdict(set)
+        self.en_cours_par_etudiant: Counter = Counter()
+
+        # Compteurs et classements (équivalents des tables maintenues par triggers)
+        self.nb_exemplaires_dispo = 0
+        self.total_amendes = Decimal('0.00')
+        self.classement_etudiant: Counter = Counter()
+        self.classement_livre: Counter = Counter()
+        self.classement_jour_etudiant: Dict[date, Counter] = defaultdict(Counter)
+        self.classement_jour_livre: Dict[date, Counter] = defaultdict(Counter)
+
+        super().__init__(EtudiantsMemoire(self), LivresMemoire(self), EmpruntsMemoire(self), StatsMemoire(self))
+
+    # --- Écritures partagées par les dépôts ---
+
+    def ajouter_exemplaires(self, isbn: str, nombre: int):
+        for _ in range(nombre):
+            id_exemplaire = next(self.sequence_exemplaire)
+            self.exemplaire[id_exemplaire] = {'id_exemplaire': id_exemplaire, 'isbn': isbn, 'disponible': True}
+            self.exemplaires_par_livre[isbn].add(id_exemplaire)
+            insort(self.exemplaires_libres[isbn], id_exemplaire)
+            self.nb_exemplaires_dispo += 1
+
+    def supprimer_exemplaire(self, id_exemplaire: int):
+        exemplaire = self.exemplaire.pop(id_exemplaire)
+        self.exemplaires_par_livre[exemplaire['isbn']].discard(id_exemplaire)
+        if exemplaire['disponible']:
+            _retirer(self.exemplaires_libres[exemplaire['isbn']], id_exemplaire)
+            self.nb_exemplaires_dispo -= 1
+        # emprunt.id_exemplaire : ON DELETE SET NULL
+        for emprunt_id in self.emprunts_par_exemplaire.pop(id_exemplaire, ()):
+            self.emprunt[emprunt_id]['id_exemplaire'] = None
+
+    def occuper_exemplaire(self, id_exemplaire: int):
+        exemplaire = self.exemplaire[id_exemplaire]
+        if exemplaire['disponible']:
+            exemplaire['disponible'] = False
+            _retirer(self.exemplaires_libres[exemplaire['isbn']], id_exemplaire)
+            self.nb_exemplaires_dispo -= 1
+
+    def liberer_exemplaire(self, id_exemplaire: Optional[int]):
+        exemplaire = self.exemplaire.get(id_exemplaire)
+        if exemplaire is not None and not exemplaire['disponible']:
+            exemplaire['disponible'] = True
+            insort(self.exemplaires_libres[exemplaire['isbn']], id_exemplaire)
+            self.nb_exemplaires_dispo += 1
+
+    def inserer_emprunt(self, id_etud: int, isbn: str, date_emprunt: date, date_retour: Optional[date] = None,
+                        amende=0, id_exemplaire: Optional[int] = None) -> int:
+        """
+        Insère un emprunt et met à jour index, compteurs et classements.
+        L'exemplaire éventuel doit déjà être marqué indisponible s'il est en cours.
+        """
+        emprunt_id = next(self.sequence_emprunt)
+        self.emprunt[emprunt_id] = {
+            'id_emprunt': emprunt_id, 'id_etud': id_etud, 'isbn': isbn,
+            'date_emprunt': date_emprunt, 'date_retour': date_retour,
+            'amende': _montant(amende), 'id_exemplaire': id_exemplaire,
+        }
+        insort(self.emprunts_tries, (date_emprunt, emprunt_id))
+        self.emprunts_par_etudiant[id_etud].add(emprunt_id)
+        self.emprunts_par_livre[isbn].add(emprunt_id)
+        if id_exemplaire is not None:
+            self.emprunts_par_exemplaire[id_exemplaire].add(emprunt_id)
+        if date_retour is None:
+            insort(self.emprunts_en_cours, (date_emprunt, emprunt_id))
+            self.en_cours_par_etudiant[id_etud] += 1
+
+        self.classement_etudiant[id_etud] += 1
+        self.classement_livre[isbn] += 1
+        self.classement_jour_etudiant[date_emprunt][id_etud] += 1
+        self.classement_jour_livre[date_emprunt][isbn] += 1
+        return emprunt_id
+
+    def supprimer_emprunt(self, emprunt_id: int) -> Dict:
+        emprunt = self.emprunt.pop(emprunt_id)
+        cle = (emprunt['date_emprunt'], emprunt_id)
+        _retirer(self.emprunts_tries, cle)
+        self.emprunts_par_etudiant[emprunt['id_etud']].discard(emprunt_id)
+        self.emprunts_par_livre[emprunt['isbn']].discard(emprunt_id)
+        if emprunt['id_exemplaire'] is not None:
+            self.emprunts_par_exemplaire[emprunt['id_exemplaire']].discard(emprunt_id)
+        if emprunt['date_retour'] is None:
+            _retirer(self.emprunts_en_cours, cle)
+            self.en_cours_par_etudiant[emprunt['id_etud']] -= 1
+
+        self.classement_etudiant[emprunt['id_etud']] -= 1
+        self.classement_livre[emprunt['isbn']] -= 1
+        self.classement_jour_etudiant[emprunt['date_emprunt']][emprunt['id_etud']] -= 1
+        self.classement_jour_livre[emprunt['date_emprunt']][emprunt['isbn']] -= 1
+        return emprunt
+
+    def crediter_amende(self, id_etud: int, montant: Decimal):
+        self.etudiant[id_etud]['solde_amende'] += montant
+        self.total_amendes += montant
+
+
+class EtudiantsMemoire(StockageEtudiants):
+
+    def __init__(self, m: StockageMemoire):
+        self.m = m
+
+    @staticmethod
+    def _ligne(etudiant: Dict) -> Dict:
+        return {'id': etudiant['id_etud'], 'nom': etudiant['nom'], 'prenom': etudiant['prenom'],
+                'email': etudiant['email'], 'date_inscription': etudiant['date_inscription'],
+                'solde_amende': etudiant['solde_amende']}
+
+    def _verifier_email(self, email: str, etudiant_id: Optional[int]):
+        autre = self.m.etudiant_par_email.get(email)
+        if autre is not None and autre != etudiant_id:
+            raise errors.UniqueViolation(
+                'duplicate key value violates unique constraint "etudiant_email_key"\n'
+                f'DETAIL:  Key (email)=({email}) already exists.'
+            )
+
+    def create(self, nom: str, prenom: str, email: str) -> Optional[int]:
+        with self.m.verrou:
+            # Comme une séquence SERIAL, un identifiant est consommé même si l'INSERT échoue
+            etudiant_id = next(self.m.sequence_etudiant)
+            self._verifier_email(email, None)
+            self.m.etudiant[etudiant_id] = {
+                'id_etud': etudiant_id, 'nom': nom, 'prenom': prenom, 'email': email,
+                'date_inscription': date.today(), 'solde_amende': Decimal('0.00'),
+            }
+            self.m.etudiant_par_email[email] = etudiant_id
+            insort(self.m.etudiants_tries, (nom, prenom, etudiant_id))
+            return etudiant_id
+
+    def get_all(self) -> List[Dict]:
+        with self.m.verrou:
+            return [self._ligne(self.m.etudiant[cle[2]]) for cle in self.m.etudiants_tries]
+
+    def get_page(self, limite: int, apres: Optional[List] = None) -> List[Dict]:
+        with self.m.verrou:
+            tries = self.m.etudiants_tries
+            debut = bisect_right(tries, _cle_apres(apres, (str, str, int))) if apres else 0
+            return [self._ligne(self.m.etudiant[cle[2]]) for cle in tries[debut:debut + limite]]
+
+    def get_by_id(self, etudiant_id: int) -> Optional[Dict]:
+        with self.m.verrou:
+            etudiant = self.m.etudiant.get(etudiant_id)
+            return self._ligne(etudiant) if etudiant else None
+
+    def search(self, terme: str, limite: int) -> List[Dict]:
+        t = _sans_accents(terme)
+        trouves = []
+        with self.m.verrou:
+            for etudiant in self.m.etudiant.values():
+                nom, prenom = _sans_accents(etudiant['nom']), _sans_accents(etudiant['prenom'])
+                score = max(_word_similarity(t, nom), _word_similarity(t, prenom))
+                if t in nom or t in prenom or terme.lower() in etudiant['email'].lower() \
+                        or score >= SEUIL_WORD_SIMILARITY:
+                    trouves.append((-score, etudiant['nom'], etudiant['prenom'], etudiant['id_etud']))
+            meilleurs = heapq.nsmallest(limite, trouves)
+            return [self._ligne(self.m.etudiant[cle[3]]) for cle in meilleurs]
+
+    def update(self, etudiant_id: int, nom: str, prenom: str, email: str) -> bool:
+        with self.m.verrou:
+            etudiant = self.m.etudiant.get(etudiant_id)
+            if etudiant is None:
+                return True
+            self._verifier_email(email, etudiant_id)
+            _retirer(self.m.etudiants_tries, (etudiant['nom'], etudiant['prenom'], etudiant_id))
+            del self.m.etudiant_par_email[etudiant['email']]
+            etudiant.update(nom=nom, prenom=prenom, email=email)
+            self.m.etudiant_par_email[email] = etudiant_id
+            insort(self.m.etudiants_tries, (nom, prenom, etudiant_id))
+            return True
+
+    def delete(self, etudiant_id: int) -> bool:
+        with self.m.verrou:
+            if self.m.emprunts_par_etudiant.get(etudiant_id):
+                # emprunt.id_etud : ON DELETE RESTRICT
+                raise errors.ForeignKeyViolation(
+                    'update or delete on table "etudiant" violates foreign key constraint on table "emprunt"'
+                )
+            etudiant = self.m.etudiant.pop(etudiant_id, None)
+            if etudiant is None:
+                return True
+            _retirer(self.m.etudiants_tries, (etudiant['nom'], etudiant['prenom'], etudiant_id))
+            del self.m.etudiant_par_email[etudiant['email']]
+            self.m.total_amendes -= etudiant['solde_amende']
+            # Classements : ON DELETE CASCADE
+            self.m.classement_etudiant.pop(etudiant_id, None)
+            for compteurs in self.m.classement_jour_etudiant.values():
+                compteurs.pop(etudiant_id, None)
+            return True
+
+    def exists(self, etudiant_id: int) -> bool:
+        return etudiant_id in self.m.etudiant
+
+    def count_emprunts(self, etudiant_id: int) -> int:
+        with self.m.verrou:
+            return len(self.m.emprunts_par_etudiant.get(etudiant_id, ()))
+
+    def count_emprunts_actifs(self, etudiant_id: int) -> int:
+        with self.m.verrou:
+            return self.m.en_cours_par_etudiant.get(etudiant_id, 0)
+
+
+class LivresMemoire(StockageLivres):
+
+    def __init__(self, m: StockageMemoire):
+        self.m = m
+
+    def _ligne(self, livre: Dict) -> Dict:
+        return {'isbn': livre['isbn'], 'titre': livre['titre'], 'editeur': livre['editeur'],
+                'annee_publication': livre['annee'],
+                'exemplaires_dispo': len(self.m.exemplaires_libres.get(livre['isbn'], ()))}
+
+    def create(self, titre: str, editeur: str, isbn: str, annee: Optional[int], exemplaires: int) -> Optional[str]:
+        with self.m.verrou:
+            if isbn in self.m.livre:
+                raise errors.UniqueViolation(
+                    'duplicate key value violates unique constraint "livre_pkey"\n'
+                    f'DETAIL:  Key (isbn)=({isbn}) already exists.'
+                )
+            self.m.livre[isbn] = {'isbn': isbn, 'titre': titre, 'editeur': editeur, 'annee': annee}
+            insort(self.m.livres_tries, (titre, isbn))
+            self.m.ajouter_exemplaires(isbn, exemplaires)
+            return isbn
+
+    def get_all(self) -> List[Dict]:
+        with self.m.verrou:
+            return [self._ligne(self.m.livre[cle[1]]) for cle in self.m.livres_tries]
+
+    def importer(self, lots: Iterable[List[Tuple]]) -> Tuple[int, int]:
+        # Lots lus (et validés) avant d'écrire : l'import est atomique comme la transaction SQL
+        livres = [valeurs for lot in lots for valeurs in lot]
+        inseres = modifies = 0
+        with self.m.verrou:
+            for isbn, titre, editeur, annee, exemplaires in livres:
+                livre = self.m.livre.get(isbn)
+                if livre is None:
+                    self.m.livre[isbn] = {'isbn': isbn, 'titre': titre, 'editeur': editeur, 'annee': annee}
+                    insort(self.m.livres_tries, (titre, isbn))
+                    self.m.ajouter_exemplaires(isbn, 1 if exemplaires is None else exemplaires)
+                    inseres += 1
+                elif (livre['titre'], livre['editeur'], livre['annee']) != (titre, editeur, annee):
+                    _retirer(self.m.livres_tries, (livre['titre'], isbn))
+                    livre.update(titre=titre, editeur=editeur, annee=annee)
+                    insort(self.m.livres_tries, (titre, isbn))
+                    modifies += 1
+        return inseres, modifies
+
+    def get_page(self, limite: int, apres: Optional[List] = None) -> List[Dict]:
+        with self.m.verrou:
+            tries = self.m.livres_tries
+            debut = bisect_right(tries, _cle_apres(apres, (str, str))) if apres else 0
+            return [self._ligne(self.m.livre[cle[1]]) for cle in tries[debut:debut + limite]]
+
+    def get_by_id(self, isbn: str) -> Optional[Dict]:
+        with self.m.verrou:
+            livre = self.m.livre.get(isbn)
+            return self._ligne(livre) if livre else None
+
+    def search(self, terme: str, limite: int) -> List[Dict]:
+        t = _sans_accents(terme)
+        requete = set(_racines(terme))
+        trouves = []
+        with self.m.verrou:
+            for livre in self.m.livre.values():
+                titre = _sans_accents(livre['titre'])
+                racines = _racines(livre['titre'])
+                plein_texte = bool(requete) and requete <= set(racines)
+                rang = sum(1 for r in racines if r in requete) if plein_texte else 0
+                score = _word_similarity(t, titre)
+                if plein_texte or t in titre or t in _sans_accents(livre['editeur']) \
+                        or score >= SEUIL_WORD_SIMILARITY:
+                    trouves.append((-rang, -score, livre['titre'], livre['isbn']))
+            meilleurs = heapq.nsmallest(limite, trouves)
+            return [self._ligne(self.m.livre[cle[3]]) for cle in meilleurs]
+
+    def update(self, isbn: str, titre: str, editeur: str, annee: Optional[int],
+               exemplaires: Optional[int] = None) -> bool:
+        with self.m.verrou:
+            livre = self.m.livre.get(isbn)
+            if livre is not None:
+                _retirer(self.m.livres_tries, (livre['titre'], isbn))
+                livre.update(titre=titre, editeur=editeur, annee=annee)
+                insort(self.m.livres_tries, (titre, isbn))
+            if exemplaires is None:
+                return True
+
+            # ajuster_exemplaires : ajoute des exemplaires ou retire les libres les plus récents
+            libres = self.m.exemplaires_libres.get(isbn, [])
+            if exemplaires > len(libres):
+                if livre is None:
+                    raise errors.ForeignKeyViolation(
+                        'insert or update on table "exemplaire" violates foreign key constraint "exemplaire_isbn_fkey"'
+                    )
+                self.m.ajouter_exemplaires(isbn, exemplaires - len(libres))
+            else:
+                for id_exemplaire in libres[exemplaires:]:
+                    self.m.supprimer_exemplaire(id_exemplaire)
+            return True
+
+    def delete(self, isbn: str) -> bool:
+        with self.m.verrou:
+            if self.m.emprunts_par_livre.get(isbn):
+                # emprunt.isbn : ON DELETE RESTRICT
+                raise errors.ForeignKeyViolation(
+                    'update or delete on table "livre" violates foreign key constraint on table "emprunt"'
+                )
+            livre = self.m.livre.pop(isbn, None)
+            if livre is None:
+                return True
+            _retirer(self.m.livres_tries, (livre['titre'], isbn))
+            # Exemplaires et classements : ON DELETE CASCADE
+            for id_exemplaire in list(self.m.exemplaires_par_livre.pop(isbn, ())):
+                self.m.supprimer_exemplaire(id_exemplaire)
+            self.m.exemplaires_libres.pop(isbn, None)
+            self.m.classement_livre.pop(isbn, None)
+            for compteurs in self.m.classement_jour_livre.values():
+                compteurs.pop(isbn, None)
+            return True
+
+    def exists(self, isbn: str) -> bool:
+        return isbn in self.m.livre
+
+    def count_emprunts(self, isbn: str) -> int:
+        with self.m.verrou:
+            return len(self.m.emprunts_par_livre.get(isbn, ()))
+
+    def est_disponible(self, isbn: str) -> bool:
+        with self.m.verrou:
+            return bool(self.m.exemplaires_libres.get(isbn))
+
+
+class EmpruntsMemoire(StockageEmprunts):
+
+    def __init__(self, m: StockageMemoire):
+        self.m = m
+
+    def _ligne(self, emprunt: Dict, aujourd_hui: date) -> Dict:
+        """Colonnes de EmpruntsPostgres.COLONNES (échéance, retard et amende calculés)"""
+        etudiant = self.m.etudiant[emprunt['id_etud']]
+        livre = self.m.livre[emprunt['isbn']]
+        jours_retard = 0
+        if emprunt['date_retour'] is None:
+            jours_retard = max(0, (aujourd_hui - emprunt['date_emprunt']).days - DUREE_EMPRUNT_DEFAUT)
+        return {
+            'id': emprunt['id_emprunt'],
+            'date_emprunt': emprunt['date_emprunt'],
+            'date_retour': emprunt['date_retour'],
+            'date_echeance': emprunt['date_emprunt'] + timedelta(days=DUREE_EMPRUNT_DEFAUT),
+            'jours_retard': jours_retard,
+            'amende': float(jours_retard * AMENDE_PAR_JOUR),
+            'amende_enregistree': float(emprunt['amende']),
+            'etudiant_id': etudiant['id_etud'], 'nom': etudiant['nom'], 'prenom': etudiant['prenom'],
+            'livre_id': livre['isbn'], 'titre': livre['titre'], 'auteur': livre['editeur'],
+        }
+
+    def _lignes(self, cles: Iterable[Tuple[date, int]]) -> List[Dict]:
+        aujourd_hui = date.today()
+        return [self._ligne(self.m.emprunt[cle[1]], aujourd_hui) for cle in cles]
+
+    def emprunter(self, etudiant_id: int, isbn: str) -> Tuple[str, Optional[int]]:
+        # Mêmes vérifications, dans le même ordre, que la fonction SQL emprunter_livre
+        with self.m.verrou:
+            if etudiant_id not in self.m.etudiant:
+                return 'etudiant_inconnu', None
+            if isbn not in self.m.livre:
+                return 'livre_inconnu', None
+            libres = self.m.exemplaires_libres.get(isbn)
+            if not libres:
+                return 'indisponible', None
+            if self.m.en_cours_par_etudiant[etudiant_id] >= MAX_EMPRUNTS_PAR_ETUDIANT:
+                return 'limite_atteinte', None
+
+            id_exemplaire = libres[0]
+            self.m.occuper_exemplaire(id_exemplaire)
+            emprunt_id = self.m.inserer_emprunt(etudiant_id, isbn, date.today(), id_exemplaire=id_exemplaire)
+            return 'ok', emprunt_id
+
+    def emprunter_lot(self, operations: List[Tuple[int, str]], savepoints: bool = False) -> List[Dict]:
+        resultats = [None] * len(operations)
+        with self.m.verrou:
+            rangs = range(len(operations))
+            if not savepoints:
+                # Même ordre de traitement que le lot SQL : par étudiant, puis dans l'ordre du lot
+                rangs = sorted(rangs, key=lambda rang: (operations[rang][0], rang))
+            for rang in rangs:
+                etudiant_id, isbn = operations[rang]
+                resultat, emprunt_id = self.emprunter(etudiant_id, isbn)
+                resultats[rang] = {'etudiant_id': etudiant_id, 'isbn': isbn, 'statut': resultat, 'id': emprunt_id}
+        return resultats
+
+    def retourner(self, emprunt_id: int) -> Tuple[str, int, float, Optional[int], Optional[str]]:
+        # Mêmes règles que la fonction SQL retourner_emprunt
+        with self.m.verrou:
+            emprunt = self.m.emprunt.get(emprunt_id)
+            if emprunt is None:
+                return 'inconnu', 0, 0.0, None, None
+            if emprunt['date_retour'] is not None:
+                return 'deja_retourne', 0, 0.0, None, None
+
+            aujourd_hui = date.today()
+            jours = max(0, (aujourd_hui - emprunt['date_emprunt']).days - DUREE_EMPRUNT_DEFAUT)
+            deja = emprunt['amende']
+            amende = max(deja, _montant(jours * Decimal(str(AMENDE_PAR_JOUR))))
+
+            _retirer(self.m.emprunts_en_cours, (emprunt['date_emprunt'], emprunt_id))
+            self.m.en_cours_par_etudiant[emprunt['id_etud']] -= 1
+            emprunt['date_retour'] = aujourd_hui
+            emprunt['amende'] = amende
+            self.m.liberer_exemplaire(emprunt['id_exemplaire'])
+            if amende > deja:
+                self.m.crediter_amende(emprunt['id_etud'], amende - deja)
+            return 'ok', jours, float(amende), emprunt['id_etud'], emprunt['isbn']
+
+    def retourner_lot(self, emprunt_ids: List[int], savepoints: bool = False) -> List[Dict]:
+        # Traité dans l'ordre : un identifiant répété est 'deja_retourne' après le premier,
+        # comme avec la fonction SQL retourner_emprunts
+        resultats = []
+        with self.m.verrou:
+            for emprunt_id in emprunt_ids:
+                resultat, jours_retard, amende, etudiant_id, isbn = self.retourner(emprunt_id)
+                resultats.append({'id': emprunt_id, 'statut': resultat, 'jours_retard': jours_retard,
+                                  'amende': amende, 'etudiant_id': etudiant_id, 'isbn': isbn})
+        return resultats
+
+    def get_all(self) -> List[Dict]:
+        with self.m.verrou:
+            return self._lignes(reversed(self.m.emprunts_tries))
+
+    def get_page(self, limite: int, apres: Optional[List] = None, etudiant_id: Optional[int] = None,
+                 isbn: Optional[str] = None, depuis: Optional[date] = None, jusqu_au: Optional[date] = None,
+                 statut: Optional[str] = None, croissant: bool = False) -> List[Dict]:
+        cle_apres = _cle_apres(apres, (lambda v: date.fromisoformat(str(v)), int)) if apres else None
+        with self.m.verrou:
+            # Index le plus sélectif, comme le ferait le planificateur
+            if etudiant_id is not None:
+                cles = sorted((self.m.emprunt[i]['date_emprunt'], i) for i in self.m.emprunts_par_etudiant.get(etudiant_id, ()))
+            elif isbn:
+                cles = sorted((self.m.emprunt[i]['date_emprunt'], i) for i in self.m.emprunts_par_livre.get(isbn, ()))
+            elif statut == 'en_cours':
+                cles = self.m.emprunts_en_cours
+            else:
+                cles = self.m.emprunts_tries
+
+            # Intervalle de la liste triée entre les bornes de dates et la clé de pagination
+            debut = bisect_left(cles, (depuis,)) if depuis else 0
+            fin = bisect_left(cles, (jusqu_au + timedelta(days=1),)) if jusqu_au else len(cles)
+            if cle_apres and croissant:
+                debut = max(debut, bisect_right(cles, cle_apres))
+            elif cle_apres:
+                fin = min(fin, bisect_left(cles, cle_apres))
+            indices = range(debut, fin) if croissant else range(fin - 1, debut - 1, -1)
+
+            page = []
+            for i in indices:
+                if len(page) >= limite:
+                    break
+                emprunt = self.m.emprunt[cles[i][1]]
+                if etudiant_id is not None and emprunt['id_etud'] != etudiant_id:
+                    continue
+                if isbn and emprunt['isbn'] != isbn:
+                    continue
+                if statut == 'en_cours' and emprunt['date_retour'] is not None:
+                    continue
+                if statut == 'retourne' and emprunt['date_retour'] is None:
+                    continue
+                page.append(cles[i])
+            return self._lignes(page)
+
+    def export(self, depuis: Optional[date], jusqu_au: Optional[date], taille_lot: int) -> Iterator[List[Dict]]:
+        with self.m.verrou:
+            ids = sorted(
+                emprunt_id for emprunt_id, emprunt in self.m.emprunt.items()
+                if (depuis is None or emprunt['date_emprunt'] >= depuis)
+                and (jusqu_au is None or emprunt['date_emprunt'] <= jusqu_au)
+            )
+        return self._lots_export(ids, taille_lot)
+
+    def _lots_export(self, ids: List[int], taille_lot: int) -> Iterator[List[Dict]]:
+        for debut in range(0, len(ids), taille_lot):
+            lot = []
+            with self.m.verrou:
+                for emprunt_id in ids[debut:debut + taille_lot]:
+                    emprunt = self.m.emprunt.get(emprunt_id)
+                    if emprunt is None:
+                        continue
+                    etudiant = self.m.etudiant[emprunt['id_etud']]
+                    livre = self.m.livre[emprunt['isbn']]
+                    lot.append({
+                        'id': emprunt_id, 'date_emprunt': emprunt['date_emprunt'],
+                        'date_retour': emprunt['date_retour'], 'amende': emprunt['amende'],
+                        'etudiant_id': etudiant['id_etud'], 'nom': etudiant['nom'],
+                        'prenom': etudiant['prenom'], 'email': etudiant['email'],
+                        'livre_id': livre['isbn'], 'titre': livre['titre'], 'editeur': livre['editeur'],
+                    })
+            if lot:
+                yield lot
+
+    def get_by_id(self, emprunt_id: int) -> Optional[Dict]:
+        with self.m.verrou:
+            emprunt = self.m.emprunt.get(emprunt_id)
+            return self._ligne(emprunt, date.today()) if emprunt else None
+
+    def get_by_etudiant(self, etudiant_id: int) -> List[Dict]:
+        with self.m.verrou:
+            cles = sorted(((self.m.emprunt[i]['date_emprunt'], i) for i in self.m.emprunts_par_etudiant.get(etudiant_id, ())),
+                          reverse=True)
+            return self._lignes(cles)
+
+    def get_en_cours(self) -> List[Dict]:
+        limite = date.today() - timedelta(days=DUREE_EMPRUNT_DEFAUT)
+        with self.m.verrou:
+            en_cours = self.m.emprunts_en_cours
+            return self._lignes(en_cours[bisect_left(en_cours, (limite,)):])
+
+    def get_en_retard(self) -> List[Dict]:
+        limite = date.today() - timedelta(days=DUREE_EMPRUNT_DEFAUT)
+        with self.m.verrou:
+            en_cours = self.m.emprunts_en_cours
+            return self._lignes(en_cours[:bisect_left(en_cours, (limite,))])
+
+    def delete(self, emprunt_id: int) -> bool:
+        with self.m.verrou:
+            if emprunt_id in self.m.emprunt:
+                emprunt = self.m.supprimer_emprunt(emprunt_id)
+                if emprunt['date_retour'] is None:
+                    self.m.liberer_exemplaire(emprunt['id_exemplaire'])
+            return True
+
+
+class StatsMemoire(StockageStats):
+
+    def __init__(self, m: StockageMemoire):
+        self.m = m
+
+    def get_compteurs(self) -> Dict:
+        with self.m.verrou:
+            return {
+                'etudiants': len(self.m.etudiant),
+                'amendes': self.m.total_amendes,
+                'livres': len(self.m.livre),
+                'exemplaires_dispo': self.m.nb_exemplaires_dispo,
+                'emprunts': len(self.m.emprunt),
+                'emprunts_en_cours': len(self.m.emprunts_en_cours),
+            }
+
+    def _compteurs(self, total: Counter, par_jour: Dict[date, Counter], fenetre: Optional[int]) -> Counter:
+        if fenetre is None:
+            return total
+        depuis = date.today() - timedelta(days=fenetre)
+        somme = Counter()
+        for jour, compteurs in par_jour.items():
+            if jour > depuis:
+                somme.update(compteurs)
+        return somme
+
+    def get_top_etudiants(self, limit: int, fenetre: Optional[int] = None) -> List[Dict]:
+        with self.m.verrou:
+            compteurs = self._compteurs(self.m.classement_etudiant, self.m.classement_jour_etudiant, fenetre)
+            meilleurs = heapq.nsmallest(limit, ((-nb, i) for i, nb in compteurs.items() if nb > 0))
+            return [{'id': i, 'nom': self.m.etudiant[i]['nom'], 'prenom': self.m.etudiant[i]['prenom'],
+                     'nombre_emprunts': -nb} for nb, i in meilleurs]
+
+    def get_top_livres(self, limit: int, fenetre: Optional[int] = None) -> List[Dict]:
+        with self.m.verrou:
+            compteurs = self._compteurs(self.m.classement_livre, self.m.classement_jour_livre, fenetre)
+            meilleurs = heapq.nsmallest(limit, ((-nb, isbn) for isbn, nb in compteurs.items() if nb > 0))
+            return [{'isbn': isbn, 'titre': self.m.livre[isbn]['titre'], 'auteur': self.m.livre[isbn]['editeur'],
+                     'nombre_emprunts': -nb} for nb, isbn in meilleurs]
+
+    def replier_classements(self) -> int:
+        # Classements tenus à jour à chaque emprunt : rien en attente
+        return 0
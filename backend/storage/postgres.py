@@ -0,0 +1,531 @@
+import csv
+import io
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import psycopg2
+from config.database import copy_query, execute_query, stream_query, transaction, savepoint
+from config.settings import DUREE_EMPRUNT_DEFAUT, AMENDE_PAR_JOUR, MAX_EMPRUNTS_PAR_ETUDIANT
+from storage.base import Stockage, StockageEtudiants, StockageLivres, StockageEmprunts, StockageStats
+
+
+class EtudiantsPostgres(StockageEtudiants):
+
+    COLONNES = "SELECT id_etud as id, nom, prenom, email, date_inscription, solde_amende FROM etudiant"
+
+    def create(self, nom: str, prenom: str, email: str) -> Optional[int]:
+        query = """
+            INSERT INTO etudiant (nom, prenom, email, date_inscription, solde_amende)
+            VALUES (%s, %s, %s, CURRENT_DATE, 0)
+            RETURNING id_etud
+        """
+        result = execute_query(query, (nom, prenom, email), fetch_one=True)
+        return result['id_etud'] if result else None
+
+    def get_all(self) -> List[Dict]:
+        return execute_query(self.COLONNES + " ORDER BY nom, prenom", fetch=True) or []
+
+    def get_page(self, limite: int, apres: Optional[List] = None) -> List[Dict]:
+        query = self.COLONNES
+        params = []
+        if apres:
+            query += " WHERE (nom, prenom, id_etud) > (%s, %s, %s)"
+            params.extend(apres)
+        query += " ORDER BY nom, prenom, id_etud LIMIT %s"
+        params.append(limite)
+        return execute_query(query, tuple(params), fetch=True) or []
+
+    def get_by_id(self, etudiant_id: int) -> Optional[Dict]:
+        return execute_query(self.COLONNES + " WHERE id_etud = %s", (etudiant_id,), fetch_one=True)
+
+    def search(self, terme: str, limite: int) -> List[Dict]:
+        # Sous-chaîne et similarité (fautes de frappe) par trigrammes
+        query = """
+            SELECT id_etud as id, nom, prenom, email, date_inscription, solde_amende
+            FROM etudiant, f_unaccent(%(terme)s) AS t
+            WHERE f_unaccent(nom) ILIKE '%%' || t || '%%'
+               OR f_unaccent(prenom) ILIKE '%%' || t || '%%'
+               OR email ILIKE '%%' || %(terme)s || '%%'
+               OR t <%% f_unaccent(nom)
+               OR t <%% f_unaccent(prenom)
+            ORDER BY GREATEST(word_similarity(t, f_unaccent(nom)), word_similarity(t, f_unaccent(prenom))) DESC,
+                     nom, prenom
+            LIMIT %(limite)s
+        """
+        return execute_query(query, {'terme': terme, 'limite': limite}, fetch=True) or []
+
+    def update(self, etudiant_id: int, nom: str, prenom: str, email: str) -> bool:
+        query = """
+            UPDATE etudiant
+            SET nom = %s, prenom = %s, email = %s
+            WHERE id_etud = %s
+        """
+        return execute_query(query, (nom, prenom, email, etudiant_id))
+
+    def delete(self, etudiant_id: int) -> bool:
+        return execute_query("DELETE FROM etudiant WHERE id_etud = %s", (etudiant_id,))
+
+    def exists(self, etudiant_id: int) -> bool:
+        return execute_query("SELECT 1 FROM etudiant WHERE id_etud = %s", (etudiant_id,), fetch_one=True) is not None
+
+    def count_emprunts(self, etudiant_id: int) -> int:
+        result = execute_query("SELECT COUNT(*) as count FROM emprunt WHERE id_etud = %s", (etudiant_id,), fetch_one=True)
+        return result['count'] if result else 0
+
+    def count_emprunts_actifs(self, etudiant_id: int) -> int:
+        result = execute_query(
+            "SELECT COUNT(*) as count FROM emprunt WHERE id_etud = %s AND date_retour IS NULL",
+            (etudiant_id,),
+            fetch_one=True
+        )
+        return result['count'] if result else 0
+
+
+class LivresPostgres(StockageLivres):
+
+    # Colonnes communes aux lectures de livres. Le nombre d'exemplaires disponibles
+    # est dérivé de la table exemplaire (parcours de l'index partiel idx_exemplaire_libre).
+    COLONNES = """
+        SELECT l.isbn, l.titre, l.editeur, l.annee as annee_publication,
+               (SELECT COUNT(*) FROM exemplaire x WHERE x.isbn = l.isbn AND x.disponible)::INTEGER as exemplaires_dispo
+        FROM livre l
+    """
+
+    def create(self, titre: str, editeur: str, isbn: str, annee: Optional[int], exemplaires: int) -> Optional[str]:
+        query = """
+            WITH nouveau AS (
+                INSERT INTO livre (isbn, titre, editeur, annee)
+                VALUES (%s, %s, %s, %s)
+                RETURNING isbn
+            ),
+            copies AS (
+                INSERT INTO exemplaire (isbn)
+                SELECT isbn FROM nouveau, generate_series(1, %s)
+            )
+            SELECT isbn FROM nouveau
+        """
+        result = execute_query(query, (isbn, titre, editeur, annee, exemplaires), fetch_one=True)
+        return result['isbn'] if result else None
+
+    def get_all(self) -> List[Dict]:
+        return execute_query(self.COLONNES + " ORDER BY l.titre", fetch=True) or []
+
+    def get_page(self, limite: int, apres: Optional[List] = None) -> List[Dict]:
+        query = self.COLONNES
+        params = []
+        if apres:
+            query += " WHERE (l.titre, l.isbn) > (%s, %s)"
+            params.extend(apres)
+        query += " ORDER BY l.titre, l.isbn LIMIT %s"
+        params.append(limite)
+        return execute_query(query, tuple(params), fetch=True) or []
+
+    def get_by_id(self, isbn: str) -> Optional[Dict]:
+        return execute_query(self.COLONNES + " WHERE l.isbn = %s", (isbn,), fetch_one=True)
+
+    def search(self, terme: str, limite: int) -> List[Dict]:
+        # Plein texte français sur le titre, sous-chaîne et similarité par trigrammes
+        query = self.COLONNES.rstrip() + """,
+                 f_unaccent(%(terme)s) AS t,
+                 websearch_to_tsquery('fr_unaccent', %(terme)s) AS q
+            WHERE to_tsvector('fr_unaccent', l.titre) @@ q
+               OR f_unaccent(l.titre) ILIKE '%%' || t || '%%'
+               OR f_unaccent(l.editeur) ILIKE '%%' || t || '%%'
+               OR t <%% f_unaccent(l.titre)
+            ORDER BY ts_rank(to_tsvector('fr_unaccent', l.titre), q) DESC,
+                     word_similarity(t, f_unaccent(l.titre)) DESC,
+                     l.titre
+            LIMIT %(limite)s
+        """
+        return execute_query(query, {'terme': terme, 'limite': limite}, fetch=True) or []
+
+    def update(self, isbn: str, titre: str, editeur: str, annee: Optional[int],
+               exemplaires: Optional[int] = None) -> bool:
+        query = """
+            UPDATE livre
+            SET titre = %s, editeur = %s, annee = %s
+            WHERE isbn = %s
+        """
+        if exemplaires is None:
+            return execute_query(query, (titre, editeur, annee, isbn))
+
+        with transaction():
+            result = execute_query(query, (titre, editeur, annee, isbn))
+            execute_query("SELECT ajuster_exemplaires(%s, %s)", (isbn, exemplaires))
+        return result
+
+    def delete(self, isbn: str) -> bool:
+        return execute_query("DELETE FROM livre WHERE isbn = %s", (isbn,))
+
+    def exists(self, isbn: str) -> bool:
+        return execute_query("SELECT 1 FROM livre WHERE isbn = %s", (isbn,), fetch_one=True) is not None
+
+    def count_emprunts(self, isbn: str) -> int:
+        result = execute_query("SELECT COUNT(*) as count FROM emprunt WHERE isbn = %s", (isbn,), fetch_one=True)
+        return result['count'] if result else 0
+
+    # Import : les lots sont copiés (COPY) dans une table temporaire puis fusionnés
+    # dans livre en une seule instruction
+    CREATION_TABLE_IMPORT = """
+        CREATE TEMP TABLE livre_import (
+            isbn VARCHAR(20) NOT NULL,
+            titre VARCHAR(255) NOT NULL,
+            editeur VARCHAR(200) NOT NULL,
+            annee INTEGER,
+            exemplaires INTEGER
+        ) ON COMMIT DROP
+    """
+
+    COPIE_IMPORT = "COPY livre_import (isbn, titre, editeur, annee, exemplaires) FROM STDIN WITH (FORMAT csv)"
+
+    # Un livre déjà présent garde ses exemplaires (des emprunts peuvent être en cours) ;
+    # seules les lignes qui changent réellement sont réécrites. Les exemplaires des
+    # nouveaux livres sont créés dans la même instruction.
+    FUSION_IMPORT = """
+        WITH fusion AS (
+            INSERT INTO livre (isbn, titre, editeur, annee)
+            SELECT isbn, titre, editeur, annee
+            FROM livre_import
+            ORDER BY isbn
+            ON CONFLICT (isbn) DO UPDATE
+                SET titre = EXCLUDED.titre, editeur = EXCLUDED.editeur, annee = EXCLUDED.annee
+                WHERE (livre.titre, livre.editeur, livre.annee)
+                      IS DISTINCT FROM (EXCLUDED.titre, EXCLUDED.editeur, EXCLUDED.annee)
+            RETURNING isbn, (xmax = 0) as insere
+        ),
+        copies AS (
+            INSERT INTO exemplaire (isbn)
+            SELECT f.isbn
+            FROM fusion f
+            JOIN livre_import i ON i.isbn = f.isbn
+            CROSS JOIN LATERAL generate_series(1, COALESCE(i.exemplaires, 1))
+            WHERE f.insere
+        )
+        SELECT COUNT(*) FILTER (WHERE insere) as inseres,
+               COUNT(*) FILTER (WHERE NOT insere) as modifies
+        FROM fusion
+    """
+
+    def importer(self, lots: Iterable[List[Tuple]]) -> Tuple[int, int]:
+        copies = 0
+        with transaction():
+            execute_query(self.CREATION_TABLE_IMPORT)
+            for lot in lots:
+                tampon = io.StringIO()
+                csv.writer(tampon).writerows(lot)
+                tampon.seek(0)
+                copy_query(self.COPIE_IMPORT, tampon)
+                copies += len(lot)
+            if not copies:
+                return 0, 0
+            fusion = execute_query(self.FUSION_IMPORT, fetch_one=True)
+        return fusion['inseres'], fusion['modifies']
+
+    def est_disponible(self, isbn: str) -> bool:
+        result = execute_query(
+            "SELECT 1 FROM exemplaire WHERE isbn = %s AND disponible LIMIT 1",
+            (isbn,),
+            fetch_one=True
+        )
+        return result is not None
+
+
+class EmpruntsPostgres(StockageEmprunts):
+
+    # Colonnes communes aux listes d'emprunts. L'échéance, les jours de retard et
+    # l'amende en cours (0 si le livre est rendu) sont calculés par la requête à
+    # partir des paramètres %(duree)s et %(amende_jour)s (voir _params_calcul).
+    COLONNES = """
+        SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour,
+               e.date_emprunt + %(duree)s as date_echeance,
+               CASE WHEN e.date_retour IS NULL
+                    THEN GREATEST(0, CURRENT_DATE - e.date_emprunt - %(duree)s) ELSE 0 END as jours_retard,
+               CASE WHEN e.date_retour IS NULL
+                    THEN GREATEST(0, CURRENT_DATE - e.date_emprunt - %(duree)s) * %(amende_jour)s
+                    ELSE 0 END::float8 as amende,
+               e.amende::float8 as amende_enregistree,
+               et.id_etud as etudiant_id, et.nom, et.prenom,
+               l.isbn as livre_id, l.titre, l.editeur as auteur
+        FROM emprunt e
+        JOIN etudiant et ON e.id_etud = et.id_etud
+        JOIN livre l ON e.isbn = l.isbn
+    """
+
+    @staticmethod
+    def _params_calcul(**params) -> Dict:
+        """Paramètres de calcul du retard et de l'amende pour COLONNES"""
+        return {'duree': DUREE_EMPRUNT_DEFAUT, 'amende_jour': AMENDE_PAR_JOUR, **params}
+
+    def emprunter(self, etudiant_id: int, isbn: str) -> Tuple[str, Optional[int]]:
+        result = execute_query(
+            "SELECT resultat, emprunt_id FROM emprunter_livre(%s, %s, %s)",
+            (etudiant_id, isbn, MAX_EMPRUNTS_PAR_ETUDIANT),
+            fetch_one=True,
+            primary=True
+        )
+        return result['resultat'], result['emprunt_id']
+
+    def emprunter_lot(self, operations: List[Tuple[int, str]], savepoints: bool = False) -> List[Dict]:
+        resultats = []
+        with transaction():
+            if savepoints:
+                for etudiant_id, isbn in operations:
+                    try:
+                        with savepoint():
+                            resultat, emprunt_id = self.emprunter(etudiant_id, isbn)
+                        resultats.append({'etudiant_id': etudiant_id, 'isbn': isbn,
+                                          'statut': resultat, 'id': emprunt_id})
+                    except psycopg2.Error as e:
+                        resultats.append({'etudiant_id': etudiant_id, 'isbn': isbn,
+                                          'statut': 'erreur', 'id': None, 'erreur': str(e).strip()})
+                return resultats
+
+            if not operations:
+                return resultats
+
+            # Opérations traitées par étudiant (verrous pris dans un ordre stable),
+            # dans l'ordre du lot pour un même étudiant
+            query = """
+                SELECT o.rang, r.resultat, r.emprunt_id
+                FROM (
+                    SELECT * FROM unnest(%s::INTEGER[], %s::VARCHAR[]) WITH ORDINALITY AS o(id_etud, isbn, rang)
+                    ORDER BY id_etud, rang
+                ) o
+                CROSS JOIN LATERAL emprunter_livre(o.id_etud, o.isbn, %s) r
+            """
+            lignes = execute_query(
+                query,
+                ([op[0] for op in operations], [op[1] for op in operations], MAX_EMPRUNTS_PAR_ETUDIANT),
+                fetch=True,
+                primary=True
+            )
+            par_rang = {ligne['rang']: ligne for ligne in lignes}
+            for rang, (etudiant_id, isbn) in enumerate(operations, start=1):
+                ligne = par_rang[rang]
+                resultats.append({'etudiant_id': etudiant_id, 'isbn': isbn,
+                                  'statut': ligne['resultat'], 'id': ligne['emprunt_id']})
+        return resultats
+
+    def retourner(self, emprunt_id: int) -> Tuple[str, int, float, Optional[int], Optional[str]]:
+        result = execute_query(
+            "SELECT resultat, jours_retard, amende_due, etudiant_id, isbn FROM retourner_emprunt(%s, %s, %s)",
+            (emprunt_id, DUREE_EMPRUNT_DEFAUT, AMENDE_PAR_JOUR),
+            fetch_one=True,
+            primary=True
+        )
+        return (result['resultat'], result['jours_retard'], float(result['amende_due']),
+                result['etudiant_id'], result['isbn'])
+
+    def retourner_lot(self, emprunt_ids: List[int], savepoints: bool = False) -> List[Dict]:
+        resultats = []
+        with transaction():
+            if savepoints:
+                for emprunt_id in emprunt_ids:
+                    try:
+                        with savepoint():
+                            resultat, jours_retard, amende, etudiant_id, isbn = self.retourner(emprunt_id)
+                        resultats.append({'id': emprunt_id, 'statut': resultat, 'jours_retard': jours_retard,
+                                          'amende': amende, 'etudiant_id': etudiant_id, 'isbn': isbn})
+                    except psycopg2.Error as e:
+                        resultats.append({'id': emprunt_id, 'statut': 'erreur', 'jours_retard': 0, 'amende': 0.0,
+                                          'etudiant_id': None, 'isbn': None, 'erreur': str(e).strip()})
+                return resultats
+
+            if not emprunt_ids:
+                return resultats
+
+            lignes = execute_query(
+                "SELECT emprunt_id, resultat, jours_retard, amende_due, etudiant_id, isbn "
+                "FROM retourner_emprunts(%s::INTEGER[], %s, %s)",
+                (list(emprunt_ids), DUREE_EMPRUNT_DEFAUT, AMENDE_PAR_JOUR),
+                fetch=True,
+                primary=True
+            )
+            for ligne in lignes:
+                resultats.append({'id': ligne['emprunt_id'], 'statut': ligne['resultat'],
+                                  'jours_retard': ligne['jours_retard'], 'amende': float(ligne['amende_due']),
+                                  'etudiant_id': ligne['etudiant_id'], 'isbn': ligne['isbn']})
+        return resultats
+
+    def get_all(self) -> List[Dict]:
+        query = self.COLONNES + " ORDER BY e.date_emprunt DESC"
+        return execute_query(query, self._params_calcul(), fetch=True) or []
+
+    def get_page(self, limite: int, apres: Optional[List] = None, etudiant_id: Optional[int] = None,
+                 isbn: Optional[str] = None, depuis: Optional[date] = None, jusqu_au: Optional[date] = None,
+                 statut: Optional[str] = None, croissant: bool = False) -> List[Dict]:
+        conditions = []
+        params = self._params_calcul(limite=limite)
+
+        if etudiant_id is not None:
+            conditions.append("e.id_etud = %(etudiant_id)s")
+            params['etudiant_id'] = etudiant_id
+        if isbn:
+            conditions.append("e.isbn = %(isbn)s")
+            params['isbn'] = isbn
+        if depuis:
+            conditions.append("e.date_emprunt >= %(depuis)s")
+            params['depuis'] = depuis
+        if jusqu_au:
+            conditions.append("e.date_emprunt <= %(jusqu_au)s")
+            params['jusqu_au'] = jusqu_au
+        if statut == 'en_cours':
+            conditions.append("e.date_retour IS NULL")
+        elif statut == 'retourne':
+            conditions.append("e.date_retour IS NOT NULL")
+
+        if apres:
+            conditions.append(f"(e.date_emprunt, e.id_emprunt) {'>' if croissant else '<'} (%(apres_date)s::date, %(apres_id)s)")
+            params['apres_date'], params['apres_id'] = apres
+
+        sens = "ASC" if croissant else "DESC"
+        query = self.COLONNES + f"""
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY e.date_emprunt {sens}, e.id_emprunt {sens}
+            LIMIT %(limite)s
+        """
+        return execute_query(query, params, fetch=True) or []
+
+    def export(self, depuis: Optional[date], jusqu_au: Optional[date], taille_lot: int) -> Iterator[List[Dict]]:
+        # Lu par lots via un curseur côté serveur
+        conditions = []
+        params = []
+        if depuis:
+            conditions.append("e.date_emprunt >= %s")
+            params.append(depuis)
+        if jusqu_au:
+            conditions.append("e.date_emprunt <= %s")
+            params.append(jusqu_au)
+
+        query = f"""
+            SELECT e.id_emprunt as id, e.date_emprunt, e.date_retour, e.amende,
+                   et.id_etud as etudiant_id, et.nom, et.prenom, et.email,
+                   l.isbn as livre_id, l.titre, l.editeur
+            FROM emprunt e
+            JOIN etudiant et ON e.id_etud = et.id_etud
+            JOIN livre l ON e.isbn = l.isbn
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY e.id_emprunt
+        """
+        return stream_query(query, tuple(params), batch_size=taille_lot)
+
+    # Date de l'emprunt lue dans emprunt_cle (sous-requête évaluée une fois) : une
+    # seule partition de emprunt est lue, au lieu de sonder l'index de chacune
+    DATE_PAR_ID = "(SELECT c.date_emprunt FROM emprunt_cle c WHERE c.id_emprunt = %(id)s)"
+
+    def get_by_id(self, emprunt_id: int) -> Optional[Dict]:
+        query = self.COLONNES + " WHERE e.id_emprunt = %(id)s AND e.date_emprunt = " + self.DATE_PAR_ID
+        return execute_query(query, self._params_calcul(id=emprunt_id), fetch_one=True)
+
+    def get_by_etudiant(self, etudiant_id: int) -> List[Dict]:
+        query = self.COLONNES + " WHERE e.id_etud = %(etudiant_id)s ORDER BY e.date_emprunt DESC"
+        return execute_query(query, self._params_calcul(etudiant_id=etudiant_id), fetch=True) or []
+
+    def get_en_cours(self) -> List[Dict]:
+        query = self.COLONNES + """
+            WHERE e.date_retour IS NULL
+            AND e.date_emprunt >= CURRENT_DATE - %(duree)s
+            ORDER BY e.date_emprunt
+        """
+        return execute_query(query, self._params_calcul(), fetch=True) or []
+
+    def get_en_retard(self) -> List[Dict]:
+        # Servi par l'index partiel idx_emprunt_en_cours_date : ne lit que les
+        # emprunts non rendus antérieurs à l'échéance
+        query = self.COLONNES + """
+            WHERE e.date_retour IS NULL
+            AND e.date_emprunt < CURRENT_DATE - %(duree)s
+            ORDER BY e.date_emprunt
+        """
+        return execute_query(query, self._params_calcul(), fetch=True) or []
+
+    def delete(self, emprunt_id: int) -> bool:
+        query = """
+            WITH supprime AS (
+                DELETE FROM emprunt e WHERE e.id_emprunt = %(id)s AND e.date_emprunt = {date}
+                RETURNING e.id_exemplaire, e.date_retour
+            )
+            UPDATE exemplaire SET disponible = TRUE
+            WHERE id_exemplaire IN (SELECT id_exemplaire FROM supprime WHERE date_retour IS NULL)
+        """.format(date=self.DATE_PAR_ID)
+        return execute_query(query, {'id': emprunt_id})
+
+
+class StatsPostgres(StockageStats):
+
+    def get_compteurs(self) -> Dict:
+        # Somme des shards de chaque clé (table stats_compteur maintenue par triggers)
+        lignes = execute_query(
+            "SELECT cle, SUM(valeur) as valeur FROM stats_compteur GROUP BY cle",
+            fetch=True
+        ) or []
+        return {ligne['cle']: ligne['valeur'] for ligne in lignes}
+
+    # Les classements ajoutent les emprunts de classement_delta pas encore repliés.
+    # Au total : candidats = les `limit` premiers de la table repliée + ceux de
+    # classement_delta ; un autre ne peut pas les dépasser (les deltas sont positifs).
+    TOP_TOTAL = """
+        WITH delta AS (
+            SELECT {cle}, COUNT(*) as nb FROM classement_delta GROUP BY {cle}
+        ),
+        candidats AS (
+            (SELECT {cle} FROM {table} ORDER BY nb_emprunts DESC, {cle} LIMIT %(limit)s)
+            UNION
+            SELECT {cle} FROM delta
+        )
+        SELECT k.{cle}, (COALESCE(c.nb_emprunts, 0) + COALESCE(d.nb, 0))::INTEGER as nombre_emprunts
+        FROM candidats k
+        LEFT JOIN {table} c ON c.{cle} = k.{cle}
+        LEFT JOIN delta d ON d.{cle} = k.{cle}
+        WHERE COALESCE(c.nb_emprunts, 0) + COALESCE(d.nb, 0) > 0
+        ORDER BY nombre_emprunts DESC, k.{cle}
+        LIMIT %(limit)s
+    """
+
+    TOP_FENETRE = """
+        SELECT {cle}, SUM(nb)::INTEGER as nombre_emprunts
+        FROM (
+            SELECT {cle}, nb_emprunts as nb FROM {table_jour} WHERE jour > CURRENT_DATE - %(fenetre)s
+            UNION ALL
+            SELECT {cle}, 1 FROM classement_delta WHERE jour > CURRENT_DATE - %(fenetre)s
+        ) j
+        GROUP BY {cle}
+        HAVING SUM(nb) > 0
+        ORDER BY nombre_emprunts DESC, {cle}
+        LIMIT %(limit)s
+    """
+
+    def _top(self, cle: str, table: str, table_jour: str, limit: int, fenetre: Optional[int]) -> str:
+        if fenetre is None:
+            return self.TOP_TOTAL.format(cle=cle, table=table)
+        return self.TOP_FENETRE.format(cle=cle, table_jour=table_jour)
+
+    def get_top_etudiants(self, limit: int, fenetre: Optional[int] = None) -> List[Dict]:
+        query = f"""
+            SELECT et.id_etud as id, et.nom, et.prenom, c.nombre_emprunts
+            FROM ({self._top('id_etud', 'classement_etudiant', 'classement_jour_etudiant', limit, fenetre)}) c
+            JOIN etudiant et ON et.id_etud = c.id_etud
+            ORDER BY c.nombre_emprunts DESC, c.id_etud
+        """
+        return execute_query(query, {'limit': limit, 'fenetre': fenetre}, fetch=True) or []
+
+    def get_top_livres(self, limit: int, fenetre: Optional[int] = None) -> List[Dict]:
+        query = f"""
+            SELECT l.isbn, l.titre, l.editeur as auteur, c.nombre_emprunts
+            FROM ({self._top('isbn', 'classement_livre', 'classement_jour_livre', limit, fenetre)}) c
+            JOIN livre l ON l.isbn = c.isbn
+            ORDER BY c.nombre_emprunts DESC, c.isbn
+        """
+        return execute_query(query, {'limit': limit, 'fenetre': fenetre}, fetch=True) or []
+
+    def replier_classements(self) -> int:
+        result = execute_query("SELECT replier_classements() as nb", fetch_one=True, primary=True)
+        return result['nb'] if result else 0
+
+
+class StockagePostgres(Stockage):
+    """Moteur par défaut : PostgreSQL via config.database (pool, sessions, réplicas)"""
+
+    nom = 'postgres'
+
+    def __init__(self):
+        super().__init__(EtudiantsPostgres(), LivresPostgres(), EmpruntsPostgres(), StatsPostgres())
@@ -0,0 +1,110 @@
+"""
+Fixtures communes : l'API et les dépôts sur chaque moteur de stockage.
+
+Les tests tournent sur le moteur mémoire. Avec TESTS_POSTGRES=1, ils sont aussi
+joués sur la base configurée dans .env (DB_*), qui doit être une base de test
+créée par sql/init.sql : elle est vidée avant chaque test.
+"""
+
+import os
+import tempfile
+from datetime import date
+from typing import Optional
+
+# Journal et métriques des tests hors du répertoire de l'application
+_TEMP = tempfile.mkdtemp(prefix='bibliotheque-tests-')
+os.environ.setdefault('LOG_FILE', os.path.join(_TEMP, 'app.log'))
+os.environ.setdefault('METRICS_DIR', os.path.join(_TEMP, 'metrics'))
+
+import pytest  # noqa: E402
+
+from app import create_app  # noqa: E402
+from config.database import execute_query, transaction  # noqa: E402
+from models import cache  # noqa: E402
+from services import stats_service  # noqa: E402
+from storage import set_stockage  # noqa: E402
+
+MOTEURS = ['memoire'] + (['postgres'] if os.getenv('TESTS_POSTGRES') else [])
+
+
+def _creer_moteur(nom: str):
+    if nom == 'memoire':
+        from storage.memoire import StockageMemoire
+        return StockageMemoire()
+
+    from storage.postgres import StockagePostgres
+    execute_query("TRUNCATE emprunt, exemplaire, livre, etudiant, amende_lot RESTART IDENTITY CASCADE")
+    return StockagePostgres()
+
+
+def _installer(nom: str):
+    moteur = _creer_moteur(nom)
+    ancien = set_stockage(moteur)
+    cache.vider()
+    stats_service.invalider_cache()
+    yield moteur
+    set_stockage(ancien)
+    cache.vider()
+    stats_service.invalider_cache()
+
+
+@pytest.fixture(params=MOTEURS)
+def stockage(request):
+    """Moteur de stockage vide, installé comme moteur courant"""
+    yield from _installer(request.param)
+
+
+@pytest.fixture
+def postgres():
+    """Base PostgreSQL de test vidée (tests propres à PostgreSQL : traitements SQL, migrations)"""
+    if 'postgres' not in MOTEURS:
+        pytest.skip("TESTS_POSTGRES non défini")
+    yield from _installer('postgres')
+
+
+@pytest.fixture
+def client(stockage):
+    return create_app().test_client()
+
+
+def emprunter_le(stockage, etudiant_id: int, isbn: str, jour: date, retour: Optional[date] = None) -> int:
+    """Emprunt daté de `jour` (l'API n'emprunte qu'à la date du jour), rendu le jour `retour`"""
+    if stockage.nom == 'memoire':
+        with stockage.verrou:
+            id_exemplaire = stockage.exemplaires_libres[isbn][0]
+            if retour is None:
+                stockage.occuper_exemplaire(id_exemplaire)
+            return stockage.inserer_emprunt(etudiant_id, isbn, jour, retour, id_exemplaire=id_exemplaire)
+
+    with transaction():
+        ligne = execute_query("""
+            WITH x AS (
+                SELECT id_exemplaire FROM exemplaire
+                WHERE isbn = %(isbn)s AND disponible
+                ORDER BY id_exemplaire LIMIT 1
+            ),
+            occupe AS (
+                UPDATE exemplaire SET disponible = FALSE
+                WHERE id_exemplaire IN (SELECT id_exemplaire FROM x) AND %(retour)s::date IS NULL
+            )
+            INSERT INTO emprunt (id_etud, isbn, date_emprunt, date_retour, amende, id_exemplaire)
+            SELECT %(etudiant)s, %(isbn)s, %(jour)s, %(retour)s, 0, id_exemplaire FROM x
+            RETURNING id_emprunt
+        """, {'etudiant': etudiant_id, 'isbn': isbn, 'jour': jour, 'retour': retour}, fetch_one=True)
+    return ligne['id_emprunt']
+
+
+def isbn13(numero: int) -> str:
+    """ISBN-13 valide (clé de contrôle comprise) construit à partir d'un numéro"""
+    debut = f"978{numero:09d}"
+    total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(debut))
+    return debut + str(-total % 10)
+
+
+def creer_livre(stockage, numero: int, titre: str, editeur: str = 'Dunod', exemplaires: int = 1) -> str:
+    return stockage.livres.create(titre, editeur, isbn13(numero), 2020, exemplaires)
+
+
+def creer_etudiant(stockage, nom: str, prenom: str = 'Alice') -> int:
+    email = f"{prenom}.{nom}@univ.fr".lower().replace(' ', '')
+    return stockage.etudiants.create(nom, prenom, email)
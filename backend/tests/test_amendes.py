@@ -0,0 +1,53 @@
+"""Traitement de nuit des amendes (PostgreSQL)"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from config.database import execute_query
+from config.settings import AMENDE_PAR_JOUR, DUREE_EMPRUNT_DEFAUT
+from services import amende_service
+from tests.conftest import creer_etudiant, creer_livre, emprunter_le
+
+AUJOURD_HUI = date.today()
+
+
+def jours(n: int) -> date:
+    return AUJOURD_HUI - timedelta(days=n)
+
+
+def euros(montant: float) -> Decimal:
+    return Decimal(str(montant)).quantize(Decimal('0.01'))
+
+
+def test_accumuler_par_lots_et_reprise(postgres):
+    martin = creer_etudiant(postgres, 'Martin')
+    durand = creer_etudiant(postgres, 'Durand')
+    isbn = creer_livre(postgres, 1, 'Analyse', exemplaires=4)
+    emprunter_le(postgres, martin, isbn, jours(DUREE_EMPRUNT_DEFAUT + 6))
+    emprunter_le(postgres, martin, isbn, jours(DUREE_EMPRUNT_DEFAUT + 2))
+    en_retard = emprunter_le(postgres, durand, isbn, jours(DUREE_EMPRUNT_DEFAUT + 4))
+    emprunter_le(postgres, durand, isbn, jours(1))
+
+    rapport = amende_service.accumuler_amendes(AUJOURD_HUI, taille_lot=2)
+    assert (rapport['lots'], rapport['lues'], rapport['modifiees']) == (2, 3, 3)
+    assert rapport['montant'] == 12 * AMENDE_PAR_JOUR
+    assert postgres.etudiants.get_by_id(martin)['solde_amende'] == euros(8 * AMENDE_PAR_JOUR)
+    assert postgres.etudiants.get_by_id(durand)['solde_amende'] == euros(4 * AMENDE_PAR_JOUR)
+    assert postgres.stats.get_compteurs()['amendes'] == euros(12 * AMENDE_PAR_JOUR)
+
+    # Jour déjà traité : rien ne change
+    rapport = amende_service.accumuler_amendes(AUJOURD_HUI)
+    assert (rapport['deja_termine'], rapport['modifiees']) == (True, 0)
+
+    # Traitement interrompu après le premier lot : il reprend au point de reprise
+    demain = AUJOURD_HUI + timedelta(days=1)
+    execute_query("INSERT INTO amende_lot (jour, dernier_date, dernier_id) VALUES (%s, %s, %s)",
+                  (demain, jours(DUREE_EMPRUNT_DEFAUT + 6), 1))
+    rapport = amende_service.accumuler_amendes(demain)
+    assert (rapport['reprise'], rapport['modifiees']) == (True, 2)
+    assert postgres.etudiants.get_by_id(durand)['solde_amende'] == euros(5 * AMENDE_PAR_JOUR)
+
+    # Au retour, seul le complément éventuel est ajouté au solde
+    assert postgres.emprunts.retourner(en_retard)[2] == 5 * AMENDE_PAR_JOUR
+    assert postgres.etudiants.get_by_id(durand)['solde_amende'] == euros(5 * AMENDE_PAR_JOUR)
+    assert postgres.stats.get_compteurs()['amendes'] == euros(14 * AMENDE_PAR_JOUR)
@@ -0,0 +1,180 @@
+"""Routes HTTP : codes de retour, pagination par curseur, validation des paramètres"""
+
+import io
+import json
+from datetime import date, timedelta
+
+from config.settings import MAX_EMPRUNTS_PAR_ETUDIANT
+from models.emprunt import COLONNES_EXPORT
+from tests.conftest import isbn13
+
+
+def creer_etudiant(client, nom: str, prenom: str = 'Alice') -> int:
+    reponse = client.post('/api/etudiants', json={'nom': nom, 'prenom': prenom,
+                                                  'email': f"{prenom}.{nom}@univ.fr".lower()})
+    assert reponse.status_code == 201
+    return reponse.get_json()['id']
+
+
+def creer_livre(client, numero: int, titre: str) -> str:
+    reponse = client.post('/api/livres', json={'titre': titre, 'editeur': 'Dunod', 'isbn': isbn13(numero),
+                                               'annee_publication': 2020})
+    assert reponse.status_code == 201
+    return reponse.get_json()['isbn']
+
+
+def parcourir(client, route: str, limite: int) -> list:
+    items, suivant = [], None
+    while True:
+        reponse = client.get(f"{route}{'&' if '?' in route else '?'}limit={limite}"
+                             + (f"&after={suivant}" if suivant else ''))
+        assert reponse.status_code == 200
+        page = reponse.get_json()
+        assert page['limit'] == limite and len(page['items']) <= limite
+        items.extend(page['items'])
+        suivant = page['next']
+        if not suivant:
+            return items
+
+
+def test_etudiants_crud(client):
+    etudiant_id = creer_etudiant(client, 'Martin')
+
+    assert client.get(f"/api/etudiants/{etudiant_id}").get_json()['nom'] == 'Martin'
+    assert client.get(f"/api/etudiants/{etudiant_id + 1}").status_code == 404
+    assert client.post('/api/etudiants', json={'nom': 'X', 'prenom': 'Y', 'email': 'invalide'}).status_code == 400
+    assert client.post('/api/etudiants', json={'nom': '', 'prenom': 'Y', 'email': 'y@univ.fr'}).status_code == 400
+
+    reponse = client.put(f"/api/etudiants/{etudiant_id}",
+                         json={'nom': 'Aubert', 'prenom': 'Alice', 'email': 'alice.aubert@univ.fr'})
+    assert reponse.status_code == 200
+    assert client.get(f"/api/etudiants/{etudiant_id}").get_json()['nom'] == 'Aubert'
+
+    assert client.delete(f"/api/etudiants/{etudiant_id}").status_code == 200
+    assert client.get(f"/api/etudiants/{etudiant_id}").status_code == 404
+
+
+def test_recherche(client):
+    creer_etudiant(client, 'Lefèvre', 'Hélène')
+    creer_livre(client, 1, 'Topologie générale')
+
+    assert [e['nom'] for e in client.get('/api/etudiants/search?q=lefevre').get_json()] == ['Lefèvre']
+    assert [l['titre'] for l in client.get('/api/livres/search?q=topo').get_json()] == ['Topologie générale']
+    assert client.get('/api/livres/search?q=zoologie').get_json() == []
+
+
+def test_pagination_par_curseur(client):
+    for i in range(7):
+        creer_etudiant(client, 'Dupont', f"P{i}")
+        creer_livre(client, i, f"Titre {i % 3}")
+
+    etudiants = parcourir(client, '/api/etudiants', 3)
+    assert etudiants == client.get('/api/etudiants?all=1').get_json()
+    assert len(etudiants) == 7
+    livres = parcourir(client, '/api/livres', 2)
+    assert livres == client.get('/api/livres?all=1').get_json()
+    assert len(livres) == 7
+
+    assert client.get('/api/livres?after=pas-un-curseur').status_code == 400
+    assert client.get('/api/etudiants?limit=0').status_code == 400
+    assert client.get('/api/emprunts?limit=abc').status_code == 400
+
+
+def test_export_emprunts(client):
+    etudiant_id = creer_etudiant(client, 'Martin')
+    isbns = [creer_livre(client, i, f"Titre {i}") for i in range(3)]
+    ids = [client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbn}).get_json()['id']
+           for isbn in isbns]
+
+    reponse = client.get('/api/emprunts/export')
+    assert reponse.status_code == 200 and reponse.mimetype == 'application/x-ndjson'
+    lignes = [json.loads(ligne) for ligne in reponse.get_data(as_text=True).splitlines()]
+    assert [ligne['id'] for ligne in lignes] == ids
+    assert lignes[0]['date_emprunt'] == date.today().isoformat() and lignes[0]['nom'] == 'Martin'
+
+    reponse = client.get('/api/emprunts/export?format=csv')
+    assert reponse.status_code == 200 and reponse.mimetype == 'text/csv'
+    lignes = reponse.get_data(as_text=True).splitlines()
+    assert lignes[0].split(',') == list(COLONNES_EXPORT)
+    assert len(lignes) == 1 + len(ids)
+
+    demain = (date.today() + timedelta(days=1)).isoformat()
+    assert client.get(f"/api/emprunts/export?depuis={demain}").get_data() == b''
+    assert client.get('/api/emprunts/export?format=xml').status_code == 400
+    assert client.get('/api/emprunts/export?depuis=hier').status_code == 400
+
+
+def test_emprunts_statuts_http(client):
+    etudiant_id = creer_etudiant(client, 'Martin')
+    isbn = creer_livre(client, 1, 'Analyse')
+
+    assert client.post('/api/emprunts', json={'etudiant_id': etudiant_id + 1, 'livre_id': isbn}).status_code == 404
+    assert client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbn13(9)}).status_code == 404
+    reponse = client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbn})
+    assert reponse.status_code == 201
+    emprunt_id = reponse.get_json()['id']
+    assert client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbn}).status_code == 400
+
+    assert [e['id'] for e in client.get('/api/emprunts/en-cours').get_json()] == [emprunt_id]
+    assert client.get('/api/emprunts/en-retard').get_json() == []
+    page = client.get(f"/api/emprunts?etudiant_id={etudiant_id}&statut=en_cours").get_json()
+    assert [e['id'] for e in page['items']] == [emprunt_id]
+
+    reponse = client.post(f"/api/emprunts/{emprunt_id}/retourner")
+    assert reponse.status_code == 200
+    assert reponse.get_json()['jours_retard'] == 0
+    assert client.post(f"/api/emprunts/{emprunt_id}/retourner").status_code == 400
+    assert client.post(f"/api/emprunts/{emprunt_id + 1}/retourner").status_code == 404
+
+    assert client.delete(f"/api/livres/{isbn}").status_code == 400
+    assert client.delete(f"/api/emprunts/{emprunt_id}").status_code == 200
+    assert client.delete(f"/api/livres/{isbn}").status_code == 200
+
+
+def test_emprunts_limite_et_lots(client):
+    etudiant_id = creer_etudiant(client, 'Martin')
+    isbns = [creer_livre(client, i, f"Titre {i}") for i in range(MAX_EMPRUNTS_PAR_ETUDIANT + 1)]
+
+    operations = [{'etudiant_id': etudiant_id, 'livre_id': isbn} for isbn in isbns]
+    reponse = client.post('/api/emprunts/lot', json={'operations': operations})
+    assert reponse.status_code == 200
+    corps = reponse.get_json()
+    assert corps['resume'] == {'ok': MAX_EMPRUNTS_PAR_ETUDIANT, 'limite_atteinte': 1}
+    assert client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbns[-1]}).status_code == 400
+
+    ids = [r['id'] for r in corps['resultats'] if r['id']]
+    reponse = client.post('/api/emprunts/lot/retourner', json={'ids': ids + ids[:1]})
+    assert reponse.get_json()['resume'] == {'ok': MAX_EMPRUNTS_PAR_ETUDIANT, 'deja_retourne': 1}
+    assert client.post('/api/emprunts/lot', json={'operations': []}).status_code == 400
+    assert client.post('/api/emprunts/lot/retourner', json={'ids': ['x']}).status_code == 400
+
+
+def test_livres_import_et_exemplaires(client):
+    csv = (
+        "isbn,titre,editeur,annee,exemplaires\n"
+        f"{isbn13(1)},Analyse,Dunod,2020,2\n"
+        f"{isbn13(2)},Topologie,Belin,,\n"
+        "123,Invalide,Dunod,2020,1\n"
+        f"{isbn13(1)},Doublon,Dunod,2020,1\n"
+    )
+    reponse = client.post('/api/livres/import?format=csv', data=io.BytesIO(csv.encode('utf-8')),
+                          content_type='text/csv')
+    assert reponse.status_code == 200
+    rapport = reponse.get_json()
+    assert (rapport['lignes'], rapport['valides'], rapport['inseres'], rapport['nb_erreurs']) == (4, 2, 2, 2)
+    assert client.get(f"/api/livres/{isbn13(1)}").get_json()['exemplaires_dispo'] == 2
+    assert client.get(f"/api/livres/{isbn13(2)}").get_json()['exemplaires_dispo'] == 1
+
+    ndjson = json.dumps({'isbn': isbn13(2), 'titre': 'Topologie générale', 'editeur': 'Belin'}) + '\n'
+    reponse = client.post('/api/livres/import?format=ndjson', data=ndjson.encode('utf-8'),
+                          content_type='application/x-ndjson')
+    assert (reponse.get_json()['inseres'], reponse.get_json()['modifies']) == (0, 1)
+    assert client.get(f"/api/livres/{isbn13(2)}").get_json()['titre'] == 'Topologie générale'
+
+    reponse = client.put(f"/api/livres/{isbn13(2)}", json={'titre': 'Topologie', 'editeur': 'Belin',
+                                                           'exemplaires_dispo': 4})
+    assert reponse.status_code == 200
+    assert client.get(f"/api/livres/{isbn13(2)}").get_json()['exemplaires_dispo'] == 4
+    assert client.put(f"/api/livres/{isbn13(2)}", json={'titre': 'Topologie', 'editeur': 'Belin',
+                                                        'exemplaires_dispo': -1}).status_code == 400
+    assert client.post('/api/livres/import?format=xml', data=b'').status_code == 400
@@ -0,0 +1,148 @@
+"""
+Accès concurrents : requêtes simultanées sur les mêmes lignes.
+
+Chaque thread a son client HTTP (une session par requête, comme un worker) ;
+une barrière les fait partir ensemble.
+"""
+
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app import create_app
+from config.settings import AMENDE_PAR_JOUR, DUREE_EMPRUNT_DEFAUT, MAX_EMPRUNTS_PAR_ETUDIANT
+from tests.conftest import creer_etudiant, creer_livre, emprunter_le
+
+
+def en_parallele(appels: list) -> list:
+    """Exécute appels[i](client) dans un thread par appel, retourne les résultats dans l'ordre"""
+    app = create_app()
+    barriere = threading.Barrier(len(appels))
+    resultats = [None] * len(appels)
+
+    def executer(i):
+        client = app.test_client()
+        barriere.wait()
+        resultats[i] = appels[i](client)
+
+    threads = [threading.Thread(target=executer, args=(i,)) for i in range(len(appels))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultats
+
+
+def emprunter(etudiant_id, isbn):
+    def appel(client):
+        return client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbn}).status_code
+    return appel
+
+
+def test_limite_par_etudiant(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbns = [creer_livre(stockage, i, f"Titre {i}") for i in range(3 * MAX_EMPRUNTS_PAR_ETUDIANT)]
+
+    statuts = en_parallele([emprunter(etudiant_id, isbn) for isbn in isbns])
+
+    assert Counter(statuts) == {201: MAX_EMPRUNTS_PAR_ETUDIANT, 400: 2 * MAX_EMPRUNTS_PAR_ETUDIANT}
+    assert stockage.etudiants.count_emprunts_actifs(etudiant_id) == MAX_EMPRUNTS_PAR_ETUDIANT
+
+
+def test_derniers_exemplaires(stockage):
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=3)
+    etudiants = [creer_etudiant(stockage, f"Nom{i}") for i in range(12)]
+
+    statuts = en_parallele([emprunter(etudiant_id, isbn) for etudiant_id in etudiants])
+
+    assert Counter(statuts) == {201: 3, 400: 9}
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 0
+    compteurs = stockage.stats.get_compteurs()
+    assert (compteurs['exemplaires_dispo'], compteurs['emprunts_en_cours']) == (0, 3)
+
+
+def test_lots_concurrents(stockage):
+    # Lots d'emprunts croisés : pas d'interblocage, chaque exemplaire prêté une fois
+    etudiants = [creer_etudiant(stockage, f"Nom{i}") for i in range(4)]
+    isbns = [creer_livre(stockage, i, f"Titre {i}", exemplaires=2) for i in range(4)]
+
+    def lot(ordre):
+        operations = [{'etudiant_id': e, 'livre_id': isbn} for e in ordre for isbn in isbns[:2]]
+        return lambda client: client.post('/api/emprunts/lot', json={'operations': operations}).get_json()
+
+    reponses = en_parallele([lot(etudiants), lot(etudiants[::-1]), lot(etudiants[1:] + etudiants[:1])])
+    ok = [r['id'] for reponse in reponses for r in reponse['resultats'] if r['statut'] == 'ok']
+    assert len(ok) == 4
+    assert len(set(ok)) == 4
+    assert stockage.stats.get_compteurs()['emprunts_en_cours'] == 4
+
+    # Retours en lots qui se recouvrent : chaque emprunt n'est rendu (et son amende comptée) qu'une fois
+    etudiant_id = etudiants[0]
+    livre = isbns[3]
+    jour = date.today() - timedelta(days=DUREE_EMPRUNT_DEFAUT + 2)
+    en_retard = [emprunter_le(stockage, etudiant_id, livre, jour), emprunter_le(stockage, etudiants[1], livre, jour)]
+    ids = ok + en_retard
+
+    def retourner(ordre):
+        return lambda client: client.post('/api/emprunts/lot/retourner', json={'ids': ordre}).get_json()
+
+    reponses = en_parallele([retourner(ids), retourner(ids[::-1]), retourner(ids[2:] + ids[:2])])
+    statuts = Counter((r['id'], r['statut']) for reponse in reponses for r in reponse['resultats'])
+    assert all(statuts[(emprunt_id, 'ok')] == 1 for emprunt_id in ids)
+    assert all(statuts[(emprunt_id, 'deja_retourne')] == 2 for emprunt_id in ids)
+    assert float(stockage.stats.get_compteurs()['amendes']) == 2 * 2 * AMENDE_PAR_JOUR
+    assert stockage.stats.get_compteurs()['emprunts_en_cours'] == 0
+
+
+def test_retours_en_double(stockage):
+    # Le même emprunt rendu par plusieurs postes à la fois : un seul retour, une seule amende
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse')
+    jour = date.today() - timedelta(days=DUREE_EMPRUNT_DEFAUT + 3)
+    emprunt_id = emprunter_le(stockage, etudiant_id, isbn, jour)
+
+    def retourner(client):
+        return client.post(f"/api/emprunts/{emprunt_id}/retourner").status_code
+
+    statuts = en_parallele([retourner] * 8)
+
+    assert Counter(statuts) == {200: 1, 400: 7}
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 1
+    solde = Decimal(str(3 * AMENDE_PAR_JOUR)).quantize(Decimal('0.01'))
+    assert stockage.etudiants.get_by_id(etudiant_id)['solde_amende'] == solde
+    compteurs = stockage.stats.get_compteurs()
+    assert (compteurs['emprunts_en_cours'], compteurs['exemplaires_dispo'], compteurs['amendes']) == (0, 1, solde)
+
+
+def test_ajuster_exemplaires_pendant_les_emprunts(stockage):
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=4)
+    etudiants = [creer_etudiant(stockage, f"Nom{i}") for i in range(8)]
+
+    def ajuster(nombre):
+        def appel(client):
+            return client.put(f"/api/livres/{isbn}", json={'titre': 'Analyse', 'editeur': 'Dunod',
+                                                           'exemplaires_dispo': nombre}).status_code
+        return appel
+
+    statuts = en_parallele([emprunter(etudiant_id, isbn) for etudiant_id in etudiants] + [ajuster(2), ajuster(6)])
+
+    # Les exemplaires empruntés ne sont jamais retirés ; les compteurs restent exacts
+    assert statuts[-2:] == [200, 200]
+    prets = statuts[:-2].count(201)
+    livre = stockage.livres.get_by_id(isbn)
+    compteurs = stockage.stats.get_compteurs()
+    assert compteurs['emprunts_en_cours'] == prets
+    assert compteurs['exemplaires_dispo'] == livre['exemplaires_dispo'] >= 0
+
+    # Remise à zéro : tous les exemplaires libres partent, les emprunts restent en cours
+    assert ajuster(0)(create_app().test_client()) == 200
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 0
+    assert stockage.stats.get_compteurs()['emprunts_en_cours'] == prets
+    en_cours = [e['id'] for e in stockage.emprunts.get_en_cours()]
+    assert len(en_cours) == prets
+
+    # Chaque exemplaire prêté existe encore et revient une fois en rayon
+    for emprunt_id in en_cours:
+        assert stockage.emprunts.retourner(emprunt_id)[0] == 'ok'
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == prets
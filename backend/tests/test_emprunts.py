@@ -0,0 +1,229 @@
+"""Dépôt des emprunts : mêmes règles et mêmes résultats sur chaque moteur"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from config.database import execute_query
+from config.settings import AMENDE_PAR_JOUR, DUREE_EMPRUNT_DEFAUT, MAX_EMPRUNTS_PAR_ETUDIANT
+from tests.conftest import creer_etudiant, creer_livre, emprunter_le, isbn13
+
+AUJOURD_HUI = date.today()
+
+
+def jours(n: int) -> date:
+    return AUJOURD_HUI - timedelta(days=n)
+
+
+def test_emprunter_statuts(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse')
+
+    assert stockage.emprunts.emprunter(etudiant_id + 1, isbn) == ('etudiant_inconnu', None)
+    assert stockage.emprunts.emprunter(etudiant_id, isbn13(9)) == ('livre_inconnu', None)
+    statut, emprunt_id = stockage.emprunts.emprunter(etudiant_id, isbn)
+    assert statut == 'ok' and emprunt_id
+    assert stockage.emprunts.emprunter(etudiant_id, isbn) == ('indisponible', None)
+
+    autre = creer_livre(stockage, 2, 'Topologie', exemplaires=MAX_EMPRUNTS_PAR_ETUDIANT)
+    for _ in range(MAX_EMPRUNTS_PAR_ETUDIANT - 1):
+        assert stockage.emprunts.emprunter(etudiant_id, autre)[0] == 'ok'
+    assert stockage.emprunts.emprunter(etudiant_id, autre) == ('limite_atteinte', None)
+
+
+def test_get_by_id_colonnes(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse')
+    emprunt_id = emprunter_le(stockage, etudiant_id, isbn, jours(DUREE_EMPRUNT_DEFAUT + 6))
+
+    ligne = stockage.emprunts.get_by_id(emprunt_id)
+    assert ligne == {
+        'id': emprunt_id, 'date_emprunt': jours(DUREE_EMPRUNT_DEFAUT + 6), 'date_retour': None,
+        'date_echeance': jours(6), 'jours_retard': 6, 'amende': 6 * AMENDE_PAR_JOUR,
+        'amende_enregistree': 0.0, 'etudiant_id': etudiant_id, 'nom': 'Martin', 'prenom': 'Alice',
+        'livre_id': isbn, 'titre': 'Analyse', 'auteur': 'Dunod',
+    }
+    assert stockage.emprunts.get_by_id(emprunt_id + 1) is None
+
+
+def test_retourner_amende(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse')
+    emprunt_id = emprunter_le(stockage, etudiant_id, isbn, jours(DUREE_EMPRUNT_DEFAUT + 4))
+
+    assert stockage.emprunts.retourner(emprunt_id) == ('ok', 4, 4 * AMENDE_PAR_JOUR, etudiant_id, isbn)
+    assert stockage.emprunts.retourner(emprunt_id)[0] == 'deja_retourne'
+    assert stockage.emprunts.retourner(emprunt_id + 1)[0] == 'inconnu'
+
+    assert stockage.livres.est_disponible(isbn)
+    assert stockage.etudiants.get_by_id(etudiant_id)['solde_amende'] == Decimal('2.00')
+    assert stockage.stats.get_compteurs()['amendes'] == Decimal('2.00')
+    ligne = stockage.emprunts.get_by_id(emprunt_id)
+    assert (ligne['date_retour'], ligne['amende_enregistree'], ligne['jours_retard']) == (AUJOURD_HUI, 2.0, 0)
+
+
+def test_emprunter_lot(stockage):
+    a = creer_etudiant(stockage, 'Martin')
+    b = creer_etudiant(stockage, 'Durand')
+    isbn = creer_livre(stockage, 1, 'Analyse')
+    autre = creer_livre(stockage, 2, 'Topologie', exemplaires=2)
+
+    for savepoints in (False, True):
+        resultats = stockage.emprunts.emprunter_lot([(b, isbn), (a, isbn), (a, autre), (b + 1, autre)], savepoints)
+        assert [r['statut'] for r in resultats][2:] == ['ok', 'etudiant_inconnu']
+        assert [(r['etudiant_id'], r['isbn']) for r in resultats] == [(b, isbn), (a, isbn), (a, autre), (b + 1, autre)]
+        assert all((r['id'] is not None) == (r['statut'] == 'ok') for r in resultats)
+        for r in resultats:
+            if r['id']:
+                stockage.emprunts.retourner(r['id'])
+
+    # Sans savepoints, le lot est traité par étudiant : 'a' (créé avant 'b') obtient le dernier exemplaire
+    resultats = stockage.emprunts.emprunter_lot([(b, isbn), (a, isbn)])
+    assert [r['statut'] for r in resultats] == ['indisponible', 'ok']
+    # Avec savepoints, dans l'ordre du lot
+    stockage.emprunts.retourner(resultats[1]['id'])
+    resultats = stockage.emprunts.emprunter_lot([(b, isbn), (a, isbn)], True)
+    assert [r['statut'] for r in resultats] == ['ok', 'indisponible']
+
+
+def test_retourner_lot(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=2)
+    en_retard = emprunter_le(stockage, etudiant_id, isbn, jours(DUREE_EMPRUNT_DEFAUT + 2))
+    _, a_l_heure = stockage.emprunts.emprunter(etudiant_id, isbn)
+
+    for savepoints in (False, True):
+        resultats = stockage.emprunts.retourner_lot([en_retard, a_l_heure + 10, en_retard, a_l_heure], savepoints)
+        if not savepoints:
+            assert resultats == [
+                {'id': en_retard, 'statut': 'ok', 'jours_retard': 2, 'amende': 2 * AMENDE_PAR_JOUR,
+                 'etudiant_id': etudiant_id, 'isbn': isbn},
+                {'id': a_l_heure + 10, 'statut': 'inconnu', 'jours_retard': 0, 'amende': 0.0,
+                 'etudiant_id': None, 'isbn': None},
+                {'id': en_retard, 'statut': 'deja_retourne', 'jours_retard': 0, 'amende': 0.0,
+                 'etudiant_id': None, 'isbn': None},
+                {'id': a_l_heure, 'statut': 'ok', 'jours_retard': 0, 'amende': 0.0,
+                 'etudiant_id': etudiant_id, 'isbn': isbn},
+            ]
+        else:
+            assert [r['statut'] for r in resultats] == ['deja_retourne', 'inconnu', 'deja_retourne', 'deja_retourne']
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 2
+    assert stockage.etudiants.count_emprunts_actifs(etudiant_id) == 0
+
+
+def _historique(stockage):
+    """Cinq emprunts de deux étudiants sur deux livres, à des dates distinctes ; le plus ancien est rendu"""
+    a = creer_etudiant(stockage, 'Martin')
+    b = creer_etudiant(stockage, 'Durand')
+    x = creer_livre(stockage, 1, 'Analyse', exemplaires=3)
+    y = creer_livre(stockage, 2, 'Topologie', exemplaires=3)
+    ids = [
+        emprunter_le(stockage, a, x, jours(40), retour=jours(30)),
+        emprunter_le(stockage, b, y, jours(20)),
+        emprunter_le(stockage, a, y, jours(10)),
+        emprunter_le(stockage, b, x, jours(10)),
+        emprunter_le(stockage, a, x, jours(1)),
+    ]
+    return a, b, x, y, ids
+
+
+def test_get_all_et_get_by_etudiant(stockage):
+    a, b, _, _, ids = _historique(stockage)
+
+    assert [e['id'] for e in stockage.emprunts.get_all()] == [ids[4], ids[3], ids[2], ids[1], ids[0]]
+    assert [e['id'] for e in stockage.emprunts.get_by_etudiant(a)] == [ids[4], ids[2], ids[0]]
+    assert [e['id'] for e in stockage.emprunts.get_by_etudiant(b + 1)] == []
+
+
+def test_get_page_curseur_et_filtres(stockage):
+    a, b, x, y, ids = _historique(stockage)
+
+    def pages(limite, **filtres):
+        vus, apres = [], None
+        while True:
+            page = stockage.emprunts.get_page(limite, apres, **filtres)
+            vus.extend(e['id'] for e in page)
+            if len(page) < limite:
+                return vus
+            apres = [page[-1]['date_emprunt'].isoformat(), page[-1]['id']]
+
+    assert pages(2) == [ids[4], ids[3], ids[2], ids[1], ids[0]]
+    assert pages(2, croissant=True) == [ids[0], ids[1], ids[2], ids[3], ids[4]]
+    assert pages(1, etudiant_id=a) == [ids[4], ids[2], ids[0]]
+    assert pages(2, isbn=x) == [ids[4], ids[3], ids[0]]
+    assert pages(2, statut='en_cours') == [ids[4], ids[3], ids[2], ids[1]]
+    assert pages(2, statut='retourne') == [ids[0]]
+    assert pages(2, depuis=jours(20), jusqu_au=jours(10)) == [ids[3], ids[2], ids[1]]
+    assert pages(3, etudiant_id=b, isbn=y, croissant=True) == [ids[1]]
+
+
+def test_export(stockage):
+    _, _, _, _, ids = _historique(stockage)
+
+    lots = list(stockage.emprunts.export(None, None, 2))
+    assert [len(lot) for lot in lots] == [2, 2, 1]
+    assert [e['id'] for lot in lots for e in lot] == sorted(ids)
+    assert set(lots[0][0]) == {'id', 'date_emprunt', 'date_retour', 'amende', 'etudiant_id', 'nom',
+                               'prenom', 'email', 'livre_id', 'titre', 'editeur'}
+
+    lots = list(stockage.emprunts.export(jours(20), jours(10), 10))
+    assert sorted(e['id'] for lot in lots for e in lot) == sorted(ids[1:4])
+
+
+def test_en_cours_et_en_retard(stockage):
+    _, _, _, _, ids = _historique(stockage)
+
+    # Échéance dépassée : emprunté il y a plus de DUREE_EMPRUNT_DEFAUT jours et non rendu
+    assert [e['id'] for e in stockage.emprunts.get_en_retard()] == [ids[1]]
+    assert sorted(e['id'] for e in stockage.emprunts.get_en_cours()) == sorted([ids[2], ids[3], ids[4]])
+
+
+def test_delete_libere_l_exemplaire(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse')
+    _, emprunt_id = stockage.emprunts.emprunter(etudiant_id, isbn)
+
+    assert stockage.emprunts.delete(emprunt_id)
+    assert stockage.emprunts.get_by_id(emprunt_id) is None
+    assert stockage.livres.est_disponible(isbn)
+    assert stockage.etudiants.count_emprunts(etudiant_id) == 0
+    assert stockage.stats.get_compteurs()['emprunts'] == 0
+
+
+def test_emprunts_anciens_et_supprimes(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=3)
+    ancien = emprunter_le(stockage, etudiant_id, isbn, jours(800))
+    supprime = emprunter_le(stockage, etudiant_id, isbn, jours(400))
+    _, recent = stockage.emprunts.emprunter(etudiant_id, isbn)
+
+    # Recherche par identifiant, quelle que soit la partition de l'emprunt
+    assert stockage.emprunts.get_by_id(ancien)['date_emprunt'] == jours(800)
+    assert stockage.emprunts.delete(supprime)
+    assert stockage.emprunts.get_by_id(supprime) is None
+    assert stockage.emprunts.retourner(supprime)[0] == 'inconnu'
+    assert [r['statut'] for r in stockage.emprunts.retourner_lot([supprime, recent, ancien])] == ['inconnu', 'ok', 'ok']
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 3
+
+
+def test_cles_emprunt_suivent_la_table(postgres):
+    def cles():
+        return execute_query("""
+            SELECT (SELECT COUNT(*) FROM emprunt_cle) as cles,
+                   (SELECT COUNT(*) FROM emprunt_cle c JOIN emprunt e USING (id_emprunt, date_emprunt)) as communes,
+                   (SELECT COUNT(*) FROM emprunt) as emprunts
+        """, fetch_one=True)
+
+    etudiant_id = creer_etudiant(postgres, 'Martin')
+    isbn = creer_livre(postgres, 1, 'Analyse', exemplaires=3)
+    ids = [emprunter_le(postgres, etudiant_id, isbn, jours(n)) for n in (0, 40, 400)]
+    assert cles() == {'cles': 3, 'communes': 3, 'emprunts': 3}
+
+    postgres.emprunts.delete(ids[1])
+    assert cles() == {'cles': 2, 'communes': 2, 'emprunts': 2}
+
+    # TRUNCATE ... RESTART IDENTITY vide aussi emprunt_cle : les identifiants peuvent resservir
+    execute_query("TRUNCATE emprunt RESTART IDENTITY CASCADE")
+    assert cles() == {'cles': 0, 'communes': 0, 'emprunts': 0}
+    execute_query("UPDATE exemplaire SET disponible = TRUE")
+    assert emprunter_le(postgres, etudiant_id, isbn, jours(0)) == 1
+    assert cles() == {'cles': 1, 'communes': 1, 'emprunts': 1}
@@ -0,0 +1,109 @@
+"""Dépôt des étudiants : mêmes résultats sur chaque moteur"""
+
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from psycopg2 import errors
+
+from tests.conftest import creer_etudiant, creer_livre
+
+
+def test_create_et_get_by_id(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+
+    assert stockage.etudiants.get_by_id(etudiant_id) == {
+        'id': etudiant_id, 'nom': 'Martin', 'prenom': 'Alice', 'email': 'alice.martin@univ.fr',
+        'date_inscription': date.today(), 'solde_amende': Decimal('0.00'),
+    }
+    assert stockage.etudiants.get_by_id(etudiant_id + 1) is None
+    assert stockage.etudiants.exists(etudiant_id)
+    assert not stockage.etudiants.exists(etudiant_id + 1)
+
+
+def test_email_unique(stockage):
+    creer_etudiant(stockage, 'Martin')
+    with pytest.raises(errors.UniqueViolation):
+        creer_etudiant(stockage, 'Martin')
+
+    autre = creer_etudiant(stockage, 'Durand')
+    with pytest.raises(errors.UniqueViolation):
+        stockage.etudiants.update(autre, 'Durand', 'Alice', 'alice.martin@univ.fr')
+
+
+def test_get_all_trie_par_nom_prenom_id(stockage):
+    creer_etudiant(stockage, 'Petit', 'Zoe')
+    creer_etudiant(stockage, 'Bernard', 'Luc')
+    creer_etudiant(stockage, 'Petit', 'Anne')
+
+    assert [(e['nom'], e['prenom']) for e in stockage.etudiants.get_all()] == [
+        ('Bernard', 'Luc'), ('Petit', 'Anne'), ('Petit', 'Zoe'),
+    ]
+
+
+def test_get_page_curseur(stockage):
+    for i in range(7):
+        creer_etudiant(stockage, 'Dupont', f"P{i}")
+    creer_etudiant(stockage, 'Arnaud')
+
+    vus, apres = [], None
+    while True:
+        page = stockage.etudiants.get_page(3, apres)
+        vus.extend(page)
+        if len(page) < 3:
+            break
+        apres = [page[-1]['nom'], page[-1]['prenom'], page[-1]['id']]
+
+    assert vus == stockage.etudiants.get_all()
+    assert len(vus) == 8
+
+
+def test_search_classement_et_accents(stockage):
+    creer_etudiant(stockage, 'Lefèvre', 'Hélène')
+    creer_etudiant(stockage, 'Lefebvre', 'Paul')
+    creer_etudiant(stockage, 'Durand', 'Lefe')
+    creer_etudiant(stockage, 'Moreau', 'Jean')
+
+    # Mot entier (prénom 'Lefe') d'abord, puis les préfixes à égalité, par nom
+    assert [e['nom'] for e in stockage.etudiants.search('lefe', 50)] == ['Durand', 'Lefebvre', 'Lefèvre']
+    # Faute de frappe : similarité par trigrammes, sans accents
+    assert [e['nom'] for e in stockage.etudiants.search('lefevra', 50)] == ['Lefèvre']
+    assert [e['prenom'] for e in stockage.etudiants.search('helene', 50)] == ['Hélène']
+    assert [e['nom'] for e in stockage.etudiants.search('moreau', 1)] == ['Moreau']
+
+
+def test_update(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+
+    assert stockage.etudiants.update(etudiant_id, 'Aubert', 'Alice', 'alice.aubert@univ.fr')
+    ligne = stockage.etudiants.get_by_id(etudiant_id)
+    assert (ligne['nom'], ligne['email']) == ('Aubert', 'alice.aubert@univ.fr')
+    assert [e['nom'] for e in stockage.etudiants.get_all()] == ['Aubert']
+    assert [e['nom'] for e in stockage.etudiants.get_page(10)] == ['Aubert']
+    assert [e['nom'] for e in stockage.etudiants.search('aubert', 50)] == ['Aubert']
+    assert stockage.etudiants.search('martin', 50) == []
+
+
+def test_delete(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    garde = creer_etudiant(stockage, 'Durand')
+    isbn = creer_livre(stockage, 1, 'Algèbre')
+    stockage.emprunts.emprunter(garde, isbn)
+
+    assert stockage.etudiants.delete(etudiant_id)
+    assert stockage.etudiants.get_by_id(etudiant_id) is None
+    # Les emprunts liés empêchent la suppression
+    with pytest.raises(errors.ForeignKeyViolation):
+        stockage.etudiants.delete(garde)
+    assert stockage.etudiants.exists(garde)
+
+
+def test_count_emprunts(stockage):
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Algèbre', exemplaires=3)
+    ids = [stockage.emprunts.emprunter(etudiant_id, isbn)[1] for _ in range(3)]
+    stockage.emprunts.retourner(ids[0])
+
+    assert stockage.etudiants.count_emprunts(etudiant_id) == 3
+    assert stockage.etudiants.count_emprunts_actifs(etudiant_id) == 2
+    assert stockage.etudiants.count_emprunts_actifs(etudiant_id + 1) == 0
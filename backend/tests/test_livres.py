@@ -0,0 +1,144 @@
+"""Dépôt des livres : mêmes résultats sur chaque moteur"""
+
+import pytest
+from psycopg2 import errors
+
+from tests.conftest import creer_etudiant, creer_livre, isbn13
+
+
+def test_create_et_get_by_id(stockage):
+    isbn = creer_livre(stockage, 1, 'Algèbre linéaire', exemplaires=3)
+
+    assert stockage.livres.get_by_id(isbn) == {
+        'isbn': isbn, 'titre': 'Algèbre linéaire', 'editeur': 'Dunod',
+        'annee_publication': 2020, 'exemplaires_dispo': 3,
+    }
+    assert stockage.livres.get_by_id(isbn13(2)) is None
+    assert stockage.livres.exists(isbn)
+    assert not stockage.livres.exists(isbn13(2))
+    with pytest.raises(errors.UniqueViolation):
+        creer_livre(stockage, 1, 'Doublon')
+
+
+def test_get_all_trie_par_titre_isbn(stockage):
+    for i, titre in enumerate(['Chimie', 'Biologie', 'Chimie', 'Analyse', 'Botanique']):
+        creer_livre(stockage, i, titre)
+
+    tous = stockage.livres.get_all()
+    assert [(l['titre'], l['isbn']) for l in tous] == sorted((l['titre'], l['isbn']) for l in tous)
+    assert len(tous) == 5
+
+
+def test_get_page_curseur(stockage):
+    for i, titre in enumerate(['Chimie', 'Biologie', 'Chimie', 'Analyse', 'Botanique']):
+        creer_livre(stockage, i, titre)
+
+    vus, apres = [], None
+    while True:
+        page = stockage.livres.get_page(2, apres)
+        vus.extend(page)
+        if len(page) < 2:
+            break
+        apres = [page[-1]['titre'], page[-1]['isbn']]
+    assert vus == stockage.livres.get_all()
+
+
+def test_search_classement(stockage):
+    creer_livre(stockage, 1, 'Astrophysique moderne')
+    creer_livre(stockage, 2, 'Physique quantique')
+    creer_livre(stockage, 3, 'Physique des particules et physique nucléaire')
+    creer_livre(stockage, 4, 'Chimie organique', editeur='Physique Éditions')
+    creer_livre(stockage, 5, 'Histoire de la peinture')
+
+    titres = [l['titre'] for l in stockage.livres.search('physique', 50)]
+    # Plein texte d'abord (le titre qui répète le mot en tête), puis sous-chaînes
+    assert titres[:2] == ['Physique des particules et physique nucléaire', 'Physique quantique']
+    assert set(titres[2:]) == {'Astrophysique moderne', 'Chimie organique'}
+    assert [l['titre'] for l in stockage.livres.search('physique', 1)] == titres[:1]
+
+
+def test_search_accents_et_pluriels(stockage):
+    creer_livre(stockage, 1, 'Le théâtre classique')
+    creer_livre(stockage, 2, 'Les équations différentielles')
+
+    assert [l['titre'] for l in stockage.livres.search('theatre', 50)] == ['Le théâtre classique']
+    assert [l['titre'] for l in stockage.livres.search('équation', 50)] == ['Les équations différentielles']
+    assert stockage.livres.search('zoologie', 50) == []
+
+
+def test_update(stockage):
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=2)
+
+    # Sans exemplaires : les autres champs seulement
+    assert stockage.livres.update(isbn, 'Analyse réelle', 'Ellipses', 2021)
+    assert stockage.livres.get_by_id(isbn) == {
+        'isbn': isbn, 'titre': 'Analyse réelle', 'editeur': 'Ellipses',
+        'annee_publication': 2021, 'exemplaires_dispo': 2,
+    }
+    assert [l['titre'] for l in stockage.livres.get_all()] == ['Analyse réelle']
+    assert [l['titre'] for l in stockage.livres.search('reelle', 50)] == ['Analyse réelle']
+
+
+def test_update_exemplaires(stockage):
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=2)
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    stockage.emprunts.emprunter(etudiant_id, isbn)
+
+    assert stockage.livres.update(isbn, 'Analyse', 'Dunod', 2020, 4)
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 4
+    assert stockage.stats.get_compteurs()['exemplaires_dispo'] == 4
+
+    # Seuls les exemplaires libres sont retirés : l'exemplaire emprunté reste
+    stockage.livres.update(isbn, 'Analyse', 'Dunod', 2020, 0)
+    assert stockage.livres.get_by_id(isbn)['exemplaires_dispo'] == 0
+    assert not stockage.livres.est_disponible(isbn)
+    assert stockage.stats.get_compteurs()['exemplaires_dispo'] == 0
+    assert stockage.etudiants.count_emprunts_actifs(etudiant_id) == 1
+
+    with pytest.raises(errors.ForeignKeyViolation):
+        stockage.livres.update(isbn13(9), 'Inconnu', 'Dunod', None, 1)
+
+
+def test_delete(stockage):
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=2)
+    garde = creer_livre(stockage, 2, 'Topologie')
+    stockage.emprunts.emprunter(creer_etudiant(stockage, 'Martin'), garde)
+
+    assert stockage.livres.delete(isbn)
+    assert stockage.livres.get_by_id(isbn) is None
+    assert stockage.stats.get_compteurs()['exemplaires_dispo'] == 0
+    with pytest.raises(errors.ForeignKeyViolation):
+        stockage.livres.delete(garde)
+
+
+def test_count_emprunts_et_est_disponible(stockage):
+    isbn = creer_livre(stockage, 1, 'Analyse')
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+
+    assert stockage.livres.est_disponible(isbn)
+    _, emprunt_id = stockage.emprunts.emprunter(etudiant_id, isbn)
+    assert not stockage.livres.est_disponible(isbn)
+    stockage.emprunts.retourner(emprunt_id)
+    assert stockage.livres.est_disponible(isbn)
+    assert stockage.livres.count_emprunts(isbn) == 1
+    assert stockage.livres.count_emprunts(isbn13(2)) == 0
+
+
+def test_importer(stockage):
+    existant = creer_livre(stockage, 1, 'Analyse', exemplaires=2)
+    inchange = creer_livre(stockage, 2, 'Topologie')
+    lots = [
+        [(existant, 'Analyse réelle', 'Dunod', 2020, None), (inchange, 'Topologie', 'Dunod', 2020, None)],
+        [(isbn13(3), 'Géométrie', 'Belin', None, 3), (isbn13(4), 'Probabilités', 'Belin', 1999, None)],
+    ]
+
+    assert stockage.livres.importer(iter(lots)) == (2, 1)
+    assert stockage.livres.get_by_id(existant)['titre'] == 'Analyse réelle'
+    # Les exemplaires d'un livre existant ne sont pas modifiés ; un nouveau livre en a 1 par défaut
+    assert stockage.livres.get_by_id(existant)['exemplaires_dispo'] == 2
+    assert stockage.livres.get_by_id(isbn13(3))['exemplaires_dispo'] == 3
+    assert stockage.livres.get_by_id(isbn13(4)) == {
+        'isbn': isbn13(4), 'titre': 'Probabilités', 'editeur': 'Belin',
+        'annee_publication': 1999, 'exemplaires_dispo': 1,
+    }
+    assert stockage.stats.get_compteurs()['livres'] == 4
@@ -0,0 +1,139 @@
+"""
+Migrations du schéma : sql/init.sql et sql/migrations doivent donner le même schéma.
+
+Les tests qui recréent la base (PostgreSQL seulement) l'exécutent à nouveau
+par sql/init.sql : la base de test reste utilisable par les autres tests.
+"""
+
+import os
+import re
+
+import pytest
+from psycopg2.extras import RealDictCursor
+
+from config.database import fermer_pool, get_connection
+from services import migration_service
+from tests.conftest import MOTEURS
+
+INIT_SQL = os.path.join(os.path.dirname(migration_service.DOSSIER_MIGRATIONS), 'init.sql')
+
+# Objets créés par les migrations : supprimés de la base créée par init.sql
+# pour rejouer les migrations sur le schéma qu'elles ont trouvé
+RETOUR_AVANT_MIGRATIONS = """
+    DROP INDEX idx_emprunt_en_cours_date, idx_emprunt_en_cours_etudiant, idx_exemplaire_libre,
+               idx_emprunt_exemplaire, idx_exemplaire_livre;
+    DROP TRIGGER cles_emprunt_ins ON emprunt;
+    DROP TRIGGER cles_emprunt_del ON emprunt;
+    DROP TRIGGER cles_emprunt_tru ON emprunt;
+    DROP FUNCTION trg_cles_emprunt();
+    DROP TABLE classement_delta, emprunt_cle;
+    DELETE FROM schema_migration;
+"""
+
+# Schéma public hors partitions (les index des partitions ne sont pas nommés pareil)
+INSTANTANE = {
+    'colonnes': """
+        SELECT c.table_name, c.column_name, c.data_type, c.is_nullable, c.column_default
+        FROM information_schema.columns c
+        JOIN pg_class t ON t.relname = c.table_name AND t.relnamespace = 'public'::regnamespace
+        WHERE c.table_schema = 'public' AND NOT t.relispartition
+        ORDER BY 1, 2
+    """,
+    'index': """
+        SELECT replace(pg_get_indexdef(x.indexrelid), ' ONLY ', ' ') as definition, x.indisvalid as valide
+        FROM pg_index x
+        JOIN pg_class t ON t.oid = x.indrelid
+        WHERE t.relnamespace = 'public'::regnamespace AND NOT t.relispartition
+        ORDER BY 1
+    """,
+    'triggers': """
+        SELECT pg_get_triggerdef(g.oid) as definition
+        FROM pg_trigger g
+        JOIN pg_class t ON t.oid = g.tgrelid
+        WHERE t.relnamespace = 'public'::regnamespace AND NOT g.tgisinternal
+        ORDER BY 1
+    """,
+    'fonctions': """
+        SELECT p.oid::regprocedure::TEXT as signature, md5(pg_get_functiondef(p.oid)) as corps
+        FROM pg_proc p
+        WHERE p.pronamespace = 'public'::regnamespace AND p.prokind = 'f'
+          AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = p.oid AND d.deptype = 'e')
+        ORDER BY 1
+    """,
+}
+
+
+def _lignes_init_sql() -> list:
+    """Lignes (version, nom, somme de contrôle) enregistrées par init.sql dans schema_migration"""
+    with open(INIT_SQL, encoding='utf-8') as f:
+        texte = f.read()
+    insertion = re.search(r"INSERT INTO schema_migration .*? VALUES(.*?);", texte, re.S)
+    assert insertion, "init.sql n'enregistre pas les migrations dans schema_migration"
+    return [(int(v), nom, somme) for v, nom, somme in
+            re.findall(r"\((\d+), '([^']+)', '([0-9a-f]{64})', \d+\)", insertion.group(1))]
+
+
+def test_init_sql_enregistre_toutes_les_migrations():
+    assert _lignes_init_sql() == [(m['version'], m['nom'], m['somme_controle'])
+                                  for m in migration_service.lister_migrations()]
+
+
+def _executer(texte: str):
+    conn = get_connection()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(texte)
+    finally:
+        conn.close()
+
+
+def _instantane() -> dict:
+    conn = get_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            resultat = {}
+            for nom, requete in INSTANTANE.items():
+                cur.execute(requete)
+                resultat[nom] = cur.fetchall()
+        conn.rollback()
+        return resultat
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def base_init_sql():
+    """Base de test recréée par sql/init.sql (PostgreSQL seulement)"""
+    if 'postgres' not in MOTEURS:
+        pytest.skip("TESTS_POSTGRES non défini")
+    # Aucune connexion du pool ne doit garder de verrou sur les tables supprimées
+    fermer_pool()
+    with open(INIT_SQL, encoding='utf-8') as f:
+        init_sql = f.read()
+    _executer(init_sql)
+    yield
+    fermer_pool()
+    _executer(init_sql)
+
+
+def test_base_init_sql_a_jour(base_init_sql):
+    assert migration_service.migrer() == []
+    etat = migration_service.statut()
+    assert [(m['nom'], m['appliquee'], m['modifiee']) for m in etat['migrations']] == [
+        (m['nom'], True, False) for m in migration_service.lister_migrations()
+    ]
+    assert etat['index_invalides'] == []
+
+
+def test_migrations_donnent_le_schema_de_init_sql(base_init_sql):
+    attendu = _instantane()
+    _executer(RETOUR_AVANT_MIGRATIONS)
+
+    faites = migration_service.migrer()
+
+    assert [m['nom'] for m in faites] == [m['nom'] for m in migration_service.lister_migrations()]
+    obtenu = _instantane()
+    for nom in INSTANTANE:
+        assert obtenu[nom] == attendu[nom], nom
+    assert migration_service.statut()['index_invalides'] == []
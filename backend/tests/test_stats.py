@@ -0,0 +1,153 @@
+"""Compteurs et classements : mêmes résultats sur chaque moteur"""
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from services import stats_service
+from tests.conftest import creer_etudiant, creer_livre, emprunter_le, isbn13
+
+
+def jours(n: int) -> date:
+    return date.today() - timedelta(days=n)
+
+
+def test_overview_en_cache_et_invalide_par_les_ecritures(stockage, client):
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=4)
+    overview = client.get('/api/stats/overview').get_json()
+    assert overview['totaux']['etudiants'] == 0
+    assert (overview['livres_disponibles'], overview['taux_emprunt']) == (4, 0.0)
+
+    # Une écriture par l'API vide le cache
+    reponse = client.post('/api/etudiants', json={'nom': 'Martin', 'prenom': 'Alice', 'email': 'alice@univ.fr'})
+    etudiant_id = reponse.get_json()['id']
+    assert client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': isbn}).status_code == 201
+    overview = client.get('/api/stats/overview').get_json()
+    assert overview['totaux']['etudiants'] == 1
+    assert overview['emprunts'] == {'en_cours': 1, 'termines': 0}
+    assert (overview['livres_disponibles'], overview['taux_emprunt']) == (3, 33.3)
+
+    # Une écriture directe dans le dépôt n'est visible qu'une fois le cache invalidé
+    creer_etudiant(stockage, 'Durand')
+    assert client.get('/api/stats/overview').get_json()['totaux']['etudiants'] == 1
+    stats_service.invalider_cache()
+    assert client.get('/api/stats/overview').get_json()['totaux']['etudiants'] == 2
+
+
+def test_get_compteurs(stockage):
+    assert stockage.stats.get_compteurs() == {
+        'etudiants': 0, 'amendes': Decimal('0.00'), 'livres': 0,
+        'exemplaires_dispo': 0, 'emprunts': 0, 'emprunts_en_cours': 0,
+    }
+
+    etudiant_id = creer_etudiant(stockage, 'Martin')
+    isbn = creer_livre(stockage, 1, 'Analyse', exemplaires=3)
+    creer_livre(stockage, 2, 'Topologie')
+    en_retard = emprunter_le(stockage, etudiant_id, isbn, jours(20))
+    stockage.emprunts.emprunter(etudiant_id, isbn)
+    stockage.emprunts.retourner(en_retard)
+
+    compteurs = stockage.stats.get_compteurs()
+    assert {cle: int(valeur) for cle, valeur in compteurs.items() if cle != 'amendes'} == {
+        'etudiants': 1, 'livres': 2, 'exemplaires_dispo': 3, 'emprunts': 2, 'emprunts_en_cours': 1,
+    }
+    assert Decimal(compteurs['amendes']) == Decimal('3.00')
+
+
+def test_compteurs_egaux_aux_valeurs_recalculees(postgres):
+    etudiant_id = creer_etudiant(postgres, 'Martin')
+    isbn = creer_livre(postgres, 1, 'Analyse', exemplaires=3)
+    autre = creer_livre(postgres, 2, 'Topologie')
+    emprunt_id = emprunter_le(postgres, etudiant_id, isbn, jours(20))
+    postgres.emprunts.emprunter(etudiant_id, autre)
+    postgres.emprunts.retourner(emprunt_id)
+    postgres.livres.update(isbn, 'Analyse', 'Dunod', 2020, 5)
+
+    assert [e['cle'] for e in stats_service.verifier_compteurs() if e['ecart'] != 0] == []
+    avant = postgres.stats.get_compteurs()
+    assert all(e['ecart'] == 0 for e in stats_service.reconstruire_compteurs())
+    assert postgres.stats.get_compteurs() == avant
+
+
+def _classement(stockage):
+    """
+    Emprunts par étudiant (jours écoulés) :
+    Martin : 2, 3, 40 ; Durand : 100, 200, 400, 500 ; Petit : 1 ; Bernard : 3
+    """
+    noms = ('Martin', 'Durand', 'Petit', 'Bernard')
+    etudiants = {nom: creer_etudiant(stockage, nom) for nom in noms}
+    livres = {titre: creer_livre(stockage, i, titre, exemplaires=5)
+              for i, titre in enumerate(('Analyse', 'Topologie', 'Chimie'))}
+    emprunts = [
+        ('Martin', 'Analyse', 2), ('Martin', 'Topologie', 3), ('Martin', 'Analyse', 40),
+        ('Durand', 'Chimie', 100), ('Durand', 'Chimie', 200), ('Durand', 'Chimie', 400),
+        ('Durand', 'Topologie', 500), ('Petit', 'Analyse', 1), ('Bernard', 'Chimie', 3),
+    ]
+    for nom, titre, age in emprunts:
+        emprunter_le(stockage, etudiants[nom], livres[titre], jours(age), retour=jours(age))
+    return etudiants, livres
+
+
+def _top_etudiants(stockage, limite, fenetre=None):
+    return [(e['nom'], e['nombre_emprunts']) for e in stockage.stats.get_top_etudiants(limite, fenetre)]
+
+
+def _top_livres(stockage, limite, fenetre=None):
+    return [(l['titre'], l['nombre_emprunts']) for l in stockage.stats.get_top_livres(limite, fenetre)]
+
+
+def test_top_etudiants_fenetres(stockage):
+    etudiants, _ = _classement(stockage)
+
+    assert _top_etudiants(stockage, 10) == [('Durand', 4), ('Martin', 3), ('Petit', 1), ('Bernard', 1)]
+    # Égalités départagées par identifiant croissant
+    assert _top_etudiants(stockage, 3) == [('Durand', 4), ('Martin', 3), ('Petit', 1)]
+    assert _top_etudiants(stockage, 10, 7) == [('Martin', 2), ('Petit', 1), ('Bernard', 1)]
+    assert _top_etudiants(stockage, 10, 30) == [('Martin', 2), ('Petit', 1), ('Bernard', 1)]
+    assert _top_etudiants(stockage, 10, 365) == [('Martin', 3), ('Durand', 2), ('Petit', 1), ('Bernard', 1)]
+    assert stockage.stats.get_top_etudiants(1)[0] == {'id': etudiants['Durand'], 'nom': 'Durand',
+                                                      'prenom': 'Alice', 'nombre_emprunts': 4}
+
+
+def test_top_livres_fenetres(stockage):
+    _, livres = _classement(stockage)
+
+    assert _top_livres(stockage, 10) == [('Chimie', 4), ('Analyse', 3), ('Topologie', 2)]
+    assert _top_livres(stockage, 10, 7) == [('Analyse', 2), ('Topologie', 1), ('Chimie', 1)]
+    assert _top_livres(stockage, 10, 365) == [('Analyse', 3), ('Chimie', 3), ('Topologie', 1)]
+    assert _top_livres(stockage, 1, 30) == [('Analyse', 2)]
+    assert stockage.stats.get_top_livres(1)[0] == {'isbn': livres['Chimie'], 'titre': 'Chimie',
+                                                   'auteur': 'Dunod', 'nombre_emprunts': 4}
+
+
+def test_classements_apres_repli_et_suppression(stockage):
+    etudiants, livres = _classement(stockage)
+    avant = (_top_etudiants(stockage, 10), _top_livres(stockage, 10, 30))
+
+    # Le repli des emprunts en attente ne change pas les classements
+    assert stockage.stats.replier_classements() >= 0
+    assert (_top_etudiants(stockage, 10), _top_livres(stockage, 10, 30)) == avant
+    assert stockage.stats.replier_classements() == 0
+
+    # Un emprunt supprimé (replié ou non) est retiré des classements
+    _, emprunt_id = stockage.emprunts.emprunter(etudiants['Bernard'], livres['Chimie'])
+    assert _top_etudiants(stockage, 10)[2:] == [('Bernard', 2), ('Petit', 1)]
+    stockage.emprunts.delete(emprunt_id)
+    ancien = stockage.emprunts.get_by_etudiant(etudiants['Petit'])[0]['id']
+    stockage.emprunts.delete(ancien)
+    assert _top_etudiants(stockage, 10) == [('Durand', 4), ('Martin', 3), ('Bernard', 1)]
+    assert _top_livres(stockage, 10, 7) == [('Analyse', 1), ('Topologie', 1), ('Chimie', 1)]
+
+
+def test_classements_http(client):
+    reponse = client.post('/api/etudiants', json={'nom': 'Martin', 'prenom': 'Alice', 'email': 'alice@univ.fr'})
+    etudiant_id = reponse.get_json()['id']
+    reponse = client.post('/api/livres', json={'titre': 'Analyse', 'editeur': 'Dunod', 'isbn': isbn13(1)})
+    client.post('/api/emprunts', json={'etudiant_id': etudiant_id, 'livre_id': reponse.get_json()['isbn']})
+
+    for fenetre in ('all', '7', '30', '365'):
+        reponse = client.get(f"/api/stats/top-etudiants?limit=5&window={fenetre}")
+        assert reponse.status_code == 200
+        assert [e['nom'] for e in reponse.get_json()] == ['Martin']
+        assert [l['titre'] for l in client.get(f"/api/stats/top-livres?window={fenetre}").get_json()] == ['Analyse']
+    assert client.get('/api/stats/top-livres?window=10').status_code == 400
+    assert client.get('/api/stats/top-etudiants?limit=1000').status_code == 400
@@ -0,0 +1,38 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Sequence
+
+
+def _serialiser(valeur):
+    """Convertit les types PostgreSQL non JSON (dates, NUMERIC)"""
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return float(valeur)
+    raise TypeError(f"Type non sérialisable: {type(valeur).__name__}")
+
+
+def generer_ndjson(lots: Iterable[List[Dict]]) -> Iterator[str]:
+    """Produit un bloc NDJSON (un objet JSON par ligne) par lot de lignes"""
+    for lot in lots:
+        yield ''.join(json.dumps(ligne, default=_serialiser, ensure_ascii=False) + '\n' for ligne in lot)
+
+
+def generer_csv(lots: Iterable[List[Dict]], colonnes: Sequence[str]) -> Iterator[str]:
+    """Produit l'en-tête CSV puis un bloc CSV par lot de lignes"""
+    tampon = io.StringIO()
+    writer = csv.DictWriter(tampon, fieldnames=colonnes, extrasaction='ignore')
+    writer.writeheader()
+    for lot in lots:
+        writer.writerows(
+            {cle: (v.isoformat() if isinstance(v, (date, datetime)) else v) for cle, v in ligne.items()}
+            for ligne in lot
+        )
+        yield tampon.getvalue()
+        tampon.seek(0)
+        tampon.truncate()
+    if tampon.tell():
+        yield tampon.getvalue()
@@ -1,20 +1,288 @@
+"""
+Journal de l'application : log() ne fait que mettre le message dans une file ;
+un thread d'écriture le formate et l'écrit par lots dans LOG_FILE (rotation par
+taille et par âge), ce qui évite un open/write/close par message dans le chemin
+des requêtes.
+
+Variables d'environnement (optionnelles) :
+    LOG_FILE            fichier du journal (défaut : app.log)
+    LOG_LEVEL           niveau minimal écrit : DEBUG, INFO, ERROR (défaut : INFO)
+    LOG_FORMAT          texte (défaut) ou json (une ligne JSON par message)
+    LOG_MAX_BYTES       rotation au-delà de cette taille (défaut : 10 Mo, 0 = jamais)
+    LOG_MAX_AGE_HOURS   rotation après ce nombre d'heures (défaut : 0 = jamais)
+    LOG_BACKUPS         anciens fichiers conservés : app.log.1 ... app.log.N (défaut : 5)
+    LOG_REQUESTS        1 pour journaliser chaque requête HTTP (statut, durée)
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
 from datetime import datetime
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
 
 LOG_FILE = "app.log"
 
+NIVEAUX = {"DEBUG": 10, "INFO": 20, "ERROR": 40}
+
+# Messages en attente au plus ; au-delà (tempête d'erreurs) ils sont comptés puis perdus
+TAILLE_FILE = 10000
+# Un lot est écrit dès qu'il atteint TAILLE_LOT messages, ou INTERVALLE_LOT secondes après son premier message
+TAILLE_LOT = 500
+INTERVALLE_LOT = 0.2
+
+_ARRET = object()
+
+# Requête HTTP en cours (identifiant, méthode, chemin, début) pour les messages qu'elle produit
+_requete: ContextVar[Optional[Dict]] = ContextVar("log_requete", default=None)
+_ID_VALIDE = re.compile(r'^[\w.-]{1,64}$')
+
+
+def _lire_config() -> Dict:
+    load_dotenv()
+    try:
+        return {
+            "fichier": os.getenv("LOG_FILE", LOG_FILE),
+            "niveau": NIVEAUX.get(os.getenv("LOG_LEVEL", "INFO").strip().upper(), NIVEAUX["INFO"]),
+            "json": os.getenv("LOG_FORMAT", "texte").strip().lower() == "json",
+            "taille_max": int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            "age_max": float(os.getenv("LOG_MAX_AGE_HOURS", "0")) * 3600,
+            "sauvegardes": int(os.getenv("LOG_BACKUPS", "5")),
+            "requetes": os.getenv("LOG_REQUESTS", "").strip().lower() in ("1", "true", "oui", "yes"),
+        }
+    except ValueError as e:
+        print(f"ERREUR: configuration du journal invalide ({e}), valeurs par défaut utilisées", file=sys.stderr)
+        return {"fichier": LOG_FILE, "niveau": NIVEAUX["INFO"], "json": False, "taille_max": 10 * 1024 * 1024,
+                "age_max": 0.0, "sauvegardes": 5, "requetes": False}
+
+
+class Journal:
+    """File de messages et thread d'écriture par lots"""
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.file: queue.Queue = queue.Queue(maxsize=TAILLE_FILE)
+        self.perdus = 0
+        self.ecrits = 0
+        self.lots = 0
+        self._f = None
+        self._taille = 0
+        self._ouvert_le = 0.0
+        self._thread = threading.Thread(target=self._boucle, name="journal", daemon=True)
+        self._thread.start()
+
+    def ajouter(self, enregistrement: Dict):
+        try:
+            self.file.put_nowait(enregistrement)
+        except queue.Full:
+            self.perdus += 1
+
+    def arreter(self, delai: float = 2.0):
+        """Écrit les messages en attente puis arrête le thread (au plus `delai` secondes)"""
+        try:
+            self.file.put(_ARRET, timeout=delai)
+        except queue.Full:
+            return
+        self._thread.join(delai)
+
+    def _boucle(self):
+        fin = False
+        while not fin:
+            premier = self.file.get()
+            lot = []
+            if premier is _ARRET:
+                fin = True
+            else:
+                lot.append(premier)
+                echeance = time.monotonic() + INTERVALLE_LOT
+                while len(lot) < TAILLE_LOT:
+                    reste = echeance - time.monotonic()
+                    try:
+                        suivant = self.file.get(timeout=reste) if reste > 0 else self.file.get_nowait()
+                    except queue.Empty:
+                        break
+                    if suivant is _ARRET:
+                        fin = True
+                        break
+                    lot.append(suivant)
+            if fin:
+                # Vide la file avant de s'arrêter
+                while True:
+                    try:
+                        suivant = self.file.get_nowait()
+                    except queue.Empty:
+                        break
+                    if suivant is not _ARRET:
+                        lot.append(suivant)
+            if lot:
+                self._ecrire(lot)
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def _formater(self, enregistrement: Dict) -> str:
+        if self.config["json"]:
+            return json.dumps(enregistrement, ensure_ascii=False, default=str) + "\n"
+        prefixe = f"[{enregistrement['horodatage'][:19].replace('T', ' ')}] [{enregistrement['niveau']}]"
+        if "request_id" in enregistrement:
+            prefixe += f" [{enregistrement['request_id']}]"
+        return f"{prefixe} {enregistrement['message']}\n"
+
+    def _ecrire(self, lot: List[Dict]):
+        if self.perdus:
+            perdus, self.perdus = self.perdus, 0
+            lot.append(_enregistrement(f"{perdus} message(s) de journal perdu(s) (file pleine)", "ERROR", {}))
+
+        texte = "".join(self._formater(e) for e in lot)
+        try:
+            self._preparer_fichier(len(texte.encode("utf-8")))
+            self._f.write(texte)
+            self._f.flush()
+            self._taille += len(texte.encode("utf-8"))
+        except OSError as e:
+            print(f"ERREUR: écriture du journal impossible ({e})", file=sys.stderr)
+            self._f = None
+        self.ecrits += len(lot)
+        self.lots += 1
+
+        # Afficher en console seulement les erreurs
+        for enregistrement in lot:
+            if enregistrement["niveau"] == "ERROR":
+                print(f"ERREUR: {enregistrement['message']}")
+
+    def _preparer_fichier(self, taille_lot: int):
+        """Ouvre le fichier, le rouvre si un autre processus l'a fait tourner, et le fait tourner si besoin"""
+        chemin = self.config["fichier"]
+        if self._f is not None:
+            try:
+                if os.stat(chemin).st_ino != os.fstat(self._f.fileno()).st_ino:
+                    self._f.close()
+                    self._f = None
+            except FileNotFoundError:
+                self._f.close()
+                self._f = None
+        if self._f is None:
+            self._ouvrir()
+
+        trop_gros = self.config["taille_max"] > 0 and self._taille > 0 \
+            and self._taille + taille_lot > self.config["taille_max"]
+        trop_vieux = self.config["age_max"] > 0 and time.time() - self._ouvert_le >= self.config["age_max"]
+        if trop_gros or trop_vieux:
+            self._f.close()
+            self._faire_tourner()
+            self._ouvrir()
+
+    def _ouvrir(self):
+        self._f = open(self.config["fichier"], "a", encoding="utf-8")
+        statut = os.fstat(self._f.fileno())
+        self._taille = statut.st_size
+        # Âge compté depuis l'ouverture par ce processus (la date de création n'est pas disponible partout)
+        self._ouvert_le = time.time()
+
+    def _faire_tourner(self):
+        """app.log -> app.log.1 -> ... -> app.log.N (le plus ancien est supprimé)"""
+        chemin = self.config["fichier"]
+        n = self.config["sauvegardes"]
+        if n <= 0:
+            os.remove(chemin)
+            return
+        for i in range(n - 1, 0, -1):
+            if os.path.exists(f"{chemin}.{i}"):
+                os.replace(f"{chemin}.{i}", f"{chemin}.{i + 1}")
+        os.replace(chemin, f"{chemin}.1")
 
-def log(message: str, level: str = "INFO"):
+    def stats(self) -> Dict:
+        return {"en_attente": self.file.qsize(), "ecrits": self.ecrits, "lots": self.lots, "perdus": self.perdus}
+
+
+_journal: Optional[Journal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> Journal:
+    """Journal du processus, créé (et son thread démarré) au premier message"""
+    global _journal
+    if _journal is None:
+        with _journal_lock:
+            if _journal is None:
+                _journal = Journal(_lire_config())
+                atexit.register(_journal.arreter)
+    return _journal
+
+
+def _reinitialiser_apres_fork():
+    # Le thread d'écriture n'existe pas dans le processus fils : il en démarrera un
+    global _journal, _journal_lock
+    _journal = None
+    _journal_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reinitialiser_apres_fork)
+
+
+def _enregistrement(message: str, level: str, champs: Dict) -> Dict:
+    enregistrement = {
+        "horodatage": datetime.now().isoformat(timespec="milliseconds"),
+        "niveau": level,
+        "message": message,
+        "pid": os.getpid(),
+    }
+    requete = _requete.get()
+    if requete is not None:
+        enregistrement["request_id"] = requete["id"]
+        enregistrement["methode"] = requete["methode"]
+        enregistrement["chemin"] = requete["chemin"]
+        enregistrement["duree_ms"] = round((time.perf_counter() - requete["debut"]) * 1000, 1)
+    enregistrement.update(champs)
+    return enregistrement
+
+
+def log(message: str, level: str = "INFO", **champs):
     """
     Log un message dans le fichier et la console si erreur.
     Niveaux: INFO, ERROR, DEBUG
+    Les champs supplémentaires (statut=..., isbn=...) apparaissent dans le format json.
+    """
+    journal = get_journal()
+    if NIVEAUX.get(level, NIVEAUX["INFO"]) < journal.config["niveau"]:
+        return
+    journal.ajouter(_enregistrement(message, level, champs))
+
+
+def debut_requete(request_id: Optional[str] = None, methode: str = "", chemin: str = "") -> str:
     """
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    ligne = f"[{timestamp}] [{level}] {message}"
+    Associe les messages suivants du contexte courant à une requête HTTP.
+    Reprend l'identifiant reçu (en-tête X-Request-ID) s'il est valide, sinon en génère un.
+    """
+    if not request_id or not _ID_VALIDE.match(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    _requete.set({"id": request_id, "methode": methode, "chemin": chemin, "debut": time.perf_counter()})
+    return request_id
+
+
+def request_id_courant() -> Optional[str]:
+    """Identifiant de la requête HTTP en cours, None hors requête"""
+    requete = _requete.get()
+    return requete["id"] if requete is not None else None
+
+
+def fin_requete(statut: Optional[int] = None):
+    """Termine la requête courante (journalisée avec son statut et sa durée si LOG_REQUESTS=1)"""
+    requete = _requete.get()
+    if requete is None:
+        return
+    if statut is not None and get_journal().config["requetes"]:
+        log(f"{requete['methode']} {requete['chemin']} {statut}", statut=statut)
+    _requete.set(None)
 
-    # Toujours écrire dans le fichier
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(ligne + "\n")
 
-    # Afficher en console seulement les erreurs
-    if level == "ERROR":
-        print(f"ERREUR: {message}")
+def get_log_stats() -> Dict:
+    """Messages en attente, écrits, lots et messages perdus du journal de ce processus"""
+    return get_journal().stats()
@@ -0,0 +1,381 @@
+"""
+Métriques des requêtes HTTP, exposées au format texte Prometheus par GET /api/metrics.
+
+Chaque processus (worker gunicorn) compte en mémoire sous un verrou : latence par
+route, méthode et statut, nombre et durée des requêtes SQL par requête HTTP,
+attente d'une connexion du pool, requêtes en cours. Un thread recopie ces valeurs
+toutes les secondes dans METRICS_DIR/<pid>.json ; /api/metrics additionne les
+fichiers de tous les workers (celui qui répond écrit d'abord les siennes).
+
+Les compteurs d'un worker arrêté sont ajoutés à cumul.json pour ne pas revenir
+en arrière ; ses requêtes en cours ne sont plus comptées. Le répertoire est
+vidé au démarrage de l'application (create_app).
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows : serveur de développement, un seul processus
+    fcntl = None
+
+METRICS_DIR = os.path.join(tempfile.gettempdir(), "bibliotheque-metrics")
+FICHIER_CUMUL = "cumul.json"
+INTERVALLE_ECRITURE = 1.0
+
+# Bornes supérieures des seaux (secondes, ou nombre de requêtes SQL)
+SEAUX_LATENCE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SEAUX_SQL = (1, 2, 3, 5, 10, 20, 50, 100)
+SEAUX_ATTENTE = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+# nom -> (type, aide, seaux) ; les histogrammes ont leurs seaux, les compteurs None
+METRIQUES = {
+    "http_request_duration_seconds": ("histogram", "Durée des requêtes HTTP", SEAUX_LATENCE),
+    "http_requests_in_flight": ("gauge", "Requêtes HTTP en cours de traitement", None),
+    "db_queries_per_request": ("histogram", "Requêtes SQL exécutées par requête HTTP", SEAUX_SQL),
+    "db_queries_total": ("counter", "Requêtes SQL exécutées pendant les requêtes HTTP", None),
+    "db_query_seconds_total": ("counter", "Temps passé dans les requêtes SQL pendant les requêtes HTTP", None),
+    "db_pool_wait_seconds": ("histogram", "Attente d'une connexion du pool primaire", SEAUX_ATTENTE),
+    "entity_cache_events_total": ("counter", "Lectures et retraits du cache d'entités (models/cache.py)", None),
+}
+
+Etiquettes = Tuple[Tuple[str, str], ...]
+
+# Requête HTTP en cours : [début, nombre de requêtes SQL, durée SQL]
+_mesure: ContextVar[Optional[List[float]]] = ContextVar("metrics_requete", default=None)
+
+
+class Registre:
+    """Valeurs d'un processus : histogrammes (seaux non cumulés, somme, nombre) et compteurs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histogrammes: Dict[Tuple[str, Etiquettes], List[float]] = {}
+        self.compteurs: Dict[Tuple[str, Etiquettes], float] = {}
+        self.en_cours = 0
+        self.version = 0
+
+    def observer(self, nom: str, etiquettes: Etiquettes, valeur: float):
+        seaux = METRIQUES[nom][2]
+        with self.lock:
+            valeurs = self.histogrammes.get((nom, etiquettes))
+            if valeurs is None:
+                valeurs = self.histogrammes[(nom, etiquettes)] = [0] * (len(seaux) + 3)
+            valeurs[bisect_left(seaux, valeur)] += 1
+            valeurs[-2] += valeur
+            valeurs[-1] += 1
+            self.version += 1
+
+    def ajouter(self, nom: str, etiquettes: Etiquettes, valeur: float):
+        with self.lock:
+            cle = (nom, etiquettes)
+            self.compteurs[cle] = self.compteurs.get(cle, 0) + valeur
+            self.version += 1
+
+    def exporter(self) -> Dict:
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "en_cours": self.en_cours,
+                "histogrammes": [[nom, list(etiq), list(v)] for (nom, etiq), v in self.histogrammes.items()],
+                "compteurs": [[nom, list(etiq), v] for (nom, etiq), v in self.compteurs.items()],
+            }
+
+
+_registre = Registre()
+_repertoire: Optional[str] = None
+_ecrivain: Optional[threading.Thread] = None
+_ecrivain_lock = threading.Lock()
+_ecrit_version = -1
+
+
+def repertoire() -> str:
+    """Répertoire partagé par les workers : METRICS_DIR, sinon un dossier du répertoire temporaire"""
+    global _repertoire
+    if _repertoire is None:
+        load_dotenv()
+        _repertoire = os.getenv("METRICS_DIR") or METRICS_DIR
+    return _repertoire
+
+
+def _chemin(nom: str) -> str:
+    return os.path.join(repertoire(), nom)
+
+
+def _ecrire_fichier(nom: str, donnees: Dict):
+    """Écriture atomique : les lecteurs voient l'ancien ou le nouveau fichier, jamais un fichier partiel"""
+    os.makedirs(repertoire(), exist_ok=True)
+    temporaire = _chemin(f".{nom}.{os.getpid()}.tmp")
+    with open(temporaire, "w", encoding="utf-8") as f:
+        json.dump(donnees, f)
+    os.replace(temporaire, _chemin(nom))
+
+
+def ecrire():
+    """Recopie les valeurs du processus dans METRICS_DIR/<pid>.json"""
+    global _ecrit_version
+    version = _registre.version
+    if version == _ecrit_version:
+        return
+    try:
+        _ecrire_fichier(f"{os.getpid()}.json", _registre.exporter())
+        _ecrit_version = version
+    except OSError as e:
+        from utils.logger import log
+        log(f"Écriture des métriques impossible: {e}", level="ERROR")
+
+
+def _boucle_ecriture():
+    while True:
+        time.sleep(INTERVALLE_ECRITURE)
+        ecrire()
+
+
+def _demarrer_ecrivain():
+    global _ecrivain
+    if _ecrivain is None:
+        with _ecrivain_lock:
+            if _ecrivain is None:
+                _ecrivain = threading.Thread(target=_boucle_ecriture, name="metriques", daemon=True)
+                _ecrivain.start()
+
+
+def _reinitialiser_apres_fork():
+    # Chaque worker compte à partir de zéro dans son propre fichier
+    global _registre, _ecrivain, _ecrivain_lock, _ecrit_version
+    _registre = Registre()
+    _ecrivain = None
+    _ecrivain_lock = threading.Lock()
+    _ecrit_version = -1
+
+
+os.register_at_fork(after_in_child=_reinitialiser_apres_fork)
+
+
+# Mesures (appelées par app.py et config/database.py)
+
+def debut_requete():
+    """Début d'une requête HTTP : requêtes en cours + 1, compteurs SQL à zéro"""
+    _demarrer_ecrivain()
+    registre = _registre
+    with registre.lock:
+        registre.en_cours += 1
+        registre.version += 1
+    _mesure.set([time.perf_counter(), 0, 0.0])
+
+
+def fin_requete(route: str, methode: str, statut: int):
+    """Fin d'une requête HTTP : latence, requêtes SQL et temps SQL de la requête"""
+    mesure = _mesure.get()
+    if mesure is None:
+        return
+    _mesure.set(None)
+    duree = time.perf_counter() - mesure[0]
+    registre = _registre
+    with registre.lock:
+        registre.en_cours -= 1
+    registre.observer("http_request_duration_seconds",
+                      (("route", route), ("method", methode), ("status", str(statut))), duree)
+    etiquettes = (("route", route),)
+    registre.observer("db_queries_per_request", etiquettes, mesure[1])
+    if mesure[1]:
+        registre.ajouter("db_queries_total", etiquettes, mesure[1])
+        registre.ajouter("db_query_seconds_total", etiquettes, mesure[2])
+
+
+def compter_requete_sql(duree: float):
+    """Une requête SQL de `duree` secondes exécutée pendant la requête HTTP courante"""
+    mesure = _mesure.get()
+    if mesure is not None:
+        mesure[1] += 1
+        mesure[2] += duree
+
+
+def observer_attente_pool(attente: float):
+    _registre.observer("db_pool_wait_seconds", (), attente)
+
+
+def compter_cache(cache: str, evenement: str, nombre: int = 1):
+    """Événement du cache d'entités : hits, misses, evictions, expirations ou invalidations"""
+    _registre.ajouter("entity_cache_events_total", (("cache", cache), ("event", evenement)), nombre)
+
+
+# Agrégation et export
+
+def _processus_vivant(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _lire_fichier(nom: str) -> Optional[Dict]:
+    try:
+        with open(_chemin(nom), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        from utils.logger import log
+        log(f"Fichier de métriques illisible {nom}: {e}", level="ERROR")
+        return None
+
+
+def _fusionner(total: Dict, donnees: Dict):
+    for nom, etiq, valeurs in donnees["histogrammes"]:
+        cle = (nom, tuple(tuple(e) for e in etiq))
+        if cle in total["histogrammes"]:
+            total["histogrammes"][cle] = [a + b for a, b in zip(total["histogrammes"][cle], valeurs)]
+        else:
+            total["histogrammes"][cle] = list(valeurs)
+    for nom, etiq, valeur in donnees["compteurs"]:
+        cle = (nom, tuple(tuple(e) for e in etiq))
+        total["compteurs"][cle] = total["compteurs"].get(cle, 0) + valeur
+
+
+def _vers_json(total: Dict) -> Dict:
+    return {
+        "pid": None,
+        "en_cours": 0,
+        "histogrammes": [[nom, list(etiq), v] for (nom, etiq), v in total["histogrammes"].items()],
+        "compteurs": [[nom, list(etiq), v] for (nom, etiq), v in total["compteurs"].items()],
+    }
+
+
+def _verrou():
+    """Verrou de fichier (entre processus) pour modifier cumul.json"""
+    os.makedirs(repertoire(), exist_ok=True)
+    f = open(_chemin(".verrou"), "w")
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+    return f
+
+
+def _archiver(pids: List[int]):
+    """Ajoute les fichiers des processus arrêtés à cumul.json puis les supprime (sous _verrou())"""
+    total = {"histogrammes": {}, "compteurs": {}}
+    cumul = _lire_fichier(FICHIER_CUMUL)
+    if cumul is not None:
+        _fusionner(total, cumul)
+    archives = []
+    for pid in pids:
+        donnees = _lire_fichier(f"{pid}.json")
+        if donnees is not None:
+            _fusionner(total, donnees)
+            archives.append(pid)
+    _ecrire_fichier(FICHIER_CUMUL, _vers_json(total))
+    for pid in archives:
+        os.remove(_chemin(f"{pid}.json"))
+
+
+def agreger() -> Dict:
+    """Somme des valeurs de tous les processus (fichiers de METRICS_DIR)"""
+    ecrire()
+    total = {"histogrammes": {}, "compteurs": {}, "en_cours": 0, "processus": 0}
+    # Sous verrou : un fichier archivé par un autre processus n'est pas compté deux fois
+    with _verrou():
+        noms = os.listdir(repertoire())
+        arretes = [int(nom[:-5]) for nom in noms
+                   if nom.endswith(".json") and nom[:-5].isdigit() and not _processus_vivant(int(nom[:-5]))]
+        if arretes:
+            _archiver(arretes)
+            noms = os.listdir(repertoire())
+
+        for nom in noms:
+            if not nom.endswith(".json"):
+                continue
+            donnees = _lire_fichier(nom)
+            if donnees is None:
+                continue
+            _fusionner(total, donnees)
+            if donnees["pid"] is not None:
+                total["en_cours"] += donnees["en_cours"]
+                total["processus"] += 1
+    return total
+
+
+def _etiquettes(etiquettes, *supplementaires) -> str:
+    paires = list(etiquettes) + list(supplementaires)
+    if not paires:
+        return ""
+    echappe = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in paires)
+    return "{" + ",".join(f'{cle}="{valeur}"' for (cle, _), valeur in zip(paires, echappe)) + "}"
+
+
+def _nombre(valeur: float) -> str:
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def format_prometheus(total: Dict) -> str:
+    """Texte d'exposition Prometheus (version 0.0.4)"""
+    lignes = []
+    for nom, (type_, aide, seaux) in METRIQUES.items():
+        lignes.append(f"# HELP {nom} {aide}")
+        lignes.append(f"# TYPE {nom} {type_}")
+        if type_ == "gauge":
+            lignes.append(f"{nom} {total['en_cours']}")
+        elif type_ == "counter":
+            for (n, etiq), valeur in sorted(total["compteurs"].items()):
+                if n == nom:
+                    lignes.append(f"{nom}{_etiquettes(etiq)} {_nombre(valeur)}")
+        else:
+            for (n, etiq), valeurs in sorted(total["histogrammes"].items()):
+                if n != nom:
+                    continue
+                cumul = 0
+                for borne, compte in zip(seaux, valeurs):
+                    cumul += compte
+                    lignes.append(f"{nom}_bucket{_etiquettes(etiq, ('le', borne))} {cumul}")
+                lignes.append(f"{nom}_bucket{_etiquettes(etiq, ('le', '+Inf'))} {valeurs[-1]}")
+                lignes.append(f"{nom}_sum{_etiquettes(etiq)} {_nombre(valeurs[-2])}")
+                lignes.append(f"{nom}_count{_etiquettes(etiq)} {valeurs[-1]}")
+    lignes.append("# HELP metrics_processes Processus dont les métriques sont additionnées")
+    lignes.append("# TYPE metrics_processes gauge")
+    lignes.append(f"metrics_processes {total['processus']}")
+    return "\n".join(lignes) + "\n"
+
+
+def reinitialiser():
+    """Vide METRICS_DIR (démarrage de l'application : les compteurs repartent de zéro)"""
+    try:
+        noms = os.listdir(repertoire())
+    except FileNotFoundError:
+        return
+    for nom in noms:
+        if nom.endswith(".json"):
+            try:
+                os.remove(_chemin(nom))
+            except FileNotFoundError:
+                pass
+
+
+def fermer():
+    """Arrêt du processus : ses compteurs rejoignent cumul.json"""
+    if _registre.version == 0:
+        return
+    with _registre.lock:
+        _registre.en_cours = 0
+        _registre.version += 1
+    try:
+        ecrire()
+        with _verrou():
+            _archiver([os.getpid()])
+    except OSError:
+        pass
+
+
+atexit.register(fermer)
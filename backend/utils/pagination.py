@@ -0,0 +1,62 @@
+import base64
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+LIMITE_DEFAUT = 50
+LIMITE_MAX = 500
+
+
+def encoder_curseur(valeurs: Sequence) -> str:
+    """Encode les valeurs de la clé de tri de la dernière ligne en curseur opaque"""
+    brut = json.dumps(list(valeurs), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(brut.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decoder_curseur(curseur: str) -> List:
+    """Décode un curseur produit par encoder_curseur"""
+    try:
+        rembourrage = '=' * (-len(curseur) % 4)
+        valeurs = json.loads(base64.urlsafe_b64decode(curseur + rembourrage).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Curseur de pagination invalide")
+    if not isinstance(valeurs, list):
+        raise ValueError("Curseur de pagination invalide")
+    return valeurs
+
+
+def cle_curseur(apres: Optional[List], taille: int) -> Optional[List]:
+    """Vérifie que la clé décodée correspond à la clé de tri attendue"""
+    if apres is not None and len(apres) != taille:
+        raise ValueError("Curseur de pagination invalide")
+    return apres
+
+
+def lire_pagination(args) -> Tuple[int, Optional[List]]:
+    """Lit les paramètres limit et after d'une requête, retourne (limite, clé décodée)"""
+    try:
+        limite = int(args.get('limit', LIMITE_DEFAUT))
+    except ValueError:
+        raise ValueError("'limit' doit être un nombre entier")
+    if limite <= 0:
+        raise ValueError("'limit' doit être positif")
+    limite = min(limite, LIMITE_MAX)
+
+    after = args.get('after')
+    return limite, decoder_curseur(after) if after else None
+
+
+def lire_booleen(args, nom: str) -> bool:
+    """Lit un paramètre booléen (1, true, oui...)"""
+    return args.get(nom, '').strip().lower() in ('1', 'true', 'oui', 'yes')
+
+
+def paginer(lignes: List[Dict], limite: int, cle: Sequence[str]) -> Dict:
+    """
+    Construit la réponse paginée à partir de limite + 1 lignes lues.
+    La ligne en trop indique seulement qu'une page suivante existe.
+    """
+    items = lignes[:limite]
+    suivant = None
+    if len(lignes) > limite and items:
+        suivant = encoder_curseur([items[-1][c] for c in cle])
+    return {'items': items, 'next': suivant, 'limit': limite}
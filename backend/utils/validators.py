@@ -1,5 +1,5 @@
 import re
-from datetime import datetime
+from datetime import date, datetime
 
 
 def valider_email(email: str) -> bool:
@@ -37,6 +37,33 @@ def valider_annee(valeur: str) -> int:
     return annee
 
 
+def valider_isbn(valeur: str) -> str:
+    """Valide un ISBN-10 ou ISBN-13 (clé de contrôle comprise), retourne l'ISBN sans tirets ni espaces"""
+    isbn = re.sub(r'[\s-]', '', valeur).upper()
+
+    if re.fullmatch(r'\d{9}[\dX]', isbn):
+        total = sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(isbn))
+        if total % 11 != 0:
+            raise ValueError(f"ISBN '{valeur}' : clé de contrôle invalide")
+        return isbn
+
+    if re.fullmatch(r'\d{13}', isbn):
+        total = sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(isbn))
+        if total % 10 != 0:
+            raise ValueError(f"ISBN '{valeur}' : clé de contrôle invalide")
+        return isbn
+
+    raise ValueError(f"ISBN '{valeur}' : 10 ou 13 chiffres attendus")
+
+
+def valider_date(valeur: str, nom_champ: str) -> date:
+    """Convertit une date au format AAAA-MM-JJ"""
+    try:
+        return date.fromisoformat(valeur.strip())
+    except ValueError:
+        raise ValueError(f"'{nom_champ}' doit être une date au format AAAA-MM-JJ")
+
+
 def valider_choix_menu(choix: str, min_val: int, max_val: int) -> int:
     """Valide un choix de menu entre min et max"""
     try:
@@ -0,0 +1,13 @@
+"""
+Point d'entrée WSGI du serveur de production : gunicorn -c gunicorn.conf.py wsgi:app
+(ou python manage.py serve). Mesure le temps de chargement de l'application.
+"""
+
+import time
+
+_debut = time.perf_counter()
+
+from app import create_app  # noqa: E402
+
+app = create_app()
+app.config['DEMARRAGE']['chargement_ms'] = round((time.perf_counter() - _debut) * 1000, 1)
@@ -7,6 +7,8 @@ export interface Emprunt {
   titre: string;
   date_emprunt: string;
   date_retour?: string;
+  date_echeance?: string;
   jours_retard?: number;
   amende?: number;
+  amende_enregistree?: number;
 }
@@ -18,7 +18,7 @@ export class ApiService {
 
   // Etudiants
   getEtudiants(): Observable<Etudiant[]> {
-    return this.http.get<Etudiant[]>(`${this.API_URL}/etudiants`)
+    return this.http.get<Etudiant[]>(`${this.API_URL}/etudiants?all=1`)
       .pipe(catchError(this.handleError));
   }
 
@@ -44,7 +44,7 @@ export class ApiService {
 
   // Livres
   getLivres(): Observable<Livre[]> {
-    return this.http.get<Livre[]>(`${this.API_URL}/livres`)
+    return this.http.get<Livre[]>(`${this.API_URL}/livres?all=1`)
       .pipe(catchError(this.handleError));
   }
 
@@ -70,7 +70,7 @@ export class ApiService {
 
   // Emprunts
   getEmprunts(): Observable<Emprunt[]> {
-    return this.http.get<Emprunt[]>(`${this.API_URL}/emprunts`)
+    return this.http.get<Emprunt[]>(`${this.API_URL}/emprunts?all=1`)
       .pipe(catchError(this.handleError));
   }
 